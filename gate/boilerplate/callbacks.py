@@ -4,7 +4,7 @@ import sys
 import threading
 from abc import ABC
 from pathlib import Path
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Union
 
 import torch
 import torch.nn as nn
@@ -82,6 +82,12 @@ class Callback(ABC):
     ) -> None:
         pass
 
+    def on_data_wait_start(self, phase_name: str) -> None:
+        pass
+
+    def on_data_wait_end(self, phase_name: str, batch: Dict) -> None:
+        pass
+
     def on_batch_start(self, model: nn.Module, batch: Dict) -> None:
         pass
 
@@ -248,6 +254,14 @@ class CallbackHandler(Callback):
                 test_dataloader,
             )
 
+    def on_data_wait_start(self, phase_name: str) -> None:
+        for callback in self.callbacks:
+            callback.on_data_wait_start(phase_name)
+
+    def on_data_wait_end(self, phase_name: str, batch: Dict) -> None:
+        for callback in self.callbacks:
+            callback.on_data_wait_end(phase_name, batch)
+
     def on_batch_start(self, model: nn.Module, batch: Dict) -> None:
         for callback in self.callbacks:
             callback.on_batch_start(model, batch)
@@ -418,3 +432,353 @@ class UploadCheckpointsToHuggingFace(Callback):
             checkpoint_path=checkpoint_path,
         )
         experiment.background_threads.append(background_upload_thread)
+
+
+def get_batch_size(batch: Any) -> int:
+    # The leading dimension of the first tensor found in the batch
+    if isinstance(batch, torch.Tensor):
+        return batch.shape[0] if batch.dim() > 0 else 1
+    if isinstance(batch, dict):
+        batch = list(batch.values())
+    if isinstance(batch, (list, tuple)):
+        for item in batch:
+            batch_size = get_batch_size(item)
+            if batch_size > 0:
+                return batch_size
+    return 0
+
+
+class ProfilingCallback(Callback):
+    """
+    ⏱️ Records where the time of each phase goes, so that it is clear whether
+    a task is input-bound or compute-bound.
+
+    Per phase ("training", "validation", "testing") it tracks the time spent
+    waiting for the dataloader, running the step and, for training, the
+    split of the step into forward, backward (forward end to optimizer
+    step) and optimizer time. Loaders prepared by accelerate copy each
+    batch to the device as they yield it, so the data wait includes that
+    copy and there is no separate host-to-device time. It also tracks
+    samples/sec and peak memory. Summaries are logged through
+    `collect_metrics` under `profiling/{phase}` every `log_every_n_steps`
+    training steps and at the end of every phase, together with the hit
+    rate of the tokenization cache once text has been tokenized, and the
+    compilation totals of a compiled model.
+
+    `profiler_windows` lists (start, end) training steps between which a
+    `torch.profiler` trace is captured and written to
+    `{experiment_dir}/profiler/`, one file per process.
+
+    CUDA kernels run asynchronously, so without `synchronize` each boundary
+    is timed when the host reaches it: device work still queued is counted
+    in whichever later phase first waits for it, but the loop runs as it
+    would without the callback. With `synchronize`, every boundary waits
+    for the device, which makes the split of a step exact but adds several
+    device syncs per step and lowers the samples/sec it reports.
+
+    :param log_every_n_steps: How often to log the training summary.
+    :param profiler_windows: Training step windows to capture traces for,
+    e.g. [[100, 110]].
+    :param synchronize: Whether to synchronize CUDA at every timing boundary.
+    """
+
+    PHASES = ("training", "validation", "testing")
+
+    def __init__(
+        self,
+        log_every_n_steps: int = 50,
+        profiler_windows: Optional[List[List[int]]] = None,
+        synchronize: bool = False,
+    ):
+        super().__init__()
+        self.log_every_n_steps = log_every_n_steps
+        self.profiler_windows = [
+            (int(start), int(end)) for start, end in (profiler_windows or [])
+        ]
+        self.synchronize = synchronize
+        self.experiment = None
+        self.profiler = None
+        self.profiler_window = None
+        self._hooks = []
+        self._marks: Dict[str, float] = {}
+        self._phase_name = None
+        self._reset_all()
+
+    def _reset_all(self):
+        self.totals = {
+            phase_name: self._empty_totals() for phase_name in self.PHASES
+        }
+
+    @staticmethod
+    def _empty_totals() -> Dict[str, float]:
+        return {
+            "data_wait_time": 0.0,
+            "step_time": 0.0,
+            "forward_time": 0.0,
+            "backward_time": 0.0,
+            "optimizer_time": 0.0,
+            "num_samples": 0,
+            "num_steps": 0,
+        }
+
+    def _now(self) -> float:
+        if self.synchronize and torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _reset_peak_memory(self):
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+
+    @staticmethod
+    def _peak_memory_mb() -> float:
+        if torch.cuda.is_available():
+            return torch.cuda.max_memory_allocated() / 1024**2
+        import resource
+
+        # ru_maxrss is reported in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # ---------------------------------------------------------------------
+    # Hooks on the training model and optimizer
+
+    def _register_hooks(self, model: nn.Module, optimizer: Any):
+        def forward_pre_hook(module, args):
+            if self._phase_name == "training":
+                self._marks["forward"] = self._now()
+
+        def forward_hook(module, args, output):
+            if self._phase_name == "training" and "forward" in self._marks:
+                now = self._now()
+                self.totals["training"][
+                    "forward_time"
+                ] += now - self._marks.pop("forward")
+                self._marks["backward"] = now
+
+        def optimizer_pre_hook(optimizer, args, kwargs):
+            if self._phase_name == "training":
+                now = self._now()
+                if "backward" in self._marks:
+                    self.totals["training"][
+                        "backward_time"
+                    ] += now - self._marks.pop("backward")
+                self._marks["optimizer"] = now
+
+        def optimizer_post_hook(optimizer, args, kwargs):
+            if self._phase_name == "training" and "optimizer" in self._marks:
+                self.totals["training"][
+                    "optimizer_time"
+                ] += self._now() - self._marks.pop("optimizer")
+
+        self._hooks.append(model.register_forward_pre_hook(forward_pre_hook))
+        self._hooks.append(model.register_forward_hook(forward_hook))
+        if optimizer is not None and hasattr(
+            optimizer, "register_step_pre_hook"
+        ):
+            self._hooks.append(
+                optimizer.register_step_pre_hook(optimizer_pre_hook)
+            )
+            self._hooks.append(
+                optimizer.register_step_post_hook(optimizer_post_hook)
+            )
+
+    def on_init_end(
+        self,
+        experiment: Any,
+        model: nn.Module,
+        train_dataloader: DataLoader = None,
+        val_dataloader: Union[List[DataLoader], DataLoader] = None,
+        test_dataloader: Union[List[DataLoader], DataLoader] = None,
+    ) -> None:
+        self.experiment = experiment
+        trainer = getattr(experiment, "trainer", None)
+        self._register_hooks(
+            model=model, optimizer=getattr(trainer, "optimizer", None)
+        )
+
+    # ---------------------------------------------------------------------
+    # Data loading
+
+    def on_data_wait_start(self, phase_name: str) -> None:
+        self._marks["data_wait"] = self._now()
+
+    def on_data_wait_end(self, phase_name: str, batch: Dict) -> None:
+        if "data_wait" in self._marks:
+            self.totals[phase_name][
+                "data_wait_time"
+            ] += self._now() - self._marks.pop("data_wait")
+        self.totals[phase_name]["num_samples"] += get_batch_size(batch)
+
+    # ---------------------------------------------------------------------
+    # Steps
+
+    def _step_start(self, phase_name: str):
+        self._phase_name = phase_name
+        self._marks["step"] = self._now()
+
+    def _step_end(self, phase_name: str):
+        if "step" in self._marks:
+            self.totals[phase_name][
+                "step_time"
+            ] += self._now() - self._marks.pop("step")
+        self.totals[phase_name]["num_steps"] += 1
+
+    def on_training_step_start(self, model: nn.Module, batch: Dict) -> None:
+        self._step_start("training")
+        global_step = getattr(self.experiment, "global_step", None)
+        for start, end in self.profiler_windows:
+            if global_step == start and self.profiler is None:
+                self._start_profiler(start, end)
+
+    def on_training_step_end(self, model: nn.Module, batch: Dict) -> None:
+        self._step_end("training")
+        global_step = getattr(self.experiment, "global_step", None)
+
+        if self.profiler is not None:
+            self.profiler.step()
+            if (
+                global_step is not None
+                and global_step >= self.profiler_window[1]
+            ):
+                self._stop_profiler()
+
+        if (
+            self.log_every_n_steps is not None
+            and self.totals["training"]["num_steps"] >= self.log_every_n_steps
+        ):
+            self.log_summary("training")
+
+    def on_validation_step_start(self, model: nn.Module, batch: Dict) -> None:
+        self._step_start("validation")
+
+    def on_validation_step_end(self, model: nn.Module, batch: Dict) -> None:
+        self._step_end("validation")
+        self._phase_name = "training"
+
+    def on_testing_step_start(self, model: nn.Module, batch: Dict) -> None:
+        self._step_start("testing")
+
+    def on_testing_step_end(self, model: nn.Module, batch: Dict) -> None:
+        self._step_end("testing")
+
+    # ---------------------------------------------------------------------
+    # Phases
+
+    def on_train_start(self, experiment: Any, model: nn.Module) -> None:
+        self.experiment = experiment
+        self.totals["training"] = self._empty_totals()
+        self._reset_peak_memory()
+
+    def on_train_end(self, experiment: Any, model: nn.Module) -> None:
+        if self.profiler is not None:
+            self._stop_profiler()
+        self.log_summary("training")
+
+    def on_validation_start(self, experiment: Any, model: nn.Module):
+        self.totals["validation"] = self._empty_totals()
+
+    def on_validation_end(self, experiment: Any, model: nn.Module) -> None:
+        self.log_summary("validation")
+
+    def on_testing_start(self, experiment: Any, model: nn.Module) -> None:
+        self.experiment = experiment
+        self.totals["testing"] = self._empty_totals()
+        self._reset_peak_memory()
+
+    def on_testing_end(self, experiment: Any, model: nn.Module) -> None:
+        self.log_summary("testing")
+
+    def summarize(self, phase_name: str) -> Dict[str, float]:
+        """
+        :return: The mean per-step times, throughput and peak memory of
+        `phase_name` since its totals were last reset.
+        """
+        totals = self.totals[phase_name]
+        num_steps = max(totals["num_steps"], 1)
+        wall_time = totals["data_wait_time"] + totals["step_time"]
+
+        summary = {
+            "data_wait_time": totals["data_wait_time"] / num_steps,
+            "step_time": totals["step_time"] / num_steps,
+            "samples_per_sec": (
+                totals["num_samples"] / wall_time if wall_time > 0 else 0.0
+            ),
+            "data_wait_fraction": (
+                totals["data_wait_time"] / wall_time if wall_time > 0 else 0.0
+            ),
+            "peak_memory_mb": self._peak_memory_mb(),
+        }
+        if phase_name == "training":
+            summary["forward_time"] = totals["forward_time"] / num_steps
+            summary["backward_time"] = totals["backward_time"] / num_steps
+            summary["optimizer_time"] = totals["optimizer_time"] / num_steps
+
+        from gate.models.backbones.tokenization import tokenization_cache_stats
+
+        # since the start of the run, across forked dataloader workers
+        tokenization_stats = tokenization_cache_stats()
+        if tokenization_stats["tokenization_cache_lookups"] > 0:
+            summary["tokenization_cache_hit_rate"] = tokenization_stats[
+                "tokenization_cache_hit_rate"
+            ]
+
+        from gate.models.compile import compile_stats
+
+        stats = compile_stats()
+        if stats["compiled_graphs"] > 0:
+            summary.update(
+                {f"compile_{key}": value for key, value in stats.items()}
+            )
+
+        return summary
+
+    def log_summary(self, phase_name: str):
+        if self.totals[phase_name]["num_steps"] == 0:
+            return
+
+        from gate.boilerplate.decorators import collect_metrics
+
+        summary = self.summarize(phase_name)
+        trainer = getattr(self.experiment, "trainer", None)
+        collect_metrics(
+            metrics_dict=summary,
+            phase_name=f"profiling/{phase_name}",
+            experiment_tracker=getattr(trainer, "experiment_tracker", None),
+            global_step=getattr(self.experiment, "global_step", 0),
+        )
+        logger.debug(f"Profiling summary for {phase_name}: {summary}")
+        self.totals[phase_name] = self._empty_totals()
+
+    # ---------------------------------------------------------------------
+    # torch.profiler windows
+
+    def _start_profiler(self, start: int, end: int):
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+        self.profiler_window = (start, end)
+        self.profiler = torch.profiler.profile(
+            activities=activities,
+            record_shapes=True,
+            profile_memory=True,
+        )
+        self.profiler.__enter__()
+        logger.info(f"Capturing torch.profiler trace for steps {start}-{end}")
+
+    def _stop_profiler(self):
+        profiler, self.profiler = self.profiler, None
+        profiler.__exit__(None, None, None)
+
+        start, end = self.profiler_window
+        experiment_dir = getattr(self.experiment, "experiment_dir", Path("."))
+        trace_dir = Path(experiment_dir) / "profiler"
+        trace_dir.mkdir(parents=True, exist_ok=True)
+        # every process writes its own trace into the shared directory
+        accelerator = getattr(self.experiment, "accelerator", None)
+        process_index = getattr(accelerator, "process_index", 0)
+        trace_name = f"trace_steps_{start}_{end}_process_{process_index}"
+        trace_path = trace_dir / f"{trace_name}.json"
+        profiler.export_chrome_trace(str(trace_path))
+        logger.info(f"Saved torch.profiler trace to {trace_path}")
+        self.profiler_window = None
@@ -0,0 +1,365 @@
+import copy
+import logging
+import random
+import re
+import shutil
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+# File names follow accelerate's save_state layout so that
+# accelerator.load_state and download_model_with_name keep working
+MODEL_FILENAME = "pytorch_model.bin"
+OPTIMIZER_FILENAME = "optimizer.bin"
+SCHEDULER_FILENAME = "scheduler.bin"
+SCALER_FILENAME = "scaler.pt"
+TRAINER_STATE_FILENAME = "trainer_state.pt"
+RANDOM_STATES_FILENAME = "random_states_{process_index}.pkl"
+
+CHECKPOINT_NAME_PATTERN = re.compile(r"^ckpt_(\d+)$")
+
+
+def capture_random_states(step: int = 0) -> Dict[str, Any]:
+    """
+    Capture the python, numpy and torch RNG states in the format accelerate
+    expects when it restores `random_states_{process_index}.pkl`.
+
+    :param step: The accelerator step to store alongside the states.
+    :return: A dictionary with the random states.
+    """
+    states = {
+        "step": step,
+        "random_state": random.getstate(),
+        "numpy_random_seed": np.random.get_state(),
+        "torch_manual_seed": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        states["torch_cuda_manual_seed"] = torch.cuda.get_rng_state_all()
+    return states
+
+
+@dataclass
+class CheckpointRetentionPolicy:
+    """
+    🗑️ Decides which `ckpt_{step}` directories survive after a new
+    checkpoint is written. The most recent checkpoint is always kept so
+    that training can resume. Leaving both limits as None keeps everything.
+
+    :param keep_last_n: Keep the n most recent checkpoints.
+    :param keep_top_k: Keep the k checkpoints with the best model
+    selection metric.
+    :param higher_is_better: Whether a higher metric is better.
+    """
+
+    keep_last_n: Optional[int] = None
+    keep_top_k: Optional[int] = None
+    higher_is_better: bool = True
+
+    def select_steps_to_remove(
+        self, steps: List[int], metric_by_step: Dict[int, float]
+    ) -> List[int]:
+        if self.keep_last_n is None and self.keep_top_k is None:
+            return []
+
+        ordered_steps = sorted(steps)
+        if len(ordered_steps) == 0:
+            return []
+
+        steps_to_keep = {ordered_steps[-1]}
+
+        if self.keep_last_n is not None and self.keep_last_n > 0:
+            steps_to_keep.update(ordered_steps[-self.keep_last_n :])
+
+        if self.keep_top_k is not None and self.keep_top_k > 0:
+            scored_steps = sorted(
+                [step for step in ordered_steps if step in metric_by_step],
+                key=lambda step: metric_by_step[step],
+                reverse=self.higher_is_better,
+            )
+            steps_to_keep.update(scored_steps[: self.keep_top_k])
+
+        return [step for step in ordered_steps if step not in steps_to_keep]
+
+
+class AsyncCheckpointWriter:
+    """
+    💾 Writes checkpoints on a background thread so training does not stall
+    while state is serialized.
+
+    `save` snapshots every tensor into CPU buffers that are allocated once
+    (pinned when CUDA is available) and reused across checkpoints, then hands
+    the snapshot to a writer thread. The thread writes into a staging
+    directory and renames it into `checkpoints_dir` only once every file is
+    on disk, so a crash never leaves a half-written `ckpt_{step}`. At most
+    one write is in flight, since the snapshot buffers are shared.
+
+    Retention is left to the caller, through `apply_retention`, so that
+    callbacks such as uploads see every committed checkpoint before it can
+    be removed. Only the main process should write.
+    """
+
+    def __init__(
+        self,
+        checkpoints_dir: Union[str, Path],
+        staging_dir: Union[str, Path],
+        retention_policy: Optional[CheckpointRetentionPolicy] = None,
+        pin_memory: Optional[bool] = None,
+        is_main_process: bool = True,
+    ):
+        """
+        :param is_main_process: Whether this process owns the shared
+        directories. Only the main process clears the staging directory,
+        the others must wait for it before saving.
+        """
+        self.checkpoints_dir = Path(checkpoints_dir)
+        self.staging_dir = Path(staging_dir)
+        self.retention_policy = (
+            retention_policy
+            if retention_policy is not None
+            else CheckpointRetentionPolicy()
+        )
+        self.pin_memory = (
+            torch.cuda.is_available() if pin_memory is None else pin_memory
+        )
+        self._buffers: Dict[str, torch.Tensor] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self._completed: List[Path] = []
+        self._lock = threading.Lock()
+
+        if is_main_process:
+            self.checkpoints_dir.mkdir(parents=True, exist_ok=True)
+            # Anything left in staging belongs to a write that never
+            # committed
+            if self.staging_dir.exists():
+                shutil.rmtree(self.staging_dir, ignore_errors=True)
+            self.staging_dir.mkdir(parents=True, exist_ok=True)
+
+    def _buffer_for(self, key: str, tensor: torch.Tensor) -> torch.Tensor:
+        buffer = self._buffers.get(key)
+        if (
+            buffer is None
+            or buffer.shape != tensor.shape
+            or buffer.dtype != tensor.dtype
+        ):
+            buffer = torch.empty(
+                tensor.shape,
+                dtype=tensor.dtype,
+                pin_memory=self.pin_memory,
+            )
+            self._buffers[key] = buffer
+        return buffer
+
+    def snapshot(self, obj: Any, key: str = "") -> Any:
+        """
+        Recursively copy a (nested) state dict, placing every tensor in a
+        reusable CPU buffer.
+
+        :param obj: The object to snapshot.
+        :param key: The path of `obj` in the enclosing structure, used to
+        look up its buffer.
+        :return: A copy of `obj` that shares no storage with the live state.
+        """
+        if isinstance(obj, torch.Tensor):
+            buffer = self._buffer_for(key, obj)
+            buffer.copy_(obj.detach(), non_blocking=self.pin_memory)
+            return buffer
+        if isinstance(obj, dict):
+            return obj.__class__(
+                (k, self.snapshot(v, f"{key}/{k}")) for k, v in obj.items()
+            )
+        if isinstance(obj, (list, tuple)):
+            items = [
+                self.snapshot(v, f"{key}/{idx}") for idx, v in enumerate(obj)
+            ]
+            return obj.__class__(items) if isinstance(obj, tuple) else items
+        return copy.deepcopy(obj)
+
+    def save(
+        self,
+        checkpoint_name: str,
+        model_state: Dict[str, torch.Tensor],
+        trainer_state: Dict[str, Any],
+        optimizer_state: Optional[Dict[str, Any]] = None,
+        scheduler_state: Optional[Dict[str, Any]] = None,
+        scaler_state: Optional[Dict[str, Any]] = None,
+        random_states: Optional[List[Dict[str, Any]]] = None,
+        blocking: bool = False,
+    ) -> Path:
+        """
+        Snapshot the given state and write it to
+        `checkpoints_dir / checkpoint_name` in the background.
+
+        :param model_state: The state dict of the unwrapped model.
+        :param random_states: The random states of every process, in
+        process order, each written to its own
+        `random_states_{process_index}.pkl`.
+        :return: The final path of the checkpoint.
+        """
+        # The previous write still reads from the shared buffers
+        self.wait()
+
+        state = {
+            MODEL_FILENAME: self.snapshot(model_state, "model"),
+            TRAINER_STATE_FILENAME: self.snapshot(trainer_state, "trainer"),
+        }
+        if optimizer_state is not None:
+            state[OPTIMIZER_FILENAME] = self.snapshot(
+                optimizer_state, "optimizer"
+            )
+        if scheduler_state is not None:
+            state[SCHEDULER_FILENAME] = self.snapshot(
+                scheduler_state, "scheduler"
+            )
+        if scaler_state is not None:
+            state[SCALER_FILENAME] = self.snapshot(scaler_state, "scaler")
+        for process_index, process_random_states in enumerate(
+            random_states or []
+        ):
+            state[
+                RANDOM_STATES_FILENAME.format(process_index=process_index)
+            ] = copy.deepcopy(process_random_states)
+
+        if self.pin_memory and torch.cuda.is_available():
+            # non_blocking device-to-host copies must land before writing
+            torch.cuda.synchronize()
+
+        final_path = self.checkpoints_dir / checkpoint_name
+        self._thread = threading.Thread(
+            target=self._write,
+            args=(checkpoint_name, state),
+            daemon=True,
+        )
+        self._thread.start()
+
+        if blocking:
+            self.wait()
+
+        return final_path
+
+    def _write(
+        self,
+        checkpoint_name: str,
+        state: Dict[str, Any],
+    ):
+        try:
+            staging_path = self.staging_dir / checkpoint_name
+            if staging_path.exists():
+                shutil.rmtree(staging_path)
+            staging_path.mkdir(parents=True)
+
+            for filename, value in state.items():
+                torch.save(value, staging_path / filename)
+
+            final_path = self.commit(staging_path, checkpoint_name)
+
+            with self._lock:
+                self._completed.append(final_path)
+            logger.debug(f"Checkpoint written to {final_path}")
+        except BaseException as e:
+            self._error = e
+
+    def commit(self, staging_path: Path, checkpoint_name: str) -> Path:
+        """
+        Move a fully written staging directory into place. An existing
+        checkpoint with the same name is only removed after the new one
+        has been renamed in.
+        """
+        final_path = self.checkpoints_dir / checkpoint_name
+        previous_path = self.staging_dir / f"{checkpoint_name}.previous"
+
+        if previous_path.exists():
+            shutil.rmtree(previous_path)
+
+        if final_path.exists():
+            final_path.rename(previous_path)
+
+        staging_path.rename(final_path)
+
+        if previous_path.exists():
+            shutil.rmtree(previous_path)
+
+        return final_path
+
+    def apply_retention(
+        self,
+        metric_by_step: Dict[int, float],
+        protected_paths: Iterable[Path] = (),
+    ):
+        """
+        Remove the checkpoints the retention policy no longer keeps.
+
+        :param metric_by_step: The model selection metric of every step.
+        :param protected_paths: Checkpoints to keep regardless, e.g. those
+        still being uploaded. Committed checkpoints not yet returned by
+        `pop_completed` are always kept.
+        """
+        with self._lock:
+            protected = {Path(path) for path in self._completed}
+        protected.update(Path(path) for path in protected_paths)
+
+        step_to_path = {}
+        for path in self.checkpoints_dir.iterdir():
+            match = CHECKPOINT_NAME_PATTERN.match(path.name)
+            if match is not None and path.is_dir():
+                step_to_path[int(match.group(1))] = path
+
+        for step in self.retention_policy.select_steps_to_remove(
+            steps=list(step_to_path.keys()), metric_by_step=metric_by_step
+        ):
+            if step_to_path[step] in protected:
+                continue
+            logger.info(f"Removing checkpoint {step_to_path[step]}")
+            shutil.rmtree(step_to_path[step], ignore_errors=True)
+
+    def wait(self):
+        """
+        Block until the in-flight write, if any, has finished. Errors raised
+        on the writer thread are re-raised here.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def pop_completed(self) -> List[Path]:
+        """
+        :return: The checkpoints committed since the last call.
+        """
+        with self._lock:
+            completed, self._completed = self._completed, []
+        return completed
+
+
+def accept_unwrapped_state_dict(model: nn.Module) -> None:
+    """
+    Let a wrapper that keeps the model as `model.module`, such as
+    DistributedDataParallel, load the unwrapped state dicts written by
+    AsyncCheckpointWriter, by adding the `module.` prefix to their keys.
+    Prefixed state dicts, as written by `accelerator.save_state`, load
+    unchanged.
+    """
+    if not isinstance(getattr(model, "module", None), nn.Module):
+        return
+
+    def add_prefix(module, state_dict, prefix, *args):
+        for key in list(state_dict.keys()):
+            if key.startswith(prefix) and not key.startswith(
+                f"{prefix}module."
+            ):
+                unprefixed_key = key[len(prefix) :]
+                state_dict[f"{prefix}module.{unprefixed_key}"] = (
+                    state_dict.pop(key)
+                )
+
+    model._register_load_state_dict_pre_hook(add_prefix, with_module=True)
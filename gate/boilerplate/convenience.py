@@ -1,15 +1,28 @@
 import logging
 import pathlib
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Sequence, Tuple
 
 import torch
 import torch.nn as nn
 import transformers
 from hydra_zen import instantiate
-from torch.utils.data import Subset
+from torch.utils.data import RandomSampler, SequentialSampler, Subset
 
 import wandb
-from gate.data.core import GATEDataset
+from gate.data.core import (
+    GATEDataset,
+    InfiniteSampler,
+    LengthBucketBatchSampler,
+    MixtureDataset,
+    MixtureSampler,
+    get_sample_lengths,
+)
+from gate.data.preprocessed_cache import PreprocessedCache
+from gate.data.quarantine import QuarantineIndex, QuarantineSampler
+from gate.data.transforms.batch_augment import (
+    BatchAugmentation,
+    BatchAugmentCollate,
+)
 from gate.models.core import GATEModel
 
 logger = logging.getLogger(__name__)
@@ -69,6 +82,10 @@ def get_datasets(dataset: Dict[str, GATEDataset], global_step: int):
     """
     Get training, validation, and test datasets.
 
+    Infinitely sampled and mixture training sets are returned as-is, since
+    resuming them is handled by the sampler built in
+    `instantiate_dataloader`.
+
     Args:
         dataset (GATEDataset): The main dataset.
         global_step (int): The global training step.
@@ -80,7 +97,11 @@ def get_datasets(dataset: Dict[str, GATEDataset], global_step: int):
     val_dataset = dataset["val"]
     test_dataset = dataset["test"]
 
-    if global_step > 0:
+    if (
+        global_step > 0
+        and not isinstance(train_dataset, MixtureDataset)
+        and not getattr(train_dataset, "infinite_sampling", False)
+    ):
         train_dataset = Subset(
             train_dataset, range(global_step, len(train_dataset))
         )
@@ -89,22 +110,253 @@ def get_datasets(dataset: Dict[str, GATEDataset], global_step: int):
 
 
 def instantiate_dataloader(
-    cfg: Any, dataset: GATEDataset, batch_size: int, shuffle: bool
+    cfg: Any,
+    dataset: GATEDataset,
+    batch_size: int,
+    shuffle: bool,
+    global_step: int = 0,
 ):
     """
     Instantiate a data loader.
 
+    If the dataset uses infinite sampling, the loader is given an
+    InfiniteSampler over the true dataset length that resumes from
+    `global_step * batch_size`, instead of a sampler over the nominal
+    infinite length. Shuffled MixtureDatasets are given a MixtureSampler,
+    which draws from each source according to the mixture's sampling
+    probabilities and resumes the same way. Once the loader is prepared,
+    `Learner.resume_train_sampler` moves these samplers to the samples
+    consumed by all processes. With `cfg.length_bucketing`,
+    shuffled datasets that declare a `length_key` are batched by a
+    LengthBucketBatchSampler instead, which groups samples of similar
+    length to reduce padding. Datasets whose quarantine index holds any
+    samples get their sampler wrapped in a QuarantineSampler, which
+    substitutes those items when shuffling (training) and drops them
+    otherwise. Datasets with
+    `batch_transforms` get them applied to the collated images inside the
+    dataloader workers.
+
     Args:
         cfg (Any): The configuration parameters.
         dataset (GATEDataset): The dataset.
         batch_size (int): The batch size.
         shuffle (bool): Whether to shuffle the data.
+        global_step (int): The global step to resume the sampler from.
 
     Returns:
         DataLoader: The instantiated data loader.
     """
-    return instantiate(
-        cfg.dataloader, dataset=dataset, batch_size=batch_size, shuffle=shuffle
+    length_key = getattr(dataset, "length_key", None)
+    if getattr(cfg, "length_bucketing", False) and shuffle and length_key:
+        batch_sampler = LengthBucketBatchSampler(
+            lengths=get_sample_lengths(dataset, length_key),
+            batch_size=batch_size,
+            shuffle=True,
+            seed=cfg.seed,
+            infinite=getattr(dataset, "infinite_sampling", False),
+            start_batch=global_step,
+        )
+        dataloader = instantiate(
+            cfg.dataloader,
+            dataset=dataset,
+            batch_size=1,
+            shuffle=False,
+            batch_sampler=wrap_with_quarantine(
+                dataset, batch_sampler, substitute=shuffle
+            ),
+        )
+        return with_batch_transforms(dataloader, dataset)
+
+    if isinstance(dataset, MixtureDataset) and shuffle:
+        sampler = MixtureSampler(
+            dataset,
+            seed=cfg.seed,
+            start_index=global_step * batch_size,
+        )
+    elif getattr(dataset, "infinite_sampling", False):
+        sampler = InfiniteSampler(
+            dataset_size=len(dataset.dataset),
+            shuffle=shuffle,
+            seed=cfg.seed,
+            start_index=global_step * batch_size,
+        )
+    elif has_quarantined_items(dataset):
+        sampler = (
+            RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+        )
+    else:
+        dataloader = instantiate(
+            cfg.dataloader,
+            dataset=dataset,
+            batch_size=batch_size,
+            shuffle=shuffle,
+        )
+        return with_batch_transforms(dataloader, dataset)
+
+    dataloader = instantiate(
+        cfg.dataloader,
+        dataset=dataset,
+        batch_size=batch_size,
+        shuffle=False,
+        sampler=wrap_with_quarantine(dataset, sampler, substitute=shuffle),
+    )
+    return with_batch_transforms(dataloader, dataset)
+
+
+def with_batch_transforms(dataloader: Any, dataset: Any):
+    """
+    Apply the dataset's `batch_transforms`, if any, to the images of every
+    collated batch, e.g. the batched augmentation of classification
+    training sets.
+
+    Args:
+        dataloader (DataLoader): The data loader.
+        dataset (Any): The dataset it loads.
+
+    Returns:
+        DataLoader: The same data loader.
+    """
+    batch_transforms = getattr(dataset, "batch_transforms", None)
+    if batch_transforms is not None:
+        dataloader.collate_fn = BatchAugmentCollate(
+            dataloader.collate_fn, batch_transforms
+        )
+    return dataloader
+
+
+def attach_quarantine(
+    dataset_dict: Dict[str, GATEDataset],
+    dataset_dir: str,
+    dataset_name: str,
+) -> None:
+    """
+    Give every GATEDataset split the QuarantineIndex stored under
+    `{dataset_dir}/quarantine/{dataset_name}/{split}.jsonl`, so that items
+    failing to load are recorded there and skipped by the samplers built in
+    `instantiate_dataloader`. Only the train split replaces failing items,
+    the evaluation splits skip them.
+
+    Args:
+        dataset_dict (Dict[str, GATEDataset]): The dataset splits.
+        dataset_dir (str): The dataset root directory.
+        dataset_name (str): The name of the dataset config.
+    """
+    for split, dataset in dataset_dict.items():
+        if not isinstance(dataset, GATEDataset):
+            continue
+        dataset.quarantine = QuarantineIndex.for_split(
+            dataset_dir=dataset_dir, dataset_name=dataset_name, split=split
+        )
+        dataset.replace_failed_items = split == "train"
+        if len(dataset.quarantine) > 0:
+            logger.info(
+                f"{len(dataset.quarantine)} quarantined samples in the "
+                f"{split} split of {dataset_name}"
+            )
+
+
+def match_batch_augmentation_normalization(
+    dataset_dict: Dict[str, GATEDataset],
+    image_normalization: Optional[Tuple[Sequence[float], Sequence[float]]],
+) -> None:
+    """
+    Tell the BatchAugmentation of every split which (mean, std) the
+    encoder transforms normalised its images with, so that it undoes and
+    redoes the encoder's normalisation rather than the ImageNet one the
+    dataset builders assume.
+
+    Args:
+        dataset_dict (Dict[str, GATEDataset]): The dataset splits.
+        image_normalization (Optional[Tuple]): The encoder's (mean, std),
+            None if the encoder does not declare it.
+    """
+    for split, dataset in dataset_dict.items():
+        batch_transforms = getattr(dataset, "batch_transforms", None)
+        if not isinstance(batch_transforms, BatchAugmentation):
+            continue
+        if image_normalization is None:
+            logger.warning(
+                f"The encoder does not declare its image normalisation, "
+                f"the batch augmentation of the {split} split assumes "
+                f"mean={batch_transforms.mean} and std={batch_transforms.std}"
+            )
+            continue
+        batch_transforms.mean, batch_transforms.std = image_normalization
+
+
+def attach_preprocessed_cache(
+    dataset_dict: Dict[str, GATEDataset],
+    cache_dir: str,
+    dataset_name: str,
+    image_size: Optional[int] = None,
+    num_workers: int = 8,
+) -> None:
+    """
+    Give every GATEDataset split with a deterministic `preprocess` step its
+    PreprocessedCache, building the caches that don't exist yet for the
+    current configuration. Later epochs and runs then only apply the
+    random part of the transforms.
+
+    Args:
+        dataset_dict (Dict[str, GATEDataset]): The dataset splits.
+        cache_dir (str): The root directory of the caches.
+        dataset_name (str): The name of the dataset config.
+        image_size (Optional[int]): The image size of the encoder, part of
+            the cache key.
+        num_workers (int): The number of workers used to build a cache.
+    """
+    for split, dataset in dataset_dict.items():
+        if not isinstance(dataset, GATEDataset) or dataset.preprocess is None:
+            continue
+        cache = PreprocessedCache(
+            cache_dir=cache_dir,
+            dataset_name=dataset_name,
+            split=split,
+            preprocess=dataset.preprocess,
+            image_size=image_size,
+        )
+        if not cache.is_built:
+            logger.info(
+                f"Building the preprocessed cache of the {split} split of "
+                f"{dataset_name} in {cache.path}"
+            )
+            cache.build(
+                dataset.dataset,
+                preprocess=dataset.preprocess,
+                num_workers=num_workers,
+                quarantine=dataset.quarantine,
+            )
+        dataset.cache = cache
+
+
+def has_quarantined_items(dataset: Any) -> bool:
+    quarantine = getattr(dataset, "quarantine", None)
+    return quarantine is not None and len(quarantine) > 0
+
+
+def wrap_with_quarantine(dataset: Any, sampler: Any, substitute: bool):
+    """
+    Wrap a sampler or batch sampler in a QuarantineSampler if the dataset
+    has quarantined samples. Samples that fail later are still recorded,
+    and replaced or skipped by the dataset itself.
+
+    Args:
+        dataset (Any): The dataset the sampler draws from.
+        sampler (Any): The sampler or batch sampler.
+        substitute (bool): Whether to replace quarantined items (training)
+            rather than dropping them (evaluation).
+
+    Returns:
+        The sampler, wrapped if needed.
+    """
+    if not has_quarantined_items(dataset):
+        return sampler
+
+    return QuarantineSampler(
+        sampler,
+        quarantine=dataset.quarantine,
+        dataset_size=dataset.num_unique_items,
+        substitute=substitute,
     )
 
 
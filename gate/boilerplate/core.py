@@ -1,6 +1,7 @@
 import copy
 import logging
 import pathlib
+import shutil
 import time
 from enum import Enum
 from pathlib import Path
@@ -9,12 +10,25 @@ from typing import List, Optional, Union
 import torch
 import torch.nn as nn
 from accelerate import Accelerator
+from accelerate.data_loader import DataLoaderDispatcher, DataLoaderShard
+from accelerate.utils import DistributedType, gather_object, send_to_device
 from torch.utils.data import DataLoader
 from tqdm import tqdm
 from zmq import has
 
 from gate.boilerplate.callbacks import Callback, CallbackHandler
-from gate.boilerplate.decorators import configurable
+from gate.boilerplate.checkpointing import (
+    AsyncCheckpointWriter,
+    CheckpointRetentionPolicy,
+    accept_unwrapped_state_dict,
+    capture_random_states,
+)
+from gate.boilerplate.decorators import (
+    collect_metrics,
+    configurable,
+    configure_metrics_logging,
+    flush_metrics_logging,
+)
 from gate.boilerplate.utils import download_model_with_name
 from gate.config.variables import (
     DUMMY_BATCH_MODE,
@@ -25,7 +39,21 @@ from gate.config.variables import (
     HYDRATED_TRAIN_ITERS,
     RESUME,
 )
-from gate.models.core import Ensemble, GATEModel
+from gate.data.core import (
+    InfiniteSampler,
+    LengthBucketBatchSampler,
+    MixtureSampler,
+    batch_padding_ratio,
+    find_mixture_sampler,
+    find_sampler,
+)
+from gate.models.core import (
+    CachedOutputEnsemble,
+    Ensemble,
+    GATEModel,
+    ModelSoup,
+    OutputRecorder,
+)
 from gate.orchestration.evaluators.classification import Evaluator
 from gate.orchestration.trainers.classification import Trainer
 
@@ -35,6 +63,19 @@ from pathlib import Path
 from typing import Union
 
 
+def places_batches_on_device(dataloader) -> bool:
+    """
+    :return: Whether `dataloader` was prepared by accelerate to yield its
+    batches on the device already.
+    """
+    if isinstance(dataloader, DataLoaderDispatcher):
+        return True
+    return (
+        isinstance(dataloader, DataLoaderShard)
+        and dataloader.device is not None
+    )
+
+
 class ExperimentStatus(Enum):
     COMPLETED: str = "completed"
     TRAINING: str = "training"
@@ -52,6 +93,16 @@ class ExperimentStatus(Enum):
         resume=RESUME,
         evaluate_every_n_steps=250,
         checkpoint_after_validation=True,
+        async_checkpointing=False,
+        keep_last_n_checkpoints=None,
+        keep_top_k_checkpoints=None,
+        cached_ensemble_testing=False,
+        memory_map_ensemble_outputs=False,
+        vectorized_ensemble_testing=False,
+        model_soup_testing=False,
+        metrics_logging_queue_size=1024,
+        metrics_logging_flush_interval=5.0,
+        metrics_logging_when_full="block",
         train_iters=HYDRATED_TRAIN_ITERS,
         limit_val_iters=None,
         dummy_batch_mode=DUMMY_BATCH_MODE,
@@ -73,6 +124,16 @@ class Learner(nn.Module):
         evaluate_every_n_steps: Optional[int] = None,
         checkpoint_every_n_steps: Optional[int] = None,
         checkpoint_after_validation: Optional[bool] = False,
+        async_checkpointing: bool = False,
+        keep_last_n_checkpoints: Optional[int] = None,
+        keep_top_k_checkpoints: Optional[int] = None,
+        cached_ensemble_testing: bool = False,
+        memory_map_ensemble_outputs: bool = False,
+        vectorized_ensemble_testing: bool = False,
+        model_soup_testing: bool = False,
+        metrics_logging_queue_size: int = 1024,
+        metrics_logging_flush_interval: float = 5.0,
+        metrics_logging_when_full: str = "block",
         train_iters: Optional[int] = None,
         train_dataloader: Optional[DataLoader] = None,
         limit_train_iters: Optional[int] = None,
@@ -99,6 +160,16 @@ class Learner(nn.Module):
         :param evaluate_every_n_steps: The number of steps between evaluations.
         :param checkpoint_every_n_steps: The number of steps between checkpoints.
         :param checkpoint_after_validation: Whether to save a checkpoint after validation.
+        :param async_checkpointing: Whether to write checkpoints on a background thread. Only supported when the model and optimizer are not sharded, FSDP and DeepSpeed always save synchronously.
+        :param keep_last_n_checkpoints: Keep only the n most recent local checkpoints (None keeps all).
+        :param keep_top_k_checkpoints: Also keep the k best local checkpoints by the evaluator's model selection metric.
+        :param cached_ensemble_testing: Whether to run each top checkpoint over the test set once and build every ensemble from the cached outputs. The outputs of every test batch are kept for up to 5 checkpoints, which for dense outputs such as segmentation logits calls for memory_map_ensemble_outputs. Evaluators that run the model on sub-batches test the ensembles directly instead.
+        :param memory_map_ensemble_outputs: Whether to write the cached ensemble outputs to disk batch by batch as they are recorded, and memory-map them back in, rather than keeping them in RAM.
+        :param vectorized_ensemble_testing: Whether to run the members of a test ensemble with one vmapped call over their stacked parameters.
+        :param model_soup_testing: Whether to also test uniform and greedy weight averages ("model soups") of the top checkpoints.
+        :param metrics_logging_queue_size: The capacity of the metrics logging queue.
+        :param metrics_logging_flush_interval: The longest time, in seconds, metrics wait before being sent to the experiment tracker.
+        :param metrics_logging_when_full: Whether to "block" or "drop" when the metrics logging queue is full.
         :param train_iters: The number of training iterations.
         :param resume: Whether to resume training from a saved checkpoint.
         """
@@ -121,9 +192,51 @@ class Learner(nn.Module):
             self.checkpoints_dir.mkdir(parents=True)
 
         self.model = model
+        accept_unwrapped_state_dict(self.model)
         self.evaluate_every_n_steps = evaluate_every_n_steps
         self.checkpoint_every_n_steps = checkpoint_every_n_steps
         self.checkpoint_after_validation = checkpoint_after_validation
+        if async_checkpointing and getattr(
+            accelerator, "distributed_type", None
+        ) in (
+            DistributedType.FSDP,
+            DistributedType.DEEPSPEED,
+            DistributedType.MEGATRON_LM,
+        ):
+            # every process holds a shard of the optimizer state, which
+            # only accelerator.save_state collects
+            logger.warning(
+                "Async checkpointing is not supported with a sharded "
+                "model and optimizer, saving checkpoints synchronously"
+            )
+            async_checkpointing = False
+        self.async_checkpointing = async_checkpointing
+        self.cached_ensemble_testing = cached_ensemble_testing
+        self.memory_map_ensemble_outputs = memory_map_ensemble_outputs
+        self.vectorized_ensemble_testing = vectorized_ensemble_testing
+        self.model_soup_testing = model_soup_testing
+        configure_metrics_logging(
+            max_queue_size=metrics_logging_queue_size,
+            flush_interval=metrics_logging_flush_interval,
+            when_full=metrics_logging_when_full,
+        )
+        self.checkpoint_writer = AsyncCheckpointWriter(
+            checkpoints_dir=self.checkpoints_dir,
+            staging_dir=self.experiment_dir / "checkpoint_staging",
+            retention_policy=CheckpointRetentionPolicy(
+                keep_last_n=keep_last_n_checkpoints,
+                keep_top_k=keep_top_k_checkpoints,
+                higher_is_better=(
+                    evaluator.model_selection_metric_higher_is_better
+                    if evaluator.model_selection_metric_higher_is_better
+                    is not None
+                    else True
+                ),
+            ),
+            is_main_process=self.accelerator.is_main_process,
+        )
+        # the main process clears the shared staging directory first
+        self.accelerator.wait_for_everyone()
         self.status = ExperimentStatus.STARTING
         self.global_step = 0
 
@@ -207,6 +320,48 @@ class Learner(nn.Module):
     def __str__(self):
         return self.__repr__()
 
+    def iterate_batches(self, dataloader: DataLoader, phase_name: str):
+        """
+        Yield the batches of `dataloader` on the accelerator device, firing
+        the data-wait callback events around fetching each batch. Loaders
+        prepared by accelerate place batches on the device themselves,
+        copying without blocking when `non_blocking_transfers` is set; the
+        batches of other loaders are copied here.
+
+        :param dataloader: The dataloader to iterate.
+        :param phase_name: The phase the batches are used for.
+        """
+        on_device = places_batches_on_device(dataloader)
+        iterator = iter(dataloader)
+        while True:
+            self.callback_handler.on_data_wait_start(phase_name)
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            if batch is None:
+                # every sample of the batch failed to load and was skipped
+                continue
+            if not on_device:
+                batch = send_to_device(batch, self.accelerator.device)
+            self.callback_handler.on_data_wait_end(phase_name, batch)
+
+            self.record_padding_ratio(phase_name, batch)
+
+            yield batch
+
+    def record_padding_ratio(self, phase_name: str, batch):
+        # Reported as text-padding-ratio in the phase's epoch metrics, it
+        # stays on the device until the metric accumulator syncs
+        padding_ratio = batch_padding_ratio(batch)
+        if padding_ratio is None:
+            return
+
+        owner = self.trainer if phase_name == "training" else self.evaluator
+        metric_accumulator = getattr(owner, "metric_accumulator", None)
+        if metric_accumulator is not None:
+            metric_accumulator.update("text-padding-ratio", padding_ratio)
+
     def training_step(self, model, batch):
         model = model.train()
         self.callback_handler.on_batch_start(model, batch)
@@ -280,11 +435,68 @@ class Learner(nn.Module):
             model=self.model,
         )
 
+        self.log_mixture_source_counts()
         self.trainer.end_training(global_step=self.global_step)
+        flush_metrics_logging()
+
+        self.checkpoint_writer.wait()
+        self.dispatch_completed_checkpoints()
 
         logger.debug("Training finished 🎉")
 
+    def log_mixture_source_counts(self):
+        # Training on a MixtureDataset: report how many of the samples the
+        # training steps consumed so far came from every source
+        mixture_sampler = find_mixture_sampler(self.train_dataloader)
+        if mixture_sampler is None:
+            return
+
+        source_counts = mixture_sampler.source_counts_at(
+            self.global_step * self.samples_per_step()
+        )
+        collect_metrics(
+            metrics_dict={
+                f"mixture/{name}-num-samples": count
+                for name, count in source_counts.items()
+            },
+            phase_name="training",
+            experiment_tracker=getattr(
+                self.trainer, "experiment_tracker", None
+            ),
+            global_step=self.global_step,
+        )
+
+    def dispatch_completed_checkpoints(self):
+        # Callbacks such as the HF uploader only see a checkpoint once the
+        # background writer has committed it to disk
+        for checkpoint_path in self.checkpoint_writer.pop_completed():
+            self.callback_handler.on_save_checkpoint(
+                model=self.model,
+                optimizer=self.trainer.optimizer,
+                experiment=self,
+                checkpoint_path=checkpoint_path,
+            )
+        self.apply_checkpoint_retention()
+
+    def apply_checkpoint_retention(self):
+        # Runs after on_save_checkpoint, and keeps the checkpoints whose
+        # upload threads have not finished yet
+        if not self.accelerator.is_main_process:
+            return
+
+        uploading = [
+            thread.checkpoint_path
+            for thread in self.background_threads
+            if hasattr(thread, "checkpoint_path")
+            and (not thread.started or thread.is_alive())
+        ]
+        self.checkpoint_writer.apply_retention(
+            self.get_model_selection_metric_by_step(),
+            protected_paths=uploading,
+        )
+
     def check_manage_background_threads(self):
+        self.dispatch_completed_checkpoints()
         # iterate threads to find up to where they are done, and start the next one
         TIME_LIMIT = 3 * 60  # 60 minutes
         STOP_THREAD_FLAG = "_stop_thread"
@@ -310,6 +522,8 @@ class Learner(nn.Module):
                 logger.info(f"Removing thread {thread} since it is done")
 
     def complete_background_threads(self):
+        self.checkpoint_writer.wait()
+        self.dispatch_completed_checkpoints()
         # iterate threads to find up to where they are done, and start the next one
         TIME_LIMIT = 180  # 10 minutes
         STOP_THREAD_FLAG = "_stop_thread"
@@ -385,6 +599,7 @@ class Learner(nn.Module):
         self.evaluator.end_testing(
             global_step=self.global_step, model=model, prefix=prefix
         )
+        flush_metrics_logging()
 
         self.check_manage_background_threads()
 
@@ -422,8 +637,23 @@ class Learner(nn.Module):
             self.test_dataloader = test_dataloader
         base_model = copy.deepcopy(self.model)
         base_evaluator = copy.deepcopy(self.evaluator)
+        test_best_checkpoints = (
+            model is None
+            and self.evaluator.model_selection_metric_name is not None
+        )
 
-        if model is None:
+        if (
+            model is None
+            and self.cached_ensemble_testing
+            and self.evaluator.model_selection_metric_name is not None
+            and self.evaluator.forwards_once_per_batch
+        ):
+            self.test_cached_ensembles(
+                ensemble_sizes=[1, 3, 5],
+                model=base_model,
+                evaluator=base_evaluator,
+            )
+        elif model is None:
             for kth in [1, 3, 5]:
                 if self.evaluator.model_selection_metric_name is not None:
                     model = self.load_best_model(
@@ -449,10 +679,17 @@ class Learner(nn.Module):
                 prefix=prefix,
             )
 
+        if test_best_checkpoints and self.model_soup_testing:
+            self.test_model_soups(
+                num_checkpoints=5, model=base_model, evaluator=base_evaluator
+            )
+
         self.save_checkpoint(
             checkpoint_name=f"ckpt_{self.global_step}",
             status=ExperimentStatus.COMPLETED,
         )
+        self.checkpoint_writer.wait()
+        self.dispatch_completed_checkpoints()
 
     def _finalize_training(self):
         # self._validation_loop()
@@ -486,7 +723,9 @@ class Learner(nn.Module):
                 while self.global_step <= self.train_iters:
                     tqdm_iter = self.global_step
 
-                    for batch_idx, batch in enumerate(train_dataloader):
+                    for batch_idx, batch in enumerate(
+                        self.iterate_batches(train_dataloader, "training")
+                    ):
                         if self.global_step > self.train_iters:
                             break
                         if (
@@ -494,6 +733,7 @@ class Learner(nn.Module):
                             or self.global_step == 0
                         ):
                             self._validation_loop()
+                            self.log_mixture_source_counts()
 
                         output_list = self.training_step(
                             model=self.model,
@@ -518,20 +758,19 @@ class Learner(nn.Module):
                                 ),
                             )
 
-                        loss = torch.mean(
-                            torch.stack(
-                                [
-                                    value
-                                    for item in output_list
-                                    for key, value in item.__dict__.items()
-                                    if "opt_loss" in key
-                                ]
-                            )
-                        )
                         tqdm_update = self.global_step - tqdm_iter
                         tqdm_iter = self.global_step
                         pbar_steps.update(tqdm_update)
-                        pbar_steps.set_description(f"Loss: {loss:.4f}")
+
+                        # The loss only reaches the host when the trainer's
+                        # metric accumulator syncs, not on every step
+                        metric_accumulator = self.trainer.metric_accumulator
+                        if (
+                            metric_accumulator.step()
+                            and "loss" in metric_accumulator.latest
+                        ):
+                            loss = metric_accumulator.latest["loss"]
+                            pbar_steps.set_description(f"Loss: {loss:.4f}")
 
         self.save_checkpoint(
             checkpoint_name=f"ckpt_{self.global_step}",
@@ -557,7 +796,9 @@ class Learner(nn.Module):
                 total=len(val_dataloader), smoothing=0.0
             ) as pbar_dataloaders:
                 pre_batch_time = time.time()
-                for batch_idx, batch in enumerate(val_dataloader):
+                for batch_idx, batch in enumerate(
+                    self.iterate_batches(val_dataloader, "validation")
+                ):
                     if self.limit_val_iters is not None:
                         if batch_idx >= self.limit_val_iters:
                             break
@@ -593,7 +834,9 @@ class Learner(nn.Module):
             with tqdm(
                 total=len(test_dataloader), smoothing=0.0
             ) as pbar_dataloaders:
-                for batch_idx, batch in enumerate(test_dataloader):
+                for batch_idx, batch in enumerate(
+                    self.iterate_batches(test_dataloader, "testing")
+                ):
                     self.testing_step(
                         model=model,
                         batch=batch,
@@ -610,9 +853,6 @@ class Learner(nn.Module):
     ):
         ckpt_save_path = self.checkpoints_dir / checkpoint_name
 
-        if not ckpt_save_path.exists():
-            ckpt_save_path.mkdir(parents=True)
-
         experiment_hyperparameters = dict(
             step_idx=self.global_step,
             global_step=self.global_step,
@@ -626,6 +866,47 @@ class Learner(nn.Module):
             status=status,
         )
 
+        if self.async_checkpointing:
+            # the model and optimizer are not sharded here, so the main
+            # process holds their full state and is the only one to write;
+            # the random states of every process are gathered to it
+            model_state = self.accelerator.get_state_dict(self.model)
+            random_states = gather_object(
+                [
+                    capture_random_states(
+                        step=getattr(self.accelerator, "step", 0)
+                    )
+                ]
+            )
+            if not self.accelerator.is_main_process:
+                self.status = status
+                return ckpt_save_path
+
+            ckpt_save_path = self.checkpoint_writer.save(
+                checkpoint_name=checkpoint_name,
+                model_state=model_state,
+                trainer_state=experiment_hyperparameters,
+                optimizer_state=self.trainer.optimizer.state_dict(),
+                scheduler_state=(
+                    self.trainer.scheduler.state_dict()
+                    if self.trainer.scheduler is not None
+                    else None
+                ),
+                scaler_state=(
+                    self.accelerator.scaler.state_dict()
+                    if self.accelerator.scaler is not None
+                    else None
+                ),
+                random_states=random_states,
+            )
+            # on_save_checkpoint fires from dispatch_completed_checkpoints
+            # once the writer has committed the checkpoint
+            self.status = status
+            return ckpt_save_path
+
+        if not ckpt_save_path.exists():
+            ckpt_save_path.mkdir(parents=True)
+
         torch.save(
             obj=experiment_hyperparameters,
             f=ckpt_save_path / "trainer_state.pt",
@@ -638,10 +919,77 @@ class Learner(nn.Module):
             experiment=self,
             checkpoint_path=ckpt_save_path,
         )
+        self.apply_checkpoint_retention()
         self.status = status
 
         return ckpt_save_path
 
+    def get_model_selection_metric_by_step(self):
+        metric_name = self.evaluator.model_selection_metric_name
+        if metric_name is None:
+            return {}
+
+        metrics = self.evaluator.per_epoch_metrics.get(metric_name, [])
+        global_steps = self.evaluator.per_epoch_metrics.get("global_step", [])
+
+        return {
+            int(global_step): float(metric)
+            for global_step, metric in zip(global_steps, metrics)
+        }
+
+    def samples_per_step(self) -> int:
+        """
+        :return: The number of training samples drawn from the train
+        sampler per global step, across all processes.
+        """
+        # global_step counts batches rather than optimizer updates, so
+        # gradient accumulation does not change the samples per step
+        total_batch_size = getattr(
+            self.train_dataloader, "total_batch_size", None
+        )
+        if total_batch_size is not None:
+            # an accelerate loader, which accounts for split_batches
+            return total_batch_size
+
+        batch_size = getattr(self.train_dataloader, "batch_size", None)
+        if batch_size is None:
+            batch_sampler = getattr(
+                self.train_dataloader, "batch_sampler", None
+            )
+            batch_size = getattr(batch_sampler, "batch_size", None) or 1
+        return batch_size * self.accelerator.num_processes
+
+    def resume_train_sampler(self):
+        # Move the resumable sampler behind the (possibly quarantined and
+        # accelerate-wrapped) train dataloader to the sample after the
+        # current step
+        if self.train_dataloader is None:
+            return
+
+        num_samples = self.global_step * self.samples_per_step()
+        sampler = find_sampler(
+            self.train_dataloader, (InfiniteSampler, MixtureSampler)
+        )
+        if sampler is not None:
+            sampler.set_start_index(num_samples)
+            logger.info(
+                f"Resuming {sampler.__class__.__name__} at sample "
+                f"{sampler.start_index}"
+            )
+            return
+
+        batch_sampler = find_sampler(
+            self.train_dataloader, LengthBucketBatchSampler
+        )
+        if batch_sampler is not None:
+            batch_sampler.set_start_batch(
+                num_samples // batch_sampler.batch_size
+            )
+            logger.info(
+                f"Resuming LengthBucketBatchSampler at batch "
+                f"{batch_sampler.start_batch}"
+            )
+
     def load_checkpoint(
         self,
         checkpoint_path: Union[str, Path],
@@ -713,6 +1061,7 @@ class Learner(nn.Module):
         # torch.save(renamed_model_state, checkpoint_path / "pytorch_model.bin")
 
         self.accelerator.load_state(checkpoint_path)
+        self.resume_train_sampler()
 
         self.callback_handler.on_load_checkpoint(
             model=self.model,
@@ -723,12 +1072,11 @@ class Learner(nn.Module):
 
         return self.status
 
-    def load_best_model(
+    def get_best_checkpoint_download_dicts(
         self,
         metric_name: str,
         higher_is_better: bool,
         kth_best: int,
-        base_model: nn.Module,
         evaluator: Evaluator = None,
     ):
         (
@@ -752,12 +1100,30 @@ class Learner(nn.Module):
                 model_name=f"ckpt_{global_step}",
                 local_checkpoint_store_dir=self.checkpoints_dir,
             )
+            download_dict["global_step"] = global_step
             if download_dict["validation_passed"] is True:
                 download_dict_list.append(download_dict)
 
             if len(download_dict_list) == kth_best:
                 break
 
+        return download_dict_list
+
+    def load_best_model(
+        self,
+        metric_name: str,
+        higher_is_better: bool,
+        kth_best: int,
+        base_model: nn.Module,
+        evaluator: Evaluator = None,
+    ):
+        download_dict_list = self.get_best_checkpoint_download_dicts(
+            metric_name=metric_name,
+            higher_is_better=higher_is_better,
+            kth_best=kth_best,
+            evaluator=evaluator,
+        )
+
         models = []
 
         for download_dict in download_dict_list:
@@ -776,8 +1142,281 @@ class Learner(nn.Module):
 
         model = GATEModel(
             config=base_model.config,
-            model=Ensemble(models=models),
+            model=Ensemble(
+                models=models, vectorize=self.vectorized_ensemble_testing
+            ),
         )
         model = self.accelerator.prepare(model)
 
         return model
+
+    def cache_checkpoint_outputs(
+        self, download_dict_list: List[dict], model: nn.Module
+    ):
+        """
+        Run every checkpoint over the test set once, loading each one in
+        turn into `model`, and record the outputs of every batch.
+
+        :param download_dict_list: The checkpoints, as returned by get_best_checkpoint_download_dicts.
+        :param model: The model the checkpoints are loaded into. Its weights are overwritten.
+        :return: Per checkpoint, the list of per-batch outputs.
+        """
+        cache_dir = self.experiment_dir / "ensemble_output_cache"
+
+        recorder = OutputRecorder(model=model.model)
+        recording_model = GATEModel(config=model.config, model=recorder)
+        recording_model = recording_model.to(self.accelerator.device).eval()
+
+        cached_outputs = []
+        for idx, download_dict in enumerate(download_dict_list):
+            state_dict = torch.load(
+                download_dict["model_filepath"], map_location="cpu"
+            )
+            model.load_state_dict(state_dict)
+
+            # Labels are identical for every checkpoint, keep them once
+            recorder.record_labels = idx == 0
+            recorder.reset(
+                output_dir=(
+                    cache_dir / f"checkpoint_{idx}"
+                    if self.memory_map_ensemble_outputs
+                    else None
+                )
+            )
+
+            with torch.inference_mode():
+                # the same batches, in the same order, as the testing loop
+                # that replays them; not through iterate_batches, whose
+                # data-wait events would reach the callbacks
+                for batch in tqdm(
+                    self.test_dataloader, desc=f"Caching checkpoint {idx}"
+                ):
+                    if batch is None:
+                        continue
+                    batch = send_to_device(batch, self.accelerator.device)
+                    recording_model.forward(batch)
+
+            cached_outputs.append(recorder.outputs)
+            recorder.reset()
+
+        return cached_outputs
+
+    def test_cached_ensembles(
+        self,
+        ensemble_sizes: List[int],
+        model: nn.Module,
+        evaluator: Evaluator,
+    ):
+        """
+        Evaluate ensembles of the top checkpoints while running each
+        distinct checkpoint over the test set only once. `model` is the only
+        extra model copy held in memory; its weights are overwritten.
+
+        :param ensemble_sizes: The number of top checkpoints in each ensemble.
+        :param model: A copy of the model to load checkpoints into.
+        :param evaluator: The evaluator holding the model selection metrics.
+        """
+        download_dict_list = self.get_best_checkpoint_download_dicts(
+            metric_name=evaluator.model_selection_metric_name,
+            higher_is_better=evaluator.model_selection_metric_higher_is_better,
+            kth_best=max(ensemble_sizes),
+            evaluator=evaluator,
+        )
+
+        cached_outputs = self.cache_checkpoint_outputs(
+            download_dict_list=download_dict_list, model=model
+        )
+
+        for kth in ensemble_sizes:
+            ensemble_model = GATEModel(
+                config=model.config,
+                model=CachedOutputEnsemble(
+                    reference_model=model.model,
+                    cached_outputs=cached_outputs[:kth],
+                ),
+            )
+            ensemble_model = ensemble_model.to(self.accelerator.device)
+
+            self._testing_loop(
+                test_dataloader=self.test_dataloader,
+                model=ensemble_model,
+                prefix=f"ensemble_{kth}",
+            )
+
+        del cached_outputs
+        shutil.rmtree(
+            self.experiment_dir / "ensemble_output_cache", ignore_errors=True
+        )
+
+    def validation_metric(
+        self, model: nn.Module, evaluator: Evaluator, metric_name: str
+    ) -> float:
+        """
+        Run `model` over the validation set with a copy of `evaluator`, and
+        without callbacks, logging, checkpoint uploads or any change to the
+        recorded metrics.
+
+        :return: The value of `metric_name` over the validation set,
+        averaged over processes.
+        """
+        evaluator = copy.deepcopy(evaluator)
+        evaluator.current_epoch_dict.clear()
+        evaluator.metric_accumulator.reset()
+        # no episodes for the experiment tracker
+        evaluator.starting_eval = False
+
+        model = model.eval()
+        with torch.inference_mode():
+            # not through iterate_batches, whose data-wait events would
+            # reach the callbacks
+            for batch in self.val_dataloader:
+                if batch is None:
+                    continue
+                batch = send_to_device(batch, self.accelerator.device)
+                evaluator.step(
+                    model=model,
+                    batch=batch,
+                    global_step=self.global_step,
+                    accelerator=self.accelerator,
+                )
+            metrics = evaluator.compute_phase_metrics()
+            if metric_name not in metrics:
+                # metrics over the whole set, e.g. the mIoU of segmentation
+                task_model = getattr(
+                    self.accelerator.unwrap_model(model), "model", None
+                )
+                if hasattr(task_model, "compute_across_set_metrics"):
+                    metrics.update(task_model.compute_across_set_metrics())
+        if metric_name not in metrics:
+            raise KeyError(
+                f"{metric_name} is not among the validation metrics "
+                f"{sorted(metrics)}"
+            )
+
+        metric = torch.as_tensor(
+            metrics[metric_name],
+            dtype=torch.float32,
+            device=self.accelerator.device,
+        )
+        return float(self.accelerator.reduce(metric, reduction="mean"))
+
+    def make_model_soup(
+        self,
+        download_dict_list: List[dict],
+        model: nn.Module,
+        evaluator: Evaluator,
+        greedy: bool,
+        prepared_model: Optional[nn.Module] = None,
+    ) -> ModelSoup:
+        """
+        Average the weights of the checkpoints, best first. A uniform soup
+        takes every checkpoint, a greedy soup only those that improve the
+        validation model selection metric of the soup so far.
+
+        :param download_dict_list: The checkpoints, as returned by get_best_checkpoint_download_dicts.
+        :param model: The model the checkpoints are loaded into. Its weights are overwritten.
+        :param evaluator: The evaluator holding the model selection metric.
+        :param greedy: Whether to make a greedy rather than a uniform soup.
+        :param prepared_model: `model` as prepared by the accelerator, which greedy soup candidates are validated with. Defaults to `model`.
+        :return: The soup.
+        """
+        metric_name = evaluator.model_selection_metric_name
+        higher_is_better = evaluator.model_selection_metric_higher_is_better
+        soup = ModelSoup()
+        best_metric = None
+
+        # a greedy soup starts from the best checkpoint
+        metric_by_step = self.get_model_selection_metric_by_step()
+        worst = float("-inf") if higher_is_better else float("inf")
+        download_dict_list = sorted(
+            download_dict_list,
+            key=lambda download_dict: metric_by_step.get(
+                int(download_dict["global_step"]), worst
+            ),
+            reverse=higher_is_better,
+        )
+
+        for idx, download_dict in enumerate(download_dict_list):
+            # memory-mapped, so only the soup and the model are held
+            state_dict = torch.load(
+                download_dict["model_filepath"], map_location="cpu", mmap=True
+            )
+            model.load_state_dict(state_dict)
+            del state_dict
+            soup.mix_into(model)
+
+            if greedy:
+                metric = self.validation_metric(
+                    model=(
+                        prepared_model if prepared_model is not None else model
+                    ),
+                    evaluator=evaluator,
+                    metric_name=metric_name,
+                )
+                improves = best_metric is None or (
+                    metric > best_metric
+                    if higher_is_better
+                    else metric < best_metric
+                )
+                logger.info(
+                    f"Greedy soup candidate {idx}: {metric_name} {metric}, "
+                    f"{'added' if improves else 'skipped'}"
+                )
+                if not improves:
+                    continue
+                best_metric = metric
+
+            soup.add(model)
+
+        return soup
+
+    def test_model_soups(
+        self,
+        num_checkpoints: int,
+        model: nn.Module,
+        evaluator: Evaluator,
+    ):
+        """
+        Test a uniform and a greedy soup of the top checkpoints, each with
+        the inference cost of a single model, as soup_uniform_k and
+        soup_greedy_k next to the ensemble_k results.
+
+        :param num_checkpoints: The number of top checkpoints to make the soups from.
+        :param model: A copy of the model to load checkpoints into. Its weights are overwritten.
+        :param evaluator: The evaluator holding the model selection metrics.
+        """
+        download_dict_list = self.get_best_checkpoint_download_dicts(
+            metric_name=evaluator.model_selection_metric_name,
+            higher_is_better=evaluator.model_selection_metric_higher_is_better,
+            kth_best=num_checkpoints,
+            evaluator=evaluator,
+        )
+
+        recipes = ["uniform"]
+        if self.val_dataloader is not None:
+            recipes.append("greedy")
+        else:
+            logger.warning(
+                "No validation set to make a greedy model soup with"
+            )
+
+        # checkpoints are loaded into `model`, which the prepared model wraps
+        model = model.to(self.accelerator.device)
+        prepared_model = self.accelerator.prepare(model)
+
+        for recipe in recipes:
+            soup = self.make_model_soup(
+                download_dict_list=download_dict_list,
+                model=model,
+                evaluator=evaluator,
+                greedy=recipe == "greedy",
+                prepared_model=prepared_model,
+            )
+            soup.load_into(model)
+            del soup
+
+            self._testing_loop(
+                test_dataloader=self.test_dataloader,
+                model=prepared_model,
+                prefix=f"soup_{recipe}_{len(download_dict_list)}",
+            )
@@ -1,10 +1,14 @@
+import atexit
 import functools
 import importlib
 import inspect
 import logging
+import os
 import pkgutil
+import queue
 import threading
-from typing import Any, Callable, Dict, Optional
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import torch
 import wandb
@@ -21,86 +25,280 @@ from gate.boilerplate.wandb_utils import (
 logger = logging.getLogger(__name__)
 
 
-class BackgroundLogging(threading.Thread):
+def build_log_dict(phase_name: str, metrics_dict: Dict) -> Dict:
+    """
+    Turn the metrics of one phase into a single dictionary for the
+    experiment tracker, expanding episode entries into media.
+
+    :param phase_name: The phase the metrics belong to, used as key prefix.
+    :param metrics_dict: The metrics, keyed by metric name.
+    :return: The dictionary to pass to `experiment_tracker.log`.
+    """
+    log_dict = {}
+
+    for metric_key, computed_value in metrics_dict.items():
+        if computed_value is None:
+            continue
+
+        value = (
+            computed_value.detach()
+            if isinstance(computed_value, torch.Tensor)
+            else computed_value
+        )
+
+        log_dict[f"{phase_name}/{metric_key}"] = value
+
+        # if "image_class_episode" in metric_key:
+        #     image_dict = log_wandb_image_classification(
+        #         images=value["image"],
+        #         logits=value["logits"],
+        #         labels=value["label"],
+        #         prefix=phase_name,
+        #     )
+        #     log_dict.update(image_dict)
+
+        if "seg_episode" in metric_key:
+            mask_dict = log_wandb_masks(
+                images=value["image"],
+                logits=value["logits"],
+                labels=value["label"],
+                label_idx_to_description=value["label_idx_to_description"],
+                prefix=phase_name,
+            )
+            log_dict.update(mask_dict)
+
+        if "med_episode" in metric_key:
+            volume_dict = log_wandb_3d_volumes_and_masks(
+                volumes=value["image"],
+                logits=value["logits"],
+                labels=value["label"],
+                prefix=phase_name,
+            )
+            log_dict.update(volume_dict)
+
+        if "ae_episode" in metric_key:
+            image_dict = log_wandb_images(
+                images=value["image"],
+                reconstructions=value["recon"],
+                prefix=phase_name,
+            )
+            log_dict.update(image_dict)
+
+        if "video_episode" in metric_key:
+            video_dict = visualize_video_with_labels(
+                name=phase_name,
+                video=value["video"],
+                logits=value["logits"],
+                labels=value["label"],
+            )
+            log_dict.update(video_dict)
+
+    return log_dict
+
+
+class MetricsLoggingWorker(threading.Thread):
+    """
+    🧵 A single long-lived thread that forwards metrics to the experiment
+    tracker.
+
+    Submitted metrics go through a bounded queue. The worker merges
+    everything logged for the same (phase, global_step) into one
+    `experiment_tracker.log` call, and sends the merged calls once
+    `flush_interval` seconds have passed or `max_pending_steps` distinct
+    (phase, global_step) pairs are waiting.
+
+    :param max_queue_size: The capacity of the submission queue.
+    :param flush_interval: The longest time, in seconds, a metric waits
+    before it is sent.
+    :param max_pending_steps: How many (phase, global_step) pairs may be
+    buffered before they are sent.
+    :param when_full: What `submit` does when the queue is full. "block"
+    waits for space, "drop" discards the metrics and counts them in
+    `num_dropped`.
+    """
+
+    _FLUSH = "flush"
+    _STOP = "stop"
+    _METRICS = "metrics"
+
     def __init__(
         self,
-        experiment_tracker: wandb,
-        global_step: int,
+        max_queue_size: int = 1024,
+        flush_interval: float = 5.0,
+        max_pending_steps: int = 32,
+        when_full: str = "block",
+    ):
+        super().__init__(name="gate-metrics-logging", daemon=True)
+        if when_full not in {"block", "drop"}:
+            raise ValueError(
+                f"when_full must be 'block' or 'drop', got {when_full}"
+            )
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.flush_interval = flush_interval
+        self.max_pending_steps = max_pending_steps
+        self.when_full = when_full
+        self.num_dropped = 0
+        self.pid = os.getpid()
+        self._pending: Dict[Tuple[int, str, int], Tuple[Any, Dict]] = {}
+
+    def submit(
+        self,
+        experiment_tracker: Any,
         phase_name: str,
+        global_step: int,
         metrics_dict: Dict,
-    ):
-        super().__init__()
-        self.experiment_tracker = experiment_tracker  # Experiment tracker
-        self.global_step = global_step  # Global step
-        self.phase_name = phase_name  # Phase name
-        self.metrics_dict = metrics_dict  # Metrics dictionary
+    ) -> bool:
+        """
+        Queue metrics for logging.
+
+        :return: False if the metrics were dropped because the queue was full.
+        """
+        item = (
+            self._METRICS,
+            (experiment_tracker, phase_name, global_step, metrics_dict),
+        )
+        if self.when_full == "block":
+            self.queue.put(item)
+            return True
+
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.num_dropped += 1
+            if self.num_dropped == 1 or self.num_dropped % 1000 == 0:
+                logger.warning(
+                    f"Metrics logging queue is full, {self.num_dropped} "
+                    f"submissions dropped so far"
+                )
+            return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until everything submitted so far has been sent.
+
+        :return: Whether the flush finished within `timeout`.
+        """
+        done = threading.Event()
+        self.queue.put((self._FLUSH, done))
+        return done.wait(timeout)
+
+    def stop(self, timeout: Optional[float] = None):
+        done = threading.Event()
+        self.queue.put((self._STOP, done))
+        done.wait(timeout)
+
+    def _add(self, experiment_tracker, phase_name, global_step, metrics_dict):
+        key = (id(experiment_tracker), phase_name, global_step)
+        if key not in self._pending:
+            self._pending[key] = (
+                experiment_tracker,
+                {"global_step": global_step},
+            )
+        self._pending[key][1].update(build_log_dict(phase_name, metrics_dict))
+
+    def _send_pending(self):
+        pending, self._pending = self._pending, {}
+        for experiment_tracker, log_dict in pending.values():
+            try:
+                experiment_tracker.log(log_dict)
+            except Exception as e:
+                logger.warning(f"Failed to log metrics: {e}")
 
     def run(self):
-        metrics_dict = self.metrics_dict
-        phase_name = self.phase_name
-        global_step = self.global_step
-
-        for metric_key, computed_value in metrics_dict.items():
-            if computed_value is not None:
-                value = (
-                    computed_value.detach()
-                    if isinstance(computed_value, torch.Tensor)
-                    else computed_value
-                )
+        last_send_time = time.monotonic()
+
+        while True:
+            timeout = self.flush_interval - (time.monotonic() - last_send_time)
+            try:
+                kind, payload = self.queue.get(timeout=max(timeout, 0.0))
+            except queue.Empty:
+                kind, payload = None, None
+
+            if kind == self._METRICS:
+                try:
+                    self._add(*payload)
+                except Exception as e:
+                    logger.warning(f"Failed to collect metrics: {e}")
+
+            if (
+                kind in {self._FLUSH, self._STOP}
+                or len(self._pending) >= self.max_pending_steps
+                or time.monotonic() - last_send_time >= self.flush_interval
+            ):
+                self._send_pending()
+                last_send_time = time.monotonic()
+
+            if kind in {self._FLUSH, self._STOP}:
+                payload.set()
+                if kind == self._STOP:
+                    return
+
+
+_metrics_logging_worker: Optional[MetricsLoggingWorker] = None
+_metrics_logging_kwargs: Dict[str, Any] = {}
+_metrics_logging_lock = threading.Lock()
+
+
+def configure_metrics_logging(
+    max_queue_size: int = 1024,
+    flush_interval: float = 5.0,
+    max_pending_steps: int = 32,
+    when_full: str = "block",
+):
+    """
+    Set the options of the process-wide MetricsLoggingWorker. A running
+    worker is flushed and replaced by one with the new options.
+    """
+    global _metrics_logging_worker, _metrics_logging_kwargs
+
+    if when_full not in {"block", "drop"}:
+        raise ValueError(
+            f"when_full must be 'block' or 'drop', got {when_full}"
+        )
+
+    with _metrics_logging_lock:
+        _metrics_logging_kwargs = dict(
+            max_queue_size=max_queue_size,
+            flush_interval=flush_interval,
+            max_pending_steps=max_pending_steps,
+            when_full=when_full,
+        )
+        worker, _metrics_logging_worker = _metrics_logging_worker, None
+
+    if worker is not None and worker.pid == os.getpid() and worker.is_alive():
+        worker.stop()
+
+
+def get_metrics_logging_worker() -> MetricsLoggingWorker:
+    """
+    :return: The process-wide MetricsLoggingWorker, started on first use.
+    """
+    global _metrics_logging_worker
+
+    with _metrics_logging_lock:
+        worker = _metrics_logging_worker
+        # threads do not survive a fork, so a child starts its own worker
+        if worker is None or worker.pid != os.getpid():
+            worker = MetricsLoggingWorker(**_metrics_logging_kwargs)
+            worker.start()
+            _metrics_logging_worker = worker
+        return worker
+
+
+def flush_metrics_logging(timeout: Optional[float] = None) -> bool:
+    """
+    Send every metric submitted so far to the experiment tracker.
+
+    :return: Whether the flush finished within `timeout`.
+    """
+    worker = _metrics_logging_worker
+    if worker is None or worker.pid != os.getpid() or not worker.is_alive():
+        return True
+    return worker.flush(timeout=timeout)
+
 
-                log_dict = {
-                    f"{phase_name}/{metric_key}": value,
-                    "global_step": global_step,
-                }
-
-                # if "image_class_episode" in metric_key:
-                #     image_dict = log_wandb_image_classification(
-                #         images=value["image"],
-                #         logits=value["logits"],
-                #         labels=value["label"],
-                #         prefix=phase_name,
-                #     )
-                #     log_dict.update(image_dict)
-
-                if "seg_episode" in metric_key:
-                    mask_dict = log_wandb_masks(
-                        images=value["image"],
-                        logits=value["logits"],
-                        labels=value["label"],
-                        label_idx_to_description=value[
-                            "label_idx_to_description"
-                        ],
-                        prefix=phase_name,
-                    )
-                    log_dict.update(mask_dict)
-
-                if "med_episode" in metric_key:
-                    volume_dict = log_wandb_3d_volumes_and_masks(
-                        volumes=value["image"],
-                        logits=value["logits"],
-                        labels=value["label"],
-                        prefix=phase_name,
-                    )
-                    log_dict.update(volume_dict)
-
-                if "ae_episode" in metric_key:
-                    image_dict = log_wandb_images(
-                        images=value["image"],
-                        reconstructions=value["recon"],
-                        prefix=phase_name,
-                    )
-                    log_dict.update(image_dict)
-
-                if "video_episode" in metric_key:
-                    video_dict = visualize_video_with_labels(
-                        name=phase_name,
-                        video=value["video"],
-                        logits=value["logits"],
-                        labels=value["label"],
-                    )
-                    log_dict.update(video_dict)
-
-                self.experiment_tracker.log(log_dict)
+atexit.register(flush_metrics_logging, timeout=60)
 
 
 def configurable(
@@ -133,6 +331,37 @@ def configurable(
     return wrapper
 
 
+def register_module_configurables(
+    module: Any, config_store: Optional[ConfigStore] = None
+) -> ConfigStore:
+    """
+    Registers the configurable functions and classes of one module to the config store.
+
+    Args:
+        module: The imported module.
+        config_store (Optional[ConfigStore]): The config store, defaults to the global instance.
+    """
+    if config_store is None:
+        config_store = ConfigStore.instance()
+
+    for name, obj in inspect.getmembers(module):
+        if not (
+            inspect.isfunction(obj) or inspect.isclass(obj)
+        ):  # Skip if not a function or class
+            continue
+        if hasattr(obj, "__configurable__") and obj.__configurable__:
+            group = obj.__config_group__
+            name = obj.__config_name__
+
+            config_store.store(
+                group=group,
+                name=name,
+                node=obj.__config__(populate_full_signature=True),
+            )
+
+    return config_store
+
+
 def register_configurables(package_name: str) -> ConfigStore:
     """
     Registers all configurable functions in the specified package to the config store.
@@ -148,21 +377,7 @@ def register_configurables(package_name: str) -> ConfigStore:
 
     for _, module_name, _ in pkgutil.walk_packages(package.__path__, prefix):
         module = importlib.import_module(module_name)
-
-        for name, obj in inspect.getmembers(module):
-            if not (
-                inspect.isfunction(obj) or inspect.isclass(obj)
-            ):  # Skip if not a function or class
-                continue
-            if hasattr(obj, "__configurable__") and obj.__configurable__:
-                group = obj.__config_group__
-                name = obj.__config_name__
-
-                config_store.store(
-                    group=group,
-                    name=name,
-                    node=obj.__config__(populate_full_signature=True),
-                )
+        register_module_configurables(module, config_store)
 
     return config_store
 
@@ -199,10 +414,12 @@ def collect_metrics(
             )
             detached_metrics_dict[metric_key] = value
 
-    background_logging = BackgroundLogging(
-        experiment_tracker, global_step, phase_name, detached_metrics_dict
+    get_metrics_logging_worker().submit(
+        experiment_tracker=experiment_tracker,
+        phase_name=phase_name,
+        global_step=global_step,
+        metrics_dict=detached_metrics_dict,
     )
-    background_logging.start()
 
 
 def collect_metrics_mark(func: Callable) -> Callable:
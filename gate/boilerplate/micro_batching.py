@@ -0,0 +1,213 @@
+import gc
+import json
+import logging
+import os
+import pathlib
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+Inputs = Union[torch.Tensor, Dict[str, torch.Tensor]]
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    if isinstance(error, torch.cuda.OutOfMemoryError):
+        return True
+    return isinstance(error, RuntimeError) and "out of memory" in str(error)
+
+
+def free_memory() -> None:
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class MemoryBudget:
+    """
+    💾 A memory limit that the executor checks before running each chunk,
+    raising an out of memory error as the device would once a chunk of
+    `num_samples` needs more than `max_bytes`. This caps the memory a
+    caller may use, and lets the micro-batching be exercised on CPU.
+
+    :param max_bytes: The memory available to a chunk.
+    :param bytes_per_sample: The memory one sample of a chunk needs.
+    """
+
+    def __init__(self, max_bytes: int, bytes_per_sample: int):
+        self.max_bytes = max_bytes
+        self.bytes_per_sample = bytes_per_sample
+
+    def __call__(self, num_samples: int) -> None:
+        needed = num_samples * self.bytes_per_sample
+        if needed > self.max_bytes:
+            raise torch.cuda.OutOfMemoryError(
+                f"Chunk of {num_samples} samples needs {needed} bytes, "
+                f"out of memory with a budget of {self.max_bytes} bytes"
+            )
+
+
+def _batch_size(inputs: Inputs) -> int:
+    if isinstance(inputs, torch.Tensor):
+        return inputs.shape[0]
+    batch_sizes = {value.shape[0] for value in inputs.values()}
+    if len(batch_sizes) != 1:
+        raise ValueError(
+            f"All inputs must share their leading dim, got {batch_sizes}"
+        )
+    return batch_sizes.pop()
+
+
+def _chunk(inputs: Inputs, start: int, end: int) -> Inputs:
+    if isinstance(inputs, torch.Tensor):
+        return inputs[start:end]
+    return {key: value[start:end] for key, value in inputs.items()}
+
+
+def shape_key(name: str, inputs: Inputs) -> str:
+    """
+    :return: A key for `name` applied to inputs of these per-sample
+    shapes, dtypes and device, whatever the batch size.
+    """
+    items = (
+        {"input": inputs}
+        if isinstance(inputs, torch.Tensor)
+        else dict(sorted(inputs.items()))
+    )
+    signature = ",".join(
+        f"{key}:{tuple(value.shape[1:])}:{value.dtype}:{value.device.type}"
+        for key, value in items.items()
+    )
+    return f"{name}|{signature}"
+
+
+def concatenate_outputs(outputs: List[Any]) -> Any:
+    """
+    Concatenate the outputs of consecutive chunks along their leading dim,
+    through nested dicts, lists and tuples. Other leaves are collected into
+    a list with one item per chunk, and None leaves stay None. A single
+    output is returned as it is.
+    """
+    if len(outputs) == 1:
+        return outputs[0]
+    first = outputs[0]
+    if isinstance(first, torch.Tensor):
+        if first.dim() == 0:
+            return torch.stack(outputs)
+        return torch.cat(outputs, dim=0)
+    if isinstance(first, dict):
+        return {
+            key: concatenate_outputs([output[key] for output in outputs])
+            for key in first
+        }
+    if isinstance(first, (list, tuple)):
+        return type(first)(
+            concatenate_outputs(list(items)) for items in zip(*outputs)
+        )
+    if all(output is None for output in outputs):
+        return None
+    return list(outputs)
+
+
+class MicroBatchExecutor:
+    """
+    🧩 Runs a function over a batch in chunks small enough to fit in
+    memory, and remembers the chunk size that worked per (function name,
+    per-sample input shape).
+
+    The first batch of a shape runs whole, or in chunks of
+    `max_chunk_size`. On an out of memory error only the failing chunk is
+    retried, at half its size, and the outputs of the chunks that already
+    ran are kept. Later batches of the same shape are split into chunks of
+    the learned size up front, instead of failing again. With a
+    `state_path`, the learned sizes also persist across runs.
+
+    :param max_chunk_size: The largest chunk to run, None for the whole
+    batch.
+    :param memory_budget: Called with the size of every chunk before it
+    runs, e.g. a `MemoryBudget`.
+    :param state_path: A JSON file to load and store learned sizes in.
+    """
+
+    def __init__(
+        self,
+        max_chunk_size: Optional[int] = None,
+        memory_budget: Optional[Callable[[int], None]] = None,
+        state_path: Optional[Union[str, pathlib.Path]] = None,
+    ):
+        self.max_chunk_size = max_chunk_size
+        self.memory_budget = memory_budget
+        self.state_path = (
+            pathlib.Path(state_path) if state_path is not None else None
+        )
+        self.chunk_sizes: Dict[str, int] = {}
+        if self.state_path is not None and self.state_path.exists():
+            with open(self.state_path) as f:
+                self.chunk_sizes = json.load(f)
+
+    def chunk_size(self, key: str, batch_size: int) -> int:
+        chunk_size = self.chunk_sizes.get(key, batch_size)
+        if self.max_chunk_size is not None:
+            chunk_size = min(chunk_size, self.max_chunk_size)
+        return max(min(chunk_size, batch_size), 1)
+
+    def _learn(self, key: str, chunk_size: int) -> None:
+        self.chunk_sizes[key] = chunk_size
+        if self.state_path is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.chunk_sizes, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def run(
+        self,
+        fn: Callable[[Inputs], Any],
+        inputs: Inputs,
+        name: str,
+        combine: Callable[[List[Any]], Any] = concatenate_outputs,
+    ) -> Any:
+        """
+        :param fn: Applied to chunks of `inputs`, with the same structure.
+        :param inputs: A tensor, or a dict of tensors that share their
+        leading dim.
+        :param name: Identifies `fn` in the learned chunk sizes, e.g. the
+        class name of a module.
+        :param combine: Merges the outputs of the chunks, in order.
+        :return: The combined outputs.
+        """
+        batch_size = _batch_size(inputs)
+        key = shape_key(name, inputs)
+        chunk_size = self.chunk_size(key, batch_size)
+
+        outputs = []
+        start = 0
+        while start < batch_size:
+            end = min(start + chunk_size, batch_size)
+            try:
+                if self.memory_budget is not None:
+                    self.memory_budget(end - start)
+                outputs.append(fn(_chunk(inputs, start, end)))
+            except Exception as e:
+                if not is_out_of_memory(e) or end - start == 1:
+                    raise
+                out_of_memory = True
+            else:
+                out_of_memory = False
+
+            if not out_of_memory:
+                start = end
+                continue
+
+            # freed here, once the traceback no longer holds the activations
+            free_memory()
+            chunk_size = (end - start) // 2
+            logger.info(
+                f"Out of memory for {name} with {end - start} samples, "
+                f"continuing in chunks of {chunk_size}"
+            )
+            self._learn(key, chunk_size)
+
+        return combine(outputs)
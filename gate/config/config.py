@@ -9,18 +9,27 @@ from hydra_zen import MISSING, ZenField, builds, make_config
 from timm.scheduler import CosineLRScheduler
 from torch.utils.data import DataLoader
 
-from gate.boilerplate.callbacks import UploadCheckpointsToHuggingFace
+from gate.boilerplate.callbacks import (
+    ProfilingCallback,
+    UploadCheckpointsToHuggingFace,
+)
 from gate.boilerplate.decorators import register_configurables
 from gate.boilerplate.utils import get_hydra_config, pretty_config
+from gate.config.manifest import load_manifest, register_manifest
 from gate.config.variables import (
     CODE_DIR,
     DATASET_DIR,
     DUMMY_BATCH_MODE,
+    EAGER_CONFIGURABLES,
     EVAL_BATCH_SIZE,
     EXPERIMENTS_ROOT_DIR,
     HF_USERNAME,
     HYDRATED_NUM_WORKERS,
+    HYDRATED_PERSISTENT_WORKERS,
+    HYDRATED_PIN_MEMORY,
+    HYDRATED_PREFETCH_FACTOR,
     LOGGER_LEVEL,
+    NON_BLOCKING_TRANSFERS,
     NUM_WORKERS,
     PERSISTENT_WORKERS,
     PIN_MEMORY,
@@ -74,6 +83,11 @@ class Config:
     prefetch_factor: int = PREFETCH_FACTOR
     persistent_workers: bool = PERSISTENT_WORKERS
     pin_memory: bool = PIN_MEMORY
+    non_blocking_transfers: bool = NON_BLOCKING_TRANSFERS
+    length_bucketing: bool = False
+    preprocessed_cache: bool = False
+    cached_features: bool = False
+    compile_model: bool = False
     train: bool = True
     test: bool = True
     dummy_batch_mode: bool = DUMMY_BATCH_MODE
@@ -101,7 +115,13 @@ def collect_config_store():
 
     config_store = ConfigStore.instance()
 
-    register_configurables("gate")
+    # The manifest registers every configurable without importing its
+    # module, see `python -m gate.config.manifest` to regenerate it
+    manifest = None if EAGER_CONFIGURABLES else load_manifest()
+    if manifest is not None:
+        register_manifest(manifest)
+    else:
+        register_configurables("gate")
 
     ##########################################################################
     # Dataloader configs
@@ -119,10 +139,10 @@ def collect_config_store():
         node=dataloader_config(
             batch_size=1,
             num_workers=HYDRATED_NUM_WORKERS,
-            pin_memory=PIN_MEMORY,
+            pin_memory=HYDRATED_PIN_MEMORY,
             shuffle=True,
-            prefetch_factor=PREFETCH_FACTOR,
-            persistent_workers=PERSISTENT_WORKERS,
+            prefetch_factor=HYDRATED_PREFETCH_FACTOR,
+            persistent_workers=HYDRATED_PERSISTENT_WORKERS,
         ),
     )
     ##########################################################################
@@ -215,6 +235,14 @@ def collect_config_store():
         group="callbacks", name="default", node=default_callbacks
     )
 
+    ProfilingConfig = builds(ProfilingCallback, populate_full_signature=True)
+
+    profiling_callbacks = dict(hf_uploader=hf_upload, profiler=ProfilingConfig)
+
+    config_store.store(
+        group="callbacks", name="profiling", node=profiling_callbacks
+    )
+
     ###########################################################################
     # 🌐 Hydra configs
     config_store.store(
@@ -0,0 +1,208 @@
+import importlib
+import importlib.util
+import inspect
+import logging
+import pathlib
+import pkgutil
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import fire
+import yaml
+from hydra.core.config_store import ConfigStore
+from omegaconf import OmegaConf
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PATH = pathlib.Path(__file__).parent / "configurables_manifest.yaml"
+
+# Bump when the layout of the manifest changes
+MANIFEST_VERSION = 2
+
+# Config keys whose defaults are read from the environment when
+# gate.config.variables is imported. The manifest records the variable
+# instead of the value, and registration fills in the value of the run.
+ENV_DERIVED_DEFAULTS = {
+    "data_dir": "DATASET_DIR",
+    "dummy_batch_mode": "DUMMY_BATCH_MODE",
+}
+
+
+def _declares_configurables(module_name: str) -> bool:
+    spec = importlib.util.find_spec(module_name)
+    if spec is None or spec.origin is None or not spec.origin.endswith(".py"):
+        return False
+    return "@configurable" in pathlib.Path(spec.origin).read_text()
+
+
+def collect_configurables(
+    package_name: str = "gate", skip_unimportable: bool = False
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Import every module of a package and describe each `@configurable`
+    function or class in it by its group, name, import path and full
+    config node.
+
+    :param package_name: The package to walk.
+    :param skip_unimportable: Whether modules that fail to import are
+    skipped and returned, instead of raising.
+    :return: The entries, sorted by group and name, and the modules that
+    could not be imported but declare configurables.
+    """
+    from gate.config import variables
+
+    package = importlib.import_module(package_name)
+    prefix = package.__name__ + "."
+
+    entries = {}
+    unimported_modules = []
+    for _, module_name, _ in pkgutil.walk_packages(package.__path__, prefix):
+        try:
+            module = importlib.import_module(module_name)
+        except Exception as e:
+            if not skip_unimportable:
+                raise
+            logger.warning(f"Could not import {module_name}: {e}")
+            if _declares_configurables(module_name):
+                unimported_modules.append(module_name)
+            continue
+
+        for _, obj in inspect.getmembers(module):
+            if not (inspect.isfunction(obj) or inspect.isclass(obj)):
+                continue
+            if not getattr(obj, "__configurable__", False):
+                continue
+
+            config = obj.__config__(populate_full_signature=True)
+            node = OmegaConf.to_container(
+                OmegaConf.structured(config), resolve=False
+            )
+            # compared before OmegaConf converts them to the field types
+            env_defaults = {
+                key: variable
+                for key, variable in ENV_DERIVED_DEFAULTS.items()
+                if key in node
+                and getattr(config, key) == getattr(variables, variable)
+            }
+            for key in env_defaults:
+                node[key] = None
+
+            entry = {
+                "group": obj.__config_group__,
+                "name": obj.__config_name__,
+                "target": f"{obj.__module__}.{obj.__qualname__}",
+                "node": node,
+            }
+            if env_defaults:
+                entry["env_defaults"] = env_defaults
+            entries[(obj.__config_group__, obj.__config_name__)] = entry
+
+    return [entries[key] for key in sorted(entries)], unimported_modules
+
+
+def build_manifest(
+    package_name: str = "gate", skip_unimportable: bool = False
+) -> Dict[str, Any]:
+    entries, unimported_modules = collect_configurables(
+        package_name, skip_unimportable=skip_unimportable
+    )
+    return {
+        "version": MANIFEST_VERSION,
+        "package": package_name,
+        "configurables": entries,
+        "unimported_modules": unimported_modules,
+    }
+
+
+def load_manifest(
+    path: Union[str, pathlib.Path] = MANIFEST_PATH,
+) -> Optional[Dict[str, Any]]:
+    """
+    :return: The manifest at `path`, or None if it is missing or was
+    written by an incompatible version.
+    """
+    path = pathlib.Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        manifest = yaml.safe_load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        logger.warning(
+            f"Ignoring configurables manifest {path} of version "
+            f"{manifest.get('version')}, expected {MANIFEST_VERSION}"
+        )
+        return None
+    return manifest
+
+
+def register_manifest(manifest: Dict[str, Any]) -> ConfigStore:
+    """
+    Store the config nodes of a manifest in the config store without
+    importing the modules they point to. Hydra imports a `_target_` only
+    when a run instantiates it, so only the configurables a run selects
+    pull in their dependencies.
+
+    Defaults derived from environment variables, such as `data_dir`, take
+    the values of this process, as they would when importing the modules.
+
+    Modules that could not be imported when the manifest was generated are
+    imported here instead, and skipped with a warning if they still fail.
+
+    :param manifest: A manifest from `load_manifest`.
+    :return: The config store.
+    """
+    from gate.config import variables
+
+    config_store = ConfigStore.instance()
+
+    for entry in manifest["configurables"]:
+        node = dict(entry["node"])
+        for key, variable in entry.get("env_defaults", {}).items():
+            node[key] = getattr(variables, variable)
+        config_store.store(group=entry["group"], name=entry["name"], node=node)
+
+    for module_name in manifest["unimported_modules"]:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            logger.warning(
+                f"Could not import {module_name}, its configurables are "
+                f"unavailable: {e}"
+            )
+            continue
+
+        from gate.boilerplate.decorators import register_module_configurables
+
+        register_module_configurables(module, config_store)
+
+    return config_store
+
+
+def regenerate(
+    path: str = str(MANIFEST_PATH),
+    package_name: str = "gate",
+    skip_unimportable: bool = False,
+):
+    """
+    🗂 Regenerate the configurables manifest by importing every module of
+    the package. Run this after adding, renaming or changing the defaults
+    of a `@configurable`.
+
+    :param path: Where to write the manifest.
+    :param package_name: The package to walk.
+    :param skip_unimportable: Whether modules with missing dependencies
+    are left out of the manifest and imported at registration instead.
+    """
+    manifest = build_manifest(
+        package_name, skip_unimportable=skip_unimportable
+    )
+    with open(path, "w") as f:
+        yaml.safe_dump(manifest, f, sort_keys=False)
+
+    logger.info(
+        f"Wrote {len(manifest['configurables'])} configurables to {path}"
+    )
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(regenerate)
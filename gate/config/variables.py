@@ -25,6 +25,9 @@ NUM_WORKERS = get_env_var("NUM_WORKERS", mp.cpu_count())
 PREFETCH_FACTOR = get_env_var("PREFETCH_FACTOR", 2)
 PERSISTENT_WORKERS = get_env_var("PERSISTENT_WORKERS", False)
 PIN_MEMORY = get_env_var("PIN_MEMORY", True)
+# non-blocking host-to-device copies by accelerate, on whenever batches
+# are pinned, since only pinned batches can be copied without blocking
+NON_BLOCKING_TRANSFERS = get_env_var("NON_BLOCKING_TRANSFERS", "${pin_memory}")
 
 TRAIN_ITERS = get_env_var("TRAIN_ITERS", 10000)
 SEED = get_env_var("SEED", 42)
@@ -34,6 +37,8 @@ DUMMY_BATCH_MODE = get_env_var("DUMMY_BATCH_MODE", False)
 GPU_MEMORY = 24  # in GB
 HF_OFFLINE_MODE = get_env_var("HF_OFFLINE_MODE", False)
 WANDB_OFFLINE_MODE = get_env_var("WANDB_OFFLINE_MODE", False)
+# import every module to register configurables, instead of the manifest
+EAGER_CONFIGURABLES = bool(int(get_env_var("EAGER_CONFIGURABLES", 0)))
 
 ## Define yaml variable access codes here
 HYDRATED_EXPERIMENT_NAME = "${exp_name}"
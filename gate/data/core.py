@@ -1,53 +1,545 @@
+import bisect
 import functools
+import itertools
 import json
 import logging
 import traceback
 from collections import defaultdict
-from typing import Any, Dict, Mapping, Optional
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
 
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, Sampler, Subset
 from torch.utils.data.dataloader import default_collate
 
+from gate.data.quarantine import healthy_replacement
+
 logger = logging.getLogger(__name__)
 
+# Nominal length reported by datasets and samplers that stream forever.
+INFINITE_SAMPLING_LENGTH = int(9 * 10**7)
+
 
-class CustomConcatDataset(Dataset):
+def get_source_size(dataset: Dataset) -> int:
     """
-    A custom PyTorch Dataset class that concatenates multiple datasets.
-    📚 Useful for combining data from different sources while maintaining
-    the Dataset interface.
+    The number of distinct items in `dataset`, looking through the nominal
+    length of infinitely sampled GATEDatasets.
     """
+    if getattr(dataset, "infinite_sampling", False):
+        return len(dataset.dataset)
+    return len(dataset)
 
-    def __init__(self, datasets):
-        """
-        Constructor for the CustomConcatDataset class.
 
-        :param datasets: A list of PyTorch Dataset objects to concatenate.
+class MixtureDataset(Dataset):
+    """
+    A PyTorch Dataset that mixes several source datasets, e.g. the training
+    splits of several GATE datasets, so that one adapter can be trained on
+    all of them in a single run. 🍹
+
+    Indices address the concatenation of the sources. The cumulative sizes
+    are computed once, so `__len__` is O(1) and `__getitem__` finds the
+    source with a binary search over them.
+
+    How often each source is drawn during training is set by
+    `sampling_probabilities`, which MixtureSampler uses: source `i` is drawn
+    with probability proportional to `weights[i] ** (1 / temperature)`,
+    where the weights default to the source sizes. A temperature of 1 keeps
+    the weights as they are, higher temperatures flatten the mixture
+    towards uniform.
+    """
+
+    def __init__(
+        self,
+        datasets: List[Dataset],
+        weights: Optional[List[float]] = None,
+        temperature: float = 1.0,
+        names: Optional[List[str]] = None,
+    ):
         """
-        self.datasets = datasets
+        Constructor for the MixtureDataset class.
+
+        :param datasets: The source datasets.
+        :param weights: The sampling weight of every source, defaults to the
+        source sizes.
+        :param temperature: The sampling temperature applied to the weights.
+        :param names: A name for every source, used when reporting how many
+        samples each source contributed.
+        """
+        super().__init__()
+        if len(datasets) == 0:
+            raise ValueError("MixtureDataset needs at least one dataset")
+        if weights is not None and len(weights) != len(datasets):
+            raise ValueError(
+                f"Got {len(weights)} weights for {len(datasets)} datasets"
+            )
+        if names is not None and len(names) != len(datasets):
+            raise ValueError(
+                f"Got {len(names)} names for {len(datasets)} datasets"
+            )
+        if temperature <= 0:
+            raise ValueError(
+                f"temperature must be positive, got {temperature}"
+            )
+
+        self.datasets = list(datasets)
+        self.names = (
+            list(names)
+            if names is not None
+            else [f"source_{idx}" for idx in range(len(datasets))]
+        )
+        self.sizes = [get_source_size(dataset) for dataset in self.datasets]
+        self.cumulative_sizes = list(itertools.accumulate(self.sizes))
+        self.weights = (
+            [float(weight) for weight in weights]
+            if weights is not None
+            else [float(size) for size in self.sizes]
+        )
+        self.temperature = temperature
+        self.sampling_probabilities = self._compute_probabilities()
+
+    def _compute_probabilities(self) -> List[float]:
+        scaled = [
+            weight ** (1.0 / self.temperature) if weight > 0 else 0.0
+            for weight in self.weights
+        ]
+        total = sum(scaled)
+        if total <= 0:
+            raise ValueError("At least one source needs a positive weight")
+        return [value / total for value in scaled]
 
-    def __len__(self):
+    @property
+    def meta_data(self) -> Optional[dict]:
+        # the sources describe their own label spaces
+        return None
+
+    @property
+    def infinite_sampling(self) -> bool:
+        return any(
+            getattr(dataset, "infinite_sampling", False)
+            for dataset in self.datasets
+        )
+
+    def __len__(self) -> int:
+        return self.cumulative_sizes[-1]
+
+    def locate(self, idx: int) -> Tuple[int, int]:
+        """
+        :param idx: An index into the concatenation of the sources.
+        :return: The source index and the index within that source.
         """
-        Calculate the total length of the concatenated datasets.
-        🔢 Returns the sum of the lengths of all individual datasets.
+        if idx < 0:
+            if -idx > len(self):
+                raise IndexError(
+                    f"Index {idx} out of range for {len(self)} items"
+                )
+            idx = len(self) + idx
+        if idx >= len(self):
+            raise IndexError(f"Index {idx} out of range for {len(self)} items")
 
-        :return: The total length of the concatenated datasets.
+        source_idx = bisect.bisect_right(self.cumulative_sizes, idx)
+        offset = self.cumulative_sizes[source_idx - 1] if source_idx else 0
+        return source_idx, idx - offset
+
+    def global_index(self, source_idx: int, item_idx: int) -> int:
+        """
+        :return: The index into the concatenation of item `item_idx` of
+        source `source_idx`.
         """
-        return sum(len(d) for d in self.datasets)
+        offset = self.cumulative_sizes[source_idx - 1] if source_idx else 0
+        return offset + item_idx
 
     def __getitem__(self, idx):
+        source_idx, item_idx = self.locate(idx)
+        return self.datasets[source_idx][item_idx]
+
+
+class MixtureSampler(Sampler[int]):
+    """
+    Samples a MixtureDataset according to its sampling probabilities. 🎲
+
+    Every draw first picks a source, then takes the next index from that
+    source's own stream of seeded permutations, so each source is still
+    covered once per pass over it regardless of its weight. The stream is
+    deterministic under `seed` and can be resumed from `start_index`, and
+    every iteration continues it after the `num_samples` indices of the
+    previous one.
+
+    `source_counts_at` reports how many samples each source contributed to
+    any prefix of the stream, e.g. to the samples consumed so far.
+    """
+
+    def __init__(
+        self,
+        dataset: MixtureDataset,
+        num_samples: Optional[int] = None,
+        seed: int = 0,
+        start_index: int = 0,
+        chunk_size: int = 4096,
+    ):
+        """
+        Constructor for the MixtureSampler class.
+
+        :param dataset: The MixtureDataset to sample.
+        :param num_samples: The number of indices per iteration, defaults to
+        the length of the mixture, or the nominal infinite length if any of
+        its sources is infinitely sampled.
+        :param seed: The base seed for source choices and permutations.
+        :param start_index: The position in the stream to start from, e.g.
+        `global_step * batch_size` when resuming.
+        :param chunk_size: How many source choices are drawn at once.
+        """
+        super().__init__()
+        self.dataset = dataset
+        if num_samples is None:
+            num_samples = (
+                INFINITE_SAMPLING_LENGTH
+                if dataset.infinite_sampling
+                else len(dataset)
+            )
+        self.num_samples = num_samples
+        self.seed = seed
+        self.start_index = start_index
+        self.chunk_size = chunk_size
+        self.probabilities = torch.tensor(
+            dataset.sampling_probabilities, dtype=torch.float64
+        )
+        # the source positions at the start of the last chunk looked up
+        self._chunk_positions = (0, torch.zeros(len(dataset.datasets)).long())
+
+    def set_start_index(self, start_index: int) -> None:
+        self.start_index = start_index
+
+    def _positions_at(self, num_samples: int) -> torch.Tensor:
+        # how far into its own stream every source is after `num_samples`
+        # draws, replaying the source choices from the closest known chunk
+        num_sources = len(self.dataset.datasets)
+        chunk_idx, chunk_offset = divmod(num_samples, self.chunk_size)
+        known_chunk_idx, positions = self._chunk_positions
+        if known_chunk_idx > chunk_idx:
+            known_chunk_idx, positions = 0, torch.zeros_like(positions)
+        positions = positions.clone()
+        for previous_chunk_idx in range(known_chunk_idx, chunk_idx):
+            positions += torch.bincount(
+                self._source_choices(previous_chunk_idx),
+                minlength=num_sources,
+            )
+        self._chunk_positions = (chunk_idx, positions.clone())
+        choices = self._source_choices(chunk_idx)
+        return positions + torch.bincount(
+            choices[:chunk_offset], minlength=num_sources
+        )
+
+    def source_counts_at(self, num_samples: int) -> Dict[str, int]:
         """
-        Get an item from the concatenated datasets based on the provided index.
-        🔍 It finds the correct dataset and the corresponding index in that
-        dataset.
+        :param num_samples: The length of the prefix of the stream, e.g.
+        `global_step` times the samples consumed per step.
+        :return: How many of those samples each source contributed. Unlike
+        counting the indices yielded, this is unaffected by dataloader
+        workers running ahead of the training step, and by resuming.
+        """
+        return dict(
+            zip(self.dataset.names, self._positions_at(num_samples).tolist())
+        )
+
+    def _source_choices(self, chunk_idx: int) -> torch.Tensor:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + chunk_idx)
+        return torch.multinomial(
+            self.probabilities,
+            self.chunk_size,
+            replacement=True,
+            generator=generator,
+        )
+
+    def _source_permutation(self, source_idx: int, epoch: int) -> List[int]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + 1_000_003 * (source_idx + 1) + epoch)
+        return torch.randperm(
+            self.dataset.sizes[source_idx], generator=generator
+        ).tolist()
+
+    def __iter__(self) -> Iterator[int]:
+        # Every pass continues the stream where the previous one ended, so
+        # consecutive epochs of a finite mixture draw different samples
+        start_index = self.start_index
+        self.start_index += self.num_samples
+
+        # Replay the source choices before start_index to recover how far
+        # into its own stream every source is
+        chunk_idx, chunk_offset = divmod(start_index, self.chunk_size)
+        positions = self._positions_at(start_index).tolist()
+        choices = self._source_choices(chunk_idx)
+
+        permutations: Dict[int, Tuple[int, List[int]]] = {}
+        num_yielded = 0
+        while num_yielded < self.num_samples:
+            for source_idx in choices[chunk_offset:].tolist():
+                if num_yielded >= self.num_samples:
+                    return
+                epoch, item_idx = divmod(
+                    positions[source_idx], self.dataset.sizes[source_idx]
+                )
+                if permutations.get(source_idx, (None,))[0] != epoch:
+                    permutations[source_idx] = (
+                        epoch,
+                        self._source_permutation(source_idx, epoch),
+                    )
+                positions[source_idx] += 1
+                num_yielded += 1
+                yield self.dataset.global_index(
+                    source_idx, permutations[source_idx][1][item_idx]
+                )
+            chunk_idx += 1
+            chunk_offset = 0
+            choices = self._source_choices(chunk_idx)
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+
+def get_value_length(value: Any) -> int:
+    # Words for text, the longest caption for a list of captions, and the
+    # length of anything else
+    if isinstance(value, str):
+        return len(value.split())
+    if isinstance(value, (list, tuple)) and len(value) > 0:
+        if all(isinstance(item, str) for item in value):
+            return max(len(item.split()) for item in value)
+    if hasattr(value, "__len__"):
+        return len(value)
+    return 1
+
+
+def get_sample_lengths(dataset: Any, length_key: str) -> List[int]:
+    """
+    Estimate the length of every sample of `dataset` from the raw value
+    stored under `length_key`, without decoding the rest of the sample.
+
+    Hugging Face datasets are read column-wise, Subsets are resolved
+    through their parent, and datasets that expose `get_column(key)` are
+    asked for it. Anything else falls back to loading every sample.
+    """
+    if isinstance(dataset, GATEDataset):
+        return get_sample_lengths(dataset.dataset, length_key)
 
-        :param idx: The index of the desired item in the concatenated datasets.
-        :return: The item corresponding to the given index.
+    if isinstance(dataset, Subset):
+        parent_lengths = get_sample_lengths(dataset.dataset, length_key)
+        return [parent_lengths[idx] for idx in dataset.indices]
+
+    if hasattr(dataset, "column_names") and length_key in getattr(
+        dataset, "column_names"
+    ):
+        values = dataset[length_key]
+    elif hasattr(dataset, "get_column"):
+        values = dataset.get_column(length_key)
+    else:
+        logger.warning(
+            f"Loading every sample of {dataset.__class__.__name__} to "
+            f"compute the lengths of {length_key}"
+        )
+        values = [dataset[idx][length_key] for idx in range(len(dataset))]
+
+    return [get_value_length(value) for value in values]
+
+
+class LengthBucketBatchSampler(Sampler[List[int]]):
+    """
+    Groups samples of similar length into the same batch, so that padding
+    (and the encoder compute spent on it) is kept low. 🪣
+
+    Every epoch the indices are shuffled with a seeded permutation, cut
+    into pools of `batch_size * bucket_size_multiplier` samples, each pool
+    is sorted by length and cut into batches, and the order of all batches
+    is shuffled again. Batches therefore stay random across the epoch
+    while their members have similar lengths.
+
+    `padding_ratio` holds the padding fraction of all batches yielded so
+    far, estimated from the sample lengths.
+    """
+
+    def __init__(
+        self,
+        lengths: List[int],
+        batch_size: int,
+        shuffle: bool = True,
+        seed: int = 0,
+        bucket_size_multiplier: int = 50,
+        drop_last: bool = False,
+        infinite: bool = False,
+        start_batch: int = 0,
+    ):
+        """
+        Constructor for the LengthBucketBatchSampler class.
+
+        :param lengths: The length of every sample.
+        :param batch_size: The number of samples per batch.
+        :param shuffle: Whether to shuffle the samples and the batches.
+        :param seed: The base seed, epoch `e` uses `seed + e`.
+        :param bucket_size_multiplier: The size of the pools sorted by
+        length, in batches.
+        :param drop_last: Whether to drop the last incomplete batch of every
+        pool.
+        :param infinite: Whether to keep yielding batches from new epochs.
+        :param start_batch: The batch to start from, e.g. `global_step` when
+        resuming.
         """
-        dataset_idx = idx % len(self.datasets)
-        item_idx = idx // len(self.datasets)
-        return self.datasets[dataset_idx][item_idx]
+        super().__init__()
+        if len(lengths) == 0:
+            raise ValueError("LengthBucketBatchSampler needs some samples")
+        self.lengths = torch.as_tensor(lengths, dtype=torch.long)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.bucket_size = batch_size * bucket_size_multiplier
+        self.drop_last = drop_last
+        self.infinite = infinite
+        self.start_batch = start_batch
+        # the next epoch of a finite sampler, and whether the next pass
+        # still has to start from `start_batch`
+        self.epoch = 0
+        self._start_pending = True
+        self.num_tokens = 0
+        self.num_padded_tokens = 0
+
+    @property
+    def padding_ratio(self) -> float:
+        if self.num_padded_tokens == 0:
+            return 0.0
+        return 1.0 - self.num_tokens / self.num_padded_tokens
+
+    def _epoch_batches(self, epoch: int) -> List[List[int]]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + epoch)
+
+        indices = (
+            torch.randperm(len(self.lengths), generator=generator)
+            if self.shuffle
+            else torch.arange(len(self.lengths))
+        )
+
+        batches = []
+        for pool in indices.split(self.bucket_size):
+            # a stable sort keeps the random order within equal lengths
+            order = torch.sort(self.lengths[pool], stable=True).indices
+            for batch in pool[order].split(self.batch_size):
+                if self.drop_last and len(batch) < self.batch_size:
+                    continue
+                batches.append(batch.tolist())
+
+        if self.shuffle:
+            batch_order = torch.randperm(len(batches), generator=generator)
+            batches = [batches[idx] for idx in batch_order.tolist()]
+        return batches
+
+    def _num_epoch_batches(self) -> int:
+        num_batches = 0
+        for pool_start in range(0, len(self.lengths), self.bucket_size):
+            pool_size = min(self.bucket_size, len(self.lengths) - pool_start)
+            num_batches += (
+                pool_size // self.batch_size
+                if self.drop_last
+                else -(-pool_size // self.batch_size)
+            )
+        return num_batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        # start_batch counts batches across epochs, and only the first pass
+        # after it is set starts from it, later passes continue with the
+        # following epochs
+        if self._start_pending:
+            self.epoch, offset = divmod(
+                self.start_batch, self._num_epoch_batches()
+            )
+            self._start_pending = False
+        else:
+            offset = 0
+        epoch = self.epoch
+        if not self.infinite:
+            self.epoch += 1
+
+        while True:
+            for batch in self._epoch_batches(epoch)[offset:]:
+                batch_lengths = self.lengths[batch]
+                self.num_tokens += int(batch_lengths.sum())
+                self.num_padded_tokens += int(batch_lengths.max()) * len(batch)
+                yield batch
+            if not self.infinite:
+                return
+            offset = 0
+            epoch += 1
+
+    def set_start_batch(self, start_batch: int) -> None:
+        self.start_batch = start_batch
+        self._start_pending = True
+
+    def __len__(self) -> int:
+        if self.infinite:
+            return INFINITE_SAMPLING_LENGTH // self.batch_size
+        num_epoch_batches = self._num_epoch_batches()
+        if self._start_pending:
+            return num_epoch_batches - self.start_batch % num_epoch_batches
+        return num_epoch_batches
+
+
+def find_sampler(dataloader: Any, sampler_types: Any) -> Optional[Any]:
+    """
+    Find the sampler of one of `sampler_types` behind a dataloader, looking
+    through the QuarantineSampler and the batch sampler wrappers added by
+    accelerate.
+    """
+    candidates = [dataloader]
+    for _ in range(5):
+        next_candidates = []
+        for candidate in candidates:
+            if isinstance(candidate, sampler_types):
+                return candidate
+            for attribute in ("sampler", "batch_sampler"):
+                value = getattr(candidate, attribute, None)
+                if value is not None:
+                    next_candidates.append(value)
+        candidates = next_candidates
+    return None
+
+
+def find_mixture_sampler(dataloader: Any) -> Optional[MixtureSampler]:
+    """
+    Find the MixtureSampler behind a dataloader.
+    """
+    return find_sampler(dataloader, MixtureSampler)
+
+
+def mix_datasets(
+    dataset_dicts: List[Dict[str, Dataset]],
+    weights: Optional[List[float]] = None,
+    temperature: float = 1.0,
+    names: Optional[List[str]] = None,
+    transforms: Optional[Any] = None,
+) -> Dict[str, MixtureDataset]:
+    """
+    Combine the split dictionaries of several GATE datasets into one.
+
+    :param dataset_dicts: The {"train", "val", "test"} dicts to combine.
+    :param weights: The training sampling weight of every dataset.
+    :param temperature: The sampling temperature applied to the weights.
+    :param names: A name for every dataset.
+    :param transforms: Transforms to set on every GATEDataset, as
+    `instantiate(cfg.dataset, transforms=...)` would for a single dataset.
+    :return: A dict with the same splits, each a MixtureDataset.
+    """
+    if transforms is not None:
+        for dataset_dict in dataset_dicts:
+            for dataset in dataset_dict.values():
+                if isinstance(dataset, GATEDataset):
+                    dataset.transforms = transforms
+
+    return {
+        split: MixtureDataset(
+            datasets=[dataset_dict[split] for dataset_dict in dataset_dicts],
+            weights=weights,
+            temperature=temperature,
+            names=names,
+        )
+        for split in dataset_dicts[0].keys()
+    }
 
 
 def dict_to_summary(batch: Dict):
@@ -113,41 +605,105 @@ def dataclass_collate(batch):
 
 
 def pad_and_stack_tensors(tensor_list):
-    tensor_list = list(tensor_list)
-    for idx, tensor in enumerate(tensor_list):
-        if len(tensor.shape) == 2 and tensor.shape[0] == 1:
-            tensor = tensor.squeeze(0)
-            tensor_list[idx] = tensor
-
-    is_ireggular_shape = True if len(tensor_list[0].shape) == 2 else False
-    if is_ireggular_shape:
-        temp_tensor_list = []
-        for tensor in tensor_list:
-            temp_tensor_list.extend(tensor.unbind(0))
-        tensor_list = temp_tensor_list
-    # print(f"total tensor_list: {len(tensor_list)}")
-    max_len = max(tensor.size(0) for tensor in tensor_list)
-    padded_list = []
-
-    for tensor in tensor_list:
-        if tensor.size(0) < max_len:
-            padding_size = max_len - tensor.size(0)
-            padding = (
-                torch.ones(
-                    (padding_size),
-                    dtype=tensor.dtype,
-                    device=tensor.device,
-                )
-                * tensor[-1]
-            )  # use the last value (eos)
-            tensor = torch.cat([tensor, padding], dim=0)
-        padded_list.append(tensor)
-
-    if not is_ireggular_shape:
-        padded_list = torch.stack(padded_list)
+    """
+    Pad a list of token tensors to the longest one and stack them. Each
+    sequence is padded with its own last value (the eos token).
+
+    The output is allocated once, filled with every row's last value, and
+    the tokens are written into it with a single masked copy. Tensors of
+    shape (1, L) are treated as (L,). A list of 2D tensors (e.g. the
+    paired captions of winoground) is padded row-wise and returned as
+    (-1, 2, max_len).
+    """
+    tensor_list = [
+        (
+            tensor.squeeze(0)
+            if tensor.dim() == 2 and tensor.shape[0] == 1
+            else tensor
+        )
+        for tensor in tensor_list
+    ]
+
+    is_irregular_shape = tensor_list[0].dim() == 2
+    if is_irregular_shape:
+        lengths = torch.tensor(
+            [tensor.shape[-1] for tensor in tensor_list]
+        ).repeat_interleave(
+            torch.tensor([tensor.shape[0] for tensor in tensor_list])
+        )
     else:
-        padded_list = torch.stack(padded_list).view(-1, 2, max_len)
-    return padded_list
+        lengths = torch.tensor([tensor.shape[0] for tensor in tensor_list])
+
+    flat_tokens = torch.cat([tensor.reshape(-1) for tensor in tensor_list])
+    max_len = int(lengths.max())
+
+    # use the last value (eos) of every row as its padding value
+    row_ends = lengths.cumsum(0) - 1
+    padded = (
+        flat_tokens[row_ends.to(flat_tokens.device)]
+        .unsqueeze(1)
+        .expand(len(lengths), max_len)
+        .clone()
+    )
+    mask = torch.arange(max_len).unsqueeze(0) < lengths.unsqueeze(1)
+    padded[mask.to(padded.device)] = flat_tokens
+
+    if is_irregular_shape:
+        padded = padded.view(-1, 2, max_len)
+    return padded
+
+
+def token_padding_ratio(tokens: torch.Tensor) -> torch.Tensor:
+    """
+    The fraction of positions in a padded token batch that are padding.
+
+    Rows padded by `pad_and_stack_tensors` end in a run of their eos token,
+    so everything after the first token of that trailing run is padding.
+    The ratio is computed on the tokens' device, without a host sync.
+
+    :param tokens: A (..., L) tensor of token ids.
+    :return: A scalar tensor in [0, 1).
+    """
+    rows = tokens.reshape(-1, tokens.shape[-1])
+    is_trailing = (rows == rows[:, -1:]).flip(-1).cumprod(-1)
+    num_padding = is_trailing.sum(-1) - 1
+    return num_padding.sum().float() / rows.numel()
+
+
+def batch_padding_ratio(
+    batch: Any, text_key: str = "text"
+) -> Optional[torch.Tensor]:
+    """
+    :return: The token padding ratio of `batch[text_key]`, or None if the
+    batch carries no token ids under that key.
+    """
+    if not isinstance(batch, Mapping):
+        return None
+
+    tokens = batch.get(text_key)
+    if isinstance(tokens, Mapping):
+        tokens = tokens.get("input_ids")
+
+    if (
+        not isinstance(tokens, torch.Tensor)
+        or tokens.dtype != torch.long
+        or tokens.dim() < 2
+        or tokens.shape[-1] == 0
+    ):
+        return None
+
+    return token_padding_ratio(tokens)
+
+
+def _is_tensor_list(values: Tuple[Any, ...]) -> bool:
+    # lists of tensors of the same length in every sample
+    return all(
+        isinstance(value, list)
+        and len(value) == len(values[0])
+        and len(value) > 0
+        and all(isinstance(item, torch.Tensor) for item in value)
+        for value in values
+    )
 
 
 def collate_fn_with_token_pad(data):
@@ -162,6 +718,9 @@ def collate_fn_with_token_pad(data):
             )
         elif isinstance(value[0], Mapping):
             return collate_fn_with_token_pad(value)
+        elif _is_tensor_list(value):
+            # e.g. per-layer features, collated layer by layer
+            return [process_value(items) for items in zip(*value)]
         elif isinstance(value[0], str):
             return value
         else:
@@ -180,17 +739,62 @@ def collate_fn_with_token_pad(data):
     return batch
 
 
+# How many deterministic replacements to try before giving up on a sample
+MAX_REPLACEMENT_ATTEMPTS = 10
+
+
 def retry_on_exception(func):
+    """
+    Wrap a dataset's `__getitem__` so that a sample that fails to load is
+    recorded in the dataset's quarantine index (when it has one) and a
+    deterministic replacement is returned in its place, keeping batches at
+    full size. Datasets with `replace_failed_items` unset, such as
+    evaluation splits, return None instead, which the collate functions
+    skip, so no sample is counted twice. The full traceback is only logged
+    at debug level, and only the first time a sample fails. None is also
+    returned if no replacement loads.
+    """
+
     @functools.wraps(func)
     def wrapper(self, index):
-        try:
-            return func(self, index)
-        except Exception as e:
-            tb = (
-                traceback.format_exc()
-            )  # This gets the full traceback as a string
-            logger.warning(f"Error at index {index}: {e}\n{tb}")
-            print(f"Error at index {index}: {e}\n{tb}")
+        quarantine = getattr(self, "quarantine", None)
+        dataset_size = getattr(self, "num_unique_items", None)
+        replace = getattr(self, "replace_failed_items", True)
+
+        for attempt in range(MAX_REPLACEMENT_ATTEMPTS):
+            try:
+                return func(self, index)
+            except Exception as e:
+                tb = traceback.format_exc()
+                is_new = (
+                    quarantine.add(index, tb)
+                    if quarantine is not None
+                    else attempt == 0
+                )
+                if is_new:
+                    logger.warning(
+                        f"Error at index {index}: {e.__class__.__name__}: "
+                        f"{e}, "
+                        f"{'using a replacement' if replace else 'skipping'}"
+                    )
+                    logger.debug(tb)
+
+                if not replace or dataset_size is None or dataset_size <= 1:
+                    return None
+                # the same stand-in the QuarantineSampler would have chosen
+                index = (
+                    healthy_replacement(index, dataset_size, quarantine)
+                    if quarantine is not None
+                    else (index + 1) % dataset_size
+                )
+                if index is None:
+                    return None
+
+        logger.warning(
+            f"No loadable replacement found after "
+            f"{MAX_REPLACEMENT_ATTEMPTS} attempts"
+        )
+        return None
 
     return wrapper
 
@@ -204,6 +808,18 @@ class GATEDataset(Dataset):
         - dataset: The input dataset to wrap around
         - task: An optional task to apply to the data items
         - key_remapper_dict: An optional dictionary for key remapping
+        - length_key: The raw key whose length is used for length
+          bucketing, e.g. the caption or question of image-text datasets
+        - quarantine: An optional QuarantineIndex recording the items that
+          fail to load
+        - replace_failed_items: Whether items that fail to load are
+          replaced by another item (training) or skipped (evaluation)
+        - batch_transforms: An optional transform applied to the collated
+          images of every batch, e.g. a BatchAugmentation
+        - preprocess: An optional deterministic transform (decoding, initial
+          resizes) applied to raw items before `transforms`
+        - cache: An optional PreprocessedCache holding the output of
+          `preprocess` for every item, read instead of rerunning it
     """
 
     def __init__(
@@ -212,12 +828,24 @@ class GATEDataset(Dataset):
         infinite_sampling: bool = False,
         transforms: Optional[Any] = None,
         meta_data: Optional[Any] = None,
+        length_key: Optional[str] = None,
+        quarantine: Optional[Any] = None,
+        batch_transforms: Optional[Any] = None,
+        preprocess: Optional[Any] = None,
+        cache: Optional[Any] = None,
+        replace_failed_items: bool = True,
     ):
         super().__init__()
         self.dataset = dataset
         self.infinite_sampling = infinite_sampling
         self.transforms = transforms
         self._meta_data = meta_data
+        self.length_key = length_key
+        self.quarantine = quarantine
+        self.batch_transforms = batch_transforms
+        self.preprocess = preprocess
+        self.cache = cache
+        self.replace_failed_items = replace_failed_items
 
     @property
     def meta_data(self) -> Optional[dict]:
@@ -233,27 +861,117 @@ class GATEDataset(Dataset):
 
     def __len__(self) -> int:
         if self.infinite_sampling:
-            return int(9 * 10**7)
+            return INFINITE_SAMPLING_LENGTH
         return len(self.dataset)
 
-    def _apply_transforms(self, item: Any) -> Any:
-        if self.transforms is not None:
-            if isinstance(self.transforms, list):
-                for transform in self.transforms:
+    @staticmethod
+    def _apply(transforms: Optional[Any], item: Any) -> Any:
+        if transforms is not None:
+            if isinstance(transforms, list):
+                for transform in transforms:
                     if transform is not None:
                         item = transform(item)
             else:
-                item = self.transforms(item)
+                item = transforms(item)
+        return item
+
+    def _apply_transforms(self, item: Any) -> Any:
+        return self._apply(self.transforms, item)
+
+    def load_preprocessed_item(self, index) -> Any:
+        """
+        The item after the deterministic preprocessing, read from the cache
+        once it has been built.
+        """
+        if self.cache is not None and self.cache.is_built:
+            return self.cache[index]
+        return self._apply(self.preprocess, self.dataset[index])
+
+    @property
+    def num_unique_items(self) -> int:
+        return len(self.dataset)
+
+    def load_item(self, index) -> Any:
+        """
+        Load and transform one item, raising any error instead of replacing
+        the item.
+        """
+        item = self.load_preprocessed_item(index)
+
+        item = self._apply_transforms(item)
+
+        # Apply the task to the item if it exists
         return item
 
     @retry_on_exception
+    def _load_item_or_replacement(self, index) -> Any:
+        return self.load_item(index)
+
     def __getitem__(self, index) -> Any:
         if self.infinite_sampling:
             index = index % len(self.dataset)
 
-        item = self.dataset[index]
+        return self._load_item_or_replacement(index)
 
-        item = self._apply_transforms(item)
 
-        # Apply the task to the item if it exists
-        return item
+class InfiniteSampler(Sampler[int]):
+    """
+    A sampler that streams an endless sequence of indices over a dataset of
+    `dataset_size` items. ♾️ Each epoch over the true dataset is a fresh
+    permutation seeded with `seed + epoch`, drawn lazily only when the
+    previous epoch is exhausted, so no index range the size of the nominal
+    infinite length is ever materialised.
+
+    Resuming from `start_index` is O(1): the epoch and the offset within it
+    are recovered with a single divmod.
+    """
+
+    def __init__(
+        self,
+        dataset_size: int,
+        shuffle: bool = True,
+        seed: int = 0,
+        start_index: int = 0,
+        num_samples: int = INFINITE_SAMPLING_LENGTH,
+    ):
+        """
+        Constructor for the InfiniteSampler class.
+
+        :param dataset_size: The number of items in the underlying dataset.
+        :param shuffle: Whether to permute the indices of every epoch.
+        :param seed: The base seed, the permutation of epoch `e` uses
+        `seed + e`.
+        :param start_index: The position in the stream to start from, e.g.
+        `global_step * batch_size` when resuming.
+        :param num_samples: The nominal length reported by `__len__`.
+        """
+        super().__init__()
+        if dataset_size <= 0:
+            raise ValueError(
+                f"dataset_size must be positive, got {dataset_size}"
+            )
+        self.dataset_size = dataset_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.start_index = start_index
+        self.num_samples = num_samples
+
+    def set_start_index(self, start_index: int) -> None:
+        self.start_index = start_index
+
+    def _epoch_indices(self, epoch: int) -> torch.Tensor:
+        if not self.shuffle:
+            return torch.arange(self.dataset_size)
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + epoch)
+        return torch.randperm(self.dataset_size, generator=generator)
+
+    def __iter__(self) -> Iterator[int]:
+        epoch, offset = divmod(self.start_index, self.dataset_size)
+        while True:
+            yield from self._epoch_indices(epoch)[offset:].tolist()
+            offset = 0
+            epoch += 1
+
+    def __len__(self) -> int:
+        return self.num_samples
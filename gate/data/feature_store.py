@@ -0,0 +1,420 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+from typing import Any, Dict, List, Optional, Union
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset
+
+from gate.data.core import GATEDataset, collate_fn_with_token_pad
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_DIR_NAME = "feature_store"
+
+# Bump when the on-disk layout changes, so old stores are rebuilt
+FEATURE_STORE_VERSION = 1
+
+
+def feature_store_key(
+    encoder_config: Any,
+    dataset_name: str,
+    feature_keys: Dict[str, List[str]],
+    stem_instance_norm: bool = False,
+) -> str:
+    """
+    The hash that names the feature stores of one encoder and dataset.
+    """
+    config = {
+        "version": FEATURE_STORE_VERSION,
+        "encoder": encoder_config,
+        "dataset_name": dataset_name,
+        "feature_keys": feature_keys,
+        "stem_instance_norm": stem_instance_norm,
+    }
+    encoded = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def _concat(values: List[Any]) -> Any:
+    # batches of a shard -> one batch, see `_select` for the layout
+    first = values[0]
+    if isinstance(first, torch.Tensor):
+        return torch.cat(values)
+    if isinstance(first, dict):
+        return {
+            key: _concat([value[key] for value in values]) for key in first
+        }
+    if isinstance(first, list) and all(
+        isinstance(item, torch.Tensor) for item in first
+    ):
+        return [_concat(list(layer)) for layer in zip(*values)]
+    return [item for value in values for item in value]
+
+
+def _select(batch: Any, index: int) -> Any:
+    # tensors are indexed along the batch dimension, lists of tensors
+    # (per-layer features) layer by layer, any other list per sample
+    if isinstance(batch, torch.Tensor):
+        return batch[index]
+    if isinstance(batch, dict):
+        return {key: _select(value, index) for key, value in batch.items()}
+    if isinstance(batch, list) and all(
+        isinstance(item, torch.Tensor) for item in batch
+    ):
+        return [item[index] for item in batch]
+    return batch[index]
+
+
+def _batch_size(batch: Any) -> int:
+    if isinstance(batch, torch.Tensor):
+        return batch.shape[0]
+    if isinstance(batch, dict):
+        return _batch_size(next(iter(batch.values())))
+    if isinstance(batch, list) and all(
+        isinstance(item, torch.Tensor) for item in batch
+    ):
+        return _batch_size(batch[0])
+    return len(batch)
+
+
+def _to_storage(batch: Any) -> Any:
+    if isinstance(batch, torch.Tensor):
+        return batch.detach().cpu().contiguous()
+    if isinstance(batch, dict):
+        return {key: _to_storage(value) for key, value in batch.items()}
+    if isinstance(batch, list):
+        return [_to_storage(value) for value in batch]
+    return batch
+
+
+def _cast_floats(features: Any, dtype: torch.dtype) -> Any:
+    if isinstance(features, torch.Tensor):
+        return features.to(dtype) if features.is_floating_point() else features
+    if isinstance(features, dict):
+        return {
+            key: _cast_floats(value, dtype) for key, value in features.items()
+        }
+    if isinstance(features, list):
+        return [_cast_floats(value, dtype) for value in features]
+    return features
+
+
+def _from_storage(sample: Any) -> Any:
+    if isinstance(sample, torch.Tensor):
+        # copied out of the memory-mapped shard, half precision features
+        # are handed out as float32
+        if sample.dtype in (torch.float16, torch.bfloat16):
+            return sample.float()
+        return sample.clone()
+    if isinstance(sample, dict):
+        return {key: _from_storage(value) for key, value in sample.items()}
+    if isinstance(sample, list):
+        return [_from_storage(value) for value in sample]
+    return sample
+
+
+class FeatureStore:
+    """
+    🧊 Sharded on-disk storage of frozen encoder outputs for one dataset
+    split, stored in `{root}/{key}/{split}/`.
+
+    Every shard holds up to `shard_size` samples as one batched dict,
+    saved with `torch.save` and loaded memory-mapped, so random access only
+    reads the samples it touches. The modality inputs of every sample are
+    replaced by the encoder outputs the adapter consumes, and the other
+    fields (labels, metadata) are kept alongside.
+
+    :param root: The directory holding the stores of a dataset.
+    :param key: The `feature_store_key` of the encoder and dataset.
+    :param split: The dataset split.
+    :param shard_size: The number of samples per shard.
+    :param float_dtype: The storage dtype of the encoder outputs.
+    """
+
+    def __init__(
+        self,
+        root: Union[str, pathlib.Path],
+        key: str,
+        split: str,
+        shard_size: int = 4096,
+        float_dtype: torch.dtype = torch.float16,
+    ):
+        self.path = pathlib.Path(root) / key / split
+        self.key = key
+        self.shard_size = shard_size
+        self.float_dtype = float_dtype
+        self._meta = None
+        self._shards = {}
+
+    def __getstate__(self):
+        # shards are mapped again in every dataloader worker
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+    @property
+    def is_built(self) -> bool:
+        return (self.path / "meta.json").exists()
+
+    @property
+    def meta(self) -> Dict:
+        if self._meta is None:
+            with open(self.path / "meta.json") as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    def __len__(self) -> int:
+        return self.meta["num_items"]
+
+    def _shard(self, shard_idx: int) -> Any:
+        if shard_idx not in self._shards:
+            self._shards[shard_idx] = torch.load(
+                self.path / f"shard_{shard_idx:05d}.pt",
+                mmap=True,
+                weights_only=False,
+            )
+        return self._shards[shard_idx]
+
+    def __getitem__(self, index: int) -> Any:
+        if index < 0 or index >= len(self):
+            raise IndexError(f"{index} out of range for {len(self)} samples")
+        shard_size = self.meta["shard_size"]
+        shard = self._shard(index // shard_size)
+        return _from_storage(_select(shard, index % shard_size))
+
+    def write(self, batches: Any) -> None:
+        """
+        Store an iterable of batches, replacing what was stored before.
+        """
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        pending, num_pending = [], 0
+        num_items = num_shards = 0
+
+        def flush(num_samples: int):
+            nonlocal pending, num_pending, num_shards
+            shard = _concat(pending)
+            torch.save(
+                _select_range(shard, 0, num_samples),
+                tmp_path / f"shard_{num_shards:05d}.pt",
+            )
+            num_shards += 1
+            rest = _select_range(shard, num_samples, num_pending)
+            num_pending -= num_samples
+            pending = [rest] if num_pending > 0 else []
+
+        for batch in batches:
+            pending.append(_to_storage(batch))
+            num_pending += _batch_size(batch)
+            num_items += _batch_size(batch)
+            while num_pending >= self.shard_size:
+                flush(self.shard_size)
+        if num_pending > 0:
+            flush(num_pending)
+
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump(
+                {
+                    "key": self.key,
+                    "num_items": num_items,
+                    "num_shards": num_shards,
+                    "shard_size": self.shard_size,
+                },
+                f,
+            )
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+        self._meta = None
+        self._shards = {}
+
+
+def _select_range(batch: Any, start: int, end: int) -> Any:
+    if isinstance(batch, torch.Tensor):
+        # cloned so that a shard doesn't save the storage of its neighbours
+        return batch[start:end].clone()
+    if isinstance(batch, dict):
+        return {
+            key: _select_range(value, start, end)
+            for key, value in batch.items()
+        }
+    if isinstance(batch, list) and all(
+        isinstance(item, torch.Tensor) for item in batch
+    ):
+        return [_select_range(item, start, end) for item in batch]
+    return batch[start:end]
+
+
+class FeatureDataset(Dataset):
+    """
+    The samples of a FeatureStore, ready to be wrapped in a GATEDataset.
+    """
+
+    def __init__(self, store: FeatureStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, index: int) -> Any:
+        return self.store[index]
+
+
+@torch.no_grad()
+def extract_features(
+    adapter: nn.Module,
+    dataset: Dataset,
+    store: FeatureStore,
+    batch_size: int = 64,
+    num_workers: int = 8,
+    device: Optional[Union[str, torch.device]] = None,
+) -> None:
+    """
+    Run the frozen encoder of `adapter` once over `dataset` and store the
+    encoder outputs listed by `adapter.feature_keys()` in `store`.
+
+    :param adapter: A BaseAdapterModule with a frozen encoder.
+    :param dataset: The non-augmented dataset split.
+    :param store: The store to write to.
+    :param batch_size: The extraction batch size.
+    :param num_workers: The number of dataloader worker processes.
+    :param device: The device to run the encoder on.
+    """
+    from tqdm import tqdm
+
+    feature_keys = adapter.feature_keys()
+    encoder = adapter.encoder
+    if device is not None:
+        encoder.to(device)
+    was_training = encoder.training
+    encoder.eval()
+
+    stem_instance_norm = (
+        adapter.stem_instance_norm.to(device or "cpu").eval()
+        if adapter.use_stem_instance_norm
+        else None
+    )
+    dataloader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+        collate_fn=collate_fn_with_token_pad,
+    )
+
+    def batches():
+        for batch in tqdm(dataloader, desc=f"Extracting {store.path}"):
+            if batch is None:
+                continue
+            for modality, keys in feature_keys.items():
+                if modality not in batch:
+                    continue
+                inputs = batch[modality]
+                if device is not None:
+                    inputs = inputs.to(device)
+                if modality == "image" and stem_instance_norm is not None:
+                    inputs = stem_instance_norm(inputs)
+                outputs = encoder(**{modality: inputs})[modality]
+                batch[modality] = _cast_floats(
+                    {key: outputs[key] for key in keys}, store.float_dtype
+                )
+            yield batch
+
+    try:
+        store.write(batches())
+    finally:
+        encoder.train(was_training)
+
+
+def non_augmented_view(
+    dataset: GATEDataset, reference: Optional[GATEDataset] = None
+) -> GATEDataset:
+    """
+    The items of `dataset` with the deterministic transforms of
+    `reference`, e.g. the training set with the transforms of the
+    validation set, which apply no augmentation.
+    """
+    reference = reference if reference is not None else dataset
+    return GATEDataset(
+        dataset=dataset.dataset,
+        infinite_sampling=False,
+        transforms=reference.transforms,
+        preprocess=reference.preprocess,
+        cache=dataset.cache,
+        quarantine=dataset.quarantine,
+    )
+
+
+def build_feature_datasets(
+    adapter: nn.Module,
+    dataset_dict: Dict[str, GATEDataset],
+    cache_dir: Union[str, pathlib.Path],
+    dataset_name: str,
+    encoder_config: Any,
+    batch_size: int = 64,
+    num_workers: int = 8,
+    device: Optional[Union[str, torch.device]] = None,
+) -> Dict[str, GATEDataset]:
+    """
+    Replace every split by the stored outputs of the frozen encoder of
+    `adapter`, extracting the ones that don't exist yet. The training split
+    is extracted with the validation transforms, so without augmentation.
+
+    Args:
+        adapter (nn.Module): The adapter, with a frozen encoder.
+        dataset_dict (Dict[str, GATEDataset]): The dataset splits.
+        cache_dir (Union[str, pathlib.Path]): The root directory of the
+            stores, usually the dataset directory.
+        dataset_name (str): The name of the dataset config.
+        encoder_config (Any): The encoder config, part of the store key.
+        batch_size (int): The extraction batch size.
+        num_workers (int): The number of extraction workers.
+        device (Optional[Union[str, torch.device]]): The extraction device.
+
+    Returns:
+        Dict[str, GATEDataset]: The splits, reading from the stores.
+    """
+    adapter.check_cached_features()
+    key = feature_store_key(
+        encoder_config=encoder_config,
+        dataset_name=dataset_name,
+        feature_keys=adapter.feature_keys(),
+        stem_instance_norm=adapter.use_stem_instance_norm,
+    )
+    root = pathlib.Path(cache_dir) / FEATURE_STORE_DIR_NAME / dataset_name
+
+    feature_datasets = {}
+    for split, dataset in dataset_dict.items():
+        store = FeatureStore(root=root, key=key, split=split)
+        if not store.is_built:
+            reference = dataset_dict.get("val") if split == "train" else None
+            if split == "train" and reference is None:
+                logger.warning(
+                    "No validation split to borrow non-augmented transforms "
+                    "from, extracting training features with augmentation"
+                )
+            extract_features(
+                adapter,
+                non_augmented_view(dataset, reference=reference),
+                store,
+                batch_size=batch_size,
+                num_workers=num_workers,
+                device=device,
+            )
+        logger.info(
+            f"Using {len(store)} stored {split} features in {store.path}"
+        )
+
+        feature_datasets[split] = GATEDataset(
+            dataset=FeatureDataset(store),
+            infinite_sampling=dataset.infinite_sampling,
+            meta_data=dataset.meta_data,
+        )
+    return feature_datasets
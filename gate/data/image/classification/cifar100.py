@@ -10,7 +10,9 @@ from torch.utils.data import random_split
 from gate.boilerplate.decorators import configurable
 from gate.config.variables import DATASET_DIR
 from gate.data.core import GATEDataset
-from gate.data.image.classification.imagenet1k import StandardAugmentations
+from gate.data.image.classification.imagenet1k import (
+    build_train_image_augmentation,
+)
 from gate.data.transforms.image import pad_image
 
 
@@ -92,12 +94,16 @@ def build_gate_cifar100_dataset(
     data_dir: Optional[str] = None,
     transforms: Optional[Any] = None,
     num_classes=100,
+    batch_augmentation: bool = False,
 ):
-    augmentations = StandardAugmentations(image_key="image")
+    augmentations, batch_transforms = build_train_image_augmentation(
+        batch_augmentation=batch_augmentation
+    )
     train_set = GATEDataset(
         dataset=build_dataset("train", data_dir=data_dir),
         infinite_sampling=True,
         transforms=[transform_wrapper, augmentations, transforms],
+        batch_transforms=batch_transforms,
     )
 
     val_set = GATEDataset(
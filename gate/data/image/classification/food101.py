@@ -4,8 +4,6 @@ import multiprocessing as mp
 from dataclasses import dataclass
 from typing import Any, Optional
 
-import numpy as np
-import torchvision.transforms as T
 from datasets import load_dataset
 
 from gate.boilerplate.decorators import configurable
@@ -13,8 +11,9 @@ from gate.config.variables import DATASET_DIR
 from gate.data.core import GATEDataset
 from gate.data.image.classification.imagenet1k import (
     KeyMapper,
-    StandardAugmentations,
+    build_train_image_augmentation,
 )
+from gate.data.split_cache import split_dataset
 
 logger = logging.getLogger(__name__)
 
@@ -33,12 +32,18 @@ def build_food101_dataset(
     Returns:
         A dictionary containing the dataset split.
     """
-    np.random.RandomState(42)
-
     logger.info(
         f"Loading Food-101 dataset, will download to {data_dir} if necessary."
     )
 
+    if set_name == "test":
+        return load_dataset(
+            path="food101",
+            split="validation",
+            cache_dir=data_dir,
+            num_proc=mp.cpu_count(),
+        )
+
     train_val_data = load_dataset(
         path="food101",
         split="train",
@@ -46,19 +51,13 @@ def build_food101_dataset(
         num_proc=mp.cpu_count(),
     )
 
-    test_set = load_dataset(
-        path="food101",
-        split="validation",
+    dataset_dict = split_dataset(
+        train_val_data,
+        split_sizes={"train": 0.9, "val": 0.1},
+        dataset_name="food101",
         cache_dir=data_dir,
-        num_proc=mp.cpu_count(),
     )
 
-    train_val_data = train_val_data.train_test_split(test_size=0.1)
-    train_set = train_val_data["train"]
-    val_set = train_val_data["test"]
-
-    dataset_dict = {"train": train_set, "val": val_set, "test": test_set}
-
     return dataset_dict[set_name]
 
 
@@ -69,21 +68,11 @@ def build_gate_dataset(
     data_dir: Optional[str] = None,
     transforms: Optional[Any] = None,
     num_classes=101,
+    batch_augmentation: bool = False,
 ) -> dict:
-    single_to_three_channel = T.Lambda(lambda x: x.repeat(3, 1, 1))
-    augmentations = StandardAugmentations(image_key="image")
-
-    def train_augment(input_dict):
-        input_dict = augmentations(input_dict)
-
-        x = input_dict["image"]
-        x = T.ToTensor()(x)
-        if x.shape[0] == 1:
-            x = single_to_three_channel(x)
-        x = T.ToPILImage()(x)
-        input_dict["image"] = x
-
-        return input_dict
+    train_augment, batch_transforms = build_train_image_augmentation(
+        batch_augmentation=batch_augmentation
+    )
 
     train_set = GATEDataset(
         dataset=build_food101_dataset("train", data_dir=data_dir),
@@ -93,6 +82,7 @@ def build_gate_dataset(
             train_augment,
             transforms,
         ],
+        batch_transforms=batch_transforms,
     )
 
     val_set = GATEDataset(
@@ -1,16 +1,21 @@
 # imagenet1k.py
 import multiprocessing as mp
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
-import torchvision.transforms as T
 from datasets import load_dataset
 from PIL import Image
-from timm.data import rand_augment_transform
+from timm.data import (
+    IMAGENET_DEFAULT_MEAN,
+    IMAGENET_DEFAULT_STD,
+    rand_augment_transform,
+)
 
 from gate.boilerplate.decorators import configurable
 from gate.config.variables import DATASET_DIR
 from gate.data.core import GATEDataset
+from gate.data.split_cache import split_dataset
+from gate.data.transforms.batch_augment import BatchAugmentation
 from gate.data.transforms.image import convert_to_rgb
 
 
@@ -35,9 +40,14 @@ def build_dataset(set_name: str, data_dir: Optional[str] = None) -> dict:
     train_val_data = data["train"]
     test_data = data["validation"]
 
-    train_val_data = train_val_data.train_test_split(test_size=0.05)
+    train_val_data = split_dataset(
+        train_val_data,
+        split_sizes={"train": 0.95, "val": 0.05},
+        dataset_name="imagenet1k",
+        cache_dir=data_dir,
+    )
     train_set = train_val_data["train"]
-    val_set = train_val_data["test"]
+    val_set = train_val_data["val"]
 
     dataset_dict = {"train": train_set, "val": val_set, "test": test_data}
 
@@ -47,12 +57,18 @@ def build_dataset(set_name: str, data_dir: Optional[str] = None) -> dict:
 class StandardAugmentations:
     def __init__(self, image_key: Optional[str] = None) -> None:
         self.image_key = image_key
+        self._rand_augment = None
 
-    def __call__(self, input_dict: Dict) -> Any:
-        rand_augment = rand_augment_transform(
-            "rand-m9-n3-mstd0.5-inc1", hparams={}
-        )
+    @property
+    def rand_augment(self):
+        # built lazily so the transform is created inside each worker
+        if self._rand_augment is None:
+            self._rand_augment = rand_augment_transform(
+                "rand-m9-n3-mstd0.5-inc1", hparams={}
+            )
+        return self._rand_augment
 
+    def __call__(self, input_dict: Dict) -> Any:
         if self.image_key is None:
             x = input_dict
         else:
@@ -62,16 +78,60 @@ class StandardAugmentations:
             x = convert_to_rgb(x)
 
         try:
-            if self.image_key is None:
-                input_dict = rand_augment(x)
-            else:
-                input_dict[self.image_key] = rand_augment(x)
+            x = self.rand_augment(x)
         except Exception as e:
             logger.warn(f"RandAugment failed with error: {e}")
 
+        if self.image_key is None:
+            return x
+
+        input_dict[self.image_key] = x
+        return input_dict
+
+
+class RGBImage:
+    """
+    Convert the PIL image under `image_key` to RGB, the only per-sample
+    work left for training images when augmentation happens per batch.
+    """
+
+    def __init__(self, image_key: str = "image") -> None:
+        self.image_key = image_key
+
+    def __call__(self, input_dict: Dict) -> Dict:
+        if isinstance(input_dict[self.image_key], Image.Image):
+            input_dict[self.image_key] = convert_to_rgb(
+                input_dict[self.image_key]
+            )
         return input_dict
 
 
+def build_train_image_augmentation(
+    batch_augmentation: bool,
+    image_mean: Tuple[float, ...] = IMAGENET_DEFAULT_MEAN,
+    image_std: Tuple[float, ...] = IMAGENET_DEFAULT_STD,
+    image_key: str = "image",
+) -> Tuple[Any, Optional[BatchAugmentation]]:
+    """
+    Choose between per-sample and batched augmentation of training images.
+
+    :param batch_augmentation: Whether to augment collated batches with a
+    BatchAugmentation instead of running RandAugment on every PIL image.
+    :param image_mean: The mean the encoder transforms normalise with,
+    replaced by the encoder's own in `gate.run`.
+    :param image_std: The std the encoder transforms normalise with,
+    replaced by the encoder's own in `gate.run`.
+    :param image_key: The key of the image in every sample.
+    :return: The per-sample transform and the GATEDataset batch transforms.
+    """
+    if not batch_augmentation:
+        return StandardAugmentations(image_key=image_key), None
+
+    return RGBImage(image_key=image_key), BatchAugmentation(
+        mean=image_mean, std=image_std
+    )
+
+
 class KeyMapper:
     def __call__(self, input_dict: Dict) -> Any:
         return {"image": input_dict["image"], "labels": input_dict["label"]}
@@ -91,21 +151,11 @@ def build_gate_dataset(
     data_dir: Optional[str] = None,
     transforms: Optional[Any] = None,
     num_classes=1000,
+    batch_augmentation: bool = False,
 ) -> dict:
-    single_to_three_channel = T.Lambda(lambda x: x.repeat(3, 1, 1))
-    augmentations = StandardAugmentations(image_key="image")
-
-    def train_augment(input_dict):
-        input_dict = augmentations(input_dict)
-
-        x = input_dict["image"]
-        x = T.ToTensor()(x)
-        if x.shape[0] == 1:
-            x = single_to_three_channel(x)
-        x = T.ToPILImage()(x)
-        input_dict["image"] = x
-
-        return input_dict
+    train_augment, batch_transforms = build_train_image_augmentation(
+        batch_augmentation=batch_augmentation
+    )
 
     train_set = GATEDataset(
         dataset=build_dataset("train", data_dir=data_dir),
@@ -115,6 +165,7 @@ def build_gate_dataset(
             train_augment,
             transforms,
         ],
+        batch_transforms=batch_transforms,
     )
 
     val_set = GATEDataset(
@@ -8,6 +8,7 @@ from gate.boilerplate.decorators import configurable
 from gate.config.variables import DATASET_DIR
 from gate.data.core import GATEDataset
 from gate.data.image.classification.imagenet1k import StandardAugmentations
+from gate.data.split_cache import split_dataset
 from gate.data.transforms.image import pad_image
 
 
@@ -40,9 +41,14 @@ def build_dataset(set_name: str, data_dir: Optional[str] = None) -> dict:
         num_proc=mp.cpu_count(),
     )
 
-    train_val_data = train_val_data.train_test_split(test_size=0.1)
+    train_val_data = split_dataset(
+        train_val_data,
+        split_sizes={"train": 0.9, "val": 0.1},
+        dataset_name="svhn",
+        cache_dir=data_dir,
+    )
     train_set = train_val_data["train"]
-    val_set = train_val_data["test"]
+    val_set = train_val_data["val"]
 
     dataset_dict = {"train": train_set, "val": val_set, "test": test_data}
 
@@ -9,6 +9,7 @@ from gate.config.variables import DATASET_DIR
 from gate.data.core import GATEDataset
 from gate.data.image.segmentation.classes import cocostuff_10k_dict as CLASSES
 from gate.data.image.segmentation.label_remap import remap_tensor_values
+from gate.data.split_cache import split_dataset
 from gate.data.transforms.segmentation import (
     BaseDatasetTransforms,
     KeySelectorTransforms,
@@ -45,9 +46,14 @@ def build_dataset(
     )
 
     # 💥 Split the train set into training and validation sets
-    train_val_data = train_data.train_test_split(test_size=0.1)
+    train_val_data = split_dataset(
+        train_data,
+        split_sizes={"train": 0.9, "val": 0.1},
+        dataset_name="coco_10k",
+        cache_dir=data_dir,
+    )
     train_data = train_val_data["train"]
-    val_data = train_val_data["test"]
+    val_data = train_val_data["val"]
 
     test_data = load_dataset(
         "GATE-engine/COCOStuff10K",
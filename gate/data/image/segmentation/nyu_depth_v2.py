@@ -10,6 +10,7 @@ from gate.data.core import GATEDataset
 from gate.data.image.segmentation.classes import (
     nyu_depth_v2_classes as CLASSES,
 )
+from gate.data.split_cache import split_dataset
 from gate.data.transforms.segmentation import (
     BaseDatasetTransforms,
     KeySelectorTransforms,
@@ -42,9 +43,14 @@ def build_dataset(set_name: str, data_dir: Optional[str] = None) -> dict:
         num_proc=mp.cpu_count(),
     )
 
-    train_val_data = train_val_data.train_test_split(test_size=0.1)
+    train_val_data = split_dataset(
+        train_val_data,
+        split_sizes={"train": 0.9, "val": 0.1},
+        dataset_name="nyu_depth_v2",
+        cache_dir=data_dir,
+    )
     train_data = train_val_data["train"]
-    val_data = train_val_data["test"]
+    val_data = train_val_data["val"]
 
     dataset_dict = {"train": train_data, "val": val_data, "test": test_data}
 
@@ -85,21 +91,24 @@ def build_gate_dataset(
     train_set = GATEDataset(
         dataset=build_dataset("train", data_dir=data_dir),
         infinite_sampling=True,
-        transforms=[input_transforms, train_transforms, transforms],
+        preprocess=input_transforms,
+        transforms=[train_transforms, transforms],
         meta_data={"class_names": CLASSES, "num_classes": num_classes},
     )
 
     val_set = GATEDataset(
         dataset=build_dataset("val", data_dir=data_dir),
         infinite_sampling=False,
-        transforms=[input_transforms, eval_transforms, transforms],
+        preprocess=input_transforms,
+        transforms=[eval_transforms, transforms],
         meta_data={"class_names": CLASSES, "num_classes": num_classes},
     )
 
     test_set = GATEDataset(
         dataset=build_dataset("test", data_dir=data_dir),
         infinite_sampling=False,
-        transforms=[input_transforms, eval_transforms, transforms],
+        preprocess=input_transforms,
+        transforms=[eval_transforms, transforms],
         meta_data={"class_names": CLASSES, "num_classes": num_classes},
     )
 
@@ -172,6 +172,18 @@ class CLEVRClassificationDataset(Dataset):
         """
         return len(self.questions)
 
+    def get_column(self, key: str) -> list:
+        """
+        Read one field of every question without loading any images.
+
+        Args:
+            key (str): The question field, e.g. "question".
+
+        Returns:
+            list: The value of that field for every sample.
+        """
+        return self.questions[key]
+
     def __getitem__(
         self, idx: Union[int, torch.Tensor]
     ) -> Tuple[torch.Tensor, str]:
@@ -301,23 +313,23 @@ def build_gate_dataset(
     train_set = GATEDataset(
         dataset=build_dataset("train", data_dir=data_dir),
         infinite_sampling=True,
-        transforms=[
-            transform_wrapper,
-            StandardAugmentations(image_key="image"),
-            transforms,
-        ],
+        length_key="question",
+        preprocess=transform_wrapper,
+        transforms=[StandardAugmentations(image_key="image"), transforms],
     )
 
     val_set = GATEDataset(
         dataset=build_dataset("val", data_dir=data_dir),
         infinite_sampling=False,
-        transforms=[transform_wrapper, transforms],
+        preprocess=transform_wrapper,
+        transforms=transforms,
     )
 
     test_set = GATEDataset(
         dataset=build_dataset("test", data_dir=data_dir),
         infinite_sampling=False,
-        transforms=[transform_wrapper, transforms],
+        preprocess=transform_wrapper,
+        transforms=transforms,
     )
 
     dataset_dict = {"train": train_set, "val": val_set, "test": test_set}
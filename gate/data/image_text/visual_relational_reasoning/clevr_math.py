@@ -89,6 +89,7 @@ def build_gate_dataset(
     train_set = GATEDataset(
         dataset=build_dataset("train", data_dir=data_dir),
         infinite_sampling=True,
+        length_key="question",
         transforms=[
             transform_wrapper,
             StandardAugmentations(image_key="image"),
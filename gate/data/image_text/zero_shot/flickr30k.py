@@ -11,6 +11,7 @@ from gate.boilerplate.decorators import configurable
 from gate.config.variables import DATASET_DIR
 from gate.data.core import GATEDataset
 from gate.data.image.classification.imagenet1k import StandardAugmentations
+from gate.data.split_cache import split_dataset
 
 # Removed unused import statement
 # import numpy as np
@@ -43,13 +44,12 @@ def build_dataset(set_name: str, data_dir: Optional[str] = None) -> dict:
         num_proc=mp.cpu_count(),
     )
 
-    train_val_test_data = dataset.train_test_split(test_size=0.30)
-    train_set = train_val_test_data["train"]
-    val_test_set = train_val_test_data["test"].train_test_split(test_size=0.50)
-    val_set = val_test_set["train"]
-    test_set = val_test_set["test"]
-
-    dataset_dict = {"train": train_set, "val": val_set, "test": test_set}
+    dataset_dict = split_dataset(
+        dataset,
+        split_sizes={"train": 0.7, "val": 0.15, "test": 0.15},
+        dataset_name="flickr30k",
+        cache_dir=data_dir,
+    )
 
     return dataset_dict[set_name]
 
@@ -85,6 +85,7 @@ def build_gate_dataset(
     train_set = GATEDataset(
         dataset=build_dataset("train", data_dir=data_dir),
         infinite_sampling=True,
+        length_key="caption",
         transforms=[
             dataset_format_transform,
             StandardAugmentations(image_key="image"),
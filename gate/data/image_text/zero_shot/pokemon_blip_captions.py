@@ -10,6 +10,7 @@ from gate.boilerplate.decorators import configurable
 from gate.config.variables import DATASET_DIR
 from gate.data.core import GATEDataset
 from gate.data.image.classification.imagenet1k import StandardAugmentations
+from gate.data.split_cache import split_dataset
 
 logger = logging.getLogger(__name__)
 
@@ -41,13 +42,12 @@ def build_dataset(set_name: str, data_dir: Optional[str] = None) -> dict:
         num_proc=mp.cpu_count(),
     )
 
-    train_val_test_data = dataset.train_test_split(test_size=0.50)
-    train_set = train_val_test_data["train"]
-    val_test_set = train_val_test_data["test"].train_test_split(test_size=0.50)
-    val_set = val_test_set["train"]
-    test_set = val_test_set["test"]
-
-    dataset_dict = {"train": train_set, "val": val_set, "test": test_set}
+    dataset_dict = split_dataset(
+        dataset,
+        split_sizes={"train": 0.5, "val": 0.25, "test": 0.25},
+        dataset_name="pokemon_blip_captions",
+        cache_dir=data_dir,
+    )
 
     return dataset_dict[set_name]
 
@@ -76,6 +76,7 @@ def build_gate_dataset(
     train_set = GATEDataset(
         dataset=build_dataset("train", data_dir=data_dir),
         infinite_sampling=True,
+        length_key="text",
         transforms=[
             dataset_format_transform,
             StandardAugmentations(image_key="image"),
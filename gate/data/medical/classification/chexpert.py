@@ -12,6 +12,7 @@ from gate.boilerplate.decorators import configurable
 from gate.config.variables import DATASET_DIR
 from gate.data.core import GATEDataset
 from gate.data.image.classification.imagenet1k import StandardAugmentations
+from gate.data.split_cache import split_dataset
 
 
 def build_dataset(set_name: str, data_dir: Optional[str] = None) -> dict:
@@ -59,9 +60,14 @@ def build_dataset(set_name: str, data_dir: Optional[str] = None) -> dict:
 
         dataset.save_to_disk(filtered_dataset_path)
 
-    train_val_data = dataset["train"].train_test_split(test_size=0.10)
+    train_val_data = split_dataset(
+        dataset["train"],
+        split_sizes={"train": 0.9, "val": 0.1},
+        dataset_name="chexpert",
+        cache_dir=data_dir,
+    )
     train_set = train_val_data["train"]
-    val_set = train_val_data["test"]
+    val_set = train_val_data["val"]
 
     dataset_dict = {
         "train": train_set,
@@ -172,6 +172,53 @@ def convert_to_b3hw(image):
     return image
 
 
+class VolumePreprocess:
+    """
+    The deterministic part of the volume transforms: channels first and
+    the resize of every slice to `initial_size`.
+    """
+
+    def __init__(self, initial_size: Union[int, List[int]] = 1024):
+        self.initial_size = (
+            initial_size
+            if isinstance(initial_size, tuple)
+            or isinstance(initial_size, list)
+            else (initial_size, initial_size)
+        )
+
+    def __call__(self, item: Dict):
+        image = item["image"]
+        annotation = item["label"]
+
+        if len(image.shape) == 4:
+            image = image.permute(2, 3, 0, 1)
+            annotation = annotation.permute(2, 0, 1)
+        elif len(image.shape) == 3:
+            image = image.permute(2, 0, 1).unsqueeze(1)
+            annotation = annotation.permute(2, 0, 1)
+
+        logger.debug(f"input shapes {image.shape}, {annotation.shape}")
+
+        image = torch.tensor(image)
+        annotation = torch.tensor(annotation)
+
+        image = T.Resize(
+            (self.initial_size[0], self.initial_size[1]),
+            interpolation=T.InterpolationMode.BICUBIC,
+            antialias=True,
+        )(image)
+
+        annotation = T.Resize(
+            (self.initial_size[0], self.initial_size[1]),
+            interpolation=T.InterpolationMode.NEAREST_EXACT,
+            antialias=False,
+        )(annotation)
+
+        annotation = annotation.unsqueeze(1)
+
+        return {"image": image, "label": annotation}
+
+
 class DatasetTransforms:
     def __init__(
         self,
@@ -181,12 +228,8 @@ class DatasetTransforms:
         crop_size: Optional[Union[int, List[int]]] = None,
         photometric_config: Optional[PhotometricParams] = None,
     ):
-        self.initial_size = (
-            initial_size
-            if isinstance(initial_size, tuple)
-            or isinstance(initial_size, list)
-            else (initial_size, initial_size)
-        )
+        self.preprocess = VolumePreprocess(initial_size=initial_size)
+        self.initial_size = self.preprocess.initial_size
 
         self.input_size = (
             input_size
@@ -218,35 +261,16 @@ class DatasetTransforms:
             self.med_transforms = None
 
     def __call__(self, item: Dict):
+        return self.augment(self.preprocess(item))
+
+    def augment(self, item: Dict):
+        """
+        The random part of the transforms, applied to the output of
+        `preprocess`.
+        """
         image = item["image"]
         annotation = item["label"]
 
-        if len(image.shape) == 4:
-            image = image.permute(2, 3, 0, 1)
-            annotation = annotation.permute(2, 0, 1)
-        elif len(image.shape) == 3:
-            image = image.permute(2, 0, 1).unsqueeze(1)
-            annotation = annotation.permute(2, 0, 1)
-
-        logger.debug(f"input shapes {image.shape}, {annotation.shape}")
-
-        image = torch.tensor(image)
-        annotation = torch.tensor(annotation)
-
-        image = T.Resize(
-            (self.initial_size[0], self.initial_size[1]),
-            interpolation=T.InterpolationMode.BICUBIC,
-            antialias=True,
-        )(image)
-
-        annotation = T.Resize(
-            (self.initial_size[0], self.initial_size[1]),
-            interpolation=T.InterpolationMode.NEAREST_EXACT,
-            antialias=False,
-        )(annotation)
-
-        annotation = annotation.unsqueeze(1)
-
         logger.debug(f"pre crop shapes {image.shape}, {annotation.shape}")
 
         if self.crop_size is not None:
@@ -314,7 +338,8 @@ def build_gate_dataset(
     train_set = GATEDataset(
         dataset=build_dataset("train", data_dir=data_dir, task_name=task_name),
         infinite_sampling=True,
-        transforms=[train_transforms, transforms],
+        preprocess=train_transforms.preprocess,
+        transforms=[train_transforms.augment, transforms],
         meta_data={
             "class_names": CLASSES_DICT[task_name],
             "num_classes": len(CLASSES_DICT[task_name]),
@@ -324,7 +349,8 @@ def build_gate_dataset(
     val_set = GATEDataset(
         dataset=build_dataset("val", data_dir=data_dir, task_name=task_name),
         infinite_sampling=False,
-        transforms=[eval_transforms, transforms],
+        preprocess=eval_transforms.preprocess,
+        transforms=[eval_transforms.augment, transforms],
         meta_data={
             "class_names": CLASSES_DICT[task_name],
             "num_classes": len(CLASSES_DICT[task_name]),
@@ -334,7 +360,8 @@ def build_gate_dataset(
     test_set = GATEDataset(
         dataset=build_dataset("test", data_dir=data_dir, task_name=task_name),
         infinite_sampling=False,
-        transforms=[eval_transforms, transforms],
+        preprocess=eval_transforms.preprocess,
+        transforms=[eval_transforms.augment, transforms],
         meta_data={
             "class_names": CLASSES_DICT[task_name],
             "num_classes": len(CLASSES_DICT[task_name]),
@@ -0,0 +1,65 @@
+import logging
+from typing import Any, List, Optional
+
+from gate.boilerplate.decorators import configurable
+from gate.config.variables import DATASET_DIR
+from gate.data.core import mix_datasets
+
+logger = logging.getLogger(__name__)
+
+
+@configurable(
+    group="dataset", name="mixture", defaults=dict(data_dir=DATASET_DIR)
+)
+def build_gate_dataset(
+    data_dir: Optional[str] = None,
+    transforms: Optional[Any] = None,
+    datasets: Optional[List[str]] = None,
+    weights: Optional[List[float]] = None,
+    temperature: float = 1.0,
+) -> dict:
+    """
+    Build a mixture of registered GATE datasets. 🍹
+
+    Example:
+        python -m gate.run dataset=mixture \\
+            dataset.datasets=[food101,cifar100] dataset.temperature=2.0
+
+    :param data_dir: The dataset directory every source is built from.
+    :param transforms: The transforms applied by every source, after its
+    own key mapping and augmentation.
+    :param datasets: The names of the `dataset` configs to mix.
+    :param weights: The training sampling weight of every dataset,
+    defaults to their sizes.
+    :param temperature: The sampling temperature applied to the weights.
+    :return: A dict with the train, val and test MixtureDatasets.
+    """
+    from hydra.core.config_store import ConfigStore
+    from hydra_zen import instantiate
+
+    if not datasets:
+        raise ValueError(
+            "dataset=mixture needs the datasets to mix, e.g. "
+            "dataset.datasets=[food101,cifar100]"
+        )
+
+    dataset_configs = ConfigStore.instance().repo["dataset"]
+    dataset_dicts = []
+    for name in datasets:
+        if f"{name}.yaml" not in dataset_configs or name == "mixture":
+            raise ValueError(f"{name} is not a dataset that can be mixed")
+        logger.info(f"Building {name} for the mixture")
+        dataset_dicts.append(
+            instantiate(
+                dataset_configs[f"{name}.yaml"].node,
+                data_dir=data_dir,
+                transforms=transforms,
+            )
+        )
+
+    return mix_datasets(
+        dataset_dicts,
+        weights=None if weights is None else list(weights),
+        temperature=temperature,
+        names=list(datasets),
+    )
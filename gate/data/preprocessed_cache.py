@@ -0,0 +1,475 @@
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pathlib
+import pickle
+import shutil
+import traceback
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import fire
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+logger = logging.getLogger(__name__)
+
+PREPROCESSED_CACHE_DIR_NAME = "preprocessed_cache"
+
+# Bump when the on-disk layout changes, so old caches are rebuilt
+CACHE_FORMAT_VERSION = 1
+
+_OBJECTS_FIELD = "__objects__"
+_ITEM_KEY = "__item__"
+
+_SIMPLE_TYPES = (bool, int, float, str, type(None))
+
+
+def describe_transform(transform: Any) -> Any:
+    """
+    A JSON-serialisable description of a transform, used to key the
+    preprocessed cache: the qualified name and source hash of its class or
+    function, plus its simple attributes, partial arguments and defaults.
+    Changing any of them changes the cache key.
+
+    :param transform: A callable, a list of callables or a simple value.
+    :return: The description.
+    """
+    if isinstance(transform, _SIMPLE_TYPES):
+        return transform
+    if isinstance(transform, (list, tuple)):
+        return [describe_transform(value) for value in transform]
+    if isinstance(transform, dict):
+        return {
+            str(key): describe_transform(value)
+            for key, value in sorted(transform.items(), key=str)
+        }
+    if isinstance(transform, functools.partial):
+        return {
+            "partial": describe_transform(transform.func),
+            "args": describe_transform(transform.args),
+            "kwargs": describe_transform(transform.keywords),
+        }
+    if inspect.ismethod(transform):
+        return {
+            "method": transform.__func__.__qualname__,
+            "self": describe_transform(transform.__self__),
+        }
+
+    target = transform if inspect.isroutine(transform) else type(transform)
+    description = {
+        "name": f"{target.__module__}.{target.__qualname__}",
+        "source": _source_hash(target),
+    }
+    if inspect.isroutine(transform):
+        description["defaults"] = describe_transform(
+            getattr(transform, "__defaults__", None)
+        )
+        return description
+
+    attributes = getattr(transform, "__dict__", {})
+    description["attributes"] = {
+        key: describe_transform(value)
+        for key, value in sorted(attributes.items())
+        if not key.startswith("_")
+    }
+    return description
+
+
+def _source_hash(target: Any) -> Optional[str]:
+    try:
+        source = inspect.getsource(target)
+    except (OSError, TypeError):
+        return None
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+
+
+def cache_key(
+    dataset_name: str,
+    split: str,
+    preprocess: Any,
+    image_size: Optional[Union[int, Tuple[int, int]]] = None,
+) -> str:
+    """
+    The hash that names the cache of one dataset split, covering everything
+    the cached samples depend on.
+    """
+    config = {
+        "format_version": CACHE_FORMAT_VERSION,
+        "dataset_name": dataset_name,
+        "split": split,
+        "preprocess": describe_transform(preprocess),
+        "image_size": describe_transform(image_size),
+    }
+    encoded = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def _to_array(value: Any) -> Optional[Tuple[np.ndarray, str]]:
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu().numpy(), "tensor"
+    if isinstance(value, Image.Image):
+        return np.asarray(value), "pil"
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        return value, "ndarray"
+    return None
+
+
+def _from_array(array: np.ndarray, kind: str, dtype: str) -> Any:
+    array = array.astype(dtype, copy=False)
+    if kind == "tensor":
+        return torch.from_numpy(array)
+    if kind == "pil":
+        return Image.fromarray(array)
+    return array
+
+
+def _identity(item: Any) -> Any:
+    return item
+
+
+class _PreprocessDataset(Dataset):
+    def __init__(self, dataset: Dataset, preprocess: Any):
+        self.dataset = dataset
+        self.preprocess = preprocess
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def __getitem__(self, index: int):
+        try:
+            item = self.dataset[index]
+            if self.preprocess is not None:
+                item = self.preprocess(item)
+        except Exception:
+            return index, None, traceback.format_exc()
+        return index, item, None
+
+
+class PreprocessedCache:
+    """
+    💾 Memory-mapped storage of the output of a dataset's deterministic
+    preprocessing (decoding, initial resizes, key selection), so that it is
+    computed once per dataset split and configuration instead of every
+    epoch.
+
+    A cache lives in
+    `{cache_dir}/preprocessed_cache/{dataset_name}/{split}/{key}/`, where
+    `key` hashes the dataset, split, preprocessing transform and image size
+    (see `cache_key`). Changing any of them points to a new directory, and
+    building it removes the stale ones.
+
+    Every tensor, array or PIL image field of the preprocessed samples is
+    stored in one flat binary file, read back through `np.memmap`, with a
+    per-sample index of offsets and shapes. Float fields are stored as
+    `float_dtype` (float16 by default) and uint8 images as they are. Any
+    other values (labels, strings, ...) are pickled per sample.
+
+    :param cache_dir: The root directory, usually the dataset directory.
+    :param dataset_name: The name of the dataset config.
+    :param split: The dataset split.
+    :param preprocess: The deterministic preprocessing transform.
+    :param image_size: The image size the model consumes.
+    :param float_dtype: The storage dtype of float fields, None keeps them.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, pathlib.Path],
+        dataset_name: str,
+        split: str,
+        preprocess: Any,
+        image_size: Optional[Union[int, Tuple[int, int]]] = None,
+        float_dtype: Optional[str] = "float16",
+    ):
+        self.key = cache_key(
+            dataset_name=dataset_name,
+            split=split,
+            preprocess=preprocess,
+            image_size=image_size,
+        )
+        self.split_dir = (
+            pathlib.Path(cache_dir)
+            / PREPROCESSED_CACHE_DIR_NAME
+            / dataset_name
+            / split
+        )
+        self.path = self.split_dir / self.key
+        self.float_dtype = float_dtype
+        self._meta = None
+        self._arrays = {}
+
+    def __getstate__(self):
+        # memmaps are reopened in every dataloader worker
+        state = self.__dict__.copy()
+        state["_arrays"] = {}
+        return state
+
+    @property
+    def meta(self) -> Optional[Dict]:
+        if self._meta is None and self.is_built:
+            with open(self.path / "meta.json") as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    @property
+    def is_built(self) -> bool:
+        return (self.path / "meta.json").exists()
+
+    def __len__(self) -> int:
+        return self.meta["num_items"] if self.is_built else 0
+
+    def _field_arrays(self, field: str) -> Tuple[np.ndarray, np.ndarray]:
+        if field not in self._arrays:
+            spec = self.meta["fields"][field]
+            data_path = self.path / f"{field}.bin"
+            data = (
+                np.memmap(data_path, dtype=spec["dtype"], mode="r")
+                if data_path.stat().st_size > 0
+                else np.empty(0, dtype=spec["dtype"])
+            )
+            index = np.load(self.path / f"{field}.index.npy", mmap_mode="r")
+            self._arrays[field] = (data, index)
+        return self._arrays[field]
+
+    def is_valid(self, index: int) -> bool:
+        _, rows = self._field_arrays(_OBJECTS_FIELD)
+        return bool(rows[index, 0])
+
+    def _read(self, field: str, index: int) -> Optional[np.ndarray]:
+        data, rows = self._field_arrays(field)
+        if not rows[index, 0]:
+            return None
+        offset = int(rows[index, 1])
+        shape = tuple(int(dim) for dim in rows[index, 2:])
+        # copied out of the read-only memmap
+        return np.array(data[offset : offset + int(np.prod(shape))]).reshape(
+            shape
+        )
+
+    def __getitem__(self, index: int) -> Any:
+        if not self.is_valid(index):
+            raise RuntimeError(
+                f"Sample {index} failed to preprocess when the cache in "
+                f"{self.path} was built"
+            )
+
+        item = pickle.loads(self._read(_OBJECTS_FIELD, index).tobytes())
+        for field, spec in self.meta["fields"].items():
+            if field == _OBJECTS_FIELD:
+                continue
+            array = self._read(field, index)
+            if array is not None:
+                item[field] = _from_array(
+                    array, kind=spec["kind"], dtype=spec["original_dtype"]
+                )
+
+        return item.pop(_ITEM_KEY) if _ITEM_KEY in item else item
+
+    def build(
+        self,
+        dataset: Dataset,
+        preprocess: Any,
+        num_workers: int = 8,
+        quarantine: Optional[Any] = None,
+    ) -> None:
+        """
+        Run `preprocess` over every item of `dataset` and write the results,
+        replacing any cache of the same split built with another key.
+
+        :param dataset: The raw dataset, e.g. `GATEDataset.dataset`.
+        :param preprocess: The deterministic preprocessing transform.
+        :param num_workers: The number of dataloader worker processes.
+        :param quarantine: An optional QuarantineIndex to record samples
+        that fail to preprocess in.
+        """
+        from tqdm import tqdm
+
+        tmp_path = self.split_dir / f"{self.key}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        dataloader = DataLoader(
+            _PreprocessDataset(dataset, preprocess),
+            batch_size=None,
+            num_workers=num_workers,
+            collate_fn=_identity,
+        )
+
+        # per field: its spec, its open file, the number of elements
+        # written and, per sample, [present, offset, *shape]
+        fields: Dict[str, Dict] = {}
+        files = {}
+        offsets: Dict[str, int] = {}
+        rows: Dict[str, Dict[int, List[int]]] = {}
+        num_items = num_failed = 0
+
+        def write(name: str, position: int, array: np.ndarray, shape):
+            array = np.ascontiguousarray(array, dtype=fields[name]["dtype"])
+            files[name].write(array.tobytes())
+            rows[name][position] = [1, offsets[name], *shape]
+            offsets[name] += array.size
+
+        def add_field(name: str, spec: Dict):
+            fields[name] = spec
+            files[name] = open(tmp_path / f"{name}.bin", "wb")
+            offsets[name] = 0
+            rows[name] = {}
+
+        add_field(
+            _OBJECTS_FIELD, {"kind": "pickle", "dtype": "|u1", "ndim": 1}
+        )
+        try:
+            for position, (index, item, error) in enumerate(
+                tqdm(dataloader, total=len(dataset))
+            ):
+                num_items = position + 1
+                if error is not None:
+                    # no pickled row marks the sample as failed
+                    num_failed += 1
+                    if quarantine is not None:
+                        quarantine.add(index, error)
+                    continue
+
+                if not isinstance(item, dict):
+                    item = {_ITEM_KEY: item}
+
+                objects = {}
+                for key, value in item.items():
+                    converted = _to_array(value)
+                    if converted is None:
+                        objects[key] = value
+                        continue
+                    array, kind = converted
+                    if key not in fields:
+                        add_field(key, self._field_spec(array, kind))
+                    if array.ndim != fields[key]["ndim"]:
+                        raise ValueError(
+                            f"Field {key} of sample {index} has "
+                            f"{array.ndim} dimensions, earlier samples had "
+                            f"{fields[key]['ndim']}"
+                        )
+                    write(key, position, array, array.shape)
+
+                blob = np.frombuffer(pickle.dumps(objects), dtype=np.uint8)
+                write(_OBJECTS_FIELD, position, blob, blob.shape)
+        finally:
+            for f in files.values():
+                f.close()
+
+        for name, spec in fields.items():
+            index = np.zeros((num_items, spec["ndim"] + 2), dtype=np.int64)
+            for position, row in rows[name].items():
+                index[position] = row
+            np.save(tmp_path / f"{name}.index.npy", index)
+
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump(
+                {
+                    "key": self.key,
+                    "num_items": num_items,
+                    "num_failed": num_failed,
+                    "fields": fields,
+                },
+                f,
+            )
+
+        self.prune()
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+        self._meta = None
+        self._arrays = {}
+
+        logger.info(
+            f"Built the preprocessed cache of {num_items} samples "
+            f"({num_failed} failed) in {self.path}"
+        )
+
+    def _field_spec(self, array: np.ndarray, kind: str) -> Dict:
+        dtype = array.dtype
+        if (
+            self.float_dtype is not None
+            and np.issubdtype(dtype, np.floating)
+            and dtype.itemsize > np.dtype(self.float_dtype).itemsize
+        ):
+            dtype = np.dtype(self.float_dtype)
+        return {
+            "kind": kind,
+            "dtype": dtype.str,
+            "original_dtype": array.dtype.str,
+            "ndim": array.ndim,
+        }
+
+    def prune(self) -> None:
+        """
+        Remove the caches of this split that were built with another key,
+        i.e. with a configuration that no longer applies.
+        """
+        if not self.split_dir.exists():
+            return
+        for path in self.split_dir.iterdir():
+            if (
+                path.is_dir()
+                and path.name != self.key
+                and ".tmp-" not in (path.name)
+            ):
+                logger.info(f"Removing stale preprocessed cache {path}")
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def build(
+    dataset_name: str,
+    split: str = "train",
+    dataset_dir: Optional[str] = None,
+    image_size: Optional[int] = None,
+    num_workers: int = 8,
+):
+    """
+    Build the preprocessed cache of a dataset split ahead of training.
+
+    Example:
+        python -m gate.data.preprocessed_cache --dataset_name=ade20k --split=train
+    """
+    from hydra.core.config_store import ConfigStore
+    from hydra_zen import instantiate
+
+    from gate.config.config import collect_config_store
+    from gate.config.variables import DATASET_DIR
+    from gate.data.quarantine import QuarantineIndex
+
+    dataset_dir = dataset_dir if dataset_dir is not None else DATASET_DIR
+
+    collect_config_store()
+    dataset_config = ConfigStore.instance().repo["dataset"][
+        f"{dataset_name}.yaml"
+    ]
+    dataset = instantiate(dataset_config.node, data_dir=dataset_dir)[split]
+    if dataset.preprocess is None:
+        print(f"{dataset_name} has no deterministic preprocessing to cache")
+        return
+
+    cache = PreprocessedCache(
+        cache_dir=dataset_dir,
+        dataset_name=dataset_name,
+        split=split,
+        preprocess=dataset.preprocess,
+        image_size=image_size,
+    )
+    cache.build(
+        dataset.dataset,
+        preprocess=dataset.preprocess,
+        num_workers=num_workers,
+        quarantine=QuarantineIndex.for_split(
+            dataset_dir=dataset_dir, dataset_name=dataset_name, split=split
+        ),
+    )
+    print(f"{len(cache)} samples cached in {cache.path}")
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(build)
@@ -0,0 +1,317 @@
+import json
+import logging
+import os
+import pathlib
+import threading
+import traceback
+from typing import Dict, Iterator, List, Optional, Union
+
+import fire
+from torch.utils.data import BatchSampler, DataLoader, Dataset, Sampler
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_DIR_NAME = "quarantine"
+
+
+class QuarantineIndex:
+    """
+    🚧 A small on-disk record of the samples of one dataset split that fail
+    to load, stored as `{dataset_dir}/quarantine/{dataset_name}/{split}.jsonl`.
+
+    Every failure is appended as one JSON line, which is atomic for lines
+    this short, so dataloader workers can record failures concurrently.
+    Samplers read the index up front to avoid loading those samples again.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self.reload()
+
+    def __getstate__(self):
+        # locks can't be sent to spawned dataloader workers
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_split(
+        cls,
+        dataset_dir: Union[str, pathlib.Path],
+        dataset_name: str,
+        split: str,
+    ) -> "QuarantineIndex":
+        return cls(
+            pathlib.Path(dataset_dir)
+            / QUARANTINE_DIR_NAME
+            / dataset_name
+            / f"{split}.jsonl"
+        )
+
+    def reload(self) -> None:
+        """
+        Re-read the index from disk, picking up failures recorded by other
+        processes.
+        """
+        self.errors: Dict[int, str] = {}
+        if not self.path.exists():
+            return
+
+        with open(self.path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a write interrupted mid-line, the sample will simply
+                    # be recorded again
+                    continue
+                self.errors[int(entry["index"])] = entry.get("error", "")
+
+    @property
+    def indices(self) -> List[int]:
+        return sorted(self.errors.keys())
+
+    def __contains__(self, index: int) -> bool:
+        return int(index) in self.errors
+
+    def __len__(self) -> int:
+        return len(self.errors)
+
+    def add(self, index: int, error: str) -> bool:
+        """
+        Record that `index` failed to load.
+
+        :return: Whether the index was new.
+        """
+        index = int(index)
+        with self._lock:
+            if index in self.errors:
+                return False
+            self.errors[index] = error
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            line = json.dumps({"index": index, "error": error}) + "\n"
+            fd = os.open(
+                self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644
+            )
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+        return True
+
+
+def healthy_replacement(
+    index: int, dataset_size: int, quarantine: QuarantineIndex
+) -> Optional[int]:
+    """
+    The deterministic stand-in for a quarantined sample: the next index,
+    wrapping around, that is not quarantined.
+
+    :return: The replacement index, or None if every sample is quarantined.
+    """
+    for offset in range(1, dataset_size):
+        candidate = (index + offset) % dataset_size
+        if candidate not in quarantine:
+            return candidate
+    return None
+
+
+class QuarantineSampler(Sampler):
+    """
+    Wraps a sampler or batch sampler so that quarantined indices never
+    reach the dataset. The index is re-read at the start of every pass and
+    every `reload_every` items (infinite samplers never finish a pass), so
+    samples that failed in dataloader workers are soon skipped as well.
+
+    With `substitute`, every quarantined index is replaced by its
+    deterministic `healthy_replacement`, keeping the number of samples and
+    the batch size constant, which is what training wants. Without it,
+    quarantined indices are dropped, so evaluation never counts a sample
+    twice, and the length of a sampler of single indices shrinks by the
+    number of quarantined samples. That assumes it yields every index once
+    per pass, as sequential and random samplers do.
+    """
+
+    def __init__(
+        self,
+        sampler: Union[Sampler, Iterator],
+        quarantine: QuarantineIndex,
+        dataset_size: int,
+        substitute: bool = True,
+        reload_every: int = 10000,
+    ):
+        self.sampler = sampler
+        self.quarantine = quarantine
+        self.dataset_size = dataset_size
+        self.substitute = substitute
+        self.reload_every = reload_every
+
+    def __getattr__(self, name):
+        # keep set_start_index, source_counts_at etc. of the wrapped sampler
+        if name == "sampler":
+            raise AttributeError(name)
+        return getattr(self.sampler, name)
+
+    def _map_indices(self, indices: List[int]) -> List[int]:
+        mapped = []
+        for index in indices:
+            if index not in self.quarantine:
+                mapped.append(index)
+            elif self.substitute:
+                replacement = healthy_replacement(
+                    index, self.dataset_size, self.quarantine
+                )
+                if replacement is not None:
+                    mapped.append(replacement)
+        return mapped
+
+    def __iter__(self):
+        # pick up the failures dataloader workers recorded last epoch
+        self.quarantine.reload()
+        for num_items, item in enumerate(self.sampler, start=1):
+            if num_items % self.reload_every == 0:
+                self.quarantine.reload()
+            if isinstance(item, (list, tuple)):
+                batch = self._map_indices(item)
+                if len(batch) > 0:
+                    yield batch
+            else:
+                mapped = self._map_indices([item])
+                if len(mapped) > 0:
+                    yield mapped[0]
+
+    def _is_batch_sampler(self) -> bool:
+        return isinstance(self.sampler, BatchSampler) or hasattr(
+            self.sampler, "batch_size"
+        )
+
+    def __len__(self) -> int:
+        if self.substitute or self._is_batch_sampler():
+            return len(self.sampler)
+
+        self.quarantine.reload()
+        num_quarantined = sum(
+            1 for index in self.quarantine.indices if index < self.dataset_size
+        )
+        return max(len(self.sampler) - num_quarantined, 0)
+
+
+def _probe(dataset: Dataset, index: int) -> Optional[str]:
+    try:
+        load_item = getattr(dataset, "load_item", dataset.__getitem__)
+        item = load_item(index)
+        if item is None:
+            return "sample loaded as None"
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+class _ProbeDataset(Dataset):
+    def __init__(self, dataset: Dataset, indices: List[int]):
+        self.dataset = dataset
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, idx: int):
+        index = self.indices[idx]
+        return index, _probe(self.dataset, index)
+
+
+def scan_dataset(
+    dataset: Dataset,
+    quarantine: QuarantineIndex,
+    num_workers: int = 8,
+    indices: Optional[List[int]] = None,
+) -> List[int]:
+    """
+    Load every sample of `dataset` in parallel and record the ones that
+    fail in `quarantine`.
+
+    :param dataset: The dataset to scan, a GATEDataset is scanned through
+    `load_item` so failures are not swallowed.
+    :param quarantine: The index to record failures in.
+    :param num_workers: The number of dataloader worker processes.
+    :param indices: The indices to scan, defaults to the whole dataset.
+    :return: The indices that failed.
+    """
+    from tqdm import tqdm
+
+    if indices is None:
+        size = (
+            len(dataset.dataset)
+            if getattr(dataset, "infinite_sampling", False)
+            else len(dataset)
+        )
+        indices = list(range(size))
+
+    dataloader = DataLoader(
+        _ProbeDataset(dataset, indices),
+        batch_size=None,
+        num_workers=num_workers,
+    )
+
+    failed = []
+    for index, error in tqdm(dataloader, total=len(indices)):
+        if error is not None:
+            quarantine.add(int(index), error)
+            failed.append(int(index))
+
+    logger.info(
+        f"Scanned {len(indices)} samples, {len(failed)} failed, "
+        f"{len(quarantine)} quarantined in {quarantine.path}"
+    )
+    return failed
+
+
+def scan(
+    dataset_name: str,
+    split: str = "train",
+    dataset_dir: Optional[str] = None,
+    num_workers: int = 8,
+):
+    """
+    Build the quarantine index of a dataset split ahead of training.
+
+    Example:
+        python -m gate.data.quarantine --dataset_name=clevr --split=train
+    """
+    from hydra.core.config_store import ConfigStore
+    from hydra_zen import instantiate
+
+    from gate.config.config import collect_config_store
+    from gate.config.variables import DATASET_DIR
+
+    dataset_dir = dataset_dir if dataset_dir is not None else DATASET_DIR
+
+    collect_config_store()
+    dataset_config = ConfigStore.instance().repo["dataset"][
+        f"{dataset_name}.yaml"
+    ]
+    dataset_dict = instantiate(dataset_config.node, data_dir=dataset_dir)
+
+    quarantine = QuarantineIndex.for_split(
+        dataset_dir=dataset_dir, dataset_name=dataset_name, split=split
+    )
+    failed = scan_dataset(
+        dataset_dict[split], quarantine=quarantine, num_workers=num_workers
+    )
+    print(
+        f"{len(failed)} new failures, {len(quarantine)} quarantined samples "
+        f"in {quarantine.path}"
+    )
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(scan)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import pathlib
+import shutil
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+from torch.utils.data import Dataset, Subset
+
+logger = logging.getLogger(__name__)
+
+SPLIT_CACHE_DIR_NAME = "split_cache"
+
+# Bump when the way indices are drawn changes, so old splits are recomputed
+SPLIT_CACHE_VERSION = 1
+
+
+def split_key(
+    dataset_name: str,
+    num_samples: int,
+    split_sizes: Dict[str, float],
+    seed: int,
+) -> str:
+    """
+    The hash that names a stored split, covering everything the partition
+    depends on.
+    """
+    config = {
+        "version": SPLIT_CACHE_VERSION,
+        "dataset_name": dataset_name,
+        "num_samples": num_samples,
+        "split_sizes": split_sizes,
+        "seed": seed,
+    }
+    encoded = json.dumps(config, sort_keys=True)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def compute_split_indices(
+    num_samples: int, split_sizes: Dict[str, float], seed: int = 42
+) -> Dict[str, np.ndarray]:
+    """
+    Partition `range(num_samples)` with a seeded permutation. Every split
+    but the first takes `ceil(fraction * num_samples)` samples, like
+    `datasets.Dataset.train_test_split` does for its test split, and the
+    first split takes the remainder.
+
+    :param num_samples: The size of the dataset being split.
+    :param split_sizes: The fraction of the dataset per split, in order.
+    :param seed: The seed of the permutation.
+    :return: The sorted indices of each split.
+    """
+    names = list(split_sizes.keys())
+    counts = [math.ceil(split_sizes[name] * num_samples) for name in names]
+    counts[0] = num_samples - sum(counts[1:])
+    if counts[0] < 0:
+        raise ValueError(
+            f"Split sizes {split_sizes} do not fit {num_samples} samples"
+        )
+
+    permutation = np.random.default_rng(seed).permutation(num_samples)
+    boundaries = np.cumsum(counts)[:-1]
+    return {
+        name: np.sort(indices).astype(np.int64)
+        for name, indices in zip(names, np.split(permutation, boundaries))
+    }
+
+
+def load_split_indices(
+    num_samples: int,
+    split_sizes: Dict[str, float],
+    dataset_name: str,
+    cache_dir: Optional[Union[str, pathlib.Path]] = None,
+    seed: int = 42,
+) -> Dict[str, np.ndarray]:
+    """
+    The split indices of a dataset, computed once and stored as one `.npy`
+    file per split under
+    `{cache_dir}/split_cache/{dataset_name}/{key}`. Later calls, from any
+    process or rank, memory-map the stored arrays instead of recomputing
+    them. Without a `cache_dir` the indices are computed in memory, which
+    is still deterministic under `seed`.
+
+    :param num_samples: The size of the dataset being split.
+    :param split_sizes: The fraction of the dataset per split, in order.
+    :param dataset_name: The name of the dataset, used in the cache path.
+    :param cache_dir: The directory the dataset is stored in.
+    :param seed: The seed of the permutation.
+    :return: The indices of each split.
+    """
+    if cache_dir is None:
+        return compute_split_indices(num_samples, split_sizes, seed)
+
+    key = split_key(dataset_name, num_samples, split_sizes, seed)
+    path = pathlib.Path(cache_dir) / SPLIT_CACHE_DIR_NAME / dataset_name / key
+    if not path.exists():
+        indices = compute_split_indices(num_samples, split_sizes, seed)
+        _write(path, indices, split_sizes, num_samples, seed)
+
+    return {
+        name: np.load(path / f"{name}.npy", mmap_mode="r")
+        for name in split_sizes
+    }
+
+
+def _write(
+    path: pathlib.Path,
+    indices: Dict[str, np.ndarray],
+    split_sizes: Dict[str, float],
+    num_samples: int,
+    seed: int,
+) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.parent / f".{path.name}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir()
+    for name, split in indices.items():
+        np.save(tmp_path / f"{name}.npy", split)
+    meta = {
+        "version": SPLIT_CACHE_VERSION,
+        "num_samples": num_samples,
+        "split_sizes": split_sizes,
+        "seed": seed,
+    }
+    with open(tmp_path / "meta.json", "w") as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmp_path, path)
+        logger.info(f"Stored split indices at {path}")
+    except OSError:
+        # another process stored the same split first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _select(dataset: Any, indices: np.ndarray) -> Any:
+    if hasattr(dataset, "select"):
+        return dataset.select(indices)
+    return Subset(dataset, np.asarray(indices).tolist())
+
+
+def split_dataset(
+    dataset: Union[Dataset, Any],
+    split_sizes: Dict[str, float],
+    dataset_name: str,
+    cache_dir: Optional[Union[str, pathlib.Path]] = None,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """
+    Split a dataset into the seeded, stored partitions of
+    `load_split_indices`. Hugging Face datasets are split with `select`,
+    anything else with a `torch.utils.data.Subset`.
+
+    :param dataset: The dataset to split.
+    :param split_sizes: The fraction of the dataset per split, in order,
+    e.g. `{"train": 0.9, "val": 0.1}`.
+    :param dataset_name: The name of the dataset, used in the cache path.
+    :param cache_dir: The directory the dataset is stored in.
+    :param seed: The seed of the permutation.
+    :return: A dictionary with one dataset per split.
+    """
+    indices = load_split_indices(
+        num_samples=len(dataset),
+        split_sizes=split_sizes,
+        dataset_name=dataset_name,
+        cache_dir=cache_dir,
+        seed=seed,
+    )
+    return {name: _select(dataset, split) for name, split in indices.items()}
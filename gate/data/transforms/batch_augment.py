@@ -0,0 +1,494 @@
+import logging
+import math
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from accelerate import PartialState
+from torch.utils.data import get_worker_info
+
+logger = logging.getLogger(__name__)
+
+# ITU-R 601-2 luma weights, as used by PIL and torchvision for grayscale
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+# RandAugment ops, following timm's "increasing" set without Equalize,
+# which has no cheap batched form
+RAND_AUGMENT_OPS = (
+    "identity",
+    "auto_contrast",
+    "rotate",
+    "solarize",
+    "color",
+    "posterize",
+    "contrast",
+    "brightness",
+    "sharpness",
+    "shear_x",
+    "shear_y",
+    "translate_x",
+    "translate_y",
+)
+GEOMETRIC_OPS = ("rotate", "shear_x", "shear_y", "translate_x", "translate_y")
+
+MAX_MAGNITUDE = 10.0
+
+
+def _uniform(
+    low: float, high: float, size: int, generator: torch.Generator
+) -> torch.Tensor:
+    return torch.rand(size, generator=generator) * (high - low) + low
+
+
+def _grayscale(images: torch.Tensor) -> torch.Tensor:
+    # accumulated channel by channel, much cheaper than a weighted sum
+    # over the channel dimension on CPU
+    red, green, blue = LUMA_WEIGHTS
+    gray = images[:, 0:1] * red
+    gray.add_(images[:, 1:2], alpha=green)
+    return gray.add_(images[:, 2:3], alpha=blue)
+
+
+def _blend_(
+    images: torch.Tensor, other: torch.Tensor, factor: torch.Tensor
+) -> torch.Tensor:
+    # in place, factor 1 keeps the image, 0 gives `other`, per sample
+    factor = factor.view(-1, 1, 1, 1)
+    return images.sub_(other).mul_(factor).add_(other).clamp_(0, 1)
+
+
+def _apply_to_(
+    images: torch.Tensor,
+    mask: torch.Tensor,
+    op: Callable[[torch.Tensor, torch.Tensor], torch.Tensor],
+) -> torch.Tensor:
+    # run `op(images, indices)` on the masked samples only
+    indices = mask.nonzero().flatten()
+    if len(indices) == 0:
+        return images
+    images[indices.to(images.device)] = op(images[indices], indices)
+    return images
+
+
+class BatchAugmentation:
+    """
+    🎨 Random resized crop, horizontal flip, colour jitter and
+    RandAugment-style ops applied to a whole (B, C, H, W) batch at once,
+    with random parameters drawn per sample.
+
+    Every geometric transform (crop, flip, rotate, shear, translate) of a
+    sample is folded into one affine matrix, so the whole batch is warped
+    by a single `grid_sample` call. Photometric ops are applied to every
+    sample at once and blended in only for the samples that drew them.
+
+    Images may be uint8 in [0, 255], floats in [0, 1], or floats
+    normalised with `mean` and `std`, and are returned in the same form.
+    All random parameters come from a generator seeded with `seed`, so the
+    same seed reproduces the same augmentations.
+
+    :param output_size: The (height, width) or side of the output, defaults to the
+    input size.
+    :param scale: The range of the crop area, as a fraction of the image.
+    :param ratio: The range of the crop aspect ratio.
+    :param flip_prob: The probability of a horizontal flip.
+    :param brightness: The colour jitter brightness strength.
+    :param contrast: The colour jitter contrast strength.
+    :param saturation: The colour jitter saturation strength.
+    :param num_ops: The number of RandAugment ops per sample, 0 disables
+    them.
+    :param magnitude: The RandAugment magnitude, out of 10.
+    :param magnitude_std: The per-sample standard deviation of the
+    magnitude.
+    :param mean: The per-channel mean the images were normalised with.
+    :param std: The per-channel std the images were normalised with.
+    :param seed: The seed of the parameter generator.
+    """
+
+    def __init__(
+        self,
+        output_size: Optional[Union[int, Tuple[int, int]]] = None,
+        scale: Tuple[float, float] = (0.08, 1.0),
+        ratio: Tuple[float, float] = (3 / 4, 4 / 3),
+        flip_prob: float = 0.5,
+        brightness: float = 0.4,
+        contrast: float = 0.4,
+        saturation: float = 0.4,
+        num_ops: int = 2,
+        magnitude: float = 9.0,
+        magnitude_std: float = 0.5,
+        mean: Optional[Sequence[float]] = None,
+        std: Optional[Sequence[float]] = None,
+        seed: Optional[int] = None,
+    ):
+        if isinstance(output_size, int):
+            output_size = (output_size, output_size)
+        self.output_size = output_size
+        self.scale = scale
+        self.ratio = ratio
+        self.flip_prob = flip_prob
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.num_ops = num_ops
+        self.magnitude = magnitude
+        self.magnitude_std = magnitude_std
+        self.mean = mean
+        self.std = std
+        self.generator = torch.Generator()
+        # without a seed, draw one from torch's global RNG so that runs
+        # seeded with set_seed stay reproducible
+        self.seed = (
+            seed
+            if seed is not None
+            else int(torch.randint(0, 2**31 - 1, (1,)).item())
+        )
+        self.generator.manual_seed(self.seed)
+
+    def reseed(self, seed: int):
+        self.seed = seed
+        self.generator.manual_seed(seed)
+
+    # ------------------------------------------------------------------
+    # Conversion to and from [0, 1] floats
+
+    def _to_unit_range(self, images: torch.Tensor) -> torch.Tensor:
+        if images.dtype == torch.uint8:
+            return images.float().div_(255)
+        images = images.float()
+        if self.mean is not None and self.std is not None:
+            mean = images.new_tensor(self.mean).view(1, -1, 1, 1)
+            std = images.new_tensor(self.std).view(1, -1, 1, 1)
+            images = images * std + mean
+        return images.clamp(0, 1)
+
+    def _from_unit_range(
+        self, images: torch.Tensor, dtype: torch.dtype
+    ) -> torch.Tensor:
+        if dtype == torch.uint8:
+            return images.mul(255).round_().to(torch.uint8)
+        if self.mean is not None and self.std is not None:
+            mean = images.new_tensor(self.mean).view(1, -1, 1, 1)
+            std = images.new_tensor(self.std).view(1, -1, 1, 1)
+            images = (images - mean) / std
+        return images.to(dtype)
+
+    # ------------------------------------------------------------------
+    # Parameter sampling
+
+    def _sample_magnitudes(self, batch_size: int) -> torch.Tensor:
+        magnitudes = self.magnitude + self.magnitude_std * torch.randn(
+            batch_size, generator=self.generator
+        )
+        return magnitudes.clamp(0, MAX_MAGNITUDE) / MAX_MAGNITUDE
+
+    def _sample_signs(self, batch_size: int) -> torch.Tensor:
+        return (
+            torch.randint(0, 2, (batch_size,), generator=self.generator) * 2
+            - 1
+        ).float()
+
+    def sample_ops(self, batch_size: int) -> Dict[str, torch.Tensor]:
+        """
+        :return: For every RandAugment op, a boolean mask of the samples
+        that apply it.
+        """
+        if self.num_ops <= 0:
+            return {}
+        choices = torch.randint(
+            0,
+            len(RAND_AUGMENT_OPS),
+            (batch_size, self.num_ops),
+            generator=self.generator,
+        )
+        return {
+            op: (choices == op_idx).any(dim=1)
+            for op_idx, op in enumerate(RAND_AUGMENT_OPS)
+        }
+
+    def sample_affine(
+        self,
+        batch_size: int,
+        height: int,
+        width: int,
+        op_masks: Dict[str, torch.Tensor],
+    ) -> torch.Tensor:
+        """
+        Build the (B, 2, 3) matrices mapping output to input coordinates,
+        in the normalised [-1, 1] space of `F.affine_grid`.
+        """
+        generator = self.generator
+
+        # random resized crop, box size as a fraction of the image
+        area = _uniform(*self.scale, batch_size, generator)
+        log_ratio = _uniform(
+            math.log(self.ratio[0]),
+            math.log(self.ratio[1]),
+            batch_size,
+            generator,
+        )
+        aspect = torch.exp(log_ratio) * height / width
+        crop_w = torch.sqrt(area * aspect).clamp(max=1.0)
+        crop_h = torch.sqrt(area / aspect).clamp(max=1.0)
+        center_x = (torch.rand(batch_size, generator=generator) * 2 - 1) * (
+            1 - crop_w
+        )
+        center_y = (torch.rand(batch_size, generator=generator) * 2 - 1) * (
+            1 - crop_h
+        )
+
+        flip = torch.where(
+            torch.rand(batch_size, generator=generator) < self.flip_prob,
+            -1.0,
+            1.0,
+        )
+
+        # RandAugment geometric ops
+        zeros = torch.zeros(batch_size)
+        magnitudes = {
+            op: self._sample_magnitudes(batch_size)
+            * self._sample_signs(batch_size)
+            * op_masks.get(op, zeros.bool()).float()
+            for op in GEOMETRIC_OPS
+        }
+        angle = magnitudes["rotate"] * math.radians(30)
+        shear_x = magnitudes["shear_x"] * 0.3
+        shear_y = magnitudes["shear_y"] * 0.3
+        # translations are up to 45% of the image, i.e. 0.9 in [-1, 1]
+        translate_x = magnitudes["translate_x"] * 0.9
+        translate_y = magnitudes["translate_y"] * 0.9
+
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        rotation = torch.stack(
+            [torch.stack([cos, -sin], -1), torch.stack([sin, cos], -1)], -2
+        )
+        shear = torch.stack(
+            [
+                torch.stack([torch.ones(batch_size), shear_x], -1),
+                torch.stack([shear_y, torch.ones(batch_size)], -1),
+            ],
+            -2,
+        )
+        crop = torch.diag_embed(torch.stack([crop_w * flip, crop_h], -1))
+
+        linear = crop @ rotation @ shear
+        translation = torch.stack(
+            [center_x + translate_x, center_y + translate_y], -1
+        )
+        return torch.cat([linear, translation.unsqueeze(-1)], dim=-1)
+
+    # ------------------------------------------------------------------
+    # Photometric ops
+
+    def _colour_jitter(self, images: torch.Tensor) -> torch.Tensor:
+        batch_size = images.shape[0]
+        device = images.device
+
+        if self.brightness > 0:
+            factor = _uniform(
+                1 - self.brightness,
+                1 + self.brightness,
+                batch_size,
+                self.generator,
+            ).to(device)
+            images.mul_(factor.view(-1, 1, 1, 1)).clamp_(0, 1)
+        if self.contrast > 0:
+            factor = _uniform(
+                1 - self.contrast,
+                1 + self.contrast,
+                batch_size,
+                self.generator,
+            ).to(device)
+            mean = _grayscale(images).mean(dim=(1, 2, 3), keepdim=True)
+            _blend_(images, mean, factor)
+        if self.saturation > 0:
+            factor = _uniform(
+                1 - self.saturation,
+                1 + self.saturation,
+                batch_size,
+                self.generator,
+            ).to(device)
+            _blend_(images, _grayscale(images), factor)
+        return images
+
+    def _rand_augment_photometric(
+        self, images: torch.Tensor, op_masks: Dict[str, torch.Tensor]
+    ) -> torch.Tensor:
+        # parameters are drawn for the whole batch so that the random
+        # stream does not depend on which samples picked which op
+        batch_size = images.shape[0]
+        device = images.device
+
+        def enhance_factor() -> torch.Tensor:
+            # timm's increasing enhance ops: factor in [0.1, 1.9]
+            return (
+                1.0
+                + self._sample_magnitudes(batch_size)
+                * 0.9
+                * self._sample_signs(batch_size)
+            ).to(device)
+
+        def auto_contrast(x, indices):
+            low = x.amin(dim=(2, 3), keepdim=True)
+            high = x.amax(dim=(2, 3), keepdim=True)
+            scale = torch.where(
+                high > low, 1.0 / (high - low), torch.ones_like(high)
+            )
+            low = torch.where(high > low, low, torch.zeros_like(low))
+            return x.sub_(low).mul_(scale)
+
+        images = _apply_to_(images, op_masks["auto_contrast"], auto_contrast)
+
+        threshold = 1.0 - self._sample_magnitudes(batch_size).to(device)
+        images = _apply_to_(
+            images,
+            op_masks["solarize"],
+            lambda x, indices: torch.where(
+                x >= threshold[indices].view(-1, 1, 1, 1), 1.0 - x, x
+            ),
+        )
+
+        bits = 8 - (self._sample_magnitudes(batch_size) * 4).round()
+        step = (256 / 2**bits).to(device)
+        images = _apply_to_(
+            images,
+            op_masks["posterize"],
+            lambda x, indices: torch.floor(
+                x * 255 / step[indices].view(-1, 1, 1, 1)
+            )
+            * step[indices].view(-1, 1, 1, 1)
+            / 255,
+        )
+
+        factor = enhance_factor()
+        images = _apply_to_(
+            images,
+            op_masks["color"],
+            lambda x, indices: _blend_(x, _grayscale(x), factor[indices]),
+        )
+
+        factor = enhance_factor()
+        images = _apply_to_(
+            images,
+            op_masks["contrast"],
+            lambda x, indices: _blend_(
+                x,
+                _grayscale(x).mean(dim=(1, 2, 3), keepdim=True),
+                factor[indices],
+            ),
+        )
+
+        factor = enhance_factor()
+        images = _apply_to_(
+            images,
+            op_masks["brightness"],
+            lambda x, indices: x.mul_(
+                factor[indices].view(-1, 1, 1, 1)
+            ).clamp_(0, 1),
+        )
+
+        def sharpness(x, indices):
+            kernel = x.new_tensor([[1, 1, 1], [1, 5, 1], [1, 1, 1]]).div_(13)
+            kernel = kernel.expand(x.shape[1], 1, 3, 3)
+            smoothed = F.conv2d(
+                F.pad(x, (1, 1, 1, 1), mode="replicate"),
+                kernel,
+                groups=x.shape[1],
+            )
+            return _blend_(x, smoothed, sharpness_factor[indices])
+
+        sharpness_factor = enhance_factor()
+        images = _apply_to_(images, op_masks["sharpness"], sharpness)
+
+        return images
+
+    # ------------------------------------------------------------------
+
+    def __call__(self, images: torch.Tensor) -> torch.Tensor:
+        """
+        :param images: A (B, C, H, W) batch.
+        :return: The augmented batch, with the same dtype and value range.
+        """
+        batch_size, _, height, width = images.shape
+        dtype = images.dtype
+        output_size = self.output_size or (height, width)
+
+        images = self._to_unit_range(images)
+        op_masks = self.sample_ops(batch_size)
+
+        theta = self.sample_affine(batch_size, height, width, op_masks)
+        grid = F.affine_grid(
+            theta.to(images.device, images.dtype),
+            size=(batch_size, images.shape[1], *output_size),
+            align_corners=False,
+        )
+        images = F.grid_sample(
+            images,
+            grid,
+            mode="bilinear",
+            padding_mode="zeros",
+            align_corners=False,
+        )
+
+        if images.shape[1] == 3:
+            images = self._colour_jitter(images)
+            if op_masks:
+                images = self._rand_augment_photometric(images, op_masks)
+
+        return self._from_unit_range(images.clamp_(0, 1), dtype)
+
+
+class BatchAugmentCollate:
+    """
+    Wraps a collate function so that the collated images are augmented
+    with a BatchAugmentation inside the dataloader workers.
+
+    Every batch reseeds the augmentation from the base seed, the process
+    rank, the seed torch gave the worker and the number of batches the
+    worker has collated. Workers get a new seed every epoch, drawn from the
+    seeded global RNG, so each rank, worker and epoch draws different
+    parameters while runs stay reproducible.
+
+    :param collate_fn: The collate function to wrap.
+    :param augmentation: The batch augmentation to apply.
+    :param image_key: The key of the images in the collated batch.
+    :param process_index: The rank of this process, defaults to the one
+    accelerate reports.
+    """
+
+    def __init__(
+        self,
+        collate_fn: Callable[[List[Any]], Any],
+        augmentation: BatchAugmentation,
+        image_key: str = "image",
+        process_index: Optional[int] = None,
+    ):
+        self.collate_fn = collate_fn
+        self.augmentation = augmentation
+        self.image_key = image_key
+        self.base_seed = augmentation.seed
+        self.process_index = (
+            PartialState().process_index
+            if process_index is None
+            else process_index
+        )
+        self.num_batches = 0
+
+    def __call__(self, data: List[Any]) -> Any:
+        batch = self.collate_fn(data)
+        if batch is None:
+            return batch
+
+        # in the main process the collate persists across epochs, and so
+        # does the batch count
+        worker_seed = torch.initial_seed() if get_worker_info() else 0
+        seed_sequence = np.random.SeedSequence(
+            [self.base_seed, self.process_index, worker_seed, self.num_batches]
+        )
+        self.augmentation.reseed(int(seed_sequence.generate_state(1)[0]))
+        self.num_batches += 1
+
+        images = batch.get(self.image_key)
+        if isinstance(images, torch.Tensor) and images.dim() == 4:
+            batch[self.image_key] = self.augmentation(images)
+        return batch
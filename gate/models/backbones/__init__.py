@@ -1,10 +1,9 @@
-import gc
 import math
 from abc import ABC, abstractmethod
 from collections import defaultdict
 from copy import deepcopy
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Union
+from typing import List, Optional, Sequence, Tuple, Union
 
 import PIL
 import torch
@@ -13,10 +12,16 @@ import torchvision.transforms as T
 from torch import Tensor
 from transformers.models.clip.modeling_clip import CLIPOutput
 
+from gate.boilerplate.micro_batching import MicroBatchExecutor
+from gate.models.backbones.tokenization import CachedTokenizer
 from gate.models.core import simple_init
 
 single_to_three_channel = T.Lambda(lambda x: x.repeat(3, 1, 1))
 
+# Which layers an encoder returns in "per_layer_raw_features": "all",
+# "final", the last k layers as an int, or explicit (negative) indices
+OutputLayers = Union[str, int, Sequence[int]]
+
 
 def reinit(input_module: nn.Module):
     for name, module in input_module.named_modules():
@@ -179,59 +184,15 @@ class VisionTextGATEAdapter(ABC):
         if image is None:
             raise ValueError("Image cannot be None.")
 
-        output = None
-        batch_size = image.shape[0]
-        # print(f"batch_size: {batch_size}")
-        try:
-            return self.vision_model(image=image)
-
-        except torch.cuda.OutOfMemoryError as e:
-            # clear cache and try again
-            self.zero_grad()
-            self.vision_model.zero_grad()
-            torch.cuda.empty_cache()
-            while batch_size >= 1:
-                print(f"batch_size: {batch_size}")
-                batches = torch.split(image, batch_size)
-                print("Before forward pass:")
-                outputs = []
-                try:
-                    print("Before Before forward pass:")
-                    for batch in batches:
-                        print(f"batch shape: {batch.shape}")
-                        output = self.vision_model(image=batch)
-                        outputs.append(output.cpu())
-                        # Print memory usage after forward pass
-                        output = output.detach().cpu()
-                        del output
-                        batch = batch.cpu()
-                        torch.cuda.empty_cache()
-                        gc.collect()
-
-                    if isinstance(outputs[0], dict):
-                        output_dict = {}
-                        for k, v in outputs[0].items():
-                            output_dict[k] = torch.cat(
-                                [output[k] for output in outputs], dim=0
-                            )
-                        return output_dict
-                    elif isinstance(outputs[0], torch.Tensor):
-                        return torch.cat(outputs, dim=0)
-
-                except torch.cuda.OutOfMemoryError as inner_e:
-                    # clear cache and try again
-                    self.zero_grad()
-                    self.vision_model.zero_grad()
-                    torch.cuda.empty_cache()
-                    gc.collect()
-                    batch_size = batch_size // 2
-                    continue
-                except Exception as inner_e:
-                    raise inner_e
-
-            raise RuntimeError(f"Even with batch size 1, still failed.")
-        except Exception as e:
-            raise e
+        if getattr(self, "micro_batcher", None) is None:
+            self.micro_batcher = MicroBatchExecutor()
+
+        # split into chunks that fit, learned once per image shape
+        return self.micro_batcher.run(
+            lambda batch: self.vision_model(image=batch),
+            image,
+            name=self.vision_model.__class__.__name__,
+        )
 
     def forward(
         self,
@@ -348,7 +309,7 @@ def forward_dict(
     output = self.legacy_forward(
         x, return_dict=False, output_hidden_states=True
     )
-    (last_hidden_state, pooled_output, encoder_outputs) = output
+    last_hidden_state, pooled_output, encoder_outputs = output
     encoder_outputs = [f for f in encoder_outputs]
 
     return {
@@ -359,15 +320,18 @@ def forward_dict(
 
 
 class TextProcessor:
-    def __init__(self, preprocessor):
+    def __init__(self, preprocessor, cache_size: int = 65536):
         self.preprocessor = preprocessor
+        # processors such as CLIPProcessor hold their tokenizer
+        self.tokenizer = CachedTokenizer(
+            getattr(preprocessor, "tokenizer", preprocessor),
+            max_size=cache_size,
+        )
 
     def text_transforms(self, x: Union[List[str], List[List[str]]]):
         if isinstance(x[0], list):
             x = [item for sublist in x for item in sublist]
-        return self.preprocessor(
-            text=x, return_tensors="pt", padding=True, truncation=True
-        ).input_ids.squeeze(0)
+        return self.tokenizer(x).squeeze(0)
 
     def apply_transform(self, text: Union[List[str], List[List[str]]]):
         if not all(
@@ -424,6 +388,20 @@ class GATEncoder(ABC, nn.Module):
     def get_transforms(self):
         pass
 
+    def set_output_layers(self, output_layers: OutputLayers) -> None:
+        """
+        Request only some layers in "per_layer_raw_features", from every
+        backbone of the encoder that supports it, so the outputs of the
+        other layers are never kept. "features" and "raw_features" come
+        from the deepest requested layer.
+
+        :param output_layers: "all", "final", the number of last layers,
+        or a sequence of layer indices.
+        """
+        for module in self.modules():
+            if module is not self and hasattr(module, "set_output_layers"):
+                module.set_output_layers(output_layers)
+
 
 class GATEImageEncoder(ABC, nn.Module):
     @property
@@ -459,8 +437,27 @@ class GATEImageEncoder(ABC, nn.Module):
     def transforms(self, x):
         pass
 
+    @property
+    def image_normalization(
+        self,
+    ) -> Optional[Tuple[Sequence[float], Sequence[float]]]:
+        """
+        :return: The (mean, std) `transforms` normalises images with, or
+        None if unknown.
+        """
+        vision_model = getattr(self, "vision_model", None)
+        mean = getattr(vision_model, "image_mean", None)
+        std = getattr(vision_model, "image_std", None)
+        if mean is None or std is None:
+            return None
+        return mean, std
+
 
 class GATETextEncoder(ABC, nn.Module):
+    # Whether repeating the last token of the inputs leaves the outputs at
+    # the real positions unchanged, which sequence bucketing relies on
+    pads_sequences_safely: bool = False
+
     @property
     @abstractmethod
     def projection_layer(self):
@@ -515,6 +512,12 @@ class GATEImageTextEncoder(GATEncoder):
         if torch.cuda.device_count() > 1:
 
             transform_copy = deepcopy(self.image_embedding.transforms)
+            batch_transforms = getattr(
+                self.image_embedding, "batch_transforms", None
+            )
+            image_normalization = getattr(
+                self.image_embedding, "image_normalization", None
+            )
             num_features = self.image_embedding.num_features
             num_raw_features = self.image_embedding.num_raw_features
             self.image_embedding = self.image_embedding.to(
@@ -532,6 +535,21 @@ class GATEImageTextEncoder(GATEncoder):
             setattr(self.image_embedding, "num_features", num_features)
             setattr(self.image_embedding, "num_raw_features", num_raw_features)
             setattr(self.image_embedding, "projection_layer", projection_layer)
+            if batch_transforms is not None:
+                setattr(
+                    self.image_embedding, "batch_transforms", batch_transforms
+                )
+            setattr(
+                self.image_embedding,
+                "image_normalization",
+                image_normalization,
+            )
+
+    @property
+    def image_normalization(
+        self,
+    ) -> Optional[Tuple[Sequence[float], Sequence[float]]]:
+        return getattr(self.image_embedding, "image_normalization", None)
 
     @property
     def image_shape(self):
@@ -646,7 +664,14 @@ class GATEImageTextEncoder(GATEncoder):
         def text_transforms(x):
             return self.text_embedding.transforms(x)
 
+        batch_transforms = getattr(
+            self.image_embedding, "batch_transforms", None
+        )
+
         def image_transforms_process_multi_type(x):
+            if batch_transforms is not None and isinstance(x, torch.Tensor):
+                # (C, H, W), (B, C, H, W) or (B, S, C, H, W) in one call
+                return batch_transforms(x)
             if isinstance(x, List):
                 return [
                     apply_preprocessing_transforms(
@@ -667,6 +692,8 @@ class GATEImageTextEncoder(GATEncoder):
             )
 
         def video_transforms_process_multi_type(x):
+            if batch_transforms is not None and isinstance(x, torch.Tensor):
+                return batch_transforms(x)
             return torch.stack(
                 [image_transforms_process_multi_type(item) for item in x],
                 dim=0,
@@ -1,5 +1,5 @@
 import logging
-from typing import Dict, List, Optional, Union
+from typing import Dict, Optional
 
 import torch
 import torch.nn as nn
@@ -22,26 +22,6 @@ from gate.models.task_adapters.utils.modality_transfer import (
 logger = logging.getLogger(__name__)
 
 
-class TextProcessor:
-    def __init__(self, preprocessor):
-        self.preprocessor = preprocessor
-
-    def text_transforms(self, x: Union[List[str], List[List[str]]]):
-        if isinstance(x[0], list):
-            x = [item for sublist in x for item in sublist]
-        return self.preprocessor(
-            text=x, return_tensors="pt", padding=True, truncation=True
-        ).input_ids.squeeze(0)
-
-    def apply_transform(self, text: Union[List[str], List[List[str]]]):
-        if not all(
-            isinstance(i, list) for i in text
-        ):  # if text is list of strings
-            text = [text]
-        transformed_text = self.text_transforms(text)
-        return transformed_text
-
-
 class ModifiedMPNetModel(MPNetPreTrainedModel):
     def __init__(self, config, add_pooling_layer=True):
         super().__init__(config)
@@ -0,0 +1,82 @@
+from typing import Optional, Sequence, Tuple, Union
+
+import torch
+import torch.nn.functional as F
+
+
+def _pair(size: Union[int, Sequence[int]]) -> Tuple[int, int]:
+    if isinstance(size, int):
+        return (size, size)
+    return tuple(size)
+
+
+class TensorImageTransforms:
+    """
+    🖼 Resize, centre-crop and normalize whole batches of image tensors in
+    a single call, instead of converting every image or video frame to
+    PIL and back.
+
+    Accepts (C, H, W) images, (B, C, H, W) batches and (B, S, C, H, W)
+    videos, as floats in [0, 1] or as uint8, and returns float tensors of
+    the same leading dims. Resizing uses antialiased interpolation, which
+    is what torchvision's Resize does on tensors and close to PIL's.
+    """
+
+    def __init__(
+        self,
+        image_size: Union[int, Sequence[int]],
+        mean: Sequence[float],
+        std: Sequence[float],
+        crop_size: Optional[Union[int, Sequence[int]]] = None,
+        interpolation: str = "bicubic",
+    ):
+        """
+        :param image_size: The (height, width) to resize to.
+        :param mean: The per channel mean to normalize with.
+        :param std: The per channel standard deviation to normalize with.
+        :param crop_size: The (height, width) to centre-crop to after
+        resizing, no crop if None.
+        :param interpolation: The interpolation mode of the resize.
+        """
+        self.image_size = _pair(image_size)
+        self.crop_size = _pair(crop_size) if crop_size is not None else None
+        self.mean = torch.tensor(mean, dtype=torch.float32).view(-1, 1, 1)
+        self.std = torch.tensor(std, dtype=torch.float32).view(-1, 1, 1)
+        self.interpolation = interpolation
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        leading_shape = x.shape[:-3]
+        x = x.reshape(-1, *x.shape[-3:])
+
+        is_uint8 = not x.is_floating_point()
+        if is_uint8:
+            x = x.float() / 255.0
+        if x.shape[1] == 1:
+            x = x.expand(-1, 3, -1, -1)
+
+        if tuple(x.shape[-2:]) != self.image_size:
+            x = F.interpolate(
+                x,
+                size=self.image_size,
+                mode=self.interpolation,
+                align_corners=(
+                    False if self.interpolation != "nearest" else None
+                ),
+                antialias=self.interpolation in ("bilinear", "bicubic"),
+            )
+            if is_uint8:
+                # bicubic overshoots, PIL and torchvision clamp uint8 images
+                x = x.clamp(0.0, 1.0)
+
+        if self.crop_size is not None:
+            height, width = x.shape[-2:]
+            crop_height, crop_width = self.crop_size
+            top = int(round((height - crop_height) / 2.0))
+            left = int(round((width - crop_width) / 2.0))
+            x = x[..., top : top + crop_height, left : left + crop_width]
+
+        mean = self.mean.to(device=x.device, dtype=x.dtype)
+        std = self.std.to(device=x.device, dtype=x.dtype)
+        x = (x - mean) / std
+
+        return x.reshape(*leading_shape, *x.shape[-3:])
@@ -1,8 +1,7 @@
+import itertools
 import logging
-from typing import List, Optional
-from urllib.request import urlopen
+from typing import Any, Dict, List, Optional, Tuple
 
-import PIL
 import PIL.Image as Image
 import timm
 import torch
@@ -10,6 +9,7 @@ import torch.nn as nn
 import torchvision.transforms as T
 from timm.data import resolve_data_config
 from timm.data.transforms_factory import create_transform
+from torch.func import functional_call
 from transformers import CLIPModel, CLIPProcessor
 
 from gate.boilerplate.decorators import configurable
@@ -18,19 +18,31 @@ from gate.models.backbones import (
     GATEImageTextEncoder,
     GATETextEncoder,
     Modality,
+    OutputLayers,
     TextProcessor,
     image_dim_reshape,
 )
+from gate.models.backbones.preprocessing import TensorImageTransforms
 
 logger = logging.getLogger(__name__)
 
 single_to_three_channel = T.Lambda(lambda x: x.repeat(3, 1, 1))
 
+# (model_identifier, image_size, features_only) -> the output shapes of
+# TimmModel.forward, with every layer in "per_layer_raw_features"
+_output_shape_cache: Dict[Tuple[str, int, bool], Dict[str, Any]] = {}
+
 
 def apply_preprocessing_transforms(transforms, x, modality=Modality.image):
     input_shape = None
     is_5d_tensor = False
 
+    if isinstance(x, torch.Tensor) and isinstance(
+        transforms, TensorImageTransforms
+    ):
+        # whole (B, C, H, W) or (B, S, C, H, W) batches, no PIL round trip
+        return transforms(x)
+
     if isinstance(x, Image.Image) and modality == Modality.image:
         x = x.convert("RGB")
 
@@ -73,26 +85,65 @@ def apply_preprocessing_transforms(transforms, x, modality=Modality.image):
     return x
 
 
+def resolve_layer_indices(
+    num_layers: int, output_layers: OutputLayers
+) -> List[int]:
+    """
+    :param num_layers: The number of layers of the model.
+    :param output_layers: "all", "final", the number of last layers, or a
+    sequence of layer indices, which may be negative.
+    :return: The sorted, non-negative indices of the requested layers.
+    """
+    if output_layers == "all":
+        return list(range(num_layers))
+    if output_layers == "final":
+        return [num_layers - 1]
+    if isinstance(output_layers, int):
+        if not 0 < output_layers <= num_layers:
+            raise ValueError(
+                f"Can't take the last {output_layers} of {num_layers} layers"
+            )
+        return list(range(num_layers - output_layers, num_layers))
+    if isinstance(output_layers, str):
+        raise ValueError(f"Unknown output layers {output_layers}")
+
+    indices = set()
+    for index in output_layers:
+        if not -num_layers <= index < num_layers:
+            raise ValueError(
+                f"Layer {index} is out of range for {num_layers} layers"
+            )
+        indices.add(index % num_layers)
+    if not indices:
+        raise ValueError("At least one output layer must be requested")
+    return sorted(indices)
+
+
 class TimmModel(nn.Module):
     def __init__(
         self,
         model_identifier: str = "hf_hub:timm/vit_large_patch14_clip_224.openai_ft_in12k_in1k",
         image_size: Optional[int] = None,
         pretrained: bool = True,
+        features_only: bool = True,
     ):
         super().__init__()
 
-        try:
-            self.model = timm.create_model(
-                model_name=model_identifier,
-                pretrained=pretrained,
-                features_only=True,
-            )
+        self.model = None
+        if features_only:
+            try:
+                self.model = timm.create_model(
+                    model_name=model_identifier,
+                    pretrained=pretrained,
+                    features_only=True,
+                )
 
-        except RuntimeError as e:
-            logger.info(
-                f"Could not load model {model_identifier} because {e}, trying to load as vision transformer"
-            )
+            except RuntimeError as e:
+                logger.info(
+                    f"Could not load model {model_identifier} because {e}, trying to load as vision transformer"
+                )
+
+        if self.model is None:
             logger.info(
                 f"model_identifier: {model_identifier}, pretrained: {pretrained}, img_size: {image_size}"
             )
@@ -105,17 +156,19 @@ class TimmModel(nn.Module):
         if image_size is None:
             image_size = self.model.default_cfg["input_size"][-1]
         logger.info(f"image_size: {image_size}")
+        self.model_identifier = model_identifier
+        self.image_size = image_size
+        self.features_only = features_only
         # get model specific transforms (normalization, resize)
-        self.transforms = create_transform(
-            **resolve_data_config(
-                self.model.pretrained_cfg,
-                model=self.model,
-                verbose=True,
-                use_test_size=True,
-            ),
-            is_training=False,
+        data_config = resolve_data_config(
+            self.model.pretrained_cfg,
+            model=self.model,
+            verbose=True,
+            use_test_size=True,
         )
+        self.transforms = create_transform(**data_config, is_training=False)
 
+        # iterate over compose transforms and remove centercrop and resize
         self.transforms = T.Compose(
             [
                 T.Resize(
@@ -130,19 +183,89 @@ class TimmModel(nn.Module):
                 and "Resize" not in transform.__class__.__name__
             ]
         )
-        # iterate over compose transforms and remove centercrop and resize
+        self.image_mean = tuple(data_config["mean"])
+        self.image_std = tuple(data_config["std"])
+        # the same resize and normalization, applied to tensor batches
+        self.tensor_transforms = TensorImageTransforms(
+            image_size=image_size,
+            mean=data_config["mean"],
+            std=data_config["std"],
+            interpolation="bicubic",
+        )
+
+        # the layers `forward` returns unless it is told otherwise
+        self.output_layers: OutputLayers = "all"
 
         output_shape = self.get_output_shape()["raw_features"]
         self.num_output_features = output_shape[2]
         self.num_patches = output_shape[1]
 
-    def forward(self, x):
-        # output is a (1, num_features) shaped tensor
+    def set_output_layers(self, output_layers: OutputLayers) -> None:
+        resolve_layer_indices(self.num_layers, output_layers)
+        self.output_layers = output_layers
 
-        if hasattr(self.model, "get_intermediate_layers"):
+    @property
+    def block_model(self) -> Optional[nn.Module]:
+        """
+        The timm model whose blocks are the selectable layers. Recent timm
+        loads ViTs with features_only as a FeatureGetterNet, which wraps the
+        full model and computes a fixed set of blocks; the wrapped model is
+        used instead so that only the requested blocks run.
+        """
+        if hasattr(self.model, "blocks"):
+            return self.model
+        wrapped_model = getattr(self.model, "model", None)
+        if hasattr(wrapped_model, "blocks") and hasattr(
+            wrapped_model, "forward_intermediates"
+        ):
+            return wrapped_model
+        return None
+
+    @property
+    def num_layers(self) -> int:
+        if self.block_model is not None:
+            return len(self.block_model.blocks)
+        return 1
+
+    def forward(self, x, output_layers: Optional[OutputLayers] = None):
+        """
+        :param x: A batch of images.
+        :param output_layers: The layers to return in
+        "per_layer_raw_features", defaults to `self.output_layers`. Blocks
+        after the deepest requested one are skipped, and the normalized
+        outputs of the others are never computed.
+        """
+        # output is a (1, num_features) shaped tensor
+        if output_layers is None:
+            output_layers = self.output_layers
+
+        block_model = self.block_model
+        if block_model is not None and block_model is not self.model:
+            # keep the norm and output format of the FeatureGetterNet, so
+            # the final layer is exactly what it returns
+            per_layer_raw_features = block_model.forward_intermediates(
+                x,
+                indices=resolve_layer_indices(self.num_layers, output_layers),
+                norm=self.model.norm,
+                stop_early=True,
+                output_fmt=self.model.output_fmt,
+                intermediates_only=True,
+            )
+        elif block_model is not None and hasattr(
+            block_model, "forward_intermediates"
+        ):
+            per_layer_raw_features = block_model.forward_intermediates(
+                x,
+                indices=resolve_layer_indices(self.num_layers, output_layers),
+                norm=True,
+                stop_early=True,
+                output_fmt="NLC",
+                intermediates_only=True,
+            )
+        elif hasattr(self.model, "get_intermediate_layers"):
             per_layer_raw_features = self.model.get_intermediate_layers(
                 x,
-                n=[i for i in range(len(self.model.blocks))],
+                n=resolve_layer_indices(self.num_layers, output_layers),
                 reshape=False,
                 norm=True,
             )
@@ -184,13 +307,53 @@ class TimmModel(nn.Module):
     def get_transforms(self):
         return {"image": lambda x: self.transforms(x)}
 
-    def get_output_shape(self):
-        img = Image.open(
-            urlopen(
-                "https://huggingface.co/datasets/huggingface/documentation-images/resolve/main/beignets-task-guide.png"
+    def get_output_shape(self) -> Dict[str, Any]:
+        """
+        The shapes of the outputs of `forward` for a single image of
+        `image_size`, cached per (model_identifier, image_size,
+        features_only), with every layer in "per_layer_raw_features".
+
+        📐 The shapes come from a forward pass on the meta device, which
+        tracks shapes without allocating or computing anything, so this
+        needs neither a real image nor the network.
+        """
+        key = (self.model_identifier, self.image_size, self.features_only)
+        if key not in _output_shape_cache:
+            _output_shape_cache[key] = self._infer_output_shape()
+        return _output_shape_cache[key]
+
+    def _infer_output_shape(self) -> Dict[str, Any]:
+        num_channels = self.model.pretrained_cfg.get("input_size", (3,))[0]
+        input_shape = (1, num_channels, self.image_size, self.image_size)
+        try:
+            meta_state = {
+                name: tensor.to("meta")
+                for name, tensor in itertools.chain(
+                    self.named_parameters(), self.named_buffers()
+                )
+            }
+            with torch.no_grad():
+                output_dict = functional_call(
+                    self,
+                    meta_state,
+                    (torch.zeros(input_shape, device="meta"),),
+                    {"output_layers": "all"},
+                )
+        except (NotImplementedError, RuntimeError) as e:
+            logger.info(
+                f"Could not infer the output shape of {self.model_identifier} "
+                f"on the meta device because {e}, running a forward pass"
             )
-        )
-        output_dict = self.forward(self.transforms(img).unsqueeze(0))
+            was_training = self.training
+            self.eval()
+            device = next(self.parameters()).device
+            with torch.no_grad():
+                output_dict = self.forward(
+                    torch.zeros(input_shape, device=device),
+                    output_layers="all",
+                )
+            self.train(was_training)
+
         shape_dict = {
             k: (
                 v.shape
@@ -228,9 +391,7 @@ class GATETimmImageEncoder(GATEImageEncoder):
             image_size=self.image_size,
         )
 
-        self.image_num_raw_features = self.vision_model.get_output_shape()[
-            "raw_features"
-        ][2]
+        self.image_num_raw_features = self.vision_model.num_output_features
 
         self.image_num_features = (
             self.image_num_raw_features
@@ -269,14 +430,21 @@ class GATETimmImageEncoder(GATEImageEncoder):
     def image_shape(self):
         return (self.image_size, self.image_size)
 
-    def forward(self, x):
-        return self.vision_model(x)
+    def forward(self, x, output_layers: Optional[OutputLayers] = None):
+        return self.vision_model(x, output_layers=output_layers)
 
     def transforms(self, x):
         return self.vision_model.transforms(x)
 
+    def batch_transforms(self, x: torch.Tensor) -> torch.Tensor:
+        return self.vision_model.tensor_transforms(x)
+
 
 class GATECLIPTextEncoder(GATETextEncoder):
+    # causal, and pooled at the first end of text token, so the outputs at
+    # the real positions ignore tokens repeated after them
+    pads_sequences_safely = True
+
     def __init__(
         self,
         model_name: str,
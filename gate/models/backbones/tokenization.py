@@ -0,0 +1,112 @@
+import multiprocessing
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import torch
+
+# Shared with forked dataloader workers, where most tokenization happens
+_cache_hits = multiprocessing.Value("q", 0)
+_cache_misses = multiprocessing.Value("q", 0)
+
+
+def tokenization_cache_stats() -> Dict[str, float]:
+    """
+    :return: The number of strings looked up in every `CachedTokenizer`
+    since the last reset, and the fraction found in the cache.
+    """
+    hits, misses = _cache_hits.value, _cache_misses.value
+    total = hits + misses
+    return {
+        "tokenization_cache_lookups": total,
+        "tokenization_cache_hit_rate": hits / total if total > 0 else 0.0,
+    }
+
+
+def reset_tokenization_cache_stats() -> None:
+    for counter in (_cache_hits, _cache_misses):
+        with counter.get_lock():
+            counter.value = 0
+
+
+def _record(hits: int, misses: int) -> None:
+    for counter, count in ((_cache_hits, hits), (_cache_misses, misses)):
+        with counter.get_lock():
+            counter.value += count
+
+
+class CachedTokenizer:
+    """
+    🔤 Tokenizes batches of strings with one call to a fast tokenizer and
+    keeps the token ids of every string in an LRU cache, so the class
+    prompts and answers that recur every batch are tokenized once.
+
+    Each instance wraps a single tokenizer, so entries are keyed by
+    (string, max_length) and a cache never mixes tokenizers. The output
+    is what `tokenizer(texts, padding=True, truncation=True)` returns.
+
+    :param tokenizer: A Hugging Face tokenizer.
+    :param max_size: The number of strings to keep.
+    """
+
+    def __init__(self, tokenizer: Any, max_size: int = 65536):
+        self.tokenizer = tokenizer
+        self.max_size = max_size
+        self._cache: "OrderedDict[Tuple[str, int], List[int]]" = OrderedDict()
+
+    def __getstate__(self):
+        # dataloader workers start with an empty cache
+        state = self.__dict__.copy()
+        state["_cache"] = OrderedDict()
+        return state
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def token_ids(self, texts: List[str]) -> List[List[int]]:
+        """
+        :return: The unpadded token ids of every string in `texts`.
+        """
+        max_length = self.tokenizer.model_max_length
+        token_ids = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            key = (text, max_length)
+            cached = self._cache.get(key)
+            if cached is None:
+                missing.setdefault(text, []).append(index)
+            else:
+                self._cache.move_to_end(key)
+                token_ids[index] = cached
+
+        if missing:
+            encoded = self.tokenizer(
+                list(missing), truncation=True, padding=False
+            )["input_ids"]
+            for (text, indices), ids in zip(missing.items(), encoded):
+                for index in indices:
+                    token_ids[index] = ids
+                self._cache[(text, max_length)] = ids
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+        _record(hits=len(texts) - len(missing), misses=len(missing))
+        return token_ids
+
+    def __call__(self, texts: List[str]) -> torch.Tensor:
+        """
+        :return: The (len(texts), longest) input ids, padded like the
+        tokenizer pads a batch.
+        """
+        token_ids = self.token_ids(texts)
+        longest = max(len(ids) for ids in token_ids)
+        input_ids = torch.full(
+            (len(token_ids), longest),
+            self.tokenizer.pad_token_id,
+            dtype=torch.long,
+        )
+        for row, ids in enumerate(token_ids):
+            if self.tokenizer.padding_side == "left":
+                input_ids[row, longest - len(ids) :] = torch.tensor(ids)
+            else:
+                input_ids[row, : len(ids)] = torch.tensor(ids)
+        return input_ids
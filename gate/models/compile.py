@@ -0,0 +1,369 @@
+import logging
+import time
+import types
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+from torch._dynamo.utils import counters
+
+from gate.models.backbones import TextProcessor
+from gate.models.core import GATEModel
+
+logger = logging.getLogger(__name__)
+
+_compile_stats = {
+    "compiled_graphs": 0,
+    "graph_breaks": 0,
+    "recompiles": 0,
+    "compile_time": 0.0,
+}
+
+
+def compile_stats() -> Dict[str, float]:
+    """
+    :return: The number of graphs compiled, graph breaks hit and
+    recompilations for new input shapes by models compiled with
+    `compile_gate_model`, and the seconds spent in the calls that
+    compiled.
+    """
+    return dict(_compile_stats)
+
+
+def reset_compile_stats() -> None:
+    for key in _compile_stats:
+        _compile_stats[key] = type(_compile_stats[key])()
+
+
+def bucket_size(
+    size: int,
+    buckets: Optional[Sequence[int]] = None,
+    max_size: Optional[int] = None,
+) -> int:
+    """
+    :param size: The size of an input dimension.
+    :param buckets: The sizes to pad to, None for powers of two.
+    :param max_size: The largest size the dimension can take.
+    :return: The smallest bucket that fits `size`, or `size` itself when no
+    bucket (up to `max_size`) does.
+    """
+    if buckets is None:
+        bucket = 1 << max(size - 1, 0).bit_length()
+    else:
+        bucket = min((b for b in buckets if b >= size), default=size)
+    if max_size is not None and bucket > max_size:
+        bucket = max(size, max_size)
+    return bucket
+
+
+def _pad(tensor: torch.Tensor, dim: int, size: int) -> torch.Tensor:
+    # repeat the last entry, the same way token batches are padded with
+    # their end of sequence token
+    num_padding = size - tensor.shape[dim]
+    if num_padding <= 0:
+        return tensor
+    last = tensor.narrow(dim, tensor.shape[dim] - 1, 1)
+    expand_shape = list(tensor.shape)
+    expand_shape[dim] = num_padding
+    return torch.cat([tensor, last.expand(*expand_shape)], dim=dim)
+
+
+def _is_token_ids(tensor: torch.Tensor) -> bool:
+    return tensor.dim() > 1 and tensor.dtype in (torch.int32, torch.int64)
+
+
+def _slice_outputs(
+    output: Any,
+    batch_size: int,
+    padded_batch_size: int,
+    sequence_length: Optional[int],
+    padded_sequence_length: Optional[int],
+) -> Any:
+    if isinstance(output, torch.Tensor):
+        if output.dim() > 0 and output.shape[0] == padded_batch_size:
+            output = output[:batch_size]
+        if (
+            padded_sequence_length is not None
+            and output.dim() > 2
+            and output.shape[1] == padded_sequence_length
+        ):
+            output = output[:, :sequence_length]
+        return output
+    sizes = (
+        batch_size,
+        padded_batch_size,
+        sequence_length,
+        padded_sequence_length,
+    )
+    if isinstance(output, dict):
+        sliced = {
+            key: _slice_outputs(value, *sizes) for key, value in output.items()
+        }
+        # e.g. the ModelOutput of a Hugging Face model
+        return sliced if type(output) is dict else output.__class__(**sliced)
+    elif isinstance(output, (list, tuple)):
+        return output.__class__(
+            [_slice_outputs(value, *sizes) for value in output]
+        )
+    return output
+
+
+def max_sequence_length(module: nn.Module) -> Optional[int]:
+    """
+    :return: The longest token sequence the text tokenizer of `module`
+    produces, or None if it has no text tokenizer.
+    """
+    for submodule in module.modules():
+        text_transforms = getattr(submodule, "text_transforms", None)
+        if isinstance(text_transforms, TextProcessor):
+            return text_transforms.tokenizer.tokenizer.model_max_length
+    return None
+
+
+def pads_sequences_safely(module: nn.Module) -> bool:
+    """
+    :return: Whether every text model of `module` declares, with a
+    `pads_sequences_safely` attribute, that repeating the last token of
+    its inputs leaves its outputs at the real positions unchanged. That
+    holds for causal models such as CLIP's text transformer, which pools
+    at the first end of text token, but not for bidirectional ones such as
+    BERT, whose every token attends to the padding when no attention mask
+    is passed.
+    """
+    text_models = [
+        submodule
+        for submodule in module.modules()
+        if isinstance(
+            getattr(submodule, "text_transforms", None), TextProcessor
+        )
+    ]
+    return bool(text_models) and all(
+        getattr(text_model, "pads_sequences_safely", False)
+        for text_model in text_models
+    )
+
+
+class ShapeBucketing:
+    """
+    📦 Forward hooks that pad the tensor inputs of an encoder to a small
+    set of sizes, so that a compiled encoder only ever sees a few shapes:
+    the batch dim of every input to a batch bucket, and the last dim of
+    token ids to a sequence bucket. Outputs are sliced back to the real
+    batch and sequence sizes.
+
+    Padding repeats the last sample, so the real samples come out
+    unchanged, except through statistics taken across the batch, such as
+    batch norm in training. Sequences are padded by repeating the last
+    token, which only causal text models are unaffected by, so they are
+    left alone unless `max_sequence_length` is given.
+
+    :param batch_buckets: The batch sizes to pad to, None for powers of
+    two.
+    :param sequence_buckets: The sequence lengths to pad to, None for
+    powers of two.
+    :param max_sequence_length: The longest sequence the encoder takes,
+    sequences are not padded when None.
+    """
+
+    def __init__(
+        self,
+        batch_buckets: Optional[Sequence[int]] = None,
+        sequence_buckets: Optional[Sequence[int]] = None,
+        max_sequence_length: Optional[int] = None,
+    ):
+        self.batch_buckets = batch_buckets
+        self.sequence_buckets = sequence_buckets
+        self.max_sequence_length = max_sequence_length
+        self.sizes: List[Tuple] = []
+
+    def register(self, module: nn.Module) -> None:
+        # kept out of the compiled graphs, so the encoder call breaks the
+        # graph of its caller and runs at the bucketed shapes
+        module.register_forward_pre_hook(
+            torch.compiler.disable(self.pad_inputs), with_kwargs=True
+        )
+        module.register_forward_hook(
+            torch.compiler.disable(self.slice_outputs), with_kwargs=True
+        )
+
+    def pad_inputs(self, module: nn.Module, args: Tuple, kwargs: Dict):
+        tensors = [
+            value
+            for value in list(args) + list(kwargs.values())
+            if isinstance(value, torch.Tensor) and value.dim() > 0
+        ]
+        if not tensors:
+            self.sizes.append(None)
+            return None
+
+        batch_size = tensors[0].shape[0]
+        padded_batch_size = bucket_size(batch_size, self.batch_buckets)
+        sequence_length = padded_sequence_length = None
+        token_ids = [tensor for tensor in tensors if _is_token_ids(tensor)]
+        if token_ids and self.max_sequence_length is not None:
+            sequence_length = token_ids[0].shape[-1]
+            padded_sequence_length = bucket_size(
+                sequence_length,
+                self.sequence_buckets,
+                max_size=self.max_sequence_length,
+            )
+
+        def pad(value):
+            if not isinstance(value, torch.Tensor) or value.dim() == 0:
+                return value
+            if value.shape[0] == batch_size:
+                value = _pad(value, 0, padded_batch_size)
+            if (
+                padded_sequence_length is not None
+                and _is_token_ids(value)
+                and value.shape[-1] == sequence_length
+            ):
+                value = _pad(value, value.dim() - 1, padded_sequence_length)
+            return value
+
+        self.sizes.append(
+            (
+                batch_size,
+                padded_batch_size,
+                sequence_length,
+                padded_sequence_length,
+            )
+        )
+        return (
+            tuple(pad(value) for value in args),
+            {key: pad(value) for key, value in kwargs.items()},
+        )
+
+    def slice_outputs(
+        self, module: nn.Module, args: Tuple, kwargs: Dict, output: Any
+    ):
+        sizes = self.sizes.pop()
+        if sizes is None:
+            return None
+        return _slice_outputs(output, *sizes)
+
+
+class CompileMonitor:
+    """
+    📈 Forward hooks that log every call of a compiled module that
+    compiled new graphs: how long the call took, the input shapes that
+    caused it, and any new graph breaks, and keep the totals reported by
+    `compile_stats`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.num_calls = 0
+        self.calls: List[Tuple[float, int, int]] = []
+        self.graph_break_reasons = set()
+
+    def register(self, module: nn.Module) -> None:
+        module.register_forward_pre_hook(self.start, with_kwargs=True)
+        module.register_forward_hook(self.end, with_kwargs=True)
+
+    def start(self, module: nn.Module, args: Tuple, kwargs: Dict):
+        self.calls.append(
+            (
+                time.perf_counter(),
+                counters["stats"]["unique_graphs"],
+                sum(counters["graph_break"].values()),
+            )
+        )
+
+    def end(self, module: nn.Module, args: Tuple, kwargs: Dict, output: Any):
+        start_time, num_graphs, num_graph_breaks = self.calls.pop()
+        self.num_calls += 1
+        new_graphs = counters["stats"]["unique_graphs"] - num_graphs
+        new_graph_breaks = (
+            sum(counters["graph_break"].values()) - num_graph_breaks
+        )
+        if new_graphs <= 0:
+            return
+
+        elapsed = time.perf_counter() - start_time
+        _compile_stats["compiled_graphs"] += new_graphs
+        _compile_stats["graph_breaks"] += new_graph_breaks
+        _compile_stats["compile_time"] += elapsed
+        if self.num_calls > 1:
+            _compile_stats["recompiles"] += 1
+
+        shapes = {
+            key: tuple(value.shape)
+            for key, value in kwargs.items()
+            if isinstance(value, torch.Tensor)
+        }
+        logger.info(
+            f"{self.name} compiled {new_graphs} graphs in {elapsed:.1f}s "
+            f"for inputs {shapes} ({new_graph_breaks} graph breaks, "
+            f"{_compile_stats['recompiles']} recompiles so far)"
+        )
+        for reason in counters["graph_break"]:
+            if reason not in self.graph_break_reasons:
+                self.graph_break_reasons.add(reason)
+                logger.info(f"Graph break: {reason.splitlines()[0]}")
+
+
+def _compile_forward(module: nn.Module, **compile_kwargs) -> None:
+    # compiles the forward of this module alone, leaving its hooks eager,
+    # and bound as a method so that deep copies run their own weights
+    compiled_forward = torch.compile(type(module).forward, **compile_kwargs)
+    module.forward = types.MethodType(compiled_forward, module)
+
+
+def compile_gate_model(
+    model: GATEModel,
+    backend: str = "inductor",
+    mode: Optional[str] = None,
+    batch_buckets: Optional[Sequence[int]] = None,
+    sequence_buckets: Optional[Sequence[int]] = None,
+) -> GATEModel:
+    """
+    Compile the encoder and the adapter of a GATEModel in place.
+
+    The encoder runs on inputs padded to a few bucket sizes by
+    `ShapeBucketing`, so it is compiled with static shapes, once per
+    bucket. The adapter computes losses on its unpadded inputs, so it is
+    compiled with dynamic shapes instead, and its graph breaks around the
+    encoder call. `GATEModel.forward` itself, with its loops over the
+    modality combinations, stays eager. The parameters and their
+    state_dict names are unchanged.
+
+    :param model: The model to compile.
+    :param backend: The torch.compile backend.
+    :param mode: The torch.compile mode.
+    :param batch_buckets: The batch sizes to pad encoder inputs to, None
+    for powers of two, an empty list to leave them unpadded.
+    :param sequence_buckets: The token sequence lengths to pad encoder
+    inputs to, None for powers of two, capped at the tokenizer's maximum.
+    Only used for encoders whose text models declare
+    `pads_sequences_safely`.
+    :return: The model.
+    """
+    adapter = model.model
+    encoder = getattr(adapter, "encoder", None)
+    compile_kwargs = dict(backend=backend, mode=mode)
+
+    if isinstance(encoder, nn.Module):
+        pad_sequences = pads_sequences_safely(encoder)
+        if not pad_sequences and max_sequence_length(encoder) is not None:
+            logger.info(
+                f"Not bucketing the token sequences of "
+                f"{encoder.__class__.__name__}, its text model does not "
+                f"declare pads_sequences_safely"
+            )
+        ShapeBucketing(
+            batch_buckets=batch_buckets,
+            sequence_buckets=sequence_buckets,
+            max_sequence_length=(
+                max_sequence_length(encoder) if pad_sequences else None
+            ),
+        ).register(encoder)
+        _compile_forward(encoder, dynamic=False, **compile_kwargs)
+
+    _compile_forward(adapter, dynamic=True, **compile_kwargs)
+    CompileMonitor(name=adapter.__class__.__name__).register(adapter)
+
+    logger.info(
+        f"Compiled {adapter.__class__.__name__} with the {backend} backend"
+    )
+    return model
@@ -1,6 +1,8 @@
 import logging
+from collections.abc import Sequence
 from dataclasses import dataclass
-from typing import Any, Dict, Iterator, List, Optional, Tuple
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import torch
 import torch.nn as nn
@@ -246,6 +248,17 @@ def recursive_mean(tensor_dict):
         )
 
 
+def recursive_to(data, device):
+    if isinstance(data, torch.Tensor):
+        return data.detach().to(device)
+    elif isinstance(data, dict):
+        return {k: recursive_to(v, device) for k, v in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return data.__class__(recursive_to(i, device) for i in data)
+    else:
+        return data
+
+
 def flatten_dict(d, parent_key="", sep="_"):
     items = []
     for k, v in d.items():
@@ -266,24 +279,89 @@ def print_dict_structure(d, indent=0):
             print_dict_structure(value, indent + 2)
 
 
+def _running_sum(total: Any, value: Any) -> Any:
+    if isinstance(value, torch.Tensor):
+        return total + value
+    elif isinstance(value, dict):
+        return {k: _running_sum(total[k], v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return value.__class__(
+            _running_sum(t, v) for t, v in zip(total, value)
+        )
+    else:
+        return total
+
+
+def _divide(total: Any, count: int) -> Any:
+    if isinstance(total, torch.Tensor):
+        return total / count
+    elif isinstance(total, dict):
+        return {k: _divide(v, count) for k, v in total.items()}
+    elif isinstance(total, (list, tuple)):
+        return total.__class__(_divide(v, count) for v in total)
+    else:
+        return total
+
+
+def _mean_over_members(stacked: Any) -> Any:
+    if isinstance(stacked, torch.Tensor):
+        return stacked.mean(dim=0)
+    elif isinstance(stacked, dict):
+        return {k: _mean_over_members(v) for k, v in stacked.items()}
+    elif isinstance(stacked, (list, tuple)):
+        return stacked.__class__(_mean_over_members(v) for v in stacked)
+    else:
+        return stacked
+
+
+def stackable(models: List[nn.Module]) -> bool:
+    """
+    Whether the members share one architecture, i.e. the same class and
+    parameters and buffers of the same names, shapes and dtypes, so their
+    state can be stacked and run with one vmapped call.
+    """
+
+    def signature(model):
+        tensors = list(model.named_parameters()) + list(model.named_buffers())
+        return type(model), [
+            (name, tuple(tensor.shape), tensor.dtype, tensor.device)
+            for name, tensor in tensors
+        ]
+
+    reference = signature(models[0])
+    return all(signature(model) == reference for model in models[1:])
+
+
 class Ensemble(nn.Module):
     """
-    This class represents an ensemble of PyTorch models. It can compute ensemble predictions,
-    weighted ensemble predictions, and predictions from a "model soup" that averages the models' parameters.
+    This class represents an ensemble of PyTorch models, whose predictions are the mean of the
+    members' logits. A "model soup" that averages the models' parameters is built with ModelSoup.
+
+    Members run one after another, keeping a running sum of their logits
+    so memory does not grow with k. With `vectorize`, members of one
+    architecture have their parameters and buffers stacked into single
+    (k, ...) tensors, which the members then view, and all members run in
+    one `torch.func.vmap` call, falling back to the sequential run where
+    the members cannot be stacked or vmapped. vmap pays off for small
+    dense members, while convolutions and attention run slower vmapped on
+    CPU.
     """
 
-    def __init__(self, models: list[nn.Module]):
+    def __init__(self, models: list[nn.Module], vectorize: bool = False):
         """
         Initialize the Ensemble with a list of models and optional weights.
 
         Args:
             models (list[nn.Module]): A list of PyTorch models.
-            weights (list[float], optional): A list of weights for the models. Defaults to None, which gives equal weight to all models.
+            vectorize (bool): Run members of one architecture with a single vmapped call. Defaults to False.
         """
         super(Ensemble, self).__init__()
         self.models = nn.ModuleList(models)
         self.compute_loss_and_metrics = None
         self.iou_metrics_dict = None
+        self.vectorize = vectorize and len(models) > 1
+        self.stacked_state = None
+        self.stacked_state_key = None
 
         for model in self.models:
             model.eval()
@@ -299,6 +377,95 @@ class Ensemble(nn.Module):
 
         logger.info(f"Ensemble model with {len(self.models)} models created.")
 
+    def member_state_key(self) -> Tuple:
+        return tuple(
+            (tensor.data_ptr(), tensor._version)
+            for model in self.models
+            for tensor in list(model.parameters()) + list(model.buffers())
+        )
+
+    @torch.no_grad()
+    def stack_state(self) -> Optional[Tuple[Dict, Dict]]:
+        """
+        Stack the parameters and buffers of the members, and point the
+        members' own tensors at their slice of the stack. The stack is
+        rebuilt whenever a member's tensors are moved or replaced, e.g. by
+        `.to(device)` or `load_state_dict`.
+
+        Returns:
+            The stacked (parameters, buffers), or None if the members do not share an architecture.
+        """
+        key = self.member_state_key()
+        if self.stacked_state is not None and key == self.stacked_state_key:
+            return self.stacked_state
+
+        if not stackable(list(self.models)):
+            logger.info(
+                "Ensemble members differ in architecture, running them "
+                "one after another"
+            )
+            self.vectorize = False
+            return None
+
+        params, buffers = torch.func.stack_module_state(list(self.models))
+        params = {name: value.detach() for name, value in params.items()}
+        for index, model in enumerate(self.models):
+            for name, tensor in model.named_parameters():
+                tensor.data = params[name][index]
+            for name, tensor in model.named_buffers():
+                tensor.data = buffers[name][index]
+
+        self.stacked_state = (params, buffers)
+        self.stacked_state_key = self.member_state_key()
+        return self.stacked_state
+
+    def vectorized_forward(self, *args, **kwargs) -> Dict[str, Any]:
+        params, buffers = self.stack_state()
+        base_model = self.models[0]
+
+        output_keys = {}
+
+        def member_forward(member_params, member_buffers):
+            output = torch.func.functional_call(
+                base_model, (member_params, member_buffers), args, kwargs
+            )
+            if isinstance(output, torch.Tensor):
+                output = {"logits": output}
+            # vmap only returns tensors, so labels=None is noted aside
+            output_keys["labels"] = "labels" in output
+            return {
+                key: output[key]
+                for key in ("logits", "labels")
+                if output.get(key) is not None
+            }
+
+        outputs = torch.func.vmap(member_forward)(params, buffers)
+        ensemble_pred = _mean_over_members(outputs["logits"])
+        if "labels" in outputs:
+            labels = outputs["labels"][0]
+        elif output_keys["labels"]:
+            labels = None
+        else:
+            labels = kwargs.get("labels")
+        return self.output_dict(ensemble_pred=ensemble_pred, labels=labels)
+
+    def streaming_forward(self, *args, **kwargs) -> Dict[str, Any]:
+        total = None
+        labels = kwargs.get("labels")
+        for index, model in enumerate(self.models):
+            output = model(*args, **kwargs)
+            if isinstance(output, torch.Tensor):
+                logits = output
+            else:
+                logits = output["logits"]
+                if index == 0 and "labels" in output:
+                    labels = output["labels"]
+            total = logits if total is None else _running_sum(total, logits)
+            del output, logits
+
+        ensemble_pred = _divide(total, len(self.models))
+        return self.output_dict(ensemble_pred=ensemble_pred, labels=labels)
+
     def forward(self, *args, **kwargs) -> dict[str, torch.Tensor]:
         """
         Compute the ensemble predictions, weighted ensemble predictions, and model soup predictions.
@@ -310,49 +477,226 @@ class Ensemble(nn.Module):
         Returns:
             dict[str, torch.Tensor]: A dictionary containing the ensemble predictions, weighted ensemble predictions, and model soup predictions.
         """
+        if self.vectorize and self.stack_state() is not None:
+            try:
+                with torch.inference_mode():
+                    return self.vectorized_forward(*args, **kwargs)
+            except Exception as e:
+                logger.info(
+                    f"Ensemble members cannot be vmapped ({e}), running "
+                    f"them one after another"
+                )
+                self.vectorize = False
 
         with torch.inference_mode():
-            # # Get the outputs from each model
+            return self.streaming_forward(*args, **kwargs)
 
-            model_outputs = [model(*args, **kwargs) for model in self.models]
-            labels = None
+    def output_dict(
+        self, ensemble_pred: Any, labels: Optional[Any] = None
+    ) -> dict[str, torch.Tensor]:
+        output_dict = {"logits": ensemble_pred}
 
-            if isinstance(model_outputs[0], torch.Tensor):
-                logits = model_outputs
-            else:
-                logits = [output["logits"] for output in model_outputs]
+        if labels is not None and self.compute_loss_and_metrics is not None:
+            metrics = self.compute_loss_and_metrics(
+                logits=ensemble_pred, labels=labels
+            )
+            output_dict.update(metrics)
 
-            if "labels" in kwargs:
-                labels = kwargs["labels"]
+        return flatten_dict(output_dict)
 
-            if not isinstance(model_outputs[0], torch.Tensor):
-                if "labels" in model_outputs[0]:
-                    labels = model_outputs[0]["labels"]
+    def combine_outputs(
+        self, model_outputs: list[Any], labels: Optional[Any] = None
+    ) -> dict[str, torch.Tensor]:
+        """
+        Average the logits of the member outputs and, when labels are
+        available, compute the loss and metrics of the averaged logits.
 
-            ensemble_pred = {}
+        Args:
+            model_outputs (list[Any]): One output (a logits tensor or a dict with a "logits" entry) per member.
+            labels (Any, optional): The labels passed to the members, used when the outputs carry none.
 
-            if isinstance(logits[0], torch.Tensor):
-                ensemble_pred = torch.mean(
-                    torch.stack(logits),
-                    dim=0,
-                )
-            else:
-                for key in logits[0].keys():
-                    ensemble_pred[key] = recursive_mean(
-                        [output[key] for output in logits]
-                    )
+        Returns:
+            dict[str, torch.Tensor]: The flattened ensemble outputs.
+        """
+        if isinstance(model_outputs[0], torch.Tensor):
+            logits = model_outputs
+        else:
+            logits = [output["logits"] for output in model_outputs]
+
+        if not isinstance(model_outputs[0], torch.Tensor):
+            if "labels" in model_outputs[0]:
+                labels = model_outputs[0]["labels"]
 
-            output_dict = {"logits": ensemble_pred}
+        ensemble_pred = {}
 
-            if (
-                labels is not None
-                and self.compute_loss_and_metrics is not None
-            ):
-                metrics = self.compute_loss_and_metrics(
-                    logits=ensemble_pred, labels=labels
+        if isinstance(logits[0], torch.Tensor):
+            ensemble_pred = torch.mean(
+                torch.stack(logits),
+                dim=0,
+            )
+        else:
+            for key in logits[0].keys():
+                ensemble_pred[key] = recursive_mean(
+                    [output[key] for output in logits]
                 )
-                output_dict.update(metrics)
 
-            outputs = flatten_dict(output_dict)
+        return self.output_dict(ensemble_pred=ensemble_pred, labels=labels)
+
+
+class OutputFiles(Sequence):
+    """
+    💾 A list of per-batch outputs kept on disk, one file per batch, so
+    that recording never holds more than one batch in RAM. Outputs are
+    memory-mapped back in when read.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.num_outputs = 0
+
+    def append(self, output: Dict[str, Any]):
+        torch.save(output, self.directory / f"batch_{self.num_outputs}.pt")
+        self.num_outputs += 1
+
+    def __len__(self) -> int:
+        return self.num_outputs
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"{idx} is out of range for {len(self)} outputs")
+        return torch.load(
+            self.directory / f"batch_{idx}.pt", map_location="cpu", mmap=True
+        )
+
+
+class OutputRecorder(nn.Module):
+    """
+    📼 Wraps a model and keeps a CPU copy of the logits (and optionally the
+    labels) of every forward call, in call order, so that they can later be
+    replayed by a CachedOutputEnsemble.
+    """
+
+    def __init__(self, model: nn.Module, record_labels: bool = True):
+        super().__init__()
+        self.model = model
+        self.record_labels = record_labels
+        self.outputs = []
+
+    def reset(self, output_dir: Optional[Union[str, Path]] = None):
+        """
+        Start a new recording.
+
+        :param output_dir: If given, each output is written to this
+        directory as it is recorded instead of being kept in RAM.
+        """
+        self.outputs = [] if output_dir is None else OutputFiles(output_dir)
+
+    def forward(self, *args, **kwargs):
+        output = self.model(*args, **kwargs)
+
+        if isinstance(output, torch.Tensor):
+            record = {"logits": output}
+        else:
+            record = {"logits": output["logits"]}
+            if self.record_labels and output.get("labels") is not None:
+                record["labels"] = output["labels"]
+
+        self.outputs.append(recursive_to(record, "cpu"))
+
+        return output
+
+
+class CachedOutputEnsemble(Ensemble):
+    """
+    An Ensemble whose members have already been run over the data. Each
+    forward call replays the next batch of cached member outputs instead of
+    running the members, so any number of ensemble sizes can be evaluated
+    from a single pass per member.
+    """
+
+    def __init__(
+        self,
+        reference_model: nn.Module,
+        cached_outputs: List[List[Dict[str, Any]]],
+    ):
+        """
+        Args:
+            reference_model (nn.Module): A model of the members' architecture, used for its ensemble-marked loss and metric methods.
+            cached_outputs (List[Sequence[Dict[str, Any]]]): Per member, the per-batch outputs recorded by an OutputRecorder.
+        """
+        super().__init__(models=[reference_model])
+        self.cached_outputs = cached_outputs
+        self.batch_idx = 0
+
+    def forward(self, *args, **kwargs) -> dict[str, torch.Tensor]:
+        num_batches = len(self.cached_outputs[0])
+        if self.batch_idx >= num_batches:
+            raise ValueError(
+                f"Only {num_batches} batches were cached, but batch "
+                f"{self.batch_idx} was requested"
+            )
+
+        device = next(self.models[0].parameters()).device
+        model_outputs = [
+            recursive_to(member_outputs[self.batch_idx], device)
+            for member_outputs in self.cached_outputs
+        ]
+        self.batch_idx += 1
+
+        with torch.inference_mode():
+            return self.combine_outputs(
+                model_outputs=model_outputs, labels=kwargs.get("labels")
+            )
+
+
+class ModelSoup:
+    """
+    🍲 A uniform average of the weights of several checkpoints of one
+    model, built up one checkpoint at a time so that only the soup and the
+    model the checkpoints are loaded into are held in memory.
+
+    Each candidate is first loaded into the model and mixed with the soup
+    in place, so the model holds the soup it would make, and can be
+    evaluated, before it is `add`ed. Non floating point entries, such as
+    batch norm step counters, keep the candidate's value.
+    """
+
+    def __init__(self):
+        self.state_dict: Optional[Dict[str, torch.Tensor]] = None
+        self.num_ingredients = 0
+
+    @torch.no_grad()
+    def mix_into(self, model: nn.Module) -> None:
+        """
+        Replace the weights of `model`, which holds a candidate checkpoint,
+        with the average of the soup's ingredients and the candidate.
+        """
+        if self.state_dict is None:
+            return
+        weight = self.num_ingredients / (self.num_ingredients + 1)
+        for name, tensor in model.state_dict().items():
+            if tensor.is_floating_point():
+                tensor.lerp_(self.state_dict[name], weight)
+
+    @torch.no_grad()
+    def add(self, model: nn.Module) -> None:
+        """
+        Take the weights `model` was left with by `mix_into` as the soup.
+        """
+        if self.state_dict is None:
+            self.state_dict = {
+                name: tensor.detach().clone()
+                for name, tensor in model.state_dict().items()
+            }
+        else:
+            for name, tensor in model.state_dict().items():
+                self.state_dict[name].copy_(tensor)
+        self.num_ingredients += 1
 
-            return outputs
+    def load_into(self, model: nn.Module) -> None:
+        model.load_state_dict(self.state_dict)
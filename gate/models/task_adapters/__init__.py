@@ -1,12 +1,20 @@
-from typing import Iterator, Tuple
+import inspect
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import torch
 import torch.nn as nn
 
-from gate.models.backbones import GATEncoder
+from gate.models.backbones import GATEncoder, OutputLayers
+from gate.models.task_adapters.utils.shape_probe import probe_on_meta_device
+
+logger = logging.getLogger(__name__)
 
 
 class BaseAdapterModule(nn.Module):
+    # where `run_dummy_batch` probes shapes, None runs a real forward pass
+    shape_probe_device: Optional[str] = "meta"
+
     def __init__(
         self,
         encoder: GATEncoder,
@@ -17,12 +25,108 @@ class BaseAdapterModule(nn.Module):
         self.freeze_encoder = freeze_encoder
         self.encoder = encoder
         self.use_stem_instance_norm = use_stem_instance_norm
+        self.use_cached_features = False
+        if isinstance(self.encoder, GATEncoder):
+            self.encoder.set_output_layers(self.encoder_output_layers())
 
         if self.use_stem_instance_norm:
             self.stem_instance_norm = nn.InstanceNorm2d(
                 num_features=3, affine=True
             )
 
+    def run_dummy_batch(
+        self, dummy_batch: Dict[str, Any], method: str = "forward"
+    ) -> Any:
+        """
+        Run a dummy batch through the adapter to check that it fits the
+        encoder and to build the heads that are sized on their first
+        batch, before an optimizer is created.
+
+        📐 The batch runs on the meta device, so the encoder costs no
+        compute or activation memory, and without losses and metrics,
+        which hold no parameters. Adapters whose forward pass can't run
+        there fall back to a real forward pass.
+
+        :param dummy_batch: The keyword arguments of `method`.
+        :param method: The method to run the batch through.
+        """
+        if self.shape_probe_device == "meta":
+            inputs = dict(dummy_batch)
+            parameters = inspect.signature(getattr(self, method)).parameters
+            if "return_loss_and_metrics" in parameters:
+                inputs["return_loss_and_metrics"] = False
+            elif "labels" in parameters and (
+                parameters["labels"].default is None
+            ):
+                inputs.pop("labels", None)
+            try:
+                return probe_on_meta_device(self, inputs, method=method)
+            except Exception as e:
+                logger.info(
+                    f"Could not probe {self.__class__.__name__} on the meta "
+                    f"device because {e!r}, running a real dummy batch"
+                )
+        return getattr(self, method)(**dummy_batch)
+
+    def encoder_output_layers(self) -> OutputLayers:
+        """
+        The encoder layers the adapter head consumes through
+        "per_layer_raw_features", "all" by default. Adapters that only use
+        "features" or "raw_features" return "final", so the encoder never
+        keeps the outputs of the other layers.
+        """
+        return "all"
+
+    def feature_keys(self) -> Optional[Dict[str, List[str]]]:
+        """
+        The encoder outputs the adapter head consumes, per modality, e.g.
+        `{"image": ["features"]}`. Adapters that return None can't be
+        trained from stored features.
+        """
+        return None
+
+    def encode(self, **inputs: Any) -> Dict[str, Any]:
+        """
+        Run the encoder on the inputs, or, when training from stored
+        features, return them as they are: every input then already holds
+        the encoder outputs of its modality.
+        """
+        if self.use_cached_features:
+            return inputs
+        return self.encoder(**inputs)
+
+    def check_cached_features(self) -> None:
+        """
+        Raise if the adapter can't be trained from stored features.
+        """
+        if self.feature_keys() is None:
+            raise NotImplementedError(
+                f"{self.__class__.__name__} can't be trained from stored "
+                f"encoder features"
+            )
+        if not self.freeze_encoder:
+            raise ValueError(
+                "Training from stored features needs a frozen encoder, "
+                "set freeze_encoder=True"
+            )
+
+    def enable_cached_features(self) -> None:
+        """
+        🧊 Train the adapter head directly from encoder outputs stored by
+        `gate.data.feature_store`, instead of running the frozen encoder.
+        """
+        self.check_cached_features()
+        if self.use_stem_instance_norm:
+            # applied with its current parameters when the features are
+            # extracted, so it can't be trained any further
+            logger.warning(
+                "The stem instance norm is frozen when training from "
+                "stored features"
+            )
+            self.use_stem_instance_norm = False
+            self.stem_instance_norm.requires_grad_(False)
+        self.use_cached_features = True
+
     def encoder_parameters(self) -> Iterator[torch.nn.Parameter]:
         return self.encoder.parameters()
 
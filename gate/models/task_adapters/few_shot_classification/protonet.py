@@ -5,7 +5,8 @@ import torch
 import torch.nn as nn
 
 from gate.boilerplate.decorators import configurable, ensemble_marker
-from gate.models.backbones import GATEncoder
+from gate.boilerplate.micro_batching import MicroBatchExecutor
+from gate.models.backbones import GATEncoder, OutputLayers
 from gate.models.core import (
     SourceModalityConfig,
     TargetModalityConfig,
@@ -50,6 +51,7 @@ class PrototypicalNetwork(BaseAdapterModule):
             freeze_encoder=freeze_encoder,
             use_stem_instance_norm=use_stem_instance_norm,
         )
+        self.micro_batcher = MicroBatchExecutor()
 
         # If num_output_features is not provided, use num_clip_features and set linear layer to identity.
         if num_output_features is None:
@@ -66,35 +68,25 @@ class PrototypicalNetwork(BaseAdapterModule):
         )
 
     def build(self):
-        support_set_inputs = torch.rand(
-            (2, 2, 3, self.encoder.image_shape[0], self.encoder.image_shape[1])
-        )
-        query_set_inputs = torch.rand(
-            (2, 2, 3, self.encoder.image_shape[0], self.encoder.image_shape[1])
-        )
-        support_set_labels = torch.randint(0, 1, (2, 2))
-        query_set_labels: torch.Tensor = torch.randint(0, 1, (2, 2))
-
+        # the prototypes and losses hold no parameters, so the features of
+        # a flattened support set are enough to check the encoder and head
         dummy_batch = {
-            "image": {
-                "support_set": support_set_inputs,
-                "query_set": query_set_inputs,
-            },
-            "labels": {
-                "support_set": support_set_labels,
-                "query_set": query_set_labels,
-            },
+            "image": torch.rand(
+                (
+                    4,
+                    3,
+                    self.encoder.image_shape[0],
+                    self.encoder.image_shape[1],
+                )
+            )
         }
 
         if torch.cuda.device_count() > 1:
             self.linear = self.linear.to(torch.cuda.current_device())
             # cast the dummy batch to the current device
             dummy_batch = {
-                key: {
-                    k: v.to(torch.cuda.current_device())
-                    for k, v in value.items()
-                }
-                for key, value in dummy_batch.items()
+                k: v.to(torch.cuda.current_device())
+                for k, v in dummy_batch.items()
             }
 
             if hasattr(self, "stem_instance_norm"):
@@ -102,7 +94,7 @@ class PrototypicalNetwork(BaseAdapterModule):
                     torch.cuda.current_device()
                 )
 
-        _ = self(**dummy_batch)
+        _ = self.run_dummy_batch(dummy_batch, method="forward_features")
 
     def init_weights(self):
         simple_init(self)
@@ -117,44 +109,32 @@ class PrototypicalNetwork(BaseAdapterModule):
             labels["query_set"] if "query_set" in labels else None,
         )
 
-    def forward_features_no_oom(
-        self,
-        input_dict: Optional[Dict[str, Union[torch.Tensor, Dict]]] = None,
-        image: Optional[torch.Tensor] = None,
-    ) -> Dict[str, torch.Tensor]:
+    def forward_features_no_oom(self, image: torch.Tensor) -> torch.Tensor:
         """
-        This method takes an input dictionary and applies the model to the input.
+        Apply `forward_features` in chunks small enough to fit in memory,
+        with the chunk size learned per image shape.
 
         Args:
-            input_dict: A dictionary of input data.
-            image: Optional image tensor.
+            image: The images, with the samples along the leading dim.
 
         Returns:
-            The output tensor after being processed by the model and the linear layer.
+            The features of every image, as `forward_features` returns.
         """
-
-        oom_error = True
-        while oom_error:
-            try:
-                x = self.forward_features(input_dict, image)
-                oom_error = False
-            except RuntimeError as e:
-                if "CUDA out of memory" in str(e):
-                    torch.cuda.empty_cache()
-
-                else:
-                    raise e
+        return self.micro_batcher.run(
+            self.forward_features,
+            image,
+            name=f"{self.__class__.__name__}.forward_features",
+        )
 
     def forward_features(
         self,
         image: torch.Tensor,
-    ) -> Dict[str, torch.Tensor]:
+    ) -> torch.Tensor:
         """
-        This method takes an input dictionary and applies the model to the input.
+        This method applies the encoder and the linear layer to the images.
 
         Args:
-            input_dict: A dictionary of input data.
-            image: Optional image tensor.
+            image: The images, with the samples along the leading dim.
 
         Returns:
             The output tensor after being processed by the model and the linear layer.
@@ -198,7 +178,7 @@ class PrototypicalNetwork(BaseAdapterModule):
         output_dict = {}
 
         num_tasks, num_examples = support_set_inputs.shape[:2]
-        support_set_features = self.forward_features(
+        support_set_features = self.forward_features_no_oom(
             **{
                 "image": support_set_inputs.view(
                     -1, *support_set_inputs.shape[2:]
@@ -209,7 +189,7 @@ class PrototypicalNetwork(BaseAdapterModule):
             num_tasks, num_examples, -1
         )
 
-        query_set_features = self.forward_features(
+        query_set_features = self.forward_features_no_oom(
             **{"image": query_set_inputs.view(-1, *query_set_inputs.shape[2:])}
         )
         query_set_embedding = query_set_features.view(
@@ -247,6 +227,9 @@ class PrototypicalNetwork(BaseAdapterModule):
         accuracy = compute_prototypical_accuracy(logits=logits, labels=labels)
         return {"loss": loss, "accuracy_top_1": accuracy}
 
+    def encoder_output_layers(self) -> OutputLayers:
+        return "final"
+
     @property
     def modality_config(self):
         return TargetModalityConfig(image=[SourceModalityConfig(image=True)])
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 import torch
 import torch.nn as nn
@@ -6,7 +6,7 @@ import torch.nn.functional as F
 
 from gate.boilerplate.decorators import configurable, ensemble_marker
 from gate.config.variables import HYDRATED_NUM_CLASSES
-from gate.models.backbones import GATEncoder
+from gate.models.backbones import GATEncoder, OutputLayers
 from gate.models.core import SourceModalityConfig, TargetModalityConfig
 from gate.models.task_adapters import BaseAdapterModule
 
@@ -54,12 +54,21 @@ class MultiClassBackboneWithLinear(BaseAdapterModule):
                     torch.cuda.current_device()
                 )
 
-        _ = self(**dummy_batch)
+        _ = self.run_dummy_batch(dummy_batch)
 
     @property
     def encoder_transforms(self):
         return self.encoder.get_transforms()
 
+    def feature_keys(self) -> Dict[str, List[str]]:
+        return {
+            modality: ["features"]
+            for modality in ("image", "text", "audio", "video")
+        }
+
+    def encoder_output_layers(self) -> OutputLayers:
+        return "final"
+
     @property
     def modality_config(self):
         return TargetModalityConfig(image=[SourceModalityConfig(image=True)])
@@ -96,16 +105,16 @@ class MultiClassBackboneWithLinear(BaseAdapterModule):
         if image is not None:
             if self.use_stem_instance_norm:
                 image = self.stem_instance_norm(image)
-            x = self.encoder(image=image)["image"]["features"]
+            x = self.encode(image=image)["image"]["features"]
 
         if text is not None:
-            x = self.encoder(text=text)["text"]["features"]
+            x = self.encode(text=text)["text"]["features"]
 
         if audio is not None:
-            x = self.encoder(audio=audio)["audio"]["features"]
+            x = self.encode(audio=audio)["audio"]["features"]
 
         if video is not None:
-            x = self.encoder(video=video)["video"]["features"]
+            x = self.encode(video=video)["video"]["features"]
 
         x = self.linear(x)
 
@@ -9,7 +9,7 @@ from gate.boilerplate.decorators import configurable, ensemble_marker
 from gate.boilerplate.utils import get_logger
 from gate.config.variables import HYDRATED_NUM_CLASSES
 from gate.metrics.core import accuracy_top_k
-from gate.models.backbones import GATEncoder
+from gate.models.backbones import GATEncoder, OutputLayers
 from gate.models.core import SourceModalityConfig, TargetModalityConfig
 from gate.models.task_adapters import BaseAdapterModule
 from gate.models.task_adapters.temporal_image_classification import (
@@ -150,7 +150,7 @@ class DuoModalFusionModel(BaseAdapterModule):
                     torch.cuda.current_device()
                 )
 
-        _ = self(**dummy_batch)
+        _ = self.run_dummy_batch(dummy_batch)
 
     @ensemble_marker
     def compute_loss_and_metrics_multi_class(self, logits_dict, labels):
@@ -273,6 +273,9 @@ class DuoModalFusionModel(BaseAdapterModule):
 
         return output_dict
 
+    def encoder_output_layers(self) -> OutputLayers:
+        return "final"
+
     @property
     def modality_config(self):
         return TargetModalityConfig(
@@ -337,7 +337,7 @@ class SegmentationAdapter(BaseAdapterModule):
                     torch.cuda.current_device()
                 )
 
-        _ = self(**dummy_batch)
+        _ = self.run_dummy_batch(dummy_batch)
 
     @ensemble_marker
     def compute_across_set_metrics(self):
@@ -371,7 +371,7 @@ class SegmentationAdapter(BaseAdapterModule):
         if self.use_stem_instance_norm:
             image = self.stem_instance_norm(image)
 
-        features = self.encoder(image)["image"]["per_layer_raw_features"]
+        features = self.encode(image=image)["image"]["per_layer_raw_features"]
         # feature shape is either B, C, H, W or B, (W * H), C
         mask_predictions = self.spatial_decoder_head(features)
 
@@ -445,6 +445,9 @@ class SegmentationAdapter(BaseAdapterModule):
 
         return loss_and_metrics
 
+    def feature_keys(self) -> Dict[str, List[str]]:
+        return {"image": ["per_layer_raw_features"]}
+
     @property
     def modality_config(self):
         return TargetModalityConfig(image=[SourceModalityConfig(image=True)])
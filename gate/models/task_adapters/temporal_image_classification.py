@@ -11,7 +11,7 @@ import torch.nn.functional as F
 from gate.boilerplate.decorators import configurable, ensemble_marker
 from gate.config.variables import HYDRATED_NUM_CLASSES
 from gate.metrics.core import accuracy_top_k
-from gate.models.backbones import GATEncoder
+from gate.models.backbones import GATEncoder, OutputLayers
 from gate.models.core import SourceModalityConfig, TargetModalityConfig
 from gate.models.task_adapters import BaseAdapterModule
 
@@ -315,7 +315,10 @@ class BackboneWithTemporalTransformerAndLinear(BaseAdapterModule):
                     torch.cuda.current_device()
                 )
 
-        _ = self(**dummy_batch)
+        _ = self.run_dummy_batch(dummy_batch)
+
+    def encoder_output_layers(self) -> OutputLayers:
+        return "final"
 
     @property
     def modality_config(self):
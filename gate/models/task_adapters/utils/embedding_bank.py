@@ -0,0 +1,91 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def parameters_version(parameters: Iterable[torch.Tensor]) -> Tuple:
+    """
+    A key that changes whenever any of the parameters does: every in-place
+    update, such as an optimizer step or `load_state_dict`, bumps the
+    version counter of a tensor, and moving or replacing a parameter
+    changes its storage.
+    """
+    return tuple(
+        (parameter.data_ptr(), parameter._version) for parameter in parameters
+    )
+
+
+def prompt_set_key(tokens: torch.Tensor) -> str:
+    digest = hashlib.sha1(tokens.detach().cpu().numpy().tobytes())
+    return f"{tuple(tokens.shape)}-{tokens.dtype}-{digest.hexdigest()}"
+
+
+class TextEmbeddingBank:
+    """
+    🏦 Keeps the text embeddings of the prompt sets an evaluation encodes
+    over and over, such as the class prompts of a zero-shot benchmark, on
+    the device they were computed on.
+
+    Embeddings are keyed by the tokens of the whole prompt set, and all of
+    them are dropped as soon as the version of the text parameters they
+    were computed with changes.
+
+    :param max_prompt_sets: How many prompt sets to keep, least recently
+    used first out.
+    """
+
+    def __init__(self, max_prompt_sets: int = 8):
+        self.max_prompt_sets = max_prompt_sets
+        self.version: Optional[Tuple] = None
+        self.embeddings: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def clear(self) -> None:
+        self.embeddings.clear()
+        self.version = None
+
+    # a host-side cache, kept out of compiled graphs
+    @torch.compiler.disable
+    def lookup(
+        self,
+        tokens: torch.Tensor,
+        version: Tuple,
+        encode: Callable[[torch.Tensor], torch.Tensor],
+    ) -> torch.Tensor:
+        """
+        :param tokens: The tokenized prompt set.
+        :param version: The `parameters_version` of every parameter the
+        text embeddings depend on.
+        :param encode: Computes the embeddings of `tokens` on a miss.
+        :return: The embeddings of `tokens`.
+        """
+        if version != self.version:
+            if self.embeddings:
+                logger.debug(
+                    "Text parameters changed, clearing the text embedding bank"
+                )
+            self.embeddings.clear()
+            self.version = version
+
+        key = prompt_set_key(tokens)
+        if key in self.embeddings:
+            self.num_hits += 1
+            self.embeddings.move_to_end(key)
+            return self.embeddings[key]
+
+        self.num_misses += 1
+        with torch.no_grad():
+            embeddings = encode(tokens).detach()
+        self.embeddings[key] = embeddings
+        while len(self.embeddings) > self.max_prompt_sets:
+            self.embeddings.popitem(last=False)
+        return embeddings
@@ -166,6 +166,10 @@ class InputAgnosticIdentity(nn.Module):
 
 
 class VisionRootReplacedBackbone(nn.Module):
+    # `transforms` leaves images in [0, 1]
+    image_mean = (0.0, 0.0, 0.0)
+    image_std = (1.0, 1.0, 1.0)
+
     def __init__(
         self,
         model: nn.Module,
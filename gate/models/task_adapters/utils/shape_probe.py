@@ -0,0 +1,116 @@
+import itertools
+import logging
+from typing import Any, Dict, List, Optional
+
+import torch
+import torch.nn as nn
+from torch.func import functional_call
+from torch.utils._pytree import tree_flatten, tree_map
+
+logger = logging.getLogger(__name__)
+
+
+def _to_meta(value: Any) -> Any:
+    if isinstance(value, torch.Tensor):
+        return value.to("meta")
+    return value
+
+
+def _input_device(*inputs: Any) -> torch.device:
+    leaves, _ = tree_flatten(inputs)
+    for leaf in leaves:
+        if isinstance(leaf, torch.Tensor) and leaf.device.type != "meta":
+            return leaf.device
+    return torch.device("cpu")
+
+
+def _reset(module: nn.Module) -> bool:
+    for name in ("reset_parameters", "_reset_parameters"):
+        reset = getattr(module, name, None)
+        if callable(reset):
+            reset()
+            return True
+    return False
+
+
+def materialize_meta_modules(
+    module: nn.Module, device: Optional[torch.device] = None
+) -> List[str]:
+    """
+    Allocate the parameters and buffers left on the meta device, by
+    modules created while probing, on `device`, and initialise them with
+    the `reset_parameters` of the module that owns them.
+
+    :param module: The module to materialize.
+    :param device: Where to allocate, defaults to the CPU.
+    :return: The names of the materialized submodules.
+    """
+    device = torch.device("cpu") if device is None else device
+    materialized = []
+    for name, submodule in module.named_modules():
+        tensors = itertools.chain(
+            nn.Module.parameters(submodule, recurse=False),
+            submodule.buffers(recurse=False),
+        )
+        if not any(tensor.is_meta for tensor in tensors):
+            continue
+
+        submodule.to_empty(device=device, recurse=False)
+        if not _reset(submodule):
+            raise RuntimeError(
+                f"Can't initialise {name} ({type(submodule).__name__}) "
+                f"after shape probing, it has no reset_parameters"
+            )
+        materialized.append(name)
+    return materialized
+
+
+class _MethodCall(nn.Module):
+    # lets functional_call, which only calls forward, call another method
+    def __init__(self, module: nn.Module, method: str):
+        super().__init__()
+        self.module = module
+        self.method = method
+
+    def forward(self, **inputs: Any) -> Any:
+        return getattr(self.module, self.method)(**inputs)
+
+
+def probe_on_meta_device(
+    module: nn.Module, inputs: Dict[str, Any], method: str = "forward"
+) -> Any:
+    """
+    🔍 Run a module on the meta device, where every op only computes the
+    shapes of its outputs. Nothing is allocated or computed, so probing is
+    cheap even for large encoders. Submodules that a forward pass builds
+    lazily, sized from the shapes it sees, are then materialized on the
+    device of the inputs, as if a real batch had gone through them.
+
+    :param module: The module to probe, its own weights are left as they
+    are.
+    :param inputs: The keyword arguments of the call.
+    :param method: The method of the module to call.
+    :return: The outputs of the call, as meta tensors.
+    """
+    device = _input_device(inputs)
+    # nn.Module's own methods, as adapters hide frozen encoder weights
+    meta_state = {
+        f"module.{name}": tensor.to("meta")
+        for name, tensor in itertools.chain(
+            nn.Module.named_parameters(module), module.named_buffers()
+        )
+    }
+    try:
+        with torch.device("meta"), torch.no_grad():
+            return functional_call(
+                _MethodCall(module, method),
+                meta_state,
+                (),
+                tree_map(_to_meta, inputs),
+                tie_weights=False,
+                strict=False,
+            )
+    finally:
+        materialized = materialize_meta_modules(module, device)
+        if materialized:
+            logger.debug(f"Materialized {materialized} on {device}")
@@ -6,9 +6,13 @@ import torch.nn as nn
 from accelerate import Accelerator
 
 from gate.boilerplate.decorators import configurable, ensemble_marker
-from gate.models.backbones import GATEncoder
+from gate.models.backbones import GATEncoder, OutputLayers
 from gate.models.core import SourceModalityConfig, TargetModalityConfig
 from gate.models.task_adapters import BaseAdapterModule
+from gate.models.task_adapters.utils.embedding_bank import (
+    TextEmbeddingBank,
+    parameters_version,
+)
 from gate.models.task_adapters.utils.helpers import (
     compute_zero_shot_loss_and_metrics,
     get_similarities,
@@ -33,6 +37,7 @@ class DuoModalZeroShotModel(BaseAdapterModule):
         head_identifier: Optional[str] = "features",
         freeze_encoder: bool = False,
         use_stem_instance_norm: bool = False,
+        use_text_embedding_bank: bool = False,
     ):
         super().__init__(
             freeze_encoder=freeze_encoder,
@@ -41,6 +46,12 @@ class DuoModalZeroShotModel(BaseAdapterModule):
         )
 
         self.head_identifier = head_identifier
+        # evaluation reuses the text embeddings of prompt sets it already
+        # encoded, for as long as the text parameters are unchanged. Only
+        # worth it for datasets with a fixed prompt set, e.g. class names:
+        # each lookup costs a copy of the prompts to the CPU and a hash
+        self.use_text_embedding_bank = use_text_embedding_bank
+        self.text_embedding_bank = TextEmbeddingBank()
 
         self.projection_num_features = projection_num_features
 
@@ -88,7 +99,7 @@ class DuoModalZeroShotModel(BaseAdapterModule):
                     torch.cuda.current_device()
                 )
 
-        _ = self(**dummy_batch)
+        _ = self.run_dummy_batch(dummy_batch)
 
     @ensemble_marker
     def compute_loss_and_metrics(self, logits, **kwargs):
@@ -101,12 +112,32 @@ class DuoModalZeroShotModel(BaseAdapterModule):
     def encoder_transforms(self):
         return self.encoder.get_transforms()
 
+    def encoder_output_layers(self) -> OutputLayers:
+        return "final"
+
     @property
     def modality_config(self):
         return TargetModalityConfig(
             image_text=[SourceModalityConfig(image=True, text=True)]
         )
 
+    def text_parameters(self) -> List[torch.Tensor]:
+        """
+        The parameters the text embeddings depend on, those of the whole
+        encoder unless it has a separate text encoder.
+        """
+        text_encoder = getattr(self.encoder, "text_embedding", self.encoder)
+        parameters = list(nn.Module.parameters(text_encoder))
+        if self.projection_num_features is not None:
+            parameters.extend(self.text_linear_projection.parameters())
+        return parameters
+
+    def encode_text(self, text: torch.Tensor) -> torch.Tensor:
+        text_features = self.encoder(text=text)["text"][self.head_identifier]
+        if self.projection_num_features is not None:
+            text_features = self.text_linear_projection(text_features)
+        return text_features
+
     def forward(
         self,
         image: Optional[torch.Tensor] = None,
@@ -148,13 +179,17 @@ class DuoModalZeroShotModel(BaseAdapterModule):
             ]
 
         if text is not None:
-            text_features = self.encoder(text=text)["text"][
-                self.head_identifier
-            ]
+            if self.use_text_embedding_bank and not self.training:
+                text_features = self.text_embedding_bank.lookup(
+                    text,
+                    version=parameters_version(self.text_parameters()),
+                    encode=self.encode_text,
+                )
+            else:
+                text_features = self.encode_text(text)
 
         if self.projection_num_features is not None:
             image_features = self.image_linear_projection(image_features)
-            text_features = self.text_linear_projection(text_features)
 
         similarities_dict = get_similarities(
             image_features=image_features,
@@ -10,12 +10,17 @@ from accelerate import Accelerator
 
 from gate.boilerplate.decorators import collect_metrics_mark
 from gate.boilerplate.utils import enrichen_logger
+from gate.orchestration.utils.metric_accumulator import MetricAccumulator
 
 logger = logging.getLogger(__name__)
 logger = enrichen_logger(logger)
 
 
 class Evaluator(ABC):
+    # Whether `step` calls model.forward exactly once per batch, on the
+    # batch as loaded, which replaying cached ensemble outputs relies on
+    forwards_once_per_batch: bool = True
+
     def __init__(
         self,
         experiment_tracker: Optional[Any] = None,
@@ -27,6 +32,7 @@ class Evaluator(ABC):
         super().__init__()
         self.current_epoch_dict = defaultdict(list)
         self.per_epoch_metrics = defaultdict(list)
+        self.metric_accumulator = MetricAccumulator(sync_every_n_steps=None)
         self.experiment_tracker = experiment_tracker
         self.starting_eval = True
         self.source_modality = source_modality
@@ -87,12 +93,23 @@ class Evaluator(ABC):
         else:
             return best_global_step[:kth_best], best_metric[:kth_best]
 
+    def compute_phase_metrics(self) -> Dict[str, torch.Tensor]:
+        # Metrics recorded through the accumulator are reduced on device and
+        # copied to the host once, anything still appended to
+        # current_epoch_dict is reduced as before
+        phase_metrics = self.metric_accumulator.epoch_metrics()
+        for key, value in self.current_epoch_dict.items():
+            phase_metrics[f"{key}-epoch-mean"] = torch.stack(value).mean()
+            phase_metrics[f"{key}-epoch-std"] = torch.stack(value).std()
+        return phase_metrics
+
     @collect_metrics_mark
     def start_validation(
         self,
         global_step: int,
     ):
         self.current_epoch_dict = defaultdict(list)
+        self.metric_accumulator.reset()
         self.starting_eval = True
 
         return EvaluatorOutput(
@@ -109,6 +126,7 @@ class Evaluator(ABC):
         prefix: Optional[str] = None,
     ):
         self.current_epoch_dict = defaultdict(list)
+        self.metric_accumulator.reset()
         self.starting_eval = True
 
         return EvaluatorOutput(
@@ -123,16 +141,9 @@ class Evaluator(ABC):
         self,
         global_step: int,
     ):
-        phase_metrics = {}
-        for key, value in self.current_epoch_dict.items():
-            phase_metrics[f"{key}-epoch-mean"] = torch.stack(value).mean()
-            phase_metrics[f"{key}-epoch-std"] = torch.stack(value).std()
-            self.per_epoch_metrics[f"{key}-epoch-mean"].append(
-                phase_metrics[f"{key}-epoch-mean"]
-            )
-            self.per_epoch_metrics[f"{key}-epoch-std"].append(
-                phase_metrics[f"{key}-epoch-std"]
-            )
+        phase_metrics = self.compute_phase_metrics()
+        for key, value in phase_metrics.items():
+            self.per_epoch_metrics[key].append(value)
 
         self.per_epoch_metrics["global_step"].append(global_step)
 
@@ -155,16 +166,9 @@ class Evaluator(ABC):
         else:
             prefix = f"{prefix}-"
 
-        phase_metrics = {}
-        for key, value in self.current_epoch_dict.items():
-            phase_metrics[f"{key}-epoch-mean"] = torch.stack(value).mean()
-            phase_metrics[f"{key}-epoch-std"] = torch.stack(value).std()
-            self.per_epoch_metrics[f"{key}-epoch-mean"].append(
-                phase_metrics[f"{key}-epoch-mean"]
-            )
-            self.per_epoch_metrics[f"{key}-epoch-std"].append(
-                phase_metrics[f"{key}-epoch-std"]
-            )
+        phase_metrics = self.compute_phase_metrics()
+        for key, value in phase_metrics.items():
+            self.per_epoch_metrics[key].append(value)
 
         self.per_epoch_metrics[f"{prefix}global_step"].append(global_step)
 
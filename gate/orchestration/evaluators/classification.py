@@ -42,7 +42,7 @@ class ClassificationEvaluator(Evaluator):
         for key, value in output_dict.items():
             if "loss" in key or "iou" in key or "accuracy" in key:
                 if isinstance(value, torch.Tensor):
-                    self.current_epoch_dict[key].append(value.detach().cpu())
+                    self.metric_accumulator.update(key, value)
 
     def step(self, model, batch, global_step, accelerator: Accelerator):
         output_dict = model.forward(batch)
@@ -50,11 +50,7 @@ class ClassificationEvaluator(Evaluator):
 
         loss = output_dict["loss"]
 
-        for key, value in output_dict.items():
-            if isinstance(value, torch.Tensor):
-                self.current_epoch_dict[key].append(
-                    value.detach().float().mean().cpu()
-                )
+        self.metric_accumulator.update_dict(output_dict)
 
         return StepOutput(
             metrics=output_dict,
@@ -151,11 +147,7 @@ class VideoClassificationEvaluator(ClassificationEvaluator):
 
         loss = output_dict["loss"]
 
-        for key, value in output_dict.items():
-            if isinstance(value, torch.Tensor):
-                self.current_epoch_dict[key].append(
-                    value.detach().float().mean().cpu()
-                )
+        self.metric_accumulator.update_dict(output_dict)
 
         output_dict = self.collect_video_episode(
             output_dict, global_step, batch
@@ -216,11 +208,7 @@ class ImageClassificationEvaluator(ClassificationEvaluator):
 
         loss = output_dict["loss"]
 
-        for key, value in output_dict.items():
-            if isinstance(value, torch.Tensor):
-                self.current_epoch_dict[key].append(
-                    value.detach().float().mean().cpu()
-                )
+        self.metric_accumulator.update_dict(output_dict)
 
         output_dict = self.collect_image_classification_episode(
             output_dict, global_step, batch
@@ -284,13 +272,11 @@ class MultiClassClassificationEvaluator(Evaluator):
         else:
             prefix = f"{prefix}-"
 
-        for key, value in self.current_epoch_dict.items():
-            if "labels" not in key and "logits" not in key:
-                phase_metrics[f"{key}-epoch-mean"] = torch.stack(value).mean()
-                phase_metrics[f"{key}-epoch-std"] = torch.stack(value).std()
+        phase_metrics.update(self.metric_accumulator.epoch_metrics())
 
-        labels = torch.cat(self.current_epoch_dict[f"{prefix}labels"]).detach()
-        logits = torch.cat(self.current_epoch_dict[f"{prefix}logits"]).detach()
+        # one device-to-host copy of the labels and logits of the epoch
+        labels = torch.cat(self.current_epoch_dict[f"{prefix}labels"]).cpu()
+        logits = torch.cat(self.current_epoch_dict[f"{prefix}logits"]).cpu()
         for metric_name, metric_fn in self.metrics.items():
             for c_idx, class_name in enumerate(self.label_idx_to_class_name):
                 phase_metrics[f"{class_name}-{metric_name}"] = metric_fn(
@@ -333,19 +319,16 @@ class MultiClassClassificationEvaluator(Evaluator):
         for c_idx, class_name in enumerate(self.label_idx_to_class_name):
             metrics[f"{prefix}{class_name}-loss"] = loss[:, c_idx].mean()
 
-        for key, value in metrics.items():
-            self.per_epoch_metrics.setdefault(f"{prefix}{key}", []).append(
-                value.detach().cpu()
-            )
+        self.metric_accumulator.update_dict(metrics)
 
         # we need to round the labels because they might be soft labels due to mixup/label smoothing
         self.current_epoch_dict.setdefault(f"{prefix}labels", []).append(
-            batch["labels"].cpu().round()
+            batch["labels"].detach().round()
         )
         self.current_epoch_dict.setdefault(f"{prefix}logits", []).append(
             output_dict[self.target_modality][self.source_modality]["logits"]
-            .cpu()
-            .sigmoid_()
+            .detach()
+            .sigmoid()
         )
 
     def step(
@@ -367,10 +350,8 @@ class MultiClassClassificationEvaluator(Evaluator):
                 batch["labels"],
                 reduction="none",
             )
-
-            logits = logits.detach().cpu()
             self.compute_step_metrics(
-                output_dict, batch, loss.detach().cpu(), prefix=prefix
+                output_dict, batch, loss.detach(), prefix=prefix
             )
             loss = loss.mean()
             output_dict = {
@@ -7,15 +7,13 @@ import torch.nn.functional as F
 from accelerate import Accelerator
 
 from gate.boilerplate.decorators import collect_metrics_mark, configurable
+from gate.boilerplate.micro_batching import MicroBatchExecutor
 from gate.orchestration.evaluators import EvaluatorOutput
 from gate.orchestration.evaluators.classification import (
     ClassificationEvaluator,
     StepOutput,
 )
-from gate.orchestration.trainers.segmentation import (
-    integrate_output_list,
-    sub_batch_generator,
-)
+from gate.orchestration.trainers.segmentation import integrate_output_list
 
 logger = logging.getLogger(__name__)
 
@@ -77,9 +75,7 @@ class ImageSemanticSegmentationEvaluator(ClassificationEvaluator):
         for key, value in output_dict.items():
             if "loss" in key or "iou" in key or "accuracy" in key:
                 if isinstance(value, torch.Tensor):
-                    self.current_epoch_dict[f"{prefix}{key}"].append(
-                        value.detach().float().mean().cpu()
-                    )
+                    self.metric_accumulator.update(f"{prefix}{key}", value)
 
         return StepOutput(
             metrics=output_dict,
@@ -174,6 +170,9 @@ class ImageSemanticSegmentationEvaluator(ClassificationEvaluator):
 
 @configurable(group="evaluator", name="medical_semantic_segmentation")
 class MedicalSemanticSegmentationEvaluator(ClassificationEvaluator):
+    # steps run the model on sub-batches of the flattened volumes
+    forwards_once_per_batch = False
+
     def __init__(
         self,
         experiment_tracker: Optional[Any] = None,
@@ -188,6 +187,8 @@ class MedicalSemanticSegmentationEvaluator(ClassificationEvaluator):
         )
         self.model = None
         self.sub_batch_size = sub_batch_size
+        # sub-batches shrink below sub_batch_size if they run out of memory
+        self.micro_batcher = MicroBatchExecutor(max_chunk_size=sub_batch_size)
 
     def collect_segmentation_episode(self, output_dict, global_step, batch):
         if "logits" in output_dict:
@@ -234,24 +235,35 @@ class MedicalSemanticSegmentationEvaluator(ClassificationEvaluator):
         else:
             prefix = f"{prefix}-"
 
-        output_list = []
-        for sub_batch in sub_batch_generator(batch, self.sub_batch_size):
+        losses = []
+
+        def step_sub_batch(sub_batch):
             output_dict = model.forward(sub_batch)
             output_dict = output_dict[self.target_modality][
                 self.source_modality
             ]
 
-            loss = output_dict["loss"]
+            losses.append(output_dict["loss"])
 
             for key, value in output_dict.items():
                 if "loss" in key or "iou" in key or "accuracy" in key:
                     if isinstance(value, torch.Tensor):
-                        self.current_epoch_dict[f"{prefix}{key}"].append(
-                            value.detach().float().mean().cpu()
-                        )
-            output_list.append(output_dict)
-
-        output_dict = integrate_output_list(output_list)
+                        self.metric_accumulator.update(f"{prefix}{key}", value)
+            return output_dict
+
+        # the volumes of the batch flattened into one batch of slices
+        flat_batch = {}
+        for key, value in batch.items():
+            if isinstance(value, list):
+                value = torch.stack(value)
+            flat_batch[key] = value.reshape(-1, *value.shape[2:])
+        output_dict = self.micro_batcher.run(
+            step_sub_batch,
+            flat_batch,
+            name=self.__class__.__name__,
+            combine=integrate_output_list,
+        )
+        loss = losses[-1]
         output_dict = self.collect_segmentation_episode(
             output_dict=output_dict, global_step=global_step, batch=batch
         )
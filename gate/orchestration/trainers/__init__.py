@@ -8,6 +8,7 @@ import wandb
 from accelerate import Accelerator
 
 from gate.boilerplate.decorators import collect_metrics_mark
+from gate.orchestration.utils.metric_accumulator import MetricAccumulator
 
 
 @dataclass
@@ -36,6 +37,7 @@ class Trainer(ABC):
         self.experiment_tracker = experiment_tracker
         self.current_epoch_dict = defaultdict(list)
         self.per_epoch_metrics = defaultdict(list)
+        self.metric_accumulator = MetricAccumulator()
         self.starting_train = True
         self.source_modality = source_modality
         self.target_modality = target_modality
@@ -80,6 +82,7 @@ class Trainer(ABC):
         global_step: int,
     ):
         self.current_epoch_dict = defaultdict(list)
+        self.metric_accumulator.reset()
         self.starting_train = True
         return TrainerOutput(
             opt_loss=None,
@@ -94,7 +97,7 @@ class Trainer(ABC):
         self,
         global_step: int,
     ):
-        phase_metrics = {}
+        phase_metrics = self.metric_accumulator.epoch_metrics()
 
         return TrainerOutput(
             opt_loss=None,
@@ -43,7 +43,7 @@ class ClassificationTrainer(Trainer):
         for key, value in output_dict.items():
             if "loss" in key or "iou" in key or "accuracy" in key:
                 if isinstance(value, torch.Tensor):
-                    self.current_epoch_dict[key].append(value.detach().cpu())
+                    self.metric_accumulator.update(key, value)
 
     def step(self, model, batch, global_step, accelerator: Accelerator):
         start_time = time.time()
@@ -288,13 +288,10 @@ class MultiClassClassificationTrainer(Trainer):
     def compute_epoch_metrics(
         self, phase_metrics: Dict[str, float], global_step: int
     ):
-        for key, value in self.current_epoch_dict.items():
-            if key not in ["labels", "logits"]:
-                phase_metrics[f"{key}-epoch-mean"] = torch.stack(value).mean()
-                phase_metrics[f"{key}-epoch-std"] = torch.stack(value).std()
+        phase_metrics.update(self.metric_accumulator.epoch_metrics())
 
-        labels = torch.cat(self.current_epoch_dict["labels"]).detach().cpu()
-        logits = torch.cat(self.current_epoch_dict["logits"]).detach().cpu()
+        labels = torch.cat(self.current_epoch_dict["labels"]).cpu()
+        logits = torch.cat(self.current_epoch_dict["logits"]).cpu()
         for metric_name, metric_fn in self.metrics.items():
             for c_idx, class_name in enumerate(self.label_idx_to_class_name):
                 if metric_name == "bs":
@@ -344,19 +341,18 @@ class MultiClassClassificationTrainer(Trainer):
         for c_idx, class_name in enumerate(self.label_idx_to_class_name):
             metrics[f"{class_name}-loss"] = loss[:, c_idx].mean()
 
-        for key, value in metrics.items():
-            if isinstance(value, torch.Tensor):
-                value = value.detach().cpu()
-                self.current_epoch_dict.setdefault(key, []).append(value)
+        self.metric_accumulator.update_dict(metrics)
 
         # we need to round the labels because they might be soft labels due to mixup/label smoothing
+        # kept on the device, compute_epoch_metrics copies them to the host
+        # once
         self.current_epoch_dict.setdefault("labels", []).append(
-            batch["labels"].cpu().round()
+            batch["labels"].detach().round()
         )
         self.current_epoch_dict.setdefault("logits", []).append(
             output_dict[self.target_modality][self.source_modality]["logits"]
-            .cpu()
-            .sigmoid_()
+            .detach()
+            .sigmoid()
         )
 
     def get_optimizer(self):
@@ -376,8 +372,7 @@ class MultiClassClassificationTrainer(Trainer):
                 batch["labels"],
                 reduction="none",
             )
-            logits = logits.detach().cpu()
-            self.compute_step_metrics(output_dict, batch, loss.detach().cpu())
+            self.compute_step_metrics(output_dict, batch, loss.detach())
             loss = loss.mean()
             output_dict = {
                 "loss": loss,
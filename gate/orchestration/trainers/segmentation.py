@@ -70,10 +70,7 @@ class ImageSemanticSegmentationTrainer(ClassificationTrainer):
 
             del output_dict["logits"]
 
-        for key, value in output_dict.items():
-            if "loss" in key or "iou" in key or "accuracy" in key:
-                if isinstance(value, torch.Tensor):
-                    self.current_epoch_dict[key].append(value.detach().cpu())
+        self.select_metrics_to_report(output_dict)
 
         return StepOutput(
             output_metrics_dict=output_dict
@@ -222,12 +219,7 @@ class MedicalSemanticSegmentationTrainer(ClassificationTrainer):
             accelerator.backward(loss)
             bprop_time = time.time() - start_time
 
-            for key, value in output_dict.items():
-                if "loss" in key or "iou" in key or "accuracy" in key:
-                    if isinstance(value, torch.Tensor):
-                        self.current_epoch_dict[key].append(
-                            value.detach().cpu()
-                        )
+            self.select_metrics_to_report(output_dict)
             yield StepOutput(
                 output_metrics_dict=output_dict
                 | {"fprop_time": fprop_time, "bprop_time": bprop_time},
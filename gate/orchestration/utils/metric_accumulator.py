@@ -0,0 +1,165 @@
+import logging
+from typing import Any, Dict, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class MetricAccumulator:
+    """
+    📊 Keeps running sums, sums of squares and counts of scalar metrics on
+    the device the metrics were computed on, so that recording a metric
+    never forces a host synchronisation.
+
+    Values only travel to the host in one batched copy, either every
+    `sync_every_n_steps` calls to `step`, which refreshes `latest` with the
+    means over the last window of steps, or when the epoch statistics are
+    requested at the end of a phase.
+
+    :param sync_every_n_steps: How often `step` copies the running sums to
+    the host. None disables periodic syncing.
+    """
+
+    def __init__(self, sync_every_n_steps: Optional[int] = 50):
+        self.sync_every_n_steps = sync_every_n_steps
+        self.reset()
+
+    def reset(self):
+        self._sum: Dict[str, torch.Tensor] = {}
+        self._sum_sq: Dict[str, torch.Tensor] = {}
+        self._count: Dict[str, int] = {}
+        self._synced_sum: Dict[str, float] = {}
+        self._synced_count: Dict[str, int] = {}
+        self.num_steps = 0
+        self.latest: Dict[str, float] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._sum
+
+    def __len__(self) -> int:
+        return len(self._sum)
+
+    def keys(self):
+        return self._sum.keys()
+
+    @staticmethod
+    def _accumulation_dtype(device: torch.device) -> torch.dtype:
+        # float64 keeps the sum of squares usable for long epochs, mps has
+        # no float64 support
+        return torch.float32 if device.type == "mps" else torch.float64
+
+    def update(self, key: str, value: Any):
+        """
+        Add one observation of `key`. Tensors with more than one element are
+        reduced to their mean first, as the per-step lists used to do.
+
+        :param key: The metric name.
+        :param value: A tensor or a python number.
+        """
+        if not isinstance(value, torch.Tensor):
+            value = torch.tensor(float(value))
+
+        value = value.detach()
+        if value.numel() != 1:
+            value = value.float().mean()
+
+        if key not in self._sum:
+            dtype = self._accumulation_dtype(value.device)
+            self._sum[key] = torch.zeros((), dtype=dtype, device=value.device)
+            self._sum_sq[key] = torch.zeros(
+                (), dtype=dtype, device=value.device
+            )
+            self._count[key] = 0
+
+        value = value.reshape(()).to(self._sum[key].dtype)
+        self._sum[key].add_(value)
+        self._sum_sq[key].addcmul_(value, value)
+        self._count[key] += 1
+
+    def update_dict(self, metrics: Dict[str, Any], prefix: str = ""):
+        """
+        Add every tensor in `metrics`, with its key prefixed by `prefix`.
+        """
+        for key, value in metrics.items():
+            if isinstance(value, torch.Tensor):
+                self.update(f"{prefix}{key}", value)
+
+    def _to_host(self, tensors: Dict[Any, torch.Tensor]) -> Dict[Any, Any]:
+        if len(tensors) == 0:
+            return {}
+        keys = list(tensors.keys())
+        device = tensors[keys[0]].device
+        # a single device-to-host copy for every key
+        host_values = torch.stack(
+            [tensors[key].to(device) for key in keys]
+        ).cpu()
+        return dict(zip(keys, host_values))
+
+    def step(self) -> bool:
+        """
+        Mark the end of a step and sync every `sync_every_n_steps` steps.
+
+        :return: Whether a host sync happened.
+        """
+        self.num_steps += 1
+        if (
+            self.sync_every_n_steps is None
+            or self.num_steps % self.sync_every_n_steps != 0
+        ):
+            return False
+
+        self.sync()
+        return True
+
+    def sync(self) -> Dict[str, float]:
+        """
+        Copy the running sums to the host and compute the mean of every
+        metric over the observations made since the previous sync.
+
+        :return: Those means, also stored in `latest`.
+        """
+        sums = self._to_host(self._sum)
+
+        for key, value in sums.items():
+            new_count = self._count[key] - self._synced_count.get(key, 0)
+            if new_count > 0:
+                new_sum = value.item() - self._synced_sum.get(key, 0.0)
+                self.latest[key] = new_sum / new_count
+            self._synced_sum[key] = value.item()
+            self._synced_count[key] = self._count[key]
+
+        return self.latest
+
+    def compute(self) -> Dict[str, Dict[str, torch.Tensor]]:
+        """
+        :return: The mean and (unbiased) std of every metric, as CPU
+        tensors, keyed by metric name.
+        """
+        host_values = self._to_host(
+            {("sum", key): value for key, value in self._sum.items()}
+            | {("sum_sq", key): value for key, value in self._sum_sq.items()}
+        )
+
+        stats = {}
+        for key, count in self._count.items():
+            mean = host_values[("sum", key)] / count
+            sum_sq = host_values[("sum_sq", key)]
+            # matches torch.std: nan for a single observation
+            variance = (sum_sq - count * mean * mean) / (count - 1)
+            stats[key] = {
+                "mean": mean.float(),
+                "std": variance.clamp(min=0).sqrt().float(),
+            }
+        return stats
+
+    def epoch_metrics(self) -> Dict[str, torch.Tensor]:
+        """
+        :return: The epoch statistics in the `{key}-epoch-mean` /
+        `{key}-epoch-std` layout used by trainers and evaluators.
+        """
+        phase_metrics = {}
+        for key, stats in self.compute().items():
+            phase_metrics[f"{key}-epoch-mean"] = stats["mean"]
+            phase_metrics[f"{key}-epoch-std"] = stats["std"]
+        return phase_metrics
@@ -3,6 +3,7 @@ from copy import copy, deepcopy
 from typing import Any, Callable, Optional
 
 from accelerate import Accelerator
+from accelerate.utils import DataLoaderConfiguration
 
 import wandb
 
@@ -14,6 +15,7 @@ os.environ["TORCH_DISTRIBUTED_DEBUG"] = "DETAIL"
 import logging
 
 import hydra
+from hydra.core.hydra_config import HydraConfig
 from hydra_zen import instantiate
 from omegaconf import OmegaConf
 from rich import print
@@ -27,6 +29,8 @@ from torch import nn
 import wandb
 from gate.boilerplate.callbacks import instantiate_callbacks
 from gate.boilerplate.convenience import (
+    attach_preprocessed_cache,
+    attach_quarantine,
     count_model_parameters,
     get_datasets,
     instantiate_dataloader,
@@ -34,6 +38,7 @@ from gate.boilerplate.convenience import (
     instantiate_scheduler,
     log_checkpoint_path,
     log_wandb_parameters,
+    match_batch_augmentation_normalization,
     setup,
 )
 from gate.boilerplate.core import Learner
@@ -88,7 +93,13 @@ def run(cfg: Any) -> None:
     Args:
         cfg (Any): The configuration parameters
     """
-    accelerator = Accelerator()
+    # With pinned batches (pin_memory), prepared dataloaders can copy the
+    # next batch to the device without blocking the step that is running
+    accelerator = Accelerator(
+        dataloader_config=DataLoaderConfiguration(
+            non_blocking=cfg.non_blocking_transfers
+        )
+    )
     # Pretty print the configuration
     print(pretty_config(cfg, resolve=True))
 
@@ -130,6 +141,42 @@ def run(cfg: Any) -> None:
     log_wandb_parameters(config_dict, global_step)
 
     dataset: GATEDataset = instantiate(cfg.dataset, transforms=transform)
+    dataset_name = HydraConfig.get().runtime.choices.get("dataset", "dataset")
+    attach_quarantine(
+        dataset, dataset_dir=cfg.dataset_dir, dataset_name=dataset_name
+    )
+    match_batch_augmentation_normalization(
+        dataset, getattr(encoder, "image_normalization", None)
+    )
+    if cfg.preprocessed_cache:
+        # the main process builds missing caches, the others then read them
+        with accelerator.main_process_first():
+            attach_preprocessed_cache(
+                dataset,
+                cache_dir=cfg.dataset_dir,
+                dataset_name=dataset_name,
+                image_size=getattr(encoder, "image_size", None),
+                num_workers=cfg.num_workers,
+            )
+    if cfg.cached_features:
+        from gate.data.feature_store import build_feature_datasets
+
+        # run the frozen encoder once per split, then train the head on
+        # the stored features
+        with accelerator.main_process_first():
+            dataset = build_feature_datasets(
+                task_adapted_model,
+                dataset,
+                cache_dir=cfg.dataset_dir,
+                dataset_name=dataset_name,
+                encoder_config=OmegaConf.to_container(
+                    cfg.encoder, resolve=True
+                ),
+                batch_size=cfg.eval_batch_size,
+                num_workers=cfg.num_workers,
+                device=accelerator.device,
+            )
+        task_adapted_model.enable_cached_features()
     train_dataset, val_dataset, test_dataset = get_datasets(
         dataset, global_step
     )
@@ -137,7 +184,11 @@ def run(cfg: Any) -> None:
     model.meta_data = val_dataset.meta_data
 
     train_dataloader = instantiate_dataloader(
-        cfg, train_dataset, cfg.train_batch_size, shuffle=True
+        cfg,
+        train_dataset,
+        cfg.train_batch_size,
+        shuffle=True,
+        global_step=global_step,
     )
     val_dataloader = instantiate_dataloader(
         cfg, val_dataset, cfg.eval_batch_size, shuffle=False
@@ -146,6 +197,12 @@ def run(cfg: Any) -> None:
         cfg, test_dataset, cfg.eval_batch_size, shuffle=False
     )
 
+    if cfg.compile_model:
+        from gate.models.compile import compile_gate_model
+
+        # after the feature caching, which runs the encoder eagerly
+        model = compile_gate_model(model)
+
     optimizer = instantiate_optimizer(cfg, model)
     scheduler = instantiate_scheduler(cfg, optimizer)
 
@@ -10,6 +10,7 @@ setup(
     author="Antreas Antoniou",
     author_email="iam@antreas.io",
     packages=find_packages(),
+    package_data={"gate": ["config/configurables_manifest.yaml"]},
     entry_points={
         "console_scripts": [
             "gate = gate.cli:main",
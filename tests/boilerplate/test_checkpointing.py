@@ -0,0 +1,196 @@
+import torch
+
+from gate.boilerplate.checkpointing import (
+    MODEL_FILENAME,
+    TRAINER_STATE_FILENAME,
+    AsyncCheckpointWriter,
+    CheckpointRetentionPolicy,
+    accept_unwrapped_state_dict,
+    capture_random_states,
+)
+
+
+def test_retention_policy_keeps_everything_by_default():
+    policy = CheckpointRetentionPolicy()
+    assert policy.select_steps_to_remove([1, 2, 3], {}) == []
+
+
+def test_retention_policy_keep_last_n():
+    policy = CheckpointRetentionPolicy(keep_last_n=2)
+    assert policy.select_steps_to_remove([10, 30, 20, 40], {}) == [10, 20]
+
+
+def test_retention_policy_keep_top_k_and_latest():
+    metric_by_step = {10: 0.9, 20: 0.1, 30: 0.5, 40: 0.2}
+
+    policy = CheckpointRetentionPolicy(keep_top_k=1, higher_is_better=True)
+    assert policy.select_steps_to_remove([10, 20, 30, 40], metric_by_step) == [
+        20,
+        30,
+    ]
+
+    policy = CheckpointRetentionPolicy(keep_top_k=1, higher_is_better=False)
+    assert policy.select_steps_to_remove([10, 20, 30, 40], metric_by_step) == [
+        10,
+        30,
+    ]
+
+
+def test_async_writer_commits_checkpoint(tmp_path):
+    writer = AsyncCheckpointWriter(
+        checkpoints_dir=tmp_path / "checkpoints",
+        staging_dir=tmp_path / "staging",
+    )
+    model = torch.nn.Linear(4, 2)
+
+    path = writer.save(
+        checkpoint_name="ckpt_1",
+        model_state=model.state_dict(),
+        trainer_state=dict(global_step=1),
+    )
+    # mutating the live weights must not leak into the pending write
+    with torch.no_grad():
+        model.weight.add_(1.0)
+    writer.wait()
+
+    assert writer.pop_completed() == [path]
+    assert writer.pop_completed() == []
+    assert list((tmp_path / "staging").iterdir()) == []
+
+    saved_state = torch.load(path / MODEL_FILENAME)
+    assert torch.allclose(saved_state["weight"], model.weight - 1.0)
+    assert torch.load(path / TRAINER_STATE_FILENAME)["global_step"] == 1
+
+
+def test_only_the_main_process_clears_staging(tmp_path):
+    leftover = tmp_path / "staging" / "ckpt_1"
+    leftover.mkdir(parents=True)
+
+    AsyncCheckpointWriter(
+        checkpoints_dir=tmp_path / "checkpoints",
+        staging_dir=tmp_path / "staging",
+        is_main_process=False,
+    )
+    assert leftover.exists()
+
+    AsyncCheckpointWriter(
+        checkpoints_dir=tmp_path / "checkpoints",
+        staging_dir=tmp_path / "staging",
+    )
+    assert not leftover.exists()
+    assert (tmp_path / "staging").exists()
+
+
+def test_async_writer_reuses_buffers_and_overwrites(tmp_path):
+    writer = AsyncCheckpointWriter(
+        checkpoints_dir=tmp_path / "checkpoints",
+        staging_dir=tmp_path / "staging",
+    )
+    model = torch.nn.Linear(4, 2)
+
+    writer.save("ckpt_1", model.state_dict(), dict(global_step=1))
+    buffer = writer._buffers["model/weight"]
+
+    with torch.no_grad():
+        model.weight.fill_(3.0)
+    path = writer.save(
+        "ckpt_1", model.state_dict(), dict(global_step=1), blocking=True
+    )
+
+    assert writer._buffers["model/weight"] is buffer
+    saved_state = torch.load(path / MODEL_FILENAME)
+    assert torch.all(saved_state["weight"] == 3.0)
+
+
+def test_async_writer_applies_retention(tmp_path):
+    writer = AsyncCheckpointWriter(
+        checkpoints_dir=tmp_path / "checkpoints",
+        staging_dir=tmp_path / "staging",
+        retention_policy=CheckpointRetentionPolicy(
+            keep_last_n=1, keep_top_k=1
+        ),
+    )
+    model = torch.nn.Linear(4, 2)
+    metric_by_step = {}
+
+    for step, metric in zip([1, 2, 3, 4], [0.2, 0.9, 0.3, 0.1]):
+        metric_by_step[step] = metric
+        writer.save(f"ckpt_{step}", model.state_dict(), dict(global_step=step))
+        writer.wait()
+        writer.pop_completed()
+        writer.apply_retention(metric_by_step)
+
+    remaining = sorted(
+        path.name for path in (tmp_path / "checkpoints").iterdir()
+    )
+    assert remaining == ["ckpt_2", "ckpt_4"]
+
+
+def test_async_writer_retention_keeps_undispatched_and_protected(tmp_path):
+    writer = AsyncCheckpointWriter(
+        checkpoints_dir=tmp_path / "checkpoints",
+        staging_dir=tmp_path / "staging",
+        retention_policy=CheckpointRetentionPolicy(keep_last_n=1),
+    )
+    model = torch.nn.Linear(4, 2)
+
+    uploading = writer.save("ckpt_1", model.state_dict(), {}, blocking=True)
+    writer.pop_completed()
+    # ckpt_2 is committed but its callbacks have not fired yet
+    writer.save("ckpt_2", model.state_dict(), {}, blocking=True)
+    writer.save("ckpt_3", model.state_dict(), {}, blocking=True)
+    writer.apply_retention({}, protected_paths=[uploading])
+
+    remaining = sorted(
+        path.name for path in (tmp_path / "checkpoints").iterdir()
+    )
+    assert remaining == ["ckpt_1", "ckpt_2", "ckpt_3"]
+
+    writer.pop_completed()
+    writer.apply_retention({})
+    remaining = sorted(
+        path.name for path in (tmp_path / "checkpoints").iterdir()
+    )
+    assert remaining == ["ckpt_3"]
+
+
+def test_async_writer_writes_random_states_of_every_process(tmp_path):
+    writer = AsyncCheckpointWriter(
+        checkpoints_dir=tmp_path / "checkpoints",
+        staging_dir=tmp_path / "staging",
+    )
+    random_states = [capture_random_states(step=idx) for idx in range(2)]
+
+    path = writer.save(
+        "ckpt_1",
+        torch.nn.Linear(4, 2).state_dict(),
+        {},
+        random_states=random_states,
+        blocking=True,
+    )
+
+    for process_index in range(2):
+        states = torch.load(
+            path / f"random_states_{process_index}.pkl", weights_only=False
+        )
+        assert states["step"] == process_index
+
+
+class Wrapper(torch.nn.Module):
+    # the module layout of DistributedDataParallel
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+
+
+def test_wrapped_model_loads_unwrapped_state_dict():
+    model = torch.nn.Linear(4, 2)
+    wrapped = Wrapper(torch.nn.Linear(4, 2))
+    accept_unwrapped_state_dict(wrapped)
+
+    wrapped.load_state_dict(model.state_dict())
+    assert torch.equal(wrapped.module.weight, model.weight)
+
+    # prefixed state dicts, as accelerate writes them, still load
+    wrapped.load_state_dict(Wrapper(model).state_dict())
+    assert torch.equal(wrapped.module.bias, model.bias)
@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+import torch
+
+from gate.boilerplate.decorators import (
+    MetricsLoggingWorker,
+    collect_metrics,
+    configure_metrics_logging,
+    flush_metrics_logging,
+)
+
+
+class RecordingTracker:
+    def __init__(self, release: threading.Event = None):
+        self.calls = []
+        self.release = release
+
+    def log(self, log_dict):
+        if self.release is not None:
+            self.release.wait()
+        self.calls.append(log_dict)
+
+
+def test_worker_coalesces_metrics_per_phase_and_step():
+    tracker = RecordingTracker()
+    worker = MetricsLoggingWorker(flush_interval=60.0, max_pending_steps=100)
+    worker.start()
+
+    worker.submit(tracker, "training", 1, {"loss": torch.tensor(1.0)})
+    worker.submit(tracker, "training", 1, {"accuracy": torch.tensor(0.5)})
+    worker.submit(tracker, "training", 2, {"loss": torch.tensor(0.5)})
+    worker.submit(tracker, "validation", 2, {"loss": torch.tensor(0.7)})
+    assert worker.flush(timeout=10)
+
+    assert len(tracker.calls) == 3
+    assert tracker.calls[0].keys() == {
+        "global_step",
+        "training/loss",
+        "training/accuracy",
+    }
+    assert tracker.calls[0]["global_step"] == 1
+    assert tracker.calls[2]["validation/loss"] == torch.tensor(0.7)
+
+    worker.stop(timeout=10)
+    assert not worker.is_alive()
+
+
+def test_worker_sends_when_enough_steps_are_pending():
+    tracker = RecordingTracker()
+    worker = MetricsLoggingWorker(flush_interval=60.0, max_pending_steps=2)
+    worker.start()
+
+    for step in range(4):
+        worker.submit(tracker, "training", step, {"loss": step})
+    worker.flush(timeout=10)
+
+    assert [call["global_step"] for call in tracker.calls] == [0, 1, 2, 3]
+    worker.stop(timeout=10)
+
+
+def test_worker_drops_when_full():
+    release = threading.Event()
+    tracker = RecordingTracker(release=release)
+    worker = MetricsLoggingWorker(
+        max_queue_size=1,
+        flush_interval=60.0,
+        max_pending_steps=1,
+        when_full="drop",
+    )
+    worker.start()
+
+    # the first submission is picked up and blocks inside tracker.log
+    worker.submit(tracker, "training", 0, {"loss": 0})
+    while worker.queue.qsize() > 0:
+        pass
+    accepted = [
+        worker.submit(tracker, "training", step, {"loss": step})
+        for step in range(1, 5)
+    ]
+    release.set()
+    worker.flush(timeout=10)
+
+    assert accepted[0] is True
+    assert not all(accepted)
+    assert worker.num_dropped == accepted.count(False)
+    worker.stop(timeout=10)
+
+
+def test_invalid_policy_is_rejected():
+    with pytest.raises(ValueError):
+        MetricsLoggingWorker(when_full="sometimes")
+    with pytest.raises(ValueError):
+        configure_metrics_logging(when_full="sometimes")
+
+
+def test_collect_metrics_uses_shared_worker():
+    configure_metrics_logging(flush_interval=60.0)
+    tracker = RecordingTracker()
+
+    for phase_name in ["training", "training", "validation"]:
+        collect_metrics(
+            metrics_dict={"loss": torch.tensor(1.0), "skipped": None},
+            phase_name=phase_name,
+            experiment_tracker=tracker,
+            global_step=3,
+        )
+    assert flush_metrics_logging(timeout=10)
+
+    assert tracker.calls == [
+        {"global_step": 3, "training/loss": torch.tensor(1.0)},
+        {"global_step": 3, "validation/loss": torch.tensor(1.0)},
+    ]
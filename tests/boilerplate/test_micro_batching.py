@@ -0,0 +1,118 @@
+import pytest
+import torch
+
+from gate.boilerplate.micro_batching import (
+    MemoryBudget,
+    MicroBatchExecutor,
+    concatenate_outputs,
+    shape_key,
+)
+
+
+class CountingFunction:
+    def __init__(self):
+        self.chunk_sizes = []
+
+    def __call__(self, batch):
+        self.chunk_sizes.append(batch["image"].shape[0])
+        return {
+            "features": batch["image"].flatten(1).sum(dim=1),
+            "labels": batch["labels"] * 2,
+        }
+
+
+def make_batch(batch_size):
+    return {
+        "image": torch.randn(batch_size, 3, 8, 8),
+        "labels": torch.arange(batch_size),
+    }
+
+
+def test_outputs_match_the_unchunked_outputs():
+    batch = make_batch(13)
+    fn = CountingFunction()
+    executor = MicroBatchExecutor(
+        memory_budget=MemoryBudget(max_bytes=4, bytes_per_sample=1)
+    )
+
+    output = executor.run(fn, batch, name="counting")
+    expected = CountingFunction()(batch)
+
+    for key, value in expected.items():
+        assert torch.allclose(output[key], value)
+    # only the chunks that ran out of memory are retried: 13 -> 6 -> 3
+    assert fn.chunk_sizes == [3, 3, 3, 3, 1]
+
+
+def test_non_tensor_outputs_are_kept_for_every_chunk():
+    outputs = [
+        {"logits": torch.ones(2, 3), "name": "first", "mask": None},
+        {"logits": torch.zeros(1, 3), "name": "second", "mask": None},
+    ]
+    output = concatenate_outputs(outputs)
+
+    assert output["logits"].shape == (3, 3)
+    assert output["name"] == ["first", "second"]
+    assert output["mask"] is None
+
+
+def test_learned_chunk_size_is_reused():
+    fn = CountingFunction()
+    executor = MicroBatchExecutor(
+        memory_budget=MemoryBudget(max_bytes=4, bytes_per_sample=1)
+    )
+    executor.run(fn, make_batch(13), name="counting")
+    fn.chunk_sizes.clear()
+
+    executor.run(fn, make_batch(8), name="counting")
+
+    assert fn.chunk_sizes == [3, 3, 2]
+    # a new per-sample shape starts from the whole batch again
+    fn.chunk_sizes.clear()
+    executor.run(
+        lambda batch: fn({"image": batch, "labels": batch}),
+        torch.randn(4, 3, 4, 4),
+        name="counting",
+    )
+    assert fn.chunk_sizes == [4]
+
+
+def test_learned_chunk_sizes_persist(tmp_path):
+    state_path = tmp_path / "chunk_sizes.json"
+    batch = make_batch(16)
+    MicroBatchExecutor(
+        memory_budget=MemoryBudget(max_bytes=5, bytes_per_sample=1),
+        state_path=state_path,
+    ).run(CountingFunction(), batch, name="counting")
+
+    fn = CountingFunction()
+    MicroBatchExecutor(state_path=state_path).run(fn, batch, name="counting")
+
+    assert fn.chunk_sizes == [4, 4, 4, 4]
+    assert shape_key("counting", batch) in state_path.read_text()
+
+
+def test_max_chunk_size_caps_the_chunks():
+    fn = CountingFunction()
+    MicroBatchExecutor(max_chunk_size=5).run(
+        fn, make_batch(12), name="counting"
+    )
+    assert fn.chunk_sizes == [5, 5, 2]
+
+
+def test_other_errors_propagate():
+    def failing(batch):
+        raise ValueError("not a memory error")
+
+    executor = MicroBatchExecutor()
+    with pytest.raises(ValueError):
+        executor.run(failing, make_batch(4), name="failing")
+    assert executor.chunk_sizes == {}
+
+
+def test_out_of_memory_with_one_sample_is_raised():
+    executor = MicroBatchExecutor(
+        memory_budget=MemoryBudget(max_bytes=1, bytes_per_sample=2)
+    )
+    with pytest.raises(torch.cuda.OutOfMemoryError):
+        executor.run(CountingFunction(), make_batch(4), name="counting")
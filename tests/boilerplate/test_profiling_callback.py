@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from gate.boilerplate.callbacks import ProfilingCallback, get_batch_size
+
+
+def build_experiment(tmp_path):
+    model = nn.Sequential(nn.Linear(8, 16), nn.ReLU(), nn.Linear(16, 2))
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    experiment = SimpleNamespace(
+        model=model,
+        trainer=SimpleNamespace(optimizer=optimizer, experiment_tracker=None),
+        global_step=0,
+        experiment_dir=tmp_path,
+    )
+    return experiment, model, optimizer
+
+
+def run_training_step(callback, experiment, model, optimizer):
+    batch = {"image": torch.randn(4, 8), "labels": torch.randint(0, 2, (4,))}
+    callback.on_data_wait_start("training")
+    callback.on_data_wait_end("training", batch)
+
+    callback.on_training_step_start(model, batch)
+    optimizer.zero_grad()
+    loss = F.cross_entropy(model(batch["image"]), batch["labels"])
+    loss.backward()
+    optimizer.step()
+    callback.on_training_step_end(model, batch)
+    experiment.global_step += 1
+
+
+def test_get_batch_size():
+    assert (
+        get_batch_size({"text": ["a", "b"], "image": torch.zeros(3, 2)}) == 3
+    )
+    assert get_batch_size([{"x": torch.zeros(5)}]) == 5
+    assert get_batch_size({"name": "no tensors"}) == 0
+
+
+def test_profiling_callback_splits_training_step(tmp_path):
+    experiment, model, optimizer = build_experiment(tmp_path)
+    callback = ProfilingCallback(log_every_n_steps=None, synchronize=False)
+    callback.on_init_end(experiment, model)
+    callback.on_train_start(experiment, model)
+
+    for _ in range(3):
+        run_training_step(callback, experiment, model, optimizer)
+
+    summary = callback.summarize("training")
+    for key in [
+        "data_wait_time",
+        "step_time",
+        "forward_time",
+        "backward_time",
+        "optimizer_time",
+        "samples_per_sec",
+        "peak_memory_mb",
+    ]:
+        assert summary[key] >= 0, key
+
+    assert callback.totals["training"]["num_steps"] == 3
+    assert callback.totals["training"]["num_samples"] == 12
+    assert summary["forward_time"] > 0
+    assert summary["optimizer_time"] > 0
+    assert (
+        summary["forward_time"]
+        + summary["backward_time"]
+        + summary["optimizer_time"]
+        <= summary["step_time"]
+    )
+
+
+def test_profiling_callback_ignores_evaluation_forward(tmp_path):
+    experiment, model, optimizer = build_experiment(tmp_path)
+    callback = ProfilingCallback(log_every_n_steps=None, synchronize=False)
+    callback.on_init_end(experiment, model)
+
+    callback.on_testing_start(experiment, model)
+    batch = {"image": torch.randn(6, 8)}
+    callback.on_testing_step_start(model, batch)
+    with torch.no_grad():
+        model(batch["image"])
+    callback.on_testing_step_end(model, batch)
+
+    assert callback.totals["training"]["forward_time"] == 0
+    assert callback.totals["testing"]["num_steps"] == 1
+    assert "forward_time" not in callback.summarize("testing")
+
+
+def test_profiling_callback_writes_trace_for_window(tmp_path):
+    experiment, model, optimizer = build_experiment(tmp_path)
+    callback = ProfilingCallback(
+        log_every_n_steps=None, profiler_windows=[[1, 2]], synchronize=False
+    )
+    experiment.accelerator = SimpleNamespace(process_index=1)
+    callback.on_init_end(experiment, model)
+    callback.on_train_start(experiment, model)
+
+    for _ in range(4):
+        run_training_step(callback, experiment, model, optimizer)
+
+    assert callback.profiler is None
+    assert (tmp_path / "profiler" / "trace_steps_1_2_process_1.json").exists()
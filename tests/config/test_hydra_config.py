@@ -16,3 +16,24 @@ def test_collect_config_store():
 
         # Print the configuration
         print(pretty_config(cfg, resolve=True))
+
+
+def test_dataloader_takes_the_top_level_worker_options():
+    collect_config_store()
+
+    with initialize(config_path=None, job_name="config"):
+        cfg = compose(
+            config_name="config",
+            overrides=[
+                "encoder=timm",
+                "pin_memory=false",
+                "prefetch_factor=4",
+                "persistent_workers=true",
+            ],
+        )
+
+        assert cfg.dataloader.pin_memory is False
+        assert cfg.dataloader.prefetch_factor == 4
+        assert cfg.dataloader.persistent_workers is True
+        # unpinned batches cannot be copied without blocking
+        assert cfg.non_blocking_transfers is False
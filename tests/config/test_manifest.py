@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+
+from gate.config.manifest import build_manifest, load_manifest
+
+LAZY_REGISTRATION_SCRIPT = """
+import sys
+from hydra.core.config_store import ConfigStore
+from hydra_zen import instantiate
+from gate.config.manifest import load_manifest, register_manifest
+
+register_manifest(load_manifest())
+config = ConfigStore.instance().load("dataset/food101.yaml")
+assert config.node["_target_"].startswith("gate.data.image.classification")
+assert "gate.data.image.classification.food101" not in sys.modules
+assert "gate.dummy_module" not in sys.modules
+
+config = ConfigStore.instance().load("test_group/test_function.yaml")
+assert instantiate(config.node) == 3
+assert "gate.dummy_module" in sys.modules
+"""
+
+ENV_DEFAULTS_SCRIPT = """
+import importlib
+from hydra.core.config_store import ConfigStore
+from omegaconf import OmegaConf
+from gate.config.manifest import load_manifest, register_manifest
+
+register_manifest(load_manifest())
+for name in ["food101", "mixture"]:
+    node = ConfigStore.instance().load(f"dataset/{name}.yaml").node
+    module_name, function_name = node["_target_"].rsplit(".", 1)
+    function = getattr(importlib.import_module(module_name), function_name)
+    eager_node = OmegaConf.to_container(
+        OmegaConf.structured(function.__config__(populate_full_signature=True))
+    )
+    assert node["data_dir"] == "/tmp/gate-datasets", node
+    assert OmegaConf.to_container(OmegaConf.create(node)) == eager_node
+"""
+
+
+def test_manifest_matches_the_decorated_functions():
+    manifest = load_manifest()
+    assert manifest is not None, (
+        "Missing configurables manifest, run "
+        "`python -m gate.config.manifest`"
+    )
+    current = build_manifest("gate", skip_unimportable=True)
+
+    # modules listed as unimportable must not import cleanly here
+    importable = [
+        module_name
+        for module_name in manifest["unimported_modules"]
+        if module_name not in current["unimported_modules"]
+    ]
+    assert not importable, (
+        f"{importable} import cleanly but are missing from the manifest, "
+        f"run `python -m gate.config.manifest`"
+    )
+
+    stored = {
+        (entry["group"], entry["name"]): entry
+        for entry in manifest["configurables"]
+    }
+    for entry in current["configurables"]:
+        key = (entry["group"], entry["name"])
+        assert key in stored, (
+            f"{key} is missing from the manifest, run "
+            f"`python -m gate.config.manifest`"
+        )
+        assert stored.pop(key) == entry, (
+            f"{key} is stale in the manifest, run "
+            f"`python -m gate.config.manifest`"
+        )
+
+    # what is left must come from modules this environment cannot import
+    for key, entry in stored.items():
+        module_name = entry["target"].rsplit(".", 1)[0]
+        assert any(
+            module_name.startswith(unimported)
+            for unimported in current["unimported_modules"]
+        ), f"{key} no longer exists, run `python -m gate.config.manifest`"
+
+
+def test_manifest_registration_does_not_import_targets():
+    subprocess.run(
+        [sys.executable, "-c", LAZY_REGISTRATION_SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_manifest_registration_reads_env_derived_defaults():
+    subprocess.run(
+        [sys.executable, "-c", ENV_DEFAULTS_SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "DATASET_DIR": "/tmp/gate-datasets"},
+    )
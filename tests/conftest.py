@@ -0,0 +1,98 @@
+import pytest
+import torch
+import torch.nn as nn
+
+from gate.models.backbones import GATEncoder
+
+
+class TinyEncoder(GATEncoder):
+    """
+    A small GATEncoder for adapter tests. Images and videos go through a
+    strided convolution and text through an embedding, with
+    `num_features` features for every modality. Like GATE's image-text
+    encoders, it keeps its text model as `text_embedding`, which can be
+    swapped for a transformers text model whose pooled output then
+    becomes the text features. Likewise, the convolution can be swapped
+    for a timm model that returns its unpooled tokens (`num_classes=0,
+    global_pool=""`).
+    """
+
+    def __init__(self, num_features: int = 16):
+        super().__init__()
+        self.num_features = num_features
+        self.conv = nn.Conv2d(3, num_features, kernel_size=4, stride=4)
+        self.text_embedding = nn.Embedding(128, num_features)
+        # calls on real (not meta) inputs, in total and with text; calls
+        # under torch.compile are not counted, since dynamo would guard on
+        # the counts and recompile every call
+        self.num_calls = 0
+        self.num_text_calls = 0
+
+    @property
+    def image_shape(self):
+        return (16, 16)
+
+    @property
+    def num_in_features_image(self):
+        return self.num_features
+
+    @property
+    def num_in_features_text(self):
+        return self.num_features
+
+    @property
+    def num_in_features_video(self):
+        return self.num_features
+
+    @property
+    def num_raw_features_image(self):
+        return self.num_features
+
+    @property
+    def num_raw_features_text(self):
+        return self.num_features
+
+    def init_weights(self):
+        pass
+
+    def _outputs(self, raw, features=None):
+        return {
+            "features": raw.mean(dim=1) if features is None else features,
+            "raw_features": raw,
+            "per_layer_raw_features": [raw, raw * 2],
+        }
+
+    def _tokens(self, x):
+        raw = self.conv(x)
+        # a swapped-in timm model already returns (B, N, C) tokens
+        return raw.flatten(2).transpose(1, 2) if raw.dim() == 4 else raw
+
+    def forward(self, image=None, text=None, video=None, **kwargs):
+        inputs = [x for x in (image, text, video) if x is not None]
+        if not torch.compiler.is_compiling() and not any(
+            x.is_meta for x in inputs
+        ):
+            self.num_calls += 1
+            self.num_text_calls += int(text is not None)
+
+        output = {}
+        if image is not None:
+            output["image"] = self._outputs(self._tokens(image))
+        if text is not None:
+            text_output = self.text_embedding(text)
+            if isinstance(text_output, torch.Tensor):
+                output["text"] = self._outputs(text_output)
+            else:
+                output["text"] = self._outputs(
+                    text_output.last_hidden_state,
+                    features=text_output.pooler_output,
+                )
+        if video is not None:
+            output["video"] = self._outputs(self._tokens(video))
+        return output
+
+
+@pytest.fixture
+def tiny_encoder():
+    """The TinyEncoder class, to build as many encoders as a test needs."""
+    return TinyEncoder
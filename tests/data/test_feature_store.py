@@ -0,0 +1,127 @@
+import pytest
+import torch
+
+from gate.data.core import GATEDataset
+from gate.data.feature_store import (
+    FeatureStore,
+    build_feature_datasets,
+    feature_store_key,
+)
+from gate.models.task_adapters.standard_classification import (
+    BackboneWithLinearClassification,
+)
+
+
+class ImageDataset(torch.utils.data.Dataset):
+    def __init__(self, size):
+        generator = torch.Generator().manual_seed(0)
+        self.images = torch.rand(size, 3, 8, 8, generator=generator)
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, index):
+        return {"image": self.images[index], "labels": torch.tensor(index % 4)}
+
+
+def add_noise(item):
+    return {**item, "image": item["image"] + torch.randn(3, 8, 8)}
+
+
+def build_adapter(tiny_encoder, freeze_encoder=True):
+    return BackboneWithLinearClassification(
+        encoder=tiny_encoder(),
+        num_classes=4,
+        freeze_encoder=freeze_encoder,
+        use_stem_instance_norm=True,
+    )
+
+
+def test_feature_store_round_trips_across_shards(tmp_path):
+    store = FeatureStore(tmp_path, key="key", split="train", shard_size=3)
+    batches = [
+        {
+            "image": {
+                "features": torch.arange(4 * 2).view(4, 2).float(),
+                "per_layer": [torch.ones(4, 2), torch.zeros(4, 2)],
+            },
+            "labels": torch.arange(4),
+            "name": ["a", "b", "c", "d"],
+        },
+        {
+            "image": {
+                "features": torch.arange(8, 14).view(3, 2).float(),
+                "per_layer": [torch.ones(3, 2), torch.zeros(3, 2)],
+            },
+            "labels": torch.arange(4, 7),
+            "name": ["e", "f", "g"],
+        },
+    ]
+    store.write(batches)
+
+    assert store.is_built and len(store) == 7
+    assert store.meta["num_shards"] == 3
+    sample = store[4]
+    assert torch.equal(sample["image"]["features"], torch.tensor([8.0, 9.0]))
+    assert len(sample["image"]["per_layer"]) == 2
+    assert sample["labels"].item() == 4
+    assert sample["name"] == "e"
+    with pytest.raises(IndexError):
+        store[7]
+
+
+def test_feature_store_key_follows_the_encoder():
+    keys = {"image": ["features"]}
+    assert feature_store_key({"name": "a"}, "food101", keys) != (
+        feature_store_key({"name": "b"}, "food101", keys)
+    )
+    assert feature_store_key({"name": "a"}, "food101", keys) != (
+        feature_store_key({"name": "a"}, "food101", {"image": ["raw"]})
+    )
+
+
+def test_head_trains_from_stored_features(tmp_path, tiny_encoder):
+    adapter = build_adapter(tiny_encoder)
+    adapter.eval()
+    raw = ImageDataset(size=10)
+    dataset_dict = {
+        "train": GATEDataset(
+            raw, infinite_sampling=True, transforms=add_noise
+        ),
+        "val": GATEDataset(raw),
+    }
+
+    feature_dict = build_feature_datasets(
+        adapter,
+        dataset_dict,
+        cache_dir=tmp_path,
+        dataset_name="tiny",
+        encoder_config={"name": "tiny"},
+        batch_size=4,
+        num_workers=0,
+    )
+    adapter.enable_cached_features()
+    assert feature_dict["train"].infinite_sampling
+    assert len(feature_dict["val"]) == 10
+
+    # the training features come from the non-augmented images
+    sample = feature_dict["train"][3]
+    images = raw.images[3:4]
+    adapter.use_cached_features = False
+    adapter.use_stem_instance_norm = True
+    expected = adapter(image=images)["logits"]
+    adapter.use_cached_features = True
+    adapter.use_stem_instance_norm = False
+
+    num_calls = adapter.encoder.num_calls
+    features = {"features": sample["image"]["features"].unsqueeze(0)}
+    output = adapter(image=features, labels=sample["labels"].unsqueeze(0))
+    assert adapter.encoder.num_calls == num_calls
+    assert torch.allclose(output["logits"], expected, atol=1e-2)
+    assert "loss" in output
+
+
+def test_cached_features_need_a_frozen_encoder(tmp_path, tiny_encoder):
+    adapter = build_adapter(tiny_encoder, freeze_encoder=False)
+    with pytest.raises(ValueError):
+        adapter.enable_cached_features()
@@ -0,0 +1,84 @@
+import itertools
+from types import SimpleNamespace
+
+import torch
+
+from gate.boilerplate.core import Learner
+from gate.data.core import InfiniteSampler
+from gate.data.quarantine import QuarantineIndex, QuarantineSampler
+
+
+def take(sampler, n):
+    return list(itertools.islice(iter(sampler), n))
+
+
+def test_infinite_sampler_covers_every_epoch():
+    sampler = InfiniteSampler(dataset_size=10, shuffle=True, seed=42)
+    indices = take(sampler, 30)
+
+    for epoch in range(3):
+        epoch_indices = indices[epoch * 10 : (epoch + 1) * 10]
+        assert sorted(epoch_indices) == list(range(10))
+
+    # successive epochs are drawn with different permutations
+    assert indices[:10] != indices[10:20]
+
+
+def test_infinite_sampler_is_deterministic_under_seed():
+    first = take(InfiniteSampler(dataset_size=17, seed=3), 50)
+    second = take(InfiniteSampler(dataset_size=17, seed=3), 50)
+    other = take(InfiniteSampler(dataset_size=17, seed=4), 50)
+
+    assert first == second
+    assert first != other
+
+
+def test_infinite_sampler_resumes_from_start_index():
+    full_stream = take(InfiniteSampler(dataset_size=13, seed=0), 100)
+
+    for start_index in [0, 5, 13, 27, 64]:
+        resumed = InfiniteSampler(
+            dataset_size=13, seed=0, start_index=start_index
+        )
+        assert take(resumed, 100 - start_index) == full_stream[start_index:]
+
+
+def test_infinite_sampler_without_shuffle():
+    sampler = InfiniteSampler(dataset_size=4, shuffle=False, start_index=2)
+    assert take(sampler, 6) == [2, 3, 0, 1, 2, 3]
+
+
+def test_infinite_sampler_with_dataloader():
+    dataset = torch.arange(7)
+    sampler = InfiniteSampler(dataset_size=len(dataset), seed=1)
+    dataloader = torch.utils.data.DataLoader(
+        dataset, batch_size=3, sampler=sampler
+    )
+
+    batches = list(itertools.islice(iter(dataloader), 5))
+    assert all(batch.shape == (3,) for batch in batches)
+    assert sorted(torch.cat(batches)[:7].tolist()) == list(range(7))
+
+
+def test_learner_resumes_quarantined_sampler_across_processes(tmp_path):
+    sampler = InfiniteSampler(dataset_size=100, seed=0)
+    dataloader = torch.utils.data.DataLoader(
+        torch.arange(100),
+        batch_size=4,
+        sampler=QuarantineSampler(
+            sampler,
+            QuarantineIndex.for_split(tmp_path, "flaky", "train"),
+            dataset_size=100,
+        ),
+    )
+    learner = SimpleNamespace(
+        train_dataloader=dataloader,
+        global_step=10,
+        accelerator=SimpleNamespace(num_processes=2),
+    )
+    learner.samples_per_step = lambda: Learner.samples_per_step(learner)
+
+    Learner.resume_train_sampler(learner)
+
+    # 10 steps of 4 samples on each of 2 processes
+    assert sampler.start_index == 80
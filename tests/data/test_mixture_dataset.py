@@ -0,0 +1,180 @@
+import itertools
+from collections import Counter
+
+import pytest
+import torch
+from hydra.core.config_store import ConfigStore
+from hydra_zen import builds, instantiate
+
+from gate.data.core import (
+    GATEDataset,
+    MixtureDataset,
+    MixtureSampler,
+    find_mixture_sampler,
+    mix_datasets,
+)
+from gate.data.mixture import build_gate_dataset as build_mixture_dataset
+
+
+def build_mixture(**kwargs):
+    datasets = [
+        [("a", idx) for idx in range(3)],
+        [("b", idx) for idx in range(10)],
+        [("c", idx) for idx in range(1)],
+    ]
+    return MixtureDataset(datasets, names=["a", "b", "c"], **kwargs)
+
+
+def take(sampler, n):
+    return list(itertools.islice(iter(sampler), n))
+
+
+def test_mixture_dataset_indexes_every_item_once():
+    mixture = build_mixture()
+    assert len(mixture) == 14
+    items = [mixture[idx] for idx in range(len(mixture))]
+
+    assert items[:3] == [("a", 0), ("a", 1), ("a", 2)]
+    assert items[3:13] == [("b", idx) for idx in range(10)]
+    assert items[13] == ("c", 0)
+    assert mixture[-1] == ("c", 0)
+
+    with pytest.raises(IndexError):
+        mixture[14]
+
+
+def test_mixture_dataset_temperature_flattens_weights():
+    proportional = build_mixture().sampling_probabilities
+    assert proportional == pytest.approx([3 / 14, 10 / 14, 1 / 14])
+
+    uniform = build_mixture(temperature=1e6).sampling_probabilities
+    assert uniform == pytest.approx([1 / 3] * 3, abs=1e-4)
+
+    weighted = build_mixture(weights=[1, 1, 2]).sampling_probabilities
+    assert weighted == pytest.approx([0.25, 0.25, 0.5])
+
+
+def test_mixture_sampler_follows_probabilities_and_counts_sources():
+    mixture = build_mixture(weights=[1, 1, 2])
+    sampler = MixtureSampler(mixture, num_samples=8000, seed=0)
+    sources = Counter(mixture[idx][0] for idx in sampler)
+
+    assert sampler.source_counts_at(8000) == dict(sources)
+    assert sum(sources.values()) == 8000
+    assert sources["c"] / 8000 == pytest.approx(0.5, abs=0.03)
+    assert sources["a"] / 8000 == pytest.approx(0.25, abs=0.03)
+
+
+def test_mixture_sampler_covers_each_source_per_pass():
+    mixture = build_mixture(temperature=1e6)
+    sampler = MixtureSampler(mixture, num_samples=300, seed=1)
+    b_items = [mixture[idx] for idx in sampler if mixture[idx][0] == "b"]
+
+    for start in range(0, len(b_items) - 10, 10):
+        assert sorted(b_items[start : start + 10]) == [
+            ("b", idx) for idx in range(10)
+        ]
+
+
+def test_mixture_sampler_resumes_from_start_index():
+    mixture = build_mixture()
+    full_stream = take(
+        MixtureSampler(mixture, num_samples=500, seed=2, chunk_size=16), 500
+    )
+    for start_index in [0, 7, 16, 100]:
+        resumed = MixtureSampler(
+            mixture,
+            num_samples=500 - start_index,
+            seed=2,
+            start_index=start_index,
+            chunk_size=16,
+        )
+        assert take(resumed, 500) == full_stream[start_index:]
+
+
+def test_mixture_sampler_continues_the_stream_every_epoch():
+    mixture = build_mixture()
+    full_stream = take(
+        MixtureSampler(mixture, num_samples=500, seed=4, chunk_size=16), 500
+    )
+    sampler = MixtureSampler(mixture, num_samples=250, seed=4, chunk_size=16)
+    first_epoch, second_epoch = list(sampler), list(sampler)
+
+    assert first_epoch != second_epoch
+    assert first_epoch + second_epoch == full_stream
+
+
+def test_mixture_of_gate_datasets_with_dataloader():
+    splits = [
+        {
+            split: GATEDataset(torch.arange(size) + offset)
+            for split in ["train", "val", "test"]
+        }
+        for size, offset in [(5, 0), (20, 100)]
+    ]
+    mixture_dict = mix_datasets(splits, temperature=2.0, names=["x", "y"])
+    assert set(mixture_dict) == {"train", "val", "test"}
+    assert len(mixture_dict["val"]) == 25
+
+    sampler = MixtureSampler(mixture_dict["train"], seed=0)
+    dataloader = torch.utils.data.DataLoader(
+        mixture_dict["train"], batch_size=5, sampler=sampler
+    )
+    values = torch.cat(list(dataloader))
+
+    assert len(values) == 25
+    assert find_mixture_sampler(dataloader) is sampler
+    assert sum(sampler.source_counts_at(25).values()) == 25
+    assert sampler.source_counts_at(25)["x"] == int((values < 100).sum())
+
+
+def test_mixture_sampler_counts_only_the_consumed_prefix():
+    mixture = build_mixture()
+    sampler = MixtureSampler(mixture, num_samples=500, seed=3, chunk_size=16)
+    stream = take(sampler, 500)
+
+    # later, earlier and repeated lookups share the cached chunk positions
+    for num_samples in [100, 37, 0, 100, 499]:
+        expected = Counter(mixture[idx][0] for idx in stream[:num_samples])
+        counts = sampler.source_counts_at(num_samples)
+        assert {k: v for k, v in counts.items() if v} == dict(expected)
+
+    # a resumed sampler reports the same counts without replaying the stream
+    resumed = MixtureSampler(
+        mixture, seed=3, start_index=100, chunk_size=16, num_samples=400
+    )
+    assert resumed.source_counts_at(100) == sampler.source_counts_at(100)
+
+
+def build_toy_gate_dataset(data_dir=None, transforms=None, offset=0):
+    return {
+        split: GATEDataset(
+            list(range(offset, offset + 4)), transforms=[str, transforms]
+        )
+        for split in ["train", "val", "test"]
+    }
+
+
+def test_mixture_config_builds_registered_datasets():
+    config_store = ConfigStore.instance()
+    toy_config = builds(build_toy_gate_dataset, populate_full_signature=True)
+    config_store.store(group="dataset", name="toy_a", node=toy_config())
+    config_store.store(
+        group="dataset", name="toy_b", node=toy_config(offset=100)
+    )
+
+    mixture_config = builds(
+        build_mixture_dataset, populate_full_signature=True
+    )(datasets=["toy_a", "toy_b"], weights=[1, 3])
+    mixture_dict = instantiate(mixture_config, transforms=lambda x: x + "!")
+
+    assert mixture_dict["train"].names == ["toy_a", "toy_b"]
+    assert mixture_dict["train"].sampling_probabilities == pytest.approx(
+        [0.25, 0.75]
+    )
+    # each source keeps its own transforms ahead of the shared ones
+    assert mixture_dict["val"][5] == "101!"
+    assert mixture_dict["val"].meta_data is None
+
+    with pytest.raises(ValueError):
+        build_mixture_dataset(datasets=["toy_a", "no_such_dataset"])
@@ -0,0 +1,124 @@
+import numpy as np
+import torch
+from PIL import Image
+
+from gate.boilerplate.convenience import attach_preprocessed_cache
+from gate.data.core import GATEDataset
+from gate.data.preprocessed_cache import PreprocessedCache, cache_key
+from gate.data.quarantine import QuarantineIndex
+
+
+class RawDataset(torch.utils.data.Dataset):
+    def __init__(self, size, bad_indices=()):
+        self.size = size
+        self.bad_indices = set(bad_indices)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if index in self.bad_indices:
+            raise ValueError(f"corrupt sample {index}")
+        pixels = np.full((8, 6, 3), index, dtype=np.uint8)
+        return {
+            "image": Image.fromarray(pixels),
+            # volumes of a different depth per sample
+            "volume": torch.linspace(0, 1, (index + 1) * 16).view(-1, 4, 4),
+            "text": f"sample {index}",
+            "labels": index % 3,
+        }
+
+
+class Resize:
+    def __init__(self, size):
+        self.size = size
+        self.num_calls = 0
+
+    def __call__(self, item):
+        self.num_calls += 1
+        item["image"] = item["image"].resize((self.size, self.size))
+        return item
+
+
+def test_cache_round_trips_samples(tmp_path):
+    preprocess = Resize(size=4)
+    cache = PreprocessedCache(tmp_path, "raw", "train", preprocess)
+    assert not cache.is_built
+
+    cache.build(RawDataset(size=5), preprocess=preprocess, num_workers=0)
+    assert cache.is_built and len(cache) == 5
+
+    reference = preprocess(RawDataset(size=5)[3])
+    item = cache[3]
+    assert isinstance(item["image"], Image.Image)
+    assert np.array_equal(np.asarray(item["image"]), reference["image"])
+    assert item["volume"].shape == (4, 4, 4)
+    assert item["volume"].dtype == torch.float32
+    # floats are stored as float16
+    assert torch.allclose(item["volume"], reference["volume"], atol=1e-3)
+    assert item["text"] == "sample 3"
+    assert item["labels"] == 0
+
+
+def test_cache_key_follows_config_and_stale_caches_are_pruned(tmp_path):
+    small = PreprocessedCache(tmp_path, "raw", "train", Resize(size=4))
+    large = PreprocessedCache(tmp_path, "raw", "train", Resize(size=6))
+    assert small.key != large.key
+    assert small.key == cache_key("raw", "train", Resize(size=4))
+    assert small.key != cache_key("raw", "val", Resize(size=4))
+    assert small.key != cache_key("raw", "train", Resize(size=4), 224)
+
+    small.build(RawDataset(size=3), Resize(size=4), num_workers=0)
+    large.build(RawDataset(size=3), Resize(size=6), num_workers=0)
+
+    assert large.is_built
+    assert not small.is_built
+    assert np.asarray(large[0]["image"]).shape == (6, 6, 3)
+
+
+def test_gate_dataset_reads_the_cache_instead_of_preprocessing(tmp_path):
+    preprocess = Resize(size=4)
+    dataset = GATEDataset(
+        RawDataset(size=4),
+        preprocess=preprocess,
+        transforms=lambda item: {**item, "flipped": True},
+    )
+    uncached = dataset[2]
+    assert preprocess.num_calls == 1
+
+    attach_preprocessed_cache(
+        {"train": dataset},
+        cache_dir=tmp_path,
+        dataset_name="raw",
+        num_workers=0,
+    )
+    num_calls = preprocess.num_calls
+
+    cached = dataset[2]
+    assert preprocess.num_calls == num_calls
+    assert cached["flipped"]
+    assert np.array_equal(
+        np.asarray(cached["image"]), np.asarray(uncached["image"])
+    )
+
+
+def test_failed_samples_are_quarantined_and_replaced(tmp_path):
+    quarantine = QuarantineIndex.for_split(tmp_path, "raw", "train")
+    preprocess = Resize(size=4)
+    cache = PreprocessedCache(tmp_path, "raw", "train", preprocess)
+    cache.build(
+        RawDataset(size=4, bad_indices=[1]),
+        preprocess=preprocess,
+        num_workers=0,
+        quarantine=quarantine,
+    )
+    assert quarantine.indices == [1]
+    assert not cache.is_valid(1)
+
+    dataset = GATEDataset(
+        RawDataset(size=4, bad_indices=[1]),
+        preprocess=preprocess,
+        cache=cache,
+        quarantine=quarantine,
+    )
+    assert dataset[1]["text"] == "sample 2"
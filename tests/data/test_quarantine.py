@@ -0,0 +1,143 @@
+import pickle
+
+import torch
+
+from gate.boilerplate.convenience import wrap_with_quarantine
+from gate.data.core import GATEDataset, InfiniteSampler
+from gate.data.quarantine import (
+    QuarantineIndex,
+    QuarantineSampler,
+    healthy_replacement,
+    scan_dataset,
+)
+
+
+class FlakyDataset(torch.utils.data.Dataset):
+    def __init__(self, size, bad_indices):
+        self.size = size
+        self.bad_indices = set(bad_indices)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if index in self.bad_indices:
+            raise ValueError(f"corrupt sample {index}")
+        return {"value": torch.tensor(index)}
+
+
+def test_quarantine_index_persists_failures(tmp_path):
+    quarantine = QuarantineIndex.for_split(tmp_path, "flaky", "train")
+    assert len(quarantine) == 0
+
+    assert quarantine.add(3, "boom")
+    assert not quarantine.add(3, "boom again")
+    quarantine.add(7, "boom")
+
+    reloaded = QuarantineIndex(
+        tmp_path / "quarantine" / "flaky" / "train.jsonl"
+    )
+    assert reloaded.indices == [3, 7]
+    assert 3 in pickle.loads(pickle.dumps(reloaded))
+
+
+def test_gate_dataset_replaces_and_records_failing_items(tmp_path):
+    quarantine = QuarantineIndex.for_split(tmp_path, "flaky", "train")
+    dataset = GATEDataset(
+        FlakyDataset(size=10, bad_indices=[4, 5]), quarantine=quarantine
+    )
+
+    assert dataset[4]["value"].item() == 6
+    assert dataset[5]["value"].item() == 6
+    assert quarantine.indices == [4, 5]
+
+    # the replacement is the same once both failures are known
+    assert healthy_replacement(4, 10, quarantine) == 6
+
+
+def test_gate_dataset_skips_failing_items_in_evaluation(tmp_path):
+    quarantine = QuarantineIndex.for_split(tmp_path, "flaky", "val")
+    dataset = GATEDataset(
+        FlakyDataset(size=10, bad_indices=[4]),
+        quarantine=quarantine,
+        replace_failed_items=False,
+    )
+
+    assert dataset[4] is None
+    assert dataset[5]["value"].item() == 5
+    assert quarantine.indices == [4]
+
+
+def test_quarantine_sampler_length_matches_dropped_items(tmp_path):
+    quarantine = QuarantineIndex.for_split(tmp_path, "flaky", "val")
+    quarantine.add(2, "")
+    quarantine.add(9, "")
+
+    dropped = QuarantineSampler(
+        torch.utils.data.SequentialSampler(range(10)),
+        quarantine,
+        dataset_size=10,
+        substitute=False,
+    )
+    assert len(dropped) == len(list(dropped)) == 8
+
+    substituted = QuarantineSampler(
+        torch.utils.data.SequentialSampler(range(10)),
+        quarantine,
+        dataset_size=10,
+    )
+    assert len(substituted) == len(list(substituted)) == 10
+
+
+def test_samplers_are_only_wrapped_with_quarantined_items(tmp_path):
+    dataset = GATEDataset(
+        FlakyDataset(size=10, bad_indices=[]),
+        quarantine=QuarantineIndex.for_split(tmp_path, "flaky", "train"),
+    )
+    sampler = torch.utils.data.SequentialSampler(dataset)
+    assert wrap_with_quarantine(dataset, sampler, substitute=True) is sampler
+
+    dataset.quarantine.add(3, "")
+    wrapped = wrap_with_quarantine(dataset, sampler, substitute=True)
+    assert isinstance(wrapped, QuarantineSampler)
+
+
+def test_quarantine_sampler_substitutes_or_drops(tmp_path):
+    quarantine = QuarantineIndex.for_split(tmp_path, "flaky", "train")
+    quarantine.add(2, "")
+    quarantine.add(9, "")
+
+    substituted = QuarantineSampler(
+        list(range(10)), quarantine, dataset_size=10, substitute=True
+    )
+    assert list(substituted) == [0, 1, 3, 3, 4, 5, 6, 7, 8, 0]
+
+    dropped = QuarantineSampler(
+        list(range(10)), quarantine, dataset_size=10, substitute=False
+    )
+    assert list(dropped) == [0, 1, 3, 4, 5, 6, 7, 8]
+
+    batches = QuarantineSampler(
+        [[0, 1, 2], [8, 9]], quarantine, dataset_size=10, substitute=True
+    )
+    assert list(batches) == [[0, 1, 3], [8, 0]]
+
+
+def test_quarantine_sampler_keeps_wrapped_sampler_api(tmp_path):
+    quarantine = QuarantineIndex.for_split(tmp_path, "flaky", "train")
+    sampler = QuarantineSampler(
+        InfiniteSampler(dataset_size=5, seed=0), quarantine, dataset_size=5
+    )
+    sampler.set_start_index(3)
+    assert sampler.sampler.start_index == 3
+
+
+def test_scan_dataset_builds_index(tmp_path):
+    quarantine = QuarantineIndex.for_split(tmp_path, "flaky", "val")
+    dataset = GATEDataset(FlakyDataset(size=20, bad_indices=[0, 11, 19]))
+
+    failed = scan_dataset(dataset, quarantine, num_workers=2)
+
+    assert sorted(failed) == [0, 11, 19]
+    assert quarantine.indices == [0, 11, 19]
+    assert "corrupt sample 11" in quarantine.errors[11]
@@ -0,0 +1,91 @@
+import json
+import subprocess
+import sys
+
+import numpy as np
+import torch
+
+from gate.data.split_cache import (
+    SPLIT_CACHE_DIR_NAME,
+    compute_split_indices,
+    load_split_indices,
+    split_dataset,
+)
+
+SPLIT_SIZES = {"train": 0.8, "val": 0.05, "test": 0.15}
+
+SPLIT_SCRIPT = """
+import json, sys
+from gate.data.split_cache import load_split_indices
+indices = load_split_indices(
+    num_samples=1000,
+    split_sizes={"train": 0.8, "val": 0.05, "test": 0.15},
+    dataset_name="toy",
+    cache_dir=sys.argv[1],
+)
+print(json.dumps({name: split.tolist() for name, split in indices.items()}))
+"""
+
+
+def split_in_subprocess(cache_dir):
+    output = subprocess.run(
+        [sys.executable, "-c", SPLIT_SCRIPT, str(cache_dir)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_splits_partition_the_dataset():
+    indices = compute_split_indices(1000, SPLIT_SIZES, seed=0)
+    assert {name: len(split) for name, split in indices.items()} == {
+        "train": 800,
+        "val": 50,
+        "test": 150,
+    }
+    merged = np.concatenate(list(indices.values()))
+    assert np.array_equal(np.sort(merged), np.arange(1000))
+    assert not np.array_equal(
+        indices["val"], compute_split_indices(1000, SPLIT_SIZES, seed=1)["val"]
+    )
+
+
+def test_partitions_are_identical_across_processes(tmp_path):
+    # two processes that each compute the split, and one that reads it
+    first = split_in_subprocess(tmp_path / "a")
+    second = split_in_subprocess(tmp_path / "b")
+    stored = split_in_subprocess(tmp_path / "a")
+    assert first == second == stored
+
+    local = load_split_indices(1000, SPLIT_SIZES, "toy", cache_dir=tmp_path)
+    assert first == {name: split.tolist() for name, split in local.items()}
+
+
+def test_stored_indices_are_reused_and_versioned(tmp_path):
+    load_split_indices(100, SPLIT_SIZES, "toy", cache_dir=tmp_path)
+    (path,) = (tmp_path / SPLIT_CACHE_DIR_NAME / "toy").iterdir()
+    assert json.loads((path / "meta.json").read_text())["version"] >= 1
+
+    # a stored split is read back as is, not recomputed
+    np.save(path / "val.npy", np.arange(3))
+    indices = load_split_indices(100, SPLIT_SIZES, "toy", cache_dir=tmp_path)
+    assert indices["val"].tolist() == [0, 1, 2]
+
+    # a different dataset size gets its own split
+    load_split_indices(200, SPLIT_SIZES, "toy", cache_dir=tmp_path)
+    assert len(list((tmp_path / SPLIT_CACHE_DIR_NAME / "toy").iterdir())) == 2
+
+
+def test_split_dataset_selects_the_stored_indices(tmp_path):
+    dataset = torch.utils.data.TensorDataset(torch.arange(20))
+    splits = split_dataset(
+        dataset,
+        split_sizes={"train": 0.75, "val": 0.25},
+        dataset_name="toy",
+        cache_dir=tmp_path,
+    )
+    assert len(splits["train"]) == 15 and len(splits["val"]) == 5
+    values = [int(item[0]) for item in splits["val"]]
+    expected = compute_split_indices(20, {"train": 0.75, "val": 0.25})
+    assert values == expected["val"].tolist()
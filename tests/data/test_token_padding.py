@@ -0,0 +1,126 @@
+import pytest
+import torch
+
+from gate.data.core import (
+    GATEDataset,
+    LengthBucketBatchSampler,
+    batch_padding_ratio,
+    collate_fn_with_token_pad,
+    get_sample_lengths,
+    pad_and_stack_tensors,
+    token_padding_ratio,
+)
+
+
+def test_pad_and_stack_tensors_pads_with_each_rows_eos():
+    padded = pad_and_stack_tensors(
+        [
+            torch.tensor([5, 6, 9]),
+            torch.tensor([[7, 8]]),
+            torch.tensor([1, 2, 3, 4, 7]),
+        ]
+    )
+    assert torch.equal(
+        padded,
+        torch.tensor(
+            [[5, 6, 9, 9, 9], [7, 8, 8, 8, 8], [1, 2, 3, 4, 7]],
+        ),
+    )
+
+
+def test_pad_and_stack_tensors_with_paired_captions():
+    padded = pad_and_stack_tensors(
+        [
+            torch.tensor([[1, 2, 3], [4, 5, 6]]),
+            torch.tensor([[7, 8], [9, 10]]),
+        ]
+    )
+    assert padded.shape == (2, 2, 3)
+    assert torch.equal(padded[1], torch.tensor([[7, 8, 8], [9, 10, 10]]))
+
+
+def test_token_padding_ratio_counts_trailing_eos_run():
+    tokens = torch.tensor([[5, 6, 9, 9, 9], [1, 2, 3, 4, 7]])
+    assert token_padding_ratio(tokens).item() == pytest.approx(2 / 10)
+
+    batch = collate_fn_with_token_pad(
+        [
+            {"text": torch.tensor([3, 4, 2]), "labels": torch.tensor(0)},
+            {"text": torch.tensor([3, 2]), "labels": torch.tensor(1)},
+        ]
+    )
+    assert batch_padding_ratio(batch).item() == pytest.approx(1 / 6)
+    assert batch_padding_ratio({"image": torch.zeros(2, 3)}) is None
+
+
+def test_length_bucket_batch_sampler_reduces_padding():
+    generator = torch.Generator().manual_seed(0)
+    lengths = torch.randint(1, 64, (2000,), generator=generator).tolist()
+
+    bucketed = LengthBucketBatchSampler(lengths, batch_size=16, seed=0)
+    batches = list(bucketed)
+    assert sorted(idx for batch in batches for idx in batch) == list(
+        range(2000)
+    )
+    assert len(batches) == len(bucketed)
+
+    # pools of a single batch leave batch membership random
+    unbucketed = LengthBucketBatchSampler(
+        lengths, batch_size=16, seed=0, bucket_size_multiplier=1
+    )
+    list(unbucketed)
+
+    assert bucketed.padding_ratio < unbucketed.padding_ratio / 4
+
+
+def test_length_bucket_batch_sampler_is_deterministic_and_resumes():
+    lengths = [idx % 17 for idx in range(300)]
+    sampler = LengthBucketBatchSampler(
+        lengths, batch_size=8, seed=3, bucket_size_multiplier=4, infinite=True
+    )
+    iterator = iter(sampler)
+    full_stream = [next(iterator) for _ in range(100)]
+
+    resumed = LengthBucketBatchSampler(
+        lengths,
+        batch_size=8,
+        seed=3,
+        bucket_size_multiplier=4,
+        infinite=True,
+        start_batch=60,
+    )
+    iterator = iter(resumed)
+    assert [next(iterator) for _ in range(40)] == full_stream[60:]
+
+
+def test_finite_length_bucket_batch_sampler_advances_and_resumes():
+    lengths = [idx % 17 for idx in range(300)]
+    sampler = LengthBucketBatchSampler(
+        lengths, batch_size=8, seed=3, bucket_size_multiplier=4
+    )
+    first_epoch, second_epoch = list(sampler), list(sampler)
+    num_epoch_batches = len(first_epoch)
+    assert first_epoch != second_epoch
+    for epoch in (first_epoch, second_epoch):
+        assert sorted(idx for batch in epoch for idx in batch) == list(
+            range(300)
+        )
+
+    # resuming past the first epoch continues within the second one
+    resumed = LengthBucketBatchSampler(
+        lengths, batch_size=8, seed=3, bucket_size_multiplier=4
+    )
+    resumed.set_start_batch(num_epoch_batches + 5)
+    assert len(resumed) == num_epoch_batches - 5
+    assert list(resumed) == second_epoch[5:]
+    assert len(resumed) == num_epoch_batches
+    assert list(resumed) == list(sampler)
+
+
+def test_get_sample_lengths_resolves_wrappers():
+    raw = [{"question": "how many red cubes are there"}, {"question": "why"}]
+    dataset = GATEDataset(raw, length_key="question")
+    assert get_sample_lengths(dataset, dataset.length_key) == [6, 1]
+
+    subset = torch.utils.data.Subset(raw, [1])
+    assert get_sample_lengths(subset, "question") == [1]
@@ -0,0 +1,155 @@
+import torch
+from timm.data import IMAGENET_DEFAULT_MEAN, IMAGENET_DEFAULT_STD
+from torch.utils.data import DataLoader
+
+from gate.boilerplate.convenience import match_batch_augmentation_normalization
+from gate.data.core import GATEDataset, collate_fn_with_token_pad
+from gate.data.transforms.batch_augment import (
+    BatchAugmentation,
+    BatchAugmentCollate,
+)
+
+
+def random_images(dtype=torch.uint8, batch_size=8, size=32):
+    generator = torch.Generator().manual_seed(0)
+    images = torch.randint(
+        0, 256, (batch_size, 3, size, size), generator=generator
+    )
+    return images.to(torch.uint8) if dtype == torch.uint8 else images / 255
+
+
+def test_batch_augmentation_keeps_dtype_shape_and_range():
+    augmentation = BatchAugmentation(seed=0)
+
+    images = random_images(torch.uint8)
+    augmented = augmentation(images)
+    assert augmented.dtype == torch.uint8
+    assert augmented.shape == images.shape
+
+    images = random_images(torch.float32)
+    augmented = augmentation(images)
+    assert augmented.dtype == torch.float32
+    assert augmented.min() >= 0 and augmented.max() <= 1
+
+    resized = BatchAugmentation(output_size=(16, 24), seed=0)(images)
+    assert resized.shape == (8, 3, 16, 24)
+
+
+def test_batch_augmentation_is_deterministic_under_seed():
+    images = random_images()
+    first = BatchAugmentation(seed=7)(images)
+    second = BatchAugmentation(seed=7)(images)
+    other = BatchAugmentation(seed=8)(images)
+
+    assert torch.equal(first, second)
+    assert not torch.equal(first, other)
+
+
+def test_batch_augmentation_draws_parameters_per_sample():
+    # the same image repeated must come out differently augmented
+    images = random_images(batch_size=1).repeat(6, 1, 1, 1)
+    augmented = BatchAugmentation(seed=0)(images)
+    assert len({tuple(image.flatten().tolist()) for image in augmented}) == 6
+
+
+def test_batch_augmentation_identity_settings():
+    augmentation = BatchAugmentation(
+        scale=(1.0, 1.0),
+        ratio=(1.0, 1.0),
+        flip_prob=0.0,
+        brightness=0.0,
+        contrast=0.0,
+        saturation=0.0,
+        num_ops=0,
+        seed=0,
+    )
+    images = random_images(torch.float32)
+    assert torch.allclose(augmentation(images), images, atol=1e-5)
+
+
+def test_batch_augmentation_round_trips_normalised_images():
+    mean, std = (0.5, 0.4, 0.3), (0.2, 0.25, 0.3)
+    images = random_images(torch.float32)
+    normalised = (images - torch.tensor(mean).view(1, 3, 1, 1)) / torch.tensor(
+        std
+    ).view(1, 3, 1, 1)
+
+    kwargs = dict(seed=3, num_ops=2)
+    augmented = BatchAugmentation(mean=mean, std=std, **kwargs)(normalised)
+    reference = BatchAugmentation(**kwargs)(images)
+
+    unnormalised = augmented * torch.tensor(std).view(
+        1, 3, 1, 1
+    ) + torch.tensor(mean).view(1, 3, 1, 1)
+    assert torch.allclose(unnormalised, reference, atol=1e-4)
+
+
+def test_batch_augment_collate():
+    collate = BatchAugmentCollate(
+        collate_fn_with_token_pad, BatchAugmentation(seed=0)
+    )
+    samples = [
+        {"image": image, "labels": torch.tensor(idx)}
+        for idx, image in enumerate(random_images(batch_size=4))
+    ]
+    first = collate(samples)
+    assert first["image"].shape == (4, 3, 32, 32)
+    assert torch.equal(first["labels"], torch.arange(4))
+
+    # every batch draws new parameters
+    second = collate(samples)
+    assert not torch.equal(first["image"], second["image"])
+
+
+def test_batch_augment_collate_differs_across_ranks_and_epochs():
+    samples = [
+        {"image": image, "labels": torch.tensor(idx)}
+        for idx, image in enumerate(random_images(batch_size=4))
+    ]
+
+    def augmented_epochs(process_index, num_epochs=2):
+        torch.manual_seed(0)
+        dataloader = DataLoader(
+            samples,
+            batch_size=4,
+            num_workers=1,
+            collate_fn=BatchAugmentCollate(
+                collate_fn_with_token_pad,
+                BatchAugmentation(seed=0),
+                process_index=process_index,
+            ),
+        )
+        return [next(iter(dataloader))["image"] for _ in range(num_epochs)]
+
+    first_epoch, second_epoch = augmented_epochs(process_index=0)
+    # workers are re-created every epoch, which must not repeat it
+    assert not torch.equal(first_epoch, second_epoch)
+    # every rank draws its own parameters
+    assert not torch.equal(first_epoch, augmented_epochs(process_index=1)[0])
+    # and a seeded run reproduces them
+    assert torch.equal(first_epoch, augmented_epochs(process_index=0)[0])
+
+
+def test_batch_augmentation_uses_the_encoder_normalisation():
+    # an encoder whose transforms only scale images to [0, 1]
+    images = random_images(torch.float32)
+    reference = BatchAugmentation(seed=3)(images)
+
+    augmentation = BatchAugmentation(
+        mean=IMAGENET_DEFAULT_MEAN, std=IMAGENET_DEFAULT_STD, seed=3
+    )
+    dataset_dict = {
+        "train": GATEDataset([], batch_transforms=augmentation),
+        "val": GATEDataset([]),
+    }
+    assert not torch.allclose(augmentation(images), reference, atol=1e-4)
+
+    match_batch_augmentation_normalization(
+        dataset_dict, ((0.0, 0.0, 0.0), (1.0, 1.0, 1.0))
+    )
+    augmentation.reseed(3)
+    assert torch.allclose(augmentation(images), reference, atol=1e-4)
+
+    # an encoder without a declared normalisation keeps the current one
+    match_batch_augmentation_normalization(dataset_dict, None)
+    assert augmentation.mean == (0.0, 0.0, 0.0)
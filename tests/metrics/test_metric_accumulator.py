@@ -0,0 +1,102 @@
+import math
+
+import torch
+from torch.testing import assert_close
+
+from gate.orchestration.evaluators.classification import (
+    MultiClassClassificationEvaluator,
+)
+from gate.orchestration.utils.metric_accumulator import MetricAccumulator
+
+
+def test_epoch_metrics_match_stacked_lists():
+    values = {
+        "loss": [torch.rand(()) for _ in range(17)],
+        "accuracy": [torch.rand(8) for _ in range(17)],
+    }
+    metric_accumulator = MetricAccumulator()
+    for step in range(17):
+        for key, value in values.items():
+            metric_accumulator.update(key, value[step])
+
+    phase_metrics = metric_accumulator.epoch_metrics()
+    for key, value in values.items():
+        stacked = torch.stack([item.float().mean() for item in value])
+        assert_close(phase_metrics[f"{key}-epoch-mean"], stacked.mean())
+        assert_close(phase_metrics[f"{key}-epoch-std"], stacked.std())
+
+
+def test_single_observation_std_is_nan():
+    metric_accumulator = MetricAccumulator()
+    metric_accumulator.update("loss", torch.tensor(1.5))
+    stats = metric_accumulator.compute()["loss"]
+
+    assert stats["mean"].item() == 1.5
+    assert math.isnan(stats["std"].item())
+
+
+def test_step_syncs_window_means():
+    metric_accumulator = MetricAccumulator(sync_every_n_steps=2)
+
+    synced = []
+    for value in [1.0, 3.0, 10.0, 20.0]:
+        metric_accumulator.update("loss", torch.tensor(value))
+        synced.append(metric_accumulator.step())
+        if synced[-1]:
+            latest = dict(metric_accumulator.latest)
+
+    assert synced == [False, True, False, True]
+    assert latest == {"loss": 15.0}
+
+
+def test_reset_clears_state():
+    metric_accumulator = MetricAccumulator()
+    metric_accumulator.update_dict({"loss": torch.tensor(1.0), "name": "x"})
+
+    assert "loss" in metric_accumulator
+    assert "name" not in metric_accumulator
+
+    metric_accumulator.reset()
+    assert len(metric_accumulator) == 0
+    assert metric_accumulator.epoch_metrics() == {}
+
+
+def test_multi_class_evaluator_accumulates_on_device():
+    evaluator = MultiClassClassificationEvaluator(
+        label_idx_to_class_name=["cat", "dog"]
+    )
+    generator = torch.Generator().manual_seed(0)
+    batches = [
+        {
+            "image": torch.randn(4, 2, generator=generator),
+            "labels": torch.tensor([[0.0, 1.0], [1.0, 0.0]] * 2),
+        }
+        for _ in range(3)
+    ]
+
+    def model(batch):
+        return {"image": {"image": {"logits": batch["image"]}}}
+
+    model.forward = model
+    for batch in batches:
+        evaluator.step(model, batch, global_step=0, accelerator=None)
+
+    # the per-class losses are accumulated, not kept per step
+    assert set(evaluator.metric_accumulator.keys()) == {
+        "loss",
+        "cat-loss",
+        "dog-loss",
+    }
+    assert "loss" not in evaluator.per_epoch_metrics
+
+    phase_metrics = evaluator.compute_epoch_metrics(global_step=0)
+    losses = torch.stack(
+        [
+            torch.nn.functional.binary_cross_entropy_with_logits(
+                batch["image"], batch["labels"]
+            )
+            for batch in batches
+        ]
+    )
+    assert_close(phase_metrics["loss-epoch-mean"], losses.mean().float())
+    assert 0.0 <= phase_metrics["auc-macro"] <= 1.0
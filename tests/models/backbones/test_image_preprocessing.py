@@ -0,0 +1,74 @@
+import PIL.Image as Image
+import pytest
+import torch
+import torch.nn.functional as F
+import torchvision.transforms as T
+
+from gate.models.backbones.preprocessing import TensorImageTransforms
+from gate.models.backbones.timm import TimmModel
+
+
+@pytest.fixture(scope="module")
+def model():
+    return TimmModel("resnet18", image_size=160, pretrained=False)
+
+
+def smooth_images(*shape):
+    generator = torch.Generator().manual_seed(0)
+    images = torch.randint(0, 256, shape, generator=generator).float()
+    # natural images are smooth, unlike uniform noise
+    images = F.avg_pool2d(images.view(-1, *shape[-3:]), 5, 1, 2)
+    return images.round().to(torch.uint8).view(*shape)
+
+
+@pytest.mark.parametrize("height, width", [(200, 180), (120, 100)])
+def test_batch_matches_the_pil_processor(model, height, width):
+    images = smooth_images(4, 3, height, width)
+    expected = torch.stack(
+        [
+            model.transforms(Image.fromarray(image.permute(1, 2, 0).numpy()))
+            for image in images
+        ]
+    )
+
+    output = model.tensor_transforms(images)
+
+    assert output.shape == expected.shape == (4, 3, 160, 160)
+    assert torch.allclose(output, expected, atol=0.05)
+    assert (output - expected).abs().mean() < 0.01
+
+
+def test_batch_matches_the_per_image_tensor_processor(model):
+    images = smooth_images(4, 3, 200, 180).float() / 255.0
+    expected = torch.stack([model.transforms(image) for image in images])
+
+    assert torch.allclose(model.tensor_transforms(images), expected, atol=1e-5)
+
+
+def test_video_batches_keep_their_leading_dims(model):
+    videos = smooth_images(2, 5, 3, 96, 96)
+
+    output = model.tensor_transforms(videos)
+
+    assert output.shape == (2, 5, 3, 160, 160)
+    assert torch.equal(
+        output.view(10, 3, 160, 160),
+        model.tensor_transforms(videos.view(10, 3, 96, 96)),
+    )
+
+
+def test_centre_crop_matches_torchvision():
+    mean, std = (0.5, 0.4, 0.3), (0.2, 0.3, 0.25)
+    transforms = TensorImageTransforms(
+        image_size=(72, 64), mean=mean, std=std, crop_size=48
+    )
+    expected = T.Compose(
+        [
+            T.Resize((72, 64), interpolation=T.InterpolationMode.BICUBIC),
+            T.CenterCrop(48),
+            T.Normalize(mean, std),
+        ]
+    )
+    images = smooth_images(3, 3, 90, 80).float() / 255.0
+
+    assert torch.allclose(transforms(images), expected(images), atol=1e-5)
@@ -0,0 +1,89 @@
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
+
+from gate.models.backbones import TextProcessor
+from gate.models.backbones.tokenization import (
+    CachedTokenizer,
+    reset_tokenization_cache_stats,
+    tokenization_cache_stats,
+)
+
+WORDS = "a photo of the cat dog bird car what colour is sky blue red".split()
+
+
+def build_tokenizer(padding_side="right"):
+    vocab = {"[PAD]": 0, "[UNK]": 1}
+    vocab.update({word: index + 2 for index, word in enumerate(WORDS)})
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        pad_token="[PAD]",
+        unk_token="[UNK]",
+        model_max_length=6,
+        padding_side=padding_side,
+    )
+
+
+def per_sample_input_ids(tokenizer, text):
+    # what TextProcessor returned before tokenization was cached
+    if not all(isinstance(i, list) for i in text):
+        text = [text]
+    text = [item for sublist in text for item in sublist]
+    return tokenizer(
+        text=text, return_tensors="pt", padding=True, truncation=True
+    ).input_ids.squeeze(0)
+
+
+SAMPLES = [
+    ["a photo of a cat", "a photo of a dog", "a photo of a bird"],
+    ["a photo of a cat", "a photo of a dog", "a photo of a bird"],
+    ["what colour is the sky", "blue"],
+    [["what colour is the sky"], ["red", "blue", "a photo of a car zebra"]],
+    ["a photo of the cat and the dog and the bird"],
+]
+
+
+@pytest.mark.parametrize("padding_side", ["right", "left"])
+def test_cached_tokenization_matches_the_per_sample_path(padding_side):
+    tokenizer = build_tokenizer(padding_side)
+    processor = TextProcessor(tokenizer)
+
+    for text in SAMPLES:
+        expected = per_sample_input_ids(tokenizer, text)
+        output = processor.apply_transform(text)
+        assert torch.equal(output, expected)
+
+
+def test_repeated_strings_are_tokenized_once():
+    reset_tokenization_cache_stats()
+    calls = []
+    tokenizer = build_tokenizer()
+    cached = CachedTokenizer(tokenizer)
+    original_call = tokenizer.__call__
+
+    def counting_call(texts, **kwargs):
+        calls.append(list(texts))
+        return original_call(texts, **kwargs)
+
+    cached.tokenizer = counting_call
+    cached.tokenizer.model_max_length = tokenizer.model_max_length
+    cached.token_ids(["a cat", "a dog", "a cat"])
+    cached.token_ids(["a dog", "a bird"])
+
+    assert calls == [["a cat", "a dog"], ["a bird"]]
+    stats = tokenization_cache_stats()
+    assert stats["tokenization_cache_lookups"] == 5
+    assert stats["tokenization_cache_hit_rate"] == pytest.approx(2 / 5)
+
+
+def test_least_recently_used_strings_are_evicted():
+    cached = CachedTokenizer(build_tokenizer(), max_size=2)
+    cached.token_ids(["a cat", "a dog"])
+    cached.token_ids(["a cat", "a bird"])
+
+    assert len(cached) == 2
+    assert ("a dog", 6) not in cached._cache
+    assert ("a cat", 6) in cached._cache
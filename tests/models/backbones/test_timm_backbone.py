@@ -5,6 +5,8 @@ from gate.models.backbones import GATEImageTextEncoder
 from gate.models.backbones.timm import (  # replace 'your_module' with the module where you have defined CLIPAdapter
     CLIPModelPaths,
     TimmCLIPEncoder,
+    TimmModel,
+    resolve_layer_indices,
 )
 
 
@@ -58,3 +60,105 @@ def test_forward_pass_video(encoder):
 def test_forward_pass_raises_exception_with_no_input(encoder):
     with pytest.raises(ValueError):
         encoder.forward()
+
+
+@pytest.mark.parametrize(
+    "model_identifier, image_size",
+    [("vit_tiny_patch16_224", 224), ("resnet18", 160)],
+)
+def test_output_shape_matches_a_real_forward_pass(
+    model_identifier, image_size
+):
+    model = TimmModel(
+        model_identifier=model_identifier,
+        image_size=image_size,
+        pretrained=False,
+    )
+    model.eval()
+    with torch.no_grad():
+        output = model(torch.zeros(1, 3, image_size, image_size))
+
+    shapes = model.get_output_shape()
+    assert shapes["raw_features"] == output["raw_features"].shape
+    assert shapes["features"] == output["features"].shape
+    assert shapes["per_layer_raw_features"] == [
+        item.shape for item in output["per_layer_raw_features"]
+    ]
+    assert model.num_output_features == output["raw_features"].shape[2]
+    assert model.num_patches == output["raw_features"].shape[1]
+
+
+def test_output_shape_is_cached_per_model_and_size():
+    model = TimmModel("resnet18", image_size=64, pretrained=False)
+    assert model.get_output_shape() is model.get_output_shape()
+    other = TimmModel("resnet18", image_size=96, pretrained=False)
+    assert other.get_output_shape()["raw_features"][1] == 9
+    assert model.get_output_shape()["raw_features"][1] == 4
+
+
+@pytest.mark.parametrize(
+    "output_layers, expected_layers",
+    [("final", [11]), (3, [9, 10, 11]), ([2, -7], [2, 5])],
+)
+def test_selected_output_layers_match_all_layers(
+    output_layers, expected_layers
+):
+    model = TimmModel(
+        model_identifier="vit_tiny_patch16_224",
+        image_size=224,
+        pretrained=False,
+        features_only=False,
+    )
+    model.eval()
+    image = torch.rand(2, 3, 224, 224)
+    with torch.no_grad():
+        all_layers = model(image)
+        model.set_output_layers(output_layers)
+        selected = model(image)
+
+    assert len(all_layers["per_layer_raw_features"]) == 12
+    assert len(selected["per_layer_raw_features"]) == len(expected_layers)
+    for layer, features in zip(
+        expected_layers, selected["per_layer_raw_features"]
+    ):
+        assert torch.equal(
+            features, all_layers["per_layer_raw_features"][layer]
+        )
+    assert torch.equal(
+        selected["raw_features"],
+        all_layers["per_layer_raw_features"][expected_layers[-1]],
+    )
+
+
+@pytest.mark.parametrize("output_layers", ["some", 0, 13, [12], []])
+def test_invalid_output_layers_raise(output_layers):
+    with pytest.raises(ValueError):
+        resolve_layer_indices(12, output_layers)
+
+
+def test_default_features_only_model_selects_blocks():
+    model = TimmModel(
+        model_identifier="vit_tiny_patch16_224",
+        image_size=224,
+        pretrained=False,
+    )
+    model.eval()
+    image = torch.rand(2, 3, 224, 224)
+    with torch.no_grad():
+        feature_getter_output = model.model(image)
+        all_layers = model(image, output_layers="all")
+        model.set_output_layers("final")
+        selected = model(image)
+
+    assert model.num_layers == 12
+    assert len(all_layers["per_layer_raw_features"]) == 12
+    assert len(selected["per_layer_raw_features"]) == 1
+    # the final layer is the last output of the FeatureGetterNet
+    assert torch.equal(
+        selected["per_layer_raw_features"][0], feature_getter_output[-1]
+    )
+    assert torch.equal(
+        selected["per_layer_raw_features"][0],
+        all_layers["per_layer_raw_features"][-1],
+    )
+    assert torch.equal(selected["raw_features"], all_layers["raw_features"])
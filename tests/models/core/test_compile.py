@@ -0,0 +1,231 @@
+import copy
+import os
+import shutil
+
+import pytest
+import timm
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import (
+    BertConfig,
+    BertModel,
+    CLIPTextConfig,
+    CLIPTextModel,
+    PreTrainedTokenizerFast,
+)
+
+from gate.models.backbones import TextProcessor
+from gate.models.compile import (
+    bucket_size,
+    compile_gate_model,
+    compile_stats,
+    reset_compile_stats,
+)
+from gate.models.core import GATEModel
+from gate.models.task_adapters.zero_shot_classification import (
+    DuoModalZeroShotModel,
+)
+
+MAX_SEQUENCE_LENGTH = 16
+
+
+def build_tokenizer():
+    words = "a photo of the cat dog bird car".split()
+    vocab = {"[PAD]": 0, "[UNK]": 1}
+    vocab.update({word: index + 2 for index, word in enumerate(words)})
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        pad_token="[PAD]",
+        unk_token="[UNK]",
+        model_max_length=MAX_SEQUENCE_LENGTH,
+    )
+
+
+def build_clip_text_encoder(tiny_encoder):
+    # a causal CLIP text model, pooled at the end of text token
+    encoder = tiny_encoder(num_features=32)
+    encoder.text_embedding = CLIPTextModel(
+        CLIPTextConfig(
+            vocab_size=16,
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            max_position_embeddings=MAX_SEQUENCE_LENGTH,
+            bos_token_id=1,
+            eos_token_id=9,
+        )
+    )
+    encoder.text_transforms = TextProcessor(build_tokenizer())
+    encoder.pads_sequences_safely = True
+    return encoder
+
+
+def build_timm_clip_encoder(tiny_encoder):
+    # a timm ViT for images, with the CLIP text model for text
+    encoder = build_clip_text_encoder(tiny_encoder)
+    encoder.conv = timm.create_model(
+        "test_vit",
+        pretrained=False,
+        num_classes=0,
+        global_pool="",
+        img_size=32,
+        embed_dim=32,
+    )
+    return encoder
+
+
+def build_bert_text_encoder(tiny_encoder):
+    # bidirectional, so every token attends to repeated padding tokens
+    encoder = build_clip_text_encoder(tiny_encoder)
+    encoder.text_embedding = BertModel(
+        BertConfig(
+            vocab_size=16,
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            max_position_embeddings=MAX_SEQUENCE_LENGTH,
+        )
+    )
+    encoder.pads_sequences_safely = False
+    return encoder
+
+
+def test_bucket_size():
+    assert [bucket_size(size) for size in (1, 3, 4, 5, 33)] == [
+        1,
+        4,
+        4,
+        8,
+        64,
+    ]
+    assert bucket_size(5, buckets=[4, 16]) == 16
+    assert bucket_size(17, buckets=[4, 16]) == 17
+    assert bucket_size(70, max_size=77) == 77
+
+
+@pytest.mark.parametrize("training", [False, True])
+def test_compiled_model_matches_eager_model(tiny_encoder, training):
+    torch.manual_seed(0)
+    adapter = DuoModalZeroShotModel(
+        encoder=build_clip_text_encoder(tiny_encoder),
+        projection_num_features=16,
+    )
+    model = GATEModel(config=adapter.modality_config, model=adapter)
+    eager_model = copy.deepcopy(model)
+    model.train(training)
+    eager_model.train(training)
+
+    reset_compile_stats()
+    compile_gate_model(model, backend="eager")
+
+    # batch sizes 5 to 7 share a bucket, as do 5 and 7 tokens
+    for batch_size, sequence_length in [(6, 5), (5, 7), (2, 5), (7, 5)]:
+        image = torch.randn(batch_size, 3, 16, 16)
+        text = torch.randint(2, 9, (batch_size, sequence_length))
+        text[:, -1] = 9
+        inputs = {"image": image, "text": text}
+        output = model(inputs)["image_text"]["image_text"]
+        expected = eager_model(inputs)["image_text"]["image_text"]
+        torch.testing.assert_close(
+            output["logits"], expected["logits"], atol=1e-4, rtol=1e-4
+        )
+        torch.testing.assert_close(
+            output["loss"], expected["loss"], atol=1e-4, rtol=1e-4
+        )
+        if training:
+            output["loss"].backward()
+            expected["loss"].backward()
+
+    if training:
+        gradients = {
+            name: parameter.grad
+            for name, parameter in model.named_parameters()
+        }
+        # the padded batches change the reductions of four accumulated
+        # backwards
+        for name, parameter in eager_model.named_parameters():
+            torch.testing.assert_close(
+                gradients[name], parameter.grad, atol=1e-3, rtol=1e-3
+            )
+
+    stats = compile_stats()
+    assert stats["compiled_graphs"] > 0
+    assert stats["compile_time"] > 0
+    # (6, 5) compiles, (5, 7) reuses its buckets, (2, 5) needs a new
+    # batch bucket, (7, 5) reuses the first buckets again
+    assert stats["recompiles"] == 1
+    assert set(model.state_dict()) == set(eager_model.state_dict())
+
+
+@pytest.mark.skipif(
+    shutil.which(os.environ.get("CXX", "g++")) is None,
+    reason="inductor needs a C++ compiler to generate CPU kernels",
+)
+def test_inductor_compiled_timm_model_matches_eager_model(tiny_encoder):
+    torch.manual_seed(0)
+    adapter = DuoModalZeroShotModel(
+        encoder=build_timm_clip_encoder(tiny_encoder),
+        projection_num_features=16,
+    )
+    model = GATEModel(config=adapter.modality_config, model=adapter).eval()
+    eager_model = copy.deepcopy(model)
+
+    reset_compile_stats()
+    compile_gate_model(model, backend="inductor")
+
+    # both batches share the batch and token buckets
+    for batch_size, sequence_length in [(3, 5), (4, 6)]:
+        image = torch.randn(batch_size, 3, 32, 32)
+        text = torch.randint(2, 9, (batch_size, sequence_length))
+        text[:, -1] = 9
+        inputs = {"image": image, "text": text}
+        with torch.no_grad():
+            output = model(inputs)["image_text"]["image_text"]
+            expected = eager_model(inputs)["image_text"]["image_text"]
+        torch.testing.assert_close(
+            output["logits"], expected["logits"], atol=1e-4, rtol=1e-4
+        )
+
+    stats = compile_stats()
+    assert stats["compiled_graphs"] > 0
+    assert stats["recompiles"] == 0
+
+
+def test_bidirectional_text_encoders_keep_their_sequence_lengths(
+    tiny_encoder,
+):
+    torch.manual_seed(0)
+    adapter = DuoModalZeroShotModel(
+        encoder=build_bert_text_encoder(tiny_encoder),
+        projection_num_features=16,
+    )
+    model = GATEModel(config=adapter.modality_config, model=adapter).eval()
+    eager_model = copy.deepcopy(model)
+
+    sequence_lengths = []
+    adapter.encoder.text_embedding.register_forward_pre_hook(
+        lambda module, args: sequence_lengths.append(args[0].shape[-1])
+    )
+    compile_gate_model(model, backend="eager")
+
+    image = torch.randn(3, 3, 16, 16)
+    text = torch.randint(2, 9, (3, 5))
+    inputs = {"image": image, "text": text}
+    with torch.no_grad():
+        output = model(inputs)["image_text"]["image_text"]
+        expected = eager_model(inputs)["image_text"]["image_text"]
+        # padded to 8 tokens, every real token would see the padding
+        padded = eager_model.model.encoder(
+            text=torch.cat([text, text[:, -1:].expand(3, 3)], dim=1)
+        )["text"]["features"]
+        unpadded = eager_model.model.encoder(text=text)["text"]["features"]
+
+    assert sequence_lengths == [5]
+    torch.testing.assert_close(
+        output["logits"], expected["logits"], atol=1e-5, rtol=1e-5
+    )
+    assert not torch.allclose(padded, unpadded, atol=1e-5)
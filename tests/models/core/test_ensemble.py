@@ -1,11 +1,43 @@
+from types import SimpleNamespace
+
+import pytest
 import torch
 from rich.traceback import install
 from torch import nn
 from torch.testing import assert_close
+from torch.utils.data import DataLoader, default_collate
 
 install()
 
-from gate.models.core import Ensemble
+from gate.boilerplate.core import ExperimentStatus, Learner
+from gate.boilerplate.decorators import ensemble_marker
+from gate.models.core import (
+    CachedOutputEnsemble,
+    Ensemble,
+    GATEModel,
+    OutputRecorder,
+    SourceModalityConfig,
+    TargetModalityConfig,
+)
+from gate.orchestration.evaluators.classification import (
+    ImageClassificationEvaluator,
+)
+from gate.orchestration.evaluators.segmentation import (
+    MedicalSemanticSegmentationEvaluator,
+)
+
+
+class LinearClassifier(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = nn.Linear(10, 5)
+
+    @ensemble_marker
+    def compute_loss_and_metrics(self, logits, labels):
+        return {"loss": nn.functional.cross_entropy(logits, labels)}
+
+    def forward(self, x, labels=None):
+        return {"logits": self.linear(x), "labels": labels}
 
 
 def test_ensemble():
@@ -61,3 +93,180 @@ def test_ensemble():
     #     rtol=1e-1,
     #     atol=1e-1,
     # )
+
+
+def test_cached_output_ensemble_matches_ensemble():
+    models = [LinearClassifier() for _ in range(3)]
+    batches = [
+        (torch.randn(4, 10), torch.randint(0, 5, (4,))) for _ in range(2)
+    ]
+
+    # record every member once, then replay any prefix of the members
+    cached_outputs = []
+    for idx, model in enumerate(models):
+        recorder = OutputRecorder(model, record_labels=idx == 0)
+        for x, labels in batches:
+            recorder(x, labels=labels)
+        cached_outputs.append(recorder.outputs)
+
+    for kth in [1, 3]:
+        ensemble = Ensemble(models[:kth])
+        cached_ensemble = CachedOutputEnsemble(
+            reference_model=models[0], cached_outputs=cached_outputs[:kth]
+        )
+        for x, labels in batches:
+            expected = ensemble(x, labels=labels)
+            output = cached_ensemble(x, labels=labels)
+
+            assert set(output.keys()) == set(expected.keys())
+            for key, value in expected.items():
+                assert_close(output[key], value)
+
+
+def run_test_phase(evaluator):
+    calls = []
+    learner = SimpleNamespace(
+        status=ExperimentStatus.TESTING,
+        model=LinearClassifier(),
+        evaluator=evaluator,
+        cached_ensemble_testing=True,
+        model_soup_testing=False,
+        global_step=0,
+        test_dataloader=None,
+        accelerator=SimpleNamespace(prepare=lambda model: model),
+        test_cached_ensembles=lambda **kwargs: calls.append("cached"),
+        load_best_model=lambda **kwargs: calls.append("loaded") or None,
+        _testing_loop=lambda **kwargs: None,
+        save_checkpoint=lambda **kwargs: None,
+        checkpoint_writer=SimpleNamespace(wait=lambda: None),
+        dispatch_completed_checkpoints=lambda: None,
+    )
+    Learner.test(learner)
+    return calls
+
+
+def test_cached_ensembles_only_replay_one_forward_per_batch():
+    assert run_test_phase(ImageClassificationEvaluator()) == ["cached"]
+    # the medical evaluator runs the model on sub-batches of the volumes,
+    # which a per-batch replay would misalign
+    assert (
+        run_test_phase(MedicalSemanticSegmentationEvaluator())
+        == ["loaded"] * 3
+    )
+
+
+class SmallConvClassifier(LinearClassifier):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 4, kernel_size=3, padding=1)
+        self.norm = nn.BatchNorm2d(4)
+        self.linear = nn.Linear(4 * 4 * 4, 5)
+
+    def forward(self, x, labels=None):
+        features = self.norm(self.conv(x)).relu().flatten(1)
+        return {"logits": self.linear(features), "labels": labels}
+
+
+def test_vectorized_ensemble_matches_sequential_members():
+    models = [SmallConvClassifier() for _ in range(5)]
+    for model in models:
+        nn.init.normal_(model.norm.running_mean)
+    x = torch.randn(3, 3, 4, 4)
+    labels = torch.randint(0, 5, (3,))
+    with torch.no_grad():
+        logits = torch.stack([model.eval()(x)["logits"] for model in models])
+
+    streaming = Ensemble(models)(x, labels=labels)
+    vectorized_ensemble = Ensemble(models, vectorize=True)
+    vectorized = vectorized_ensemble(x, labels=labels)
+
+    assert vectorized_ensemble.vectorize
+    assert (
+        set(vectorized.keys()) == set(streaming.keys()) == {"logits", "loss"}
+    )
+    for output in (streaming, vectorized):
+        assert_close(output["logits"], logits.mean(dim=0))
+    assert_close(vectorized["loss"], streaming["loss"])
+
+    # the members now view one stacked copy of their parameters
+    params, _ = vectorized_ensemble.stacked_state
+    weight = params["conv.weight"]
+    assert models[2].conv.weight.data_ptr() == weight[2].data_ptr()
+
+
+class DataDependentClassifier(LinearClassifier):
+    def forward(self, x, labels=None):
+        logits = self.linear(x)
+        # .item() cannot be vmapped
+        if logits.sum().item() < 0:
+            logits = -logits
+        return {"logits": logits, "labels": labels}
+
+
+def test_ensemble_falls_back_to_sequential_members():
+    models = [DataDependentClassifier() for _ in range(2)]
+    x = torch.randn(4, 10)
+    with torch.no_grad():
+        expected = (models[0](x)["logits"] + models[1](x)["logits"]) / 2
+
+    ensemble = Ensemble(models, vectorize=True)
+
+    assert_close(ensemble(x)["logits"], expected)
+    assert not ensemble.vectorize
+
+
+def test_members_of_different_architectures_are_not_stacked():
+    ensemble = Ensemble(
+        [LinearClassifier(), SmallConvClassifier()], vectorize=True
+    )
+
+    assert ensemble.stack_state() is None
+    assert not ensemble.vectorize
+
+
+class ImageLinearClassifier(LinearClassifier):
+    def forward(self, image, labels=None):
+        return super().forward(image, labels=labels)
+
+
+@pytest.mark.parametrize("memory_map_ensemble_outputs", [False, True])
+def test_cache_checkpoint_outputs_skips_failed_batches(
+    tmp_path, memory_map_ensemble_outputs
+):
+    modality_config = TargetModalityConfig(
+        image=[SourceModalityConfig(image=True)]
+    )
+    model = GATEModel(config=modality_config, model=ImageLinearClassifier())
+    checkpoint_path = tmp_path / "model.pt"
+    torch.save(model.state_dict(), checkpoint_path)
+
+    samples = [
+        {"image": torch.randn(10), "labels": torch.tensor(idx % 5)}
+        for idx in range(6)
+    ]
+
+    def collate_fn(batch):
+        # the skip collate returns None once every sample of a batch failed
+        if len(batch) == 2:
+            return None
+        return default_collate(batch)
+
+    learner = SimpleNamespace(
+        experiment_dir=tmp_path,
+        memory_map_ensemble_outputs=memory_map_ensemble_outputs,
+        accelerator=SimpleNamespace(device=torch.device("cpu")),
+        test_dataloader=DataLoader(
+            samples, batch_size=4, collate_fn=collate_fn
+        ),
+    )
+    cached_outputs = Learner.cache_checkpoint_outputs(
+        learner,
+        download_dict_list=[{"model_filepath": checkpoint_path}] * 2,
+        model=model,
+    )
+
+    assert len(cached_outputs) == 2
+    for outputs in cached_outputs:
+        assert len(outputs) == 1
+        assert outputs[0]["logits"].shape == (4, 5)
+    assert_close(cached_outputs[0][0]["labels"], torch.arange(4) % 5)
@@ -0,0 +1,186 @@
+from types import SimpleNamespace
+
+import torch
+import torch.nn.functional as F
+from accelerate import Accelerator
+from torch import nn
+from torch.testing import assert_close
+
+from gate.boilerplate.callbacks import Callback
+from gate.boilerplate.core import Learner
+from gate.models.core import ModelSoup
+from gate.orchestration.evaluators.classification import (
+    ImageClassificationEvaluator,
+)
+
+
+def make_checkpoints(tmp_path, num_checkpoints):
+    download_dict_list = []
+    state_dicts = []
+    for idx in range(num_checkpoints):
+        torch.manual_seed(idx)
+        model = nn.Sequential(nn.Linear(4, 8), nn.BatchNorm1d(8))
+        model[1].running_mean.normal_()
+        model_filepath = tmp_path / f"ckpt_{idx}.bin"
+        torch.save(model.state_dict(), model_filepath)
+        download_dict_list.append(
+            {"model_filepath": model_filepath, "global_step": idx}
+        )
+        state_dicts.append(model.state_dict())
+    return download_dict_list, state_dicts
+
+
+def mean_state_dict(state_dicts):
+    return {
+        name: torch.stack([state_dict[name] for state_dict in state_dicts])
+        .float()
+        .mean(dim=0)
+        for name in state_dicts[0]
+        if state_dicts[0][name].is_floating_point()
+    }
+
+
+def test_uniform_soup_is_the_mean_of_the_checkpoints():
+    models = []
+    for _ in range(3):
+        models.append(nn.Sequential(nn.Linear(4, 8), nn.BatchNorm1d(8)))
+        models[-1][1].running_var.uniform_()
+    model = nn.Sequential(nn.Linear(4, 8), nn.BatchNorm1d(8))
+
+    soup = ModelSoup()
+    for ingredient in models:
+        model.load_state_dict(ingredient.state_dict())
+        soup.mix_into(model)
+        soup.add(model)
+
+    expected = mean_state_dict([m.state_dict() for m in models])
+    for name, value in expected.items():
+        assert_close(soup.state_dict[name], value)
+    assert soup.num_ingredients == 3
+
+
+def test_greedy_soup_only_adds_checkpoints_that_improve_validation(tmp_path):
+    download_dict_list, state_dicts = make_checkpoints(tmp_path, 4)
+    # candidate soups 0, 0+1 (worse), 0+2 and 0+2+3 (worse)
+    validation_metrics = iter([0.5, 0.4, 0.6, 0.55])
+    learner = SimpleNamespace(
+        accelerator=SimpleNamespace(device="cpu"),
+        validation_metric=lambda **kwargs: next(validation_metrics),
+        # checkpoint 0 recorded the best validation metric during training
+        get_model_selection_metric_by_step=lambda: {0: 0.9, 1: 0.8, 2: 0.7},
+    )
+    evaluator = SimpleNamespace(
+        model_selection_metric_name="accuracy_top_1-epoch-mean",
+        model_selection_metric_higher_is_better=True,
+    )
+    model = nn.Sequential(nn.Linear(4, 8), nn.BatchNorm1d(8))
+
+    soup = Learner.make_model_soup(
+        learner,
+        download_dict_list=download_dict_list[::-1],
+        model=model,
+        evaluator=evaluator,
+        greedy=True,
+    )
+
+    expected = mean_state_dict([state_dicts[0], state_dicts[2]])
+    assert soup.num_ingredients == 2
+    for name, value in expected.items():
+        assert_close(soup.state_dict[name], value)
+
+
+class TinyImageClassifier(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = nn.Linear(4, 3)
+
+    def forward(self, batch):
+        logits = self.linear(batch["image"])
+        labels = batch["labels"]
+        return {
+            "image": {
+                "image": {
+                    "loss": F.cross_entropy(logits, labels),
+                    "accuracy_top_1": (logits.argmax(dim=-1) == labels)
+                    .float()
+                    .mean(),
+                }
+            }
+        }
+
+
+class EventRecorder(Callback):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def __getattribute__(self, name):
+        if name.startswith("on_"):
+            self.events.append(name)
+        return super().__getattribute__(name)
+
+
+def test_greedy_soup_validates_with_a_real_evaluator(tmp_path):
+    torch.manual_seed(0)
+    teacher = TinyImageClassifier()
+    images = torch.randn(32, 4)
+    with torch.no_grad():
+        labels = teacher.linear(images).argmax(dim=-1)
+    val_dataloader = torch.utils.data.DataLoader(
+        [
+            {"image": image, "labels": label}
+            for image, label in zip(images, labels)
+        ],
+        batch_size=8,
+    )
+
+    # the teacher, then its negation, which only gets the argmin right
+    download_dict_list = []
+    for idx, sign in enumerate([1.0, -1.0]):
+        state_dict = {
+            name: sign * value for name, value in teacher.state_dict().items()
+        }
+        model_filepath = tmp_path / f"ckpt_{idx}.bin"
+        torch.save(state_dict, model_filepath)
+        download_dict_list.append(
+            {"model_filepath": model_filepath, "global_step": idx}
+        )
+
+    evaluator = ImageClassificationEvaluator()
+    recorder = EventRecorder()
+    learner = Learner(
+        experiment_name="soup",
+        accelerator=Accelerator(cpu=True),
+        root_dir=tmp_path,
+        model=TinyImageClassifier(),
+        trainer=SimpleNamespace(),
+        evaluator=evaluator,
+        val_dataloader=val_dataloader,
+        callbacks=[recorder],
+    )
+    assert "on_init_end" in recorder.events
+    recorder.events.clear()
+
+    metric = learner.validation_metric(
+        model=teacher,
+        evaluator=evaluator,
+        metric_name=evaluator.model_selection_metric_name,
+    )
+    assert metric == 1.0
+
+    model = TinyImageClassifier()
+    soup = learner.make_model_soup(
+        download_dict_list=download_dict_list,
+        model=model,
+        evaluator=evaluator,
+        greedy=True,
+        prepared_model=learner.accelerator.prepare(model),
+    )
+
+    assert soup.num_ingredients == 1
+    for name, value in teacher.state_dict().items():
+        assert_close(soup.state_dict[name], value)
+    # validating the candidates left no trace
+    assert recorder.events == []
+    assert len(evaluator.per_epoch_metrics) == 0
+    assert not any(learner.checkpoints_dir.iterdir())
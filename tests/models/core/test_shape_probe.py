@@ -0,0 +1,74 @@
+import pytest
+
+from gate.models.task_adapters import BaseAdapterModule
+from gate.models.task_adapters.few_shot_classification.protonet import (
+    PrototypicalNetwork,
+)
+from gate.models.task_adapters.multi_class_classification import (
+    MultiClassBackboneWithLinear,
+)
+from gate.models.task_adapters.relational_reasoning import DuoModalFusionModel
+from gate.models.task_adapters.semantic_segmentation import SegmentationAdapter
+from gate.models.task_adapters.standard_classification import (
+    BackboneWithLinearClassification,
+)
+from gate.models.task_adapters.temporal_image_classification import (
+    BackboneWithTemporalTransformerAndLinear,
+)
+from gate.models.task_adapters.zero_shot_classification import (
+    DuoModalZeroShotModel,
+)
+
+ADAPTERS = {
+    "standard_classification": lambda encoder: (
+        BackboneWithLinearClassification(encoder=encoder, num_classes=5)
+    ),
+    "multi_class_classification": lambda encoder: (
+        MultiClassBackboneWithLinear(encoder=encoder, num_classes=5)
+    ),
+    "semantic_segmentation": lambda encoder: SegmentationAdapter(
+        encoder=encoder,
+        num_classes=3,
+        output_target_image_size=256,
+        decoder_target_image_size=(8, 8),
+    ),
+    "relational_reasoning": lambda encoder: DuoModalFusionModel(
+        encoder=encoder, num_classes=4, projection_num_features=32
+    ),
+    "protonet": lambda encoder: PrototypicalNetwork(encoder=encoder),
+    "temporal_classification": lambda encoder: (
+        BackboneWithTemporalTransformerAndLinear(
+            encoder=encoder,
+            num_classes=4,
+            temporal_transformer_dim_feedforward=32,
+            temporal_transformer_num_layers=1,
+        )
+    ),
+    "zero_shot": lambda encoder: DuoModalZeroShotModel(
+        encoder=encoder, projection_num_features=32
+    ),
+}
+
+
+def parameter_shapes(module):
+    return {
+        name: tuple(tensor.shape)
+        for name, tensor in module.state_dict().items()
+    }
+
+
+@pytest.mark.parametrize("adapter_name", sorted(ADAPTERS))
+def test_meta_probing_builds_the_same_parameters(
+    monkeypatch, tiny_encoder, adapter_name
+):
+    build_adapter = ADAPTERS[adapter_name]
+
+    probed = build_adapter(tiny_encoder())
+    assert probed.encoder.num_calls == 0
+    assert not any(tensor.is_meta for tensor in probed.state_dict().values())
+
+    monkeypatch.setattr(BaseAdapterModule, "shape_probe_device", None)
+    reference = build_adapter(tiny_encoder())
+    assert reference.encoder.num_calls > 0
+
+    assert parameter_shapes(probed) == parameter_shapes(reference)
@@ -0,0 +1,79 @@
+import torch
+
+from gate.models.task_adapters.zero_shot_classification import (
+    DuoModalZeroShotModel,
+)
+
+
+def build_models(tiny_encoder):
+    torch.manual_seed(0)
+    model = DuoModalZeroShotModel(
+        encoder=tiny_encoder(),
+        projection_num_features=32,
+        use_text_embedding_bank=True,
+    )
+    reference = DuoModalZeroShotModel(
+        encoder=tiny_encoder(),
+        projection_num_features=32,
+        use_text_embedding_bank=False,
+    )
+    reference.load_state_dict(model.state_dict())
+    for adapter in (model, reference):
+        # leave out the dummy batch of build()
+        adapter.encoder.num_text_calls = 0
+    return model.eval(), reference.eval()
+
+
+def logits(model, image, text):
+    with torch.no_grad():
+        output = model(image=image, text=text)
+    return output["logits"]["similarities"]["image_to_text_similarities"]
+
+
+def test_bank_logits_match_on_the_fly_logits(tiny_encoder):
+    model, reference = build_models(tiny_encoder)
+    prompts = torch.randint(0, 128, (4, 7))
+
+    for _ in range(3):
+        image = torch.rand(4, 3, 16, 16)
+        assert torch.allclose(
+            logits(model, image, prompts), logits(reference, image, prompts)
+        )
+
+    assert model.encoder.num_text_calls == 1
+    assert reference.encoder.num_text_calls == 3
+    assert model.text_embedding_bank.num_hits == 2
+
+    other_prompts = torch.randint(0, 128, (4, 7))
+    image = torch.rand(4, 3, 16, 16)
+    assert torch.allclose(
+        logits(model, image, other_prompts),
+        logits(reference, image, other_prompts),
+    )
+    assert model.encoder.num_text_calls == 2
+
+
+def test_bank_is_invalidated_when_text_parameters_change(tiny_encoder):
+    model, reference = build_models(tiny_encoder)
+    prompts = torch.randint(0, 128, (4, 7))
+    image = torch.rand(4, 3, 16, 16)
+    logits(model, image, prompts)
+
+    for adapter in (model, reference):
+        adapter.train()
+        optimizer = torch.optim.SGD(adapter.parameters(), lr=1.0)
+        output = adapter(image=image, text=prompts)
+        output["loss"].backward()
+        optimizer.step()
+        adapter.eval()
+
+    assert torch.allclose(
+        logits(model, image, prompts), logits(reference, image, prompts)
+    )
+    assert model.text_embedding_bank.num_misses == 2
+
+    # image parameters alone leave the text embeddings valid
+    with torch.no_grad():
+        model.encoder.conv.weight.add_(1.0)
+    logits(model, image, prompts)
+    assert model.text_embedding_bank.num_hits == 1
@@ -0,0 +1,103 @@
+import time
+
+import fire
+import numpy as np
+import torch
+import torchvision.transforms as T
+from PIL import Image
+from rich import print
+
+from gate.data.image.classification.imagenet1k import StandardAugmentations
+from gate.data.transforms.batch_augment import BatchAugmentation
+
+
+def build_images(num_images: int, image_size: int):
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(
+            rng.integers(0, 256, (image_size, image_size, 3), dtype=np.uint8)
+        )
+        for _ in range(num_images)
+    ]
+
+
+def per_sample_throughput(images, batch_size: int, output_size: int):
+    """
+    The previous training path: RandAugment on every PIL image, the
+    ToTensor -> ToPILImage round trip, then a per-sample crop and flip.
+    """
+    augmentations = StandardAugmentations(image_key="image")
+    crop = T.Compose(
+        [
+            T.RandomResizedCrop(output_size, antialias=True),
+            T.RandomHorizontalFlip(),
+            T.PILToTensor(),
+        ]
+    )
+
+    start_time = time.perf_counter()
+    for batch_start in range(0, len(images), batch_size):
+        batch = []
+        for image in images[batch_start : batch_start + batch_size]:
+            image = augmentations({"image": image})["image"]
+            image = T.ToPILImage()(T.ToTensor()(image))
+            batch.append(crop(image))
+        torch.stack(batch)
+    return len(images) / (time.perf_counter() - start_time)
+
+
+def batched_throughput(images, batch_size: int, output_size: int):
+    augmentation = BatchAugmentation(output_size=output_size, seed=0)
+    to_tensor = T.PILToTensor()
+
+    start_time = time.perf_counter()
+    for batch_start in range(0, len(images), batch_size):
+        batch = torch.stack(
+            [
+                to_tensor(image)
+                for image in images[batch_start : batch_start + batch_size]
+            ]
+        )
+        augmentation(batch)
+    return len(images) / (time.perf_counter() - start_time)
+
+
+def main(
+    num_images: int = 512,
+    batch_size: int = 64,
+    image_size: int = 256,
+    output_size: int = 224,
+    num_threads: int = 1,
+    repeats: int = 3,
+):
+    """
+    Compare images/sec of per-sample PIL augmentation against augmenting
+    collated uint8 batches with BatchAugmentation, on the CPU of a single
+    dataloader worker.
+
+    Example:
+        python tools/benchmarks/benchmark_batch_augmentation.py --batch_size=128
+    """
+    torch.set_num_threads(num_threads)
+    images = build_images(num_images=num_images, image_size=image_size)
+
+    per_sample_throughput(images[:batch_size], batch_size, output_size)
+    batched_throughput(images[:batch_size], batch_size, output_size)
+
+    before = max(
+        per_sample_throughput(images, batch_size, output_size)
+        for _ in range(repeats)
+    )
+    after = max(
+        batched_throughput(images, batch_size, output_size)
+        for _ in range(repeats)
+    )
+
+    print(f"per-sample augmentation: {before:.1f} images/sec")
+    print(f"batched augmentation: {after:.1f} images/sec")
+    print(f"speedup: {after / before:.3f}x")
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,82 @@
+import json
+import subprocess
+import sys
+
+import fire
+from rich import print
+
+EAGER_SCRIPT = """
+import importlib, json, logging, pkgutil, sys, time
+start_time = time.perf_counter()
+import gate
+from gate.boilerplate.decorators import register_module_configurables
+logging.disable(logging.CRITICAL)
+for _, name, _ in pkgutil.walk_packages(gate.__path__, "gate."):
+    if name == "gate.run":
+        continue
+    try:
+        register_module_configurables(importlib.import_module(name))
+    except Exception:
+        pass
+print(json.dumps([time.perf_counter() - start_time, len(sys.modules)]))
+"""
+
+MANIFEST_SCRIPT = """
+import json, logging, sys, time
+start_time = time.perf_counter()
+from gate.config.manifest import load_manifest, register_manifest
+logging.disable(logging.CRITICAL)
+manifest = load_manifest()
+if "--all-importable" in sys.argv:
+    # as if every module imported when the manifest was generated
+    manifest["unimported_modules"] = []
+register_manifest(manifest)
+print(json.dumps([time.perf_counter() - start_time, len(sys.modules)]))
+"""
+
+
+def run(script: str, *args: str):
+    output = subprocess.run(
+        [sys.executable, "-c", script, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(repeats: int = 3):
+    """
+    Compare the time, in a fresh interpreter, to register every
+    configurable by importing all of `gate` against registering them from
+    the manifest. Both include the import of gate itself.
+
+    This measures config registration only. Launching `gate.run` still
+    imports accelerate, transformers, timm etc. through gate.boilerplate,
+    and modules listed as unimported in the manifest (the gulpio2/decord
+    video builders when it was generated without them) are imported as
+    fallbacks at registration.
+
+    Example:
+        python tools/benchmarks/benchmark_config_registration.py
+    """
+    eager = min(run(EAGER_SCRIPT) for _ in range(repeats))
+    lazy = min(run(MANIFEST_SCRIPT) for _ in range(repeats))
+    complete = min(
+        run(MANIFEST_SCRIPT, "--all-importable") for _ in range(repeats)
+    )
+
+    print(f"import every module: {eager[0]:.2f} sec, {eager[1]} modules")
+    print(f"manifest: {lazy[0]:.2f} sec, {lazy[1]} modules")
+    print(
+        f"manifest without unimported modules: {complete[0]:.2f} sec, "
+        f"{complete[1]} modules"
+    )
+    print(
+        f"speedup: {eager[0] / lazy[0]:.1f}x to {eager[0] / complete[0]:.1f}x"
+    )
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,172 @@
+import time
+
+import fire
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from accelerate import Accelerator
+from accelerate.utils import DataLoaderConfiguration
+from rich import print
+from torch.utils.data import DataLoader, Dataset
+
+from gate.config.variables import NUM_WORKERS, PREFETCH_FACTOR
+from gate.data.core import collate_fn_with_token_pad
+
+
+class SlowImageTextDataset(Dataset):
+    """
+    Image-text samples shaped like GATE's, whose loading sleeps to stand
+    in for decoding and augmentation.
+    """
+
+    def __init__(
+        self,
+        num_samples: int,
+        image_size: int,
+        max_num_tokens: int,
+        load_time: float,
+    ):
+        self.num_samples = num_samples
+        self.image_size = image_size
+        self.max_num_tokens = max_num_tokens
+        self.load_time = load_time
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getitem__(self, idx):
+        time.sleep(self.load_time)
+        generator = torch.Generator().manual_seed(idx)
+        num_tokens = 1 + idx % self.max_num_tokens
+        return {
+            "image": torch.rand(
+                3, self.image_size, self.image_size, generator=generator
+            ),
+            "text": torch.randint(1, 1000, (num_tokens,), generator=generator),
+            "labels": torch.tensor(idx % 10),
+        }
+
+
+def build_training_step():
+    model = nn.Sequential(
+        nn.Conv2d(3, 16, kernel_size=3, stride=2),
+        nn.ReLU(),
+        nn.AdaptiveAvgPool2d(1),
+        nn.Flatten(),
+        nn.Linear(16, 10),
+    )
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01)
+
+    def training_step(batch):
+        optimizer.zero_grad()
+        logits = model(batch["image"])
+        loss = F.cross_entropy(logits, batch["labels"])
+        loss.backward()
+        optimizer.step()
+
+    return training_step
+
+
+def run_epochs(
+    dataset: Dataset,
+    training_step,
+    batch_size: int,
+    num_epochs: int,
+    num_workers: int,
+    prefetch_factor: int,
+    persistent_workers: bool,
+    pin_memory: bool,
+    non_blocking: bool,
+) -> float:
+    accelerator = Accelerator(
+        cpu=not torch.cuda.is_available(),
+        dataloader_config=DataLoaderConfiguration(non_blocking=non_blocking),
+    )
+    dataloader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        collate_fn=collate_fn_with_token_pad,
+        num_workers=num_workers,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+        persistent_workers=persistent_workers and num_workers > 0,
+        pin_memory=pin_memory and torch.cuda.is_available(),
+    )
+    dataloader = accelerator.prepare(dataloader)
+
+    # every epoch restarts the loader, as each validation loop does
+    num_samples = 0
+    start_time = time.perf_counter()
+    for _ in range(num_epochs):
+        for batch in dataloader:
+            training_step(batch)
+            num_samples += batch["labels"].shape[0]
+    return num_samples / (time.perf_counter() - start_time)
+
+
+def main(
+    num_samples: int = 512,
+    batch_size: int = 32,
+    image_size: int = 64,
+    max_num_tokens: int = 77,
+    load_time: float = 0.002,
+    num_epochs: int = 4,
+    num_workers: int = int(NUM_WORKERS),
+    prefetch_factor: int = int(PREFETCH_FACTOR),
+):
+    """
+    Compare training samples/sec through an accelerate-prepared dataloader
+    with the repo's default loader settings (NUM_WORKERS workers,
+    PREFETCH_FACTOR, pinned batches, blocking copies) against the same
+    loader with persistent workers, which are no longer restarted every
+    epoch, and, on a GPU only, with non-blocking copies of the pinned
+    batches.
+
+    Example:
+        python tools/benchmarks/benchmark_dataloader_overlap.py --num_workers=4
+    """
+    dataset = SlowImageTextDataset(
+        num_samples=num_samples,
+        image_size=image_size,
+        max_num_tokens=max_num_tokens,
+        load_time=load_time,
+    )
+    training_step = build_training_step()
+
+    defaults = dict(
+        num_workers=num_workers,
+        prefetch_factor=prefetch_factor,
+        persistent_workers=False,
+        pin_memory=True,
+        non_blocking=False,
+    )
+    settings = {
+        f"defaults ({num_workers} workers, prefetch_factor="
+        f"{prefetch_factor})": defaults,
+        "persistent workers": defaults | dict(persistent_workers=True),
+    }
+    if torch.cuda.is_available():
+        settings["non-blocking copies"] = defaults | dict(non_blocking=True)
+
+    baseline = None
+    for name, setting in settings.items():
+        samples_per_second = run_epochs(
+            dataset,
+            training_step,
+            batch_size=batch_size,
+            num_epochs=num_epochs,
+            **setting,
+        )
+        baseline = baseline or samples_per_second
+        print(
+            f"{name}: {samples_per_second:.1f} samples/sec "
+            f"({samples_per_second / baseline:.3f}x)"
+        )
+
+    if not torch.cuda.is_available():
+        # pinning and non-blocking copies do nothing without a GPU
+        print("non-blocking copies: not measured, no CUDA device")
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,108 @@
+import copy
+import time
+
+import fire
+import torch
+import torch.nn as nn
+from rich import print
+
+from gate.models.core import Ensemble
+
+
+def build_members(model_name: str, num_models: int, num_classes: int):
+    if model_name == "mlp":
+        base_model = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(3 * 32 * 32, 1024),
+            nn.GELU(),
+            nn.Linear(1024, 1024),
+            nn.GELU(),
+            nn.Linear(1024, num_classes),
+        )
+        input_shape = (3, 32, 32)
+    else:
+        import timm
+
+        base_model = timm.create_model(
+            model_name, pretrained=False, num_classes=num_classes
+        )
+        input_shape = base_model.pretrained_cfg["input_size"]
+
+    members = []
+    for seed in range(num_models):
+        torch.manual_seed(seed)
+        member = copy.deepcopy(base_model)
+        for parameter in member.parameters():
+            nn.init.normal_(parameter, std=0.02)
+        members.append(member)
+    return members, input_shape
+
+
+def sequential_loop(ensemble: Ensemble, inputs: torch.Tensor):
+    # The previous forward: every member's logits are kept and stacked
+    with torch.inference_mode():
+        model_outputs = [model(inputs) for model in ensemble.models]
+        return ensemble.combine_outputs(model_outputs=model_outputs)
+
+
+def time_forward(forward, num_iterations: int) -> float:
+    forward()
+    start_time = time.perf_counter()
+    for _ in range(num_iterations):
+        forward()
+    return (time.perf_counter() - start_time) / num_iterations * 1000
+
+
+def main(
+    model_name: str = "mlp",
+    num_models: int = 5,
+    batch_size: int = 64,
+    num_classes: int = 100,
+    num_iterations: int = 20,
+    num_threads: int = 1,
+    repeats: int = 3,
+):
+    """
+    Compare the latency of the previous member-by-member ensemble forward
+    with the vmapped and streaming forwards of Ensemble, on CPU, and
+    check that they agree.
+
+    Example:
+        python tools/benchmarks/benchmark_ensemble.py --model_name=vit_tiny_patch16_224
+    """
+    torch.set_num_threads(num_threads)
+    members, input_shape = build_members(model_name, num_models, num_classes)
+    inputs = torch.randn(batch_size, *input_shape)
+
+    loop = Ensemble(members)
+    streaming = Ensemble(members)
+    vectorized = Ensemble(members, vectorize=True)
+
+    expected = sequential_loop(loop, inputs)["logits"]
+    for name, ensemble in (("streaming", streaming), ("vmap", vectorized)):
+        logits = ensemble(inputs)["logits"]
+        max_error = (logits - expected).abs().max().item()
+        print(f"{name}: max abs difference to the loop {max_error:.2e}")
+    print(f"vmap in use: {vectorized.vectorize}")
+
+    timings = {
+        "loop (stacked logits)": lambda: sequential_loop(loop, inputs),
+        "streaming mean": lambda: streaming(inputs),
+        "vmap": lambda: vectorized(inputs),
+    }
+    milliseconds = {name: float("inf") for name in timings}
+    # interleave the repeats so that drift affects every forward alike
+    for _ in range(repeats):
+        for name, forward in timings.items():
+            milliseconds[name] = min(
+                milliseconds[name], time_forward(forward, num_iterations)
+            )
+
+    baseline = milliseconds["loop (stacked logits)"]
+    for name, value in milliseconds.items():
+        print(f"{name}: {value:.2f} ms/batch ({baseline / value:.2f}x)")
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(main)
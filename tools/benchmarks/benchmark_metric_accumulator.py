@@ -0,0 +1,115 @@
+import time
+from collections import defaultdict
+
+import fire
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from rich import print
+
+from gate.orchestration.utils.metric_accumulator import MetricAccumulator
+
+
+def build_training_step(
+    batch_size: int, num_features: int, num_classes: int, device: str
+):
+    model = nn.Sequential(
+        nn.Linear(num_features, 256),
+        nn.ReLU(),
+        nn.Linear(256, num_classes),
+    ).to(device)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01)
+    inputs = torch.randn(batch_size, num_features, device=device)
+    labels = torch.randint(0, num_classes, (batch_size,), device=device)
+
+    def training_step():
+        optimizer.zero_grad()
+        logits = model(inputs)
+        loss = F.cross_entropy(logits, labels)
+        loss.backward()
+        optimizer.step()
+        accuracy = (logits.argmax(dim=-1) == labels).float().mean()
+        return {"loss": loss, "accuracy_top_1": accuracy}
+
+    return training_step
+
+
+def run_per_step_host_copies(training_step, num_steps: int) -> float:
+    # The previous pattern: every metric is copied to the host on every step
+    # and the loss is formatted for the progress bar
+    current_epoch_dict = defaultdict(list)
+    start_time = time.perf_counter()
+    for _ in range(num_steps):
+        output_dict = training_step()
+        for key, value in output_dict.items():
+            current_epoch_dict[key].append(value.detach().cpu())
+        loss = torch.mean(torch.stack([output_dict["loss"]]))
+        _ = f"Loss: {loss:.4f}"
+    for key, value in current_epoch_dict.items():
+        torch.stack(value).mean()
+        torch.stack(value).std()
+    return num_steps / (time.perf_counter() - start_time)
+
+
+def run_metric_accumulator(
+    training_step, num_steps: int, sync_every_n_steps: int
+) -> float:
+    metric_accumulator = MetricAccumulator(
+        sync_every_n_steps=sync_every_n_steps
+    )
+    start_time = time.perf_counter()
+    for _ in range(num_steps):
+        output_dict = training_step()
+        metric_accumulator.update_dict(output_dict)
+        if metric_accumulator.step():
+            _ = f"Loss: {metric_accumulator.latest['loss']:.4f}"
+    metric_accumulator.epoch_metrics()
+    return num_steps / (time.perf_counter() - start_time)
+
+
+def main(
+    num_steps: int = 2000,
+    batch_size: int = 64,
+    num_features: int = 128,
+    num_classes: int = 10,
+    sync_every_n_steps: int = 50,
+    device: str = "cpu",
+    repeats: int = 3,
+):
+    """
+    Compare training steps/sec when metrics are copied to the host on every
+    step against keeping them in a MetricAccumulator.
+
+    Example:
+        python tools/benchmarks/benchmark_metric_accumulator.py --num_steps=5000
+    """
+    training_step = build_training_step(
+        batch_size=batch_size,
+        num_features=num_features,
+        num_classes=num_classes,
+        device=device,
+    )
+
+    # warm up allocators and kernels before timing
+    run_per_step_host_copies(training_step, num_steps=50)
+
+    before = max(
+        run_per_step_host_copies(training_step, num_steps)
+        for _ in range(repeats)
+    )
+    after = max(
+        run_metric_accumulator(training_step, num_steps, sync_every_n_steps)
+        for _ in range(repeats)
+    )
+
+    print(f"per-step host copies: {before:.1f} steps/sec")
+    print(
+        f"metric accumulator (sync every {sync_every_n_steps}): "
+        f"{after:.1f} steps/sec"
+    )
+    print(f"speedup: {after / before:.3f}x")
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,110 @@
+import io
+import tempfile
+import time
+
+import fire
+import numpy as np
+from PIL import Image
+from rich import print
+from torch.utils.data import Dataset
+
+from gate.data.core import GATEDataset
+from gate.data.preprocessed_cache import PreprocessedCache
+from gate.data.transforms.segmentation import KeySelectorTransforms
+
+
+def encode_png(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class EncodedSegmentationDataset(Dataset):
+    """
+    Holds PNG-encoded images and annotations, like the Arrow tables of the
+    HF segmentation datasets.
+    """
+
+    def __init__(self, num_samples: int, image_size: int):
+        rng = np.random.default_rng(0)
+        self.samples = []
+        for _ in range(num_samples):
+            # smooth images compress like photos rather than noise
+            image = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+            image = np.asarray(
+                Image.fromarray(image).resize(
+                    (image_size, image_size), Image.BILINEAR
+                )
+            )
+            annotation = (image[..., 0] // 16).astype(np.uint8)
+            self.samples.append(
+                {
+                    "image": {"bytes": encode_png(image)},
+                    "annotation": {"bytes": encode_png(annotation)},
+                }
+            )
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        return dict(self.samples[index])
+
+
+def throughput(dataset: GATEDataset, repeats: int) -> float:
+    best = 0.0
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        for index in range(len(dataset)):
+            dataset[index]
+        best = max(best, len(dataset) / (time.perf_counter() - start_time))
+    return best
+
+
+def main(
+    num_samples: int = 64,
+    image_size: int = 1024,
+    initial_size: int = 512,
+    repeats: int = 3,
+):
+    """
+    Compare samples/sec of decoding and resizing PNG segmentation samples
+    every time against reading them from a PreprocessedCache, on the CPU.
+
+    Example:
+        python tools/benchmarks/benchmark_preprocessed_cache.py --initial_size=1024
+    """
+    raw_dataset = EncodedSegmentationDataset(
+        num_samples=num_samples, image_size=image_size
+    )
+    preprocess = KeySelectorTransforms(
+        initial_size=initial_size,
+        image_label="image",
+        label_label="annotation",
+    )
+    dataset = GATEDataset(raw_dataset, preprocess=preprocess)
+
+    before = throughput(dataset, repeats)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = PreprocessedCache(
+            cache_dir=cache_dir,
+            dataset_name="synthetic",
+            split="train",
+            preprocess=preprocess,
+        )
+        start_time = time.perf_counter()
+        cache.build(raw_dataset, preprocess=preprocess, num_workers=0)
+        build_time = time.perf_counter() - start_time
+        dataset.cache = cache
+        after = throughput(dataset, repeats)
+
+    print(f"cache build: {build_time:.2f} sec for {num_samples} samples")
+    print(f"decode and resize: {before:.1f} samples/sec")
+    print(f"preprocessed cache: {after:.1f} samples/sec")
+    print(f"speedup: {after / before:.3f}x")
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,122 @@
+import json
+import subprocess
+import sys
+
+import fire
+from rich import print
+
+STEP_SCRIPT = """
+import json, logging, resource, sys, time
+import torch
+from gate.models.backbones.timm import TimmModel
+
+logging.disable(logging.CRITICAL)
+model_identifier, output_layers, batch_size, steps = sys.argv[1:5]
+features_only = json.loads(sys.argv[5])
+output_layers = json.loads(output_layers)
+torch.manual_seed(0)
+model = TimmModel(
+    model_identifier=model_identifier,
+    image_size=224,
+    pretrained=False,
+    features_only=features_only,
+)
+model.train()
+image = torch.rand(int(batch_size), 3, 224, 224)
+
+saved_bytes = 0
+
+
+def pack(tensor):
+    global saved_bytes
+    saved_bytes += tensor.numel() * tensor.element_size()
+    return tensor
+
+
+def step():
+    output = model(image, output_layers=output_layers)
+    # a classification head only consumes the pooled features
+    output["features"].sum().backward()
+    model.zero_grad(set_to_none=True)
+
+
+step()
+peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+    step()
+start_time = time.perf_counter()
+for _ in range(int(steps)):
+    step()
+step_time = (time.perf_counter() - start_time) / int(steps)
+peak_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps([step_time, saved_bytes, peak_after * 1024]))
+"""
+
+
+def run(
+    model_identifier: str,
+    output_layers,
+    batch_size: int,
+    steps: int,
+    features_only: bool,
+):
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            STEP_SCRIPT,
+            model_identifier,
+            json.dumps(output_layers),
+            str(batch_size),
+            str(steps),
+            json.dumps(features_only),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(
+    model_identifier: str = "vit_small_patch16_224",
+    batch_size: int = 16,
+    steps: int = 5,
+    features_only: bool = True,
+):
+    """
+    Compare a CPU training step of a timm ViT that returns every block in
+    "per_layer_raw_features" against one that returns only the layers a
+    head consumes. Each setting runs in a fresh interpreter, so the peak
+    resident memory of one does not hide the other.
+
+    :param features_only: Load the model the way TimmModel does by
+    default, which recent timm wraps in a FeatureGetterNet.
+
+    Example:
+        python tools/benchmarks/benchmark_timm_output_layers.py
+    """
+    results = {}
+    for output_layers in ("all", 4, "final"):
+        step_time, saved_bytes, peak_bytes = run(
+            model_identifier, output_layers, batch_size, steps, features_only
+        )
+        results[output_layers] = (step_time, saved_bytes, peak_bytes)
+        print(
+            f"output_layers={output_layers!r}: {step_time * 1000:.0f} ms "
+            f"per step, {saved_bytes / 2**20:.0f} MiB saved for backward, "
+            f"{peak_bytes / 2**20:.0f} MiB peak resident memory"
+        )
+
+    step_time, saved_bytes, peak_bytes = results["all"]
+    final_time, final_saved, final_peak = results["final"]
+    print(
+        f"final only: {step_time / final_time:.2f}x faster, "
+        f"{(saved_bytes - final_saved) / 2**20:.0f} MiB less saved for "
+        f"backward, {(peak_bytes - final_peak) / 2**20:.0f} MiB lower peak"
+    )
+
+
+# This exposes the function to the command line
+if __name__ == "__main__":
+    fire.Fire(main)